@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Times celppreports.generate_reports over hundreds of synthetic CELPP week
+directories: a first run that parses every summary.txt and builds the
+index, a second run with nothing changed that takes every row from the
+index, and a run after one new week is added.
+
+Usage: python benchmarks/bench_celppreports.py [--years N] [--weeks N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from d3r import celppreports
+from d3r.celpp.task import D3RParameters
+from d3r.celpp.blastnfilter import BlastNFilterTask
+
+
+def write_week(celppdir, year, week, rand, targets):
+    """Writes a week directory with a blastnfilter summary.txt listing
+       `targets` targets
+    """
+    week_dir = os.path.join(celppdir, str(year), 'dataset.week.' + str(week))
+    blastdir = BlastNFilterTask(week_dir, D3RParameters()).get_dir()
+    os.makedirs(blastdir)
+    f = open(os.path.join(blastdir, BlastNFilterTask.SUMMARY_TXT), 'w')
+    f.write('INPUT SUMMARY\n')
+    for name in ['entries', 'complexes', 'dockable complexes', 'monomers',
+                 'dockable monomers', 'multimers', 'dockable multimers']:
+        f.write('  %-36s%5d\n' % (name + ':', rand.randint(10, 300)))
+    f.write('\nOUTPUT SUMMARY\n')
+    f.write('  Targets found:                     %5d\n' % targets)
+    for t in range(targets):
+        f.write('  Target: %d%03x|Sequences: 1|Hits: 94|Candidates: 17|'
+                'Elected:4|PDBids: 5fz7,5fyz,5a3p,5a1f\n' % (1 + t % 9, t))
+    f.close()
+
+
+def timed_report(theargs):
+    start = time.time()
+    celppreports.generate_reports(theargs)
+    return time.time() - start
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=int, default=6,
+                        help='Number of year directories (default 6)')
+    parser.add_argument('--weeks', type=int, default=52,
+                        help='Number of weeks per year (default 52)')
+    parser.add_argument('--targets', type=int, default=200,
+                        help='Targets listed per summary.txt (default 200)')
+    opts = parser.parse_args(args)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        rand = random.Random(0)
+        celppdir = os.path.join(temp_dir, 'celpp')
+        for year in range(2016, 2016 + opts.years):
+            for week in range(1, opts.weeks + 1):
+                write_week(celppdir, year, week, rand, opts.targets)
+        theargs = D3RParameters()
+        theargs.celppdir = celppdir
+        theargs.outdir = os.path.join(temp_dir, 'out')
+        csv_file = os.path.join(theargs.outdir,
+                                celppreports.BLASTNFILTER_SUMMARY_CSV)
+        print('%d week directories' % (opts.years * opts.weeks))
+
+        cold = timed_report(theargs)
+        f = open(csv_file, 'r')
+        cold_csv = f.read()
+        f.close()
+        warm = timed_report(theargs)
+        f = open(csv_file, 'r')
+        warm_csv = f.read()
+        f.close()
+        if cold_csv != warm_csv:
+            print('ERROR: report from index differs')
+            return 1
+
+        write_week(celppdir, 2016 + opts.years, 1, rand, opts.targets)
+        incremental = timed_report(theargs)
+
+        theargs.rebuildindex = True
+        rebuild = timed_report(theargs)
+
+        print('first run, parse all weeks: %.3fs' % cold)
+        print('unchanged weeks from index: %.3fs (%.1fx faster)' %
+              (warm, cold / max(warm, 1e-9)))
+        print('one new week: %.3fs' % incremental)
+        print('--rebuildindex: %.3fs' % rebuild)
+    finally:
+        shutil.rmtree(temp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Compares building a challenge tarball with single threaded tarfile 'w:gz',
+as ChallengeDataTask._tar_challenge_dir used to, against
+ParallelTarGzWriter which compresses blocks on several threads and
+computes a SHA-256 manifest while streaming, on a synthetic challenge
+directory of PDB like text files.
+
+Usage: python benchmarks/bench_challenge_tar.py [--targets N] [--threads N]
+"""
+
+import os
+import sys
+import time
+import gzip
+import random
+import shutil
+import tarfile
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from d3r.celpp.parallelgzip import ParallelTarGzWriter
+
+
+def write_challenge_dir(path, targets, atoms):
+    """Writes `targets` target directories each with a few PDB like
+       files of `atoms` atoms
+    """
+    rand = random.Random(0)
+    for t in range(targets):
+        target_dir = os.path.join(path, '%d%03x' % (1 + t % 9, t))
+        os.makedirs(target_dir)
+        for name in ['LMCSS-apo.pdb', 'SMCSS-apo.pdb', 'hiResApo.pdb']:
+            f = open(os.path.join(target_dir, name), 'w')
+            for i in range(atoms):
+                f.write('ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00'
+                        '%6.2f           C\n' %
+                        (i % 100000, i % 10000, rand.uniform(-50, 50),
+                         rand.uniform(-50, 50), rand.uniform(-50, 50),
+                         rand.uniform(0, 80)))
+            f.close()
+
+
+def get_dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def tar_with_tarfile(challenge_dir, tfile):
+    tar = tarfile.open(tfile, 'w:gz')
+    for entry in sorted(os.listdir(challenge_dir)):
+        tar.add(os.path.join(challenge_dir, entry), arcname='c/' + entry)
+    tar.close()
+
+
+def tar_with_parallel(challenge_dir, tfile, threads):
+    tar = ParallelTarGzWriter(tfile, threads=threads)
+    for entry in sorted(os.listdir(challenge_dir)):
+        tar.add(os.path.join(challenge_dir, entry), 'c/' + entry)
+    tar.close()
+    return tar
+
+
+def read_tar_contents(tfile):
+    f = gzip.open(tfile, 'rb')
+    tar = tarfile.open(fileobj=f, mode='r|')
+    contents = {}
+    for member in tar:
+        if member.isreg():
+            contents[member.name] = tar.extractfile(member).read()
+    tar.close()
+    f.close()
+    return contents
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, default=100,
+                        help='Number of target directories (default 100)')
+    parser.add_argument('--atoms', type=int, default=2500,
+                        help='Atoms per PDB file (default 2500)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Compression threads (default number of '
+                             'cpus)')
+    opts = parser.parse_args(args)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        challenge_dir = os.path.join(temp_dir, 'challenge')
+        write_challenge_dir(challenge_dir, opts.targets, opts.atoms)
+        size = get_dir_size(challenge_dir)
+        print('challenge directory: %d bytes in %d targets' %
+              (size, opts.targets))
+
+        serial_tfile = os.path.join(temp_dir, 'serial.tar.gz')
+        start = time.time()
+        tar_with_tarfile(challenge_dir, serial_tfile)
+        serial_time = time.time() - start
+
+        parallel_tfile = os.path.join(temp_dir, 'parallel.tar.gz')
+        start = time.time()
+        tar = tar_with_parallel(challenge_dir, parallel_tfile, opts.threads)
+        parallel_time = time.time() - start
+
+        if read_tar_contents(serial_tfile) != read_tar_contents(
+                parallel_tfile):
+            print('ERROR: tarball contents differ')
+            return 1
+        print('tarfile w:gz: %.2fs (%.1f MB/s) %d bytes' %
+              (serial_time, size / serial_time / 1048576.0,
+               os.path.getsize(serial_tfile)))
+        print('ParallelTarGzWriter: %.2fs (%.1f MB/s) %d bytes, '
+              '%d manifest entries' %
+              (parallel_time, size / parallel_time / 1048576.0,
+               os.path.getsize(parallel_tfile), len(tar.get_manifest())))
+        print('speedup: %.2fx' % (serial_time / max(parallel_time, 1e-9)))
+    finally:
+        shutil.rmtree(temp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Compares the time and peak memory of creating hit ligands from a
+Components-inchi.ich file (Ligand.set_inchi_component followed by
+Chem.MolFromInchi and FingerprintMol for every ligand) against loading them
+from a ComponentStore built from the same file (Ligand.set_component_store
+with entries read on demand). Each path runs in a forked child process so
+the peak RSS reported is for that path alone.
+
+If rdkit cannot be imported the store only holds InChI strings and the
+timings only cover reading the file and the store.
+
+Usage: python benchmarks/bench_component_store.py [--entries N] [--lookups N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import resource
+import tempfile
+import argparse
+import cPickle as pickle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from d3r.blast.ligand import Ligand
+from d3r.blast.component_store import ComponentStore
+
+INCHIS = ['InChI=1S/C6H6/c1-2-4-6-5-3-1/h1-6H',
+          'InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3',
+          'InChI=1S/C9H8O4/c1-6(10)13-8-5-3-2-4-7(8)9(11)12/h2-5H,1H3,'
+          '(H,11,12)',
+          'InChI=1S/C8H10N4O2/c1-10-4-9-6-5(10)7(13)12(3)8(14)11(6)2/'
+          'h4H,1-3H3',
+          'InChI=1S/C6H12O6/c7-1-2-3(8)4(9)5(10)6(11)12-2/h2-11H,1H2/'
+          't2-,3-,4+,5-,6?/m1/s1']
+
+
+def write_compinchi(path, entries):
+    """Writes a synthetic Components-inchi.ich with `entries` resnames
+    """
+    f = open(path, 'w')
+    for i in range(entries):
+        f.write('%s\t%X\tSYNTHETIC\n' % (INCHIS[i % len(INCHIS)], i))
+    f.close()
+    return ['%X' % i for i in range(entries)]
+
+
+def run_in_child(func, *args):
+    """Runs func in a forked child and returns (result, peak rss in kb)
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        result = func(*args)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out = os.fdopen(write_fd, 'wb')
+        pickle.dump((result, rss), out, pickle.HIGHEST_PROTOCOL)
+        out.close()
+        os._exit(0)
+    os.close(write_fd)
+    handle = os.fdopen(read_fd, 'rb')
+    result = pickle.load(handle)
+    handle.close()
+    os.waitpid(pid, 0)
+    return result
+
+
+def create_ligands(resnames):
+    count = 0
+    for resname in resnames:
+        ligand = Ligand(resname)
+        if ligand.set_rd_mol_from_resname(resname) and ligand.rd_mol:
+            ligand.get_fingerprint()
+            count += 1
+    return count
+
+
+def bench_inchi_component(compinchi, resnames):
+    start = time.time()
+    Ligand.set_inchi_component(compinchi)
+    load_time = time.time() - start
+    start = time.time()
+    count = create_ligands(resnames)
+    return load_time, time.time() - start, count
+
+
+def bench_component_store(store_path, resnames):
+    start = time.time()
+    Ligand.set_component_store(store_path)
+    load_time = time.time() - start
+    start = time.time()
+    count = create_ligands(resnames)
+    return load_time, time.time() - start, count
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=25000,
+                        help='Number of resnames in synthetic '
+                             'Components-inchi.ich file (default 25000)')
+    parser.add_argument('--lookups', type=int, default=2000,
+                        help='Number of hit ligands to create (default 2000)')
+    opts = parser.parse_args(args)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        compinchi = os.path.join(temp_dir, 'Components-inchi.ich')
+        store_path = os.path.join(temp_dir, 'Components-inchi.store')
+        all_resnames = write_compinchi(compinchi, opts.entries)
+        resnames = [random.Random(1).choice(all_resnames)
+                    for x in range(opts.lookups)]
+
+        start = time.time()
+        ComponentStore.build(compinchi, store_path)
+        print('ComponentStore.build (%d entries): %.3fs, %.1f MB on disk' %
+              (opts.entries, time.time() - start,
+               os.path.getsize(store_path) / 1048576.0))
+
+        base_rss = run_in_child(lambda: None)[1]
+        for name, func, path in (('inchi_component', bench_inchi_component,
+                                  compinchi),
+                                 ('component_store', bench_component_store,
+                                  store_path)):
+            (load_time, create_time, count), rss = run_in_child(func, path,
+                                                                resnames)
+            print('%s: load %.3fs, %d ligands with rd_mol in %.3fs '
+                  '(%.3f ms/ligand), peak rss +%.1f MB' %
+                  (name, load_time, count, create_time,
+                   1000.0 * create_time / opts.lookups,
+                   (rss - base_rss) / 1024.0))
+    finally:
+        shutil.rmtree(temp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
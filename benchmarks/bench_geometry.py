@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Compares the pure python coordinate loops previously used for ligand
+centers, center distances and MCS match RMSDs against the numpy kernels in
+d3r.utilities.geometry and d3r.utilities.mcs_rmsd, on a synthetic PDB file
+with 10,000 atoms.  Also times the chunked nearest atom distances and
+Kabsch superposition.
+
+Usage: python benchmarks/bench_geometry.py [--atoms N] [--mappings N]
+"""
+
+import os
+import sys
+import time
+import math
+import random
+import shutil
+import tempfile
+import argparse
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from d3r.utilities import geometry
+from d3r.utilities import mcs_rmsd
+
+
+def write_pdb(path, atoms):
+    """Writes a synthetic PDB with `atoms` HETATM records, each with
+       a unique atom name
+    """
+    rand = random.Random(0)
+    f = open(path, 'w')
+    for i in range(atoms):
+        f.write('HETATM%5d %-4s LIG A 900    %8.3f%8.3f%8.3f  1.00  0.00\n' %
+                (i % 100000, '%04x' % i, rand.uniform(-50, 50),
+                 rand.uniform(-50, 50), rand.uniform(-50, 50)))
+    f.write('END\n')
+    f.close()
+
+
+def loop_center(ligand_pdb):
+    """The per line center calculation get_center used to do"""
+    atom_list = []
+    x = y = z = 0
+    for xyz_line in open(ligand_pdb, 'r').readlines():
+        if 'HETATM' in xyz_line:
+            atom_name = xyz_line[12:16]
+            if atom_name not in atom_list:
+                atom_list.append(atom_name)
+                x += float(xyz_line[30:38])
+                y += float(xyz_line[38:46])
+                z += float(xyz_line[46:54])
+    return '%8.3f, %8.3f, %8.3f' % (x / len(atom_list), y / len(atom_list),
+                                     z / len(atom_list))
+
+
+def numpy_center(ligand_pdb):
+    coords, multi_ligand = geometry.read_ligand_coords(ligand_pdb)
+    return geometry.format_center(geometry.centroid(coords))
+
+
+def loop_min_distances(coords1, coords2):
+    result = []
+    for a in coords1:
+        best = None
+        for b in coords2:
+            d = math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 +
+                          (a[2] - b[2]) ** 2)
+            if best is None or d < best:
+                best = d
+        result.append(best)
+    return result
+
+
+def loop_symmetric_rmsd(ref_coords, fit_coords, matches):
+    """One RMSD per mapping as the OEMatch loop in rmsd_mcss did"""
+    best = None
+    for ref_match, fit_match in matches:
+        total = 0.0
+        for r, f in zip(ref_match, fit_match):
+            total += ((ref_coords[r][0] - fit_coords[f][0]) ** 2 +
+                      (ref_coords[r][1] - fit_coords[f][1]) ** 2 +
+                      (ref_coords[r][2] - fit_coords[f][2]) ** 2)
+        value = math.sqrt(total / len(ref_match))
+        if best is None or value < best:
+            best = value
+    return best
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def report(name, loop_time, numpy_time):
+    print('%s: loop %.4fs, numpy %.4fs, speedup %.0fx' %
+          (name, loop_time, numpy_time, loop_time / max(numpy_time, 1e-9)))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--atoms', type=int, default=10000,
+                        help='Number of atoms in synthetic PDB '
+                             '(default 10000)')
+    parser.add_argument('--mappings', type=int, default=2000,
+                        help='Number of symmetry mappings of a 40 atom '
+                             'ligand to evaluate (default 2000)')
+    parser.add_argument('--probes', type=int, default=50,
+                        help='Number of ligand atoms to find nearest '
+                             'protein atom for with the python loop '
+                             '(default 50)')
+    opts = parser.parse_args(args)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        pdb = os.path.join(temp_dir, 'synthetic.pdb')
+        write_pdb(pdb, opts.atoms)
+
+        loop_result, loop_time = timed(loop_center, pdb)
+        numpy_result, numpy_time = timed(numpy_center, pdb)
+        if loop_result != numpy_result:
+            print('ERROR: centers differ %s != %s' % (loop_result,
+                                                      numpy_result))
+            return 1
+        report('center of %d atoms' % opts.atoms, loop_time, numpy_time)
+
+        names, coords = geometry.read_pdb_coords(pdb)
+        rand = numpy.random.RandomState(1)
+        ligand = coords[:40] + rand.normal(0.0, 0.5, (40, 3))
+
+        probes = ligand[:opts.probes]
+        loop_result, loop_time = timed(loop_min_distances, probes.tolist(),
+                                       coords.tolist())
+        numpy_result, numpy_time = timed(geometry.min_distances, probes,
+                                         coords)
+        if not numpy.allclose(loop_result, numpy_result):
+            print('ERROR: nearest distances differ')
+            return 1
+        report('nearest of %d atoms for %d atoms' % (opts.atoms,
+                                                     len(probes)),
+               loop_time, numpy_time)
+        all_ligand = numpy.tile(ligand, (max(opts.atoms // 40, 1), 1))
+        numpy_result, numpy_time = timed(geometry.min_distances,
+                                         all_ligand, coords)
+        print('nearest of %d atoms for %d atoms: numpy %.4fs' %
+              (opts.atoms, len(all_ligand), numpy_time))
+
+        ref_match = tuple(range(40))
+        fit_matches = [tuple(rand.permutation(40))
+                       for i in range(opts.mappings)]
+        matches = [(ref_match, fit_match) for fit_match in fit_matches]
+        loop_result, loop_time = timed(loop_symmetric_rmsd, coords.tolist(),
+                                       ligand.tolist(), matches)
+        (numpy_result, count), numpy_time = timed(mcs_rmsd.min_match_rmsd,
+                                                  coords, ligand,
+                                                  [ref_match], fit_matches)
+        if abs(loop_result - numpy_result) > 1e-9:
+            print('ERROR: symmetric RMSDs differ')
+            return 1
+        report('symmetric rmsd over %d mappings' % opts.mappings,
+               loop_time, numpy_time)
+
+        angle = 0.3
+        rotation = numpy.array([[math.cos(angle), math.sin(angle), 0.0],
+                                [-math.sin(angle), math.cos(angle), 0.0],
+                                [0.0, 0.0, 1.0]])
+        moved = numpy.dot(coords, rotation) + 5.0
+        value, kabsch_time = timed(geometry.superposed_rmsd, coords, moved)
+        if value > 1e-6:
+            print('ERROR: kabsch did not recover rotation, rmsd %f' % value)
+            return 1
+        print('kabsch superposition of %d atoms: numpy %.4fs' %
+              (opts.atoms, kabsch_time))
+    finally:
+        shutil.rmtree(temp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
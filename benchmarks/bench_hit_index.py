@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Compares the per hit chain lookup done by Hit.fill_sequence using a scan of
+Hit.pdb_dict (RegDict.get_matching) against the Hit.pdb_index lookup
+built by Hit.set_pdb_dict, on a synthetic pdb_seqres.txt file.
+
+Usage: python benchmarks/bench_hit_index.py [--entries N] [--lookups N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from d3r.blast.hit import Hit
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def write_seqres(path, entries, chains=4):
+    """Writes a synthetic pdb_seqres.txt with `entries` pdb ids each
+       having `chains` protein chains
+    """
+    rand = random.Random(0)
+    f = open(path, 'w')
+    for i in range(entries):
+        pdb_id = '%d%03x' % (1 + i % 9, i // 9)
+        for c in range(chains):
+            seq = ''.join(rand.choice(AMINO_ACIDS) for x in range(60))
+            f.write('>%s_%s mol:protein length:60  SYNTHETIC\n%s\n' %
+                    (pdb_id, chr(ord('A') + c), seq))
+    f.close()
+    return ['%d%03x' % (1 + i % 9, i // 9) for i in range(entries)]
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=25000,
+                        help='Number of pdb ids in synthetic seqres file '
+                             '(default 25000)')
+    parser.add_argument('--lookups', type=int, default=200,
+                        help='Number of hits to look up (default 200)')
+    opts = parser.parse_args(args)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        seqres = os.path.join(temp_dir, 'pdb_seqres.txt')
+        pdb_ids = write_seqres(seqres, opts.entries)
+        start = time.time()
+        Hit.set_pdb_dict(seqres)
+        print('set_pdb_dict (%d chains): %.3fs' % (len(Hit.pdb_dict),
+                                                    time.time() - start))
+        lookups = random.Random(1).sample(pdb_ids, opts.lookups)
+
+        start = time.time()
+        scanned = [list(Hit.pdb_dict.get_matching(p)) for p in lookups]
+        scan_time = time.time() - start
+
+        start = time.time()
+        indexed = [Hit.get_chain_records(p) for p in lookups]
+        index_time = time.time() - start
+
+        if scanned != indexed:
+            print('ERROR: index and scan results differ')
+            return 1
+        print('RegDict.get_matching: %.4fs (%.3f ms/hit)' %
+              (scan_time, 1000.0 * scan_time / opts.lookups))
+        print('Hit.get_chain_records: %.4fs (%.4f ms/hit)' %
+              (index_time, 1000.0 * index_time / opts.lookups))
+        print('speedup: %.0fx' % (scan_time / max(index_time, 1e-9)))
+    finally:
+        shutil.rmtree(temp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Measures the time and peak memory of in_put.create_queries on synthetic
+new_release_structure_sequence, nonpolymer and crystallization pH tsv files.
+The list scan lookup used by create_queries before the query index was
+added, which is quadratic in the number of rows, is run on a smaller number
+of rows for comparison. Each build runs in a forked child process so the
+peak RSS reported is for that build alone.
+
+Usage: python benchmarks/bench_in_put.py [--rows N] [--legacyrows N]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import resource
+import tempfile
+import argparse
+import cPickle as pickle
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from d3r.utilities import in_put
+from d3r.blast.query import Query
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def write_tsvs(temp_dir, rows):
+    """Writes sequence, nonpolymer and pH tsv files with `rows` sequence
+       rows spread over rows / 2 pdb ids, one ligand row per sequence row and
+       one pH row per pdb id. Returns the paths of the three files.
+    """
+    rand = random.Random(0)
+    pdb_ids = ['%d%03X' % (1 + i % 9, i // 9) for i in range(rows // 2)]
+    polymer = os.path.join(temp_dir, 'sequence.tsv')
+    non_polymer = os.path.join(temp_dir, 'nonpolymer.tsv')
+    ph = os.path.join(temp_dir, 'ph.tsv')
+    f = open(polymer, 'w')
+    f.write('PDB_ID  Sequence_Count  Sequence\n')
+    for i in range(rows):
+        seq = ''.join(rand.choice(AMINO_ACIDS) for x in range(40))
+        f.write('%s\t%d\t%s\n' % (pdb_ids[i % len(pdb_ids)], i // len(pdb_ids) + 1, seq))
+    f.close()
+    f = open(non_polymer, 'w')
+    f.write('PDB_ID  Component_ID    InChI\n')
+    for i in range(rows):
+        # do_not_call ligands so no rdkit conversion is timed
+        f.write('%s\tZN\tInChI=1S/Zn/q+2\n' % pdb_ids[i % len(pdb_ids)])
+    f.close()
+    f = open(ph, 'w')
+    f.write('PDB_ID  _exptl_crystal_grow.pH\n')
+    for pdb_id in pdb_ids:
+        f.write('%s\t7.5\n' % pdb_id)
+    f.close()
+    return polymer, non_polymer, ph
+
+
+def legacy_create_queries(polymer, non_polymer, ph):
+    """create_queries with the list scan lookup used before the query index
+    """
+    queries = []
+    for line in open(polymer, 'r').readlines():
+        if line.startswith('PDB_ID'):
+            continue
+        words = line.split()
+        pdb_id = words[0].lower()
+        added = [q.pdb_id for q in queries if q]
+        if pdb_id in added:
+            queries[added.index(pdb_id)].set_sequence(words[1], words[2])
+        else:
+            query = Query()
+            query.pdb_id = pdb_id
+            query.set_sequence(words[1], words[2])
+            queries.append(query)
+    for line in open(ph, 'r').readlines():
+        if line.startswith('PDB_ID'):
+            continue
+        words = line.split()
+        added = [q.pdb_id for q in queries if q]
+        queries[added.index(words[0].lower())].exp_ph = words[1]
+    for line in open(non_polymer, 'r').readlines():
+        if line.startswith('PDB_ID'):
+            continue
+        words = line.split()
+        added = [q.pdb_id for q in queries if q]
+        queries[added.index(words[0].lower())].set_ligand(words[1], words[2], in_put.label(words[1]))
+    return queries
+
+
+def run_in_child(func, *args):
+    """Runs func in a forked child and returns (result, peak rss in kb)
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        result = func(*args)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out = os.fdopen(write_fd, 'wb')
+        pickle.dump((result, rss), out, pickle.HIGHEST_PROTOCOL)
+        out.close()
+        os._exit(0)
+    os.close(write_fd)
+    handle = os.fdopen(read_fd, 'rb')
+    result = pickle.load(handle)
+    handle.close()
+    os.waitpid(pid, 0)
+    return result
+
+
+def timed_build(func, polymer, non_polymer, ph):
+    start = time.time()
+    queries = func(polymer, non_polymer, ph)
+    return time.time() - start, len(queries), sum(q.sequence_count for q in queries)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000,
+                        help='Number of rows in synthetic sequence and '
+                             'nonpolymer tsv files (default 50000)')
+    parser.add_argument('--legacyrows', type=int, default=5000,
+                        help='Number of rows used for the list scan '
+                             'lookup, 0 to skip (default 5000)')
+    opts = parser.parse_args(args)
+
+    base_rss = run_in_child(lambda: None)[1]
+    runs = [('create_queries', in_put.create_queries, opts.rows)]
+    if opts.legacyrows > 0:
+        runs.append(('create_queries', in_put.create_queries, opts.legacyrows))
+        runs.append(('list scan', legacy_create_queries, opts.legacyrows))
+    for name, func, rows in runs:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            polymer, non_polymer, ph = write_tsvs(temp_dir, rows)
+            (elapsed, count, seqs), rss = run_in_child(timed_build, func, polymer, non_polymer, ph)
+            print('%s (%d rows): %d queries, %d sequences in %.3fs, peak rss +%.1f MB' %
+                  (name, rows, count, seqs, elapsed, (rss - base_rss) / 1024.0))
+        finally:
+            shutil.rmtree(temp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
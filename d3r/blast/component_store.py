@@ -0,0 +1,147 @@
+__author__ = 'churas'
+
+import os
+import struct
+import logging
+import cPickle as pickle
+
+logger = logging.getLogger(__name__)
+
+try:
+    from rdkit import Chem
+    from rdkit.Chem.Fingerprints import FingerprintMols
+except ImportError:
+    logger.warning('Unable to import rdkit, component store entries will '
+                   'only contain InChI strings')
+    Chem = None
+
+
+class ComponentStore(object):
+    """
+    Read only, indexed binary store of the ligands found in the wwPDB Components-inchi.ich file. Each entry is keyed
+    on the ligand resname and is a dict with the following keys
+        - inchi         - InChI string
+        - rd_mol        - rdkit Mol created from the InChI with removeHs=False and sanitize=False, or None
+        - size          - number of atoms in rd_mol, or None
+        - heavy         - number of heavy atoms in rd_mol, or None
+        - fingerprint   - FingerprintMols.FingerprintMol of rd_mol, or None
+    The file starts with ComponentStore.MAGIC followed by the offset of the index as an unsigned 64 bit integer.
+    The pickled entries come next and the file ends with the pickled index, { 'resname' : (offset, length) }.
+    Only the index is read when the store is opened, entries are read from disk the first time they are requested.
+    """
+    MAGIC = 'D3RCOMPSTORE1\n'
+    HEADER = struct.Struct('<Q')
+
+    @staticmethod
+    def create_entry(inchi):
+        """
+        Creates a store entry from an InChI string. If rdkit is unavailable or the conversion fails, only the inchi
+        field of the entry is set.
+        :param inchi: (string) InChI string
+        :return: entry dict
+        """
+        entry = {'inchi': inchi, 'rd_mol': None, 'size': None, 'heavy': None, 'fingerprint': None}
+        if Chem is None:
+            return entry
+        try:
+            rd_mol = Chem.MolFromInchi(format(inchi), removeHs=False, sanitize=False, treatWarningAsError=True)
+            if rd_mol is None:
+                return entry
+            entry['rd_mol'] = rd_mol
+            entry['size'] = len(rd_mol.GetAtoms())
+            entry['heavy'] = rd_mol.GetNumHeavyAtoms()
+            entry['fingerprint'] = FingerprintMols.FingerprintMol(rd_mol)
+        except Exception:
+            logger.debug('Unable to create rdkit objects for ' + str(inchi))
+        return entry
+
+    @staticmethod
+    def build(compinchi, store_path):
+        """
+        Builds a store from a Components-inchi.ich file, where each line holds an InChI string followed by the
+        resname. The store is written to a temporary file that is renamed to store_path on success.
+        :param compinchi: path to the wwPDB file Components-inchi.ich
+        :param store_path: path of the store to write
+        :return: (int) number of entries written
+        """
+        tmp_path = store_path + '.' + str(os.getpid()) + '.tmp'
+        index = {}
+        in_handle = open(compinchi, 'r')
+        out_handle = open(tmp_path, 'wb')
+        try:
+            out_handle.write(ComponentStore.MAGIC)
+            out_handle.write(ComponentStore.HEADER.pack(0))
+            for line in in_handle:
+                words = line.split()
+                if len(words) < 2:
+                    continue
+                inchi = words[0]
+                resname = words[1]
+                data = pickle.dumps(ComponentStore.create_entry(inchi), pickle.HIGHEST_PROTOCOL)
+                index[resname] = (out_handle.tell(), len(data))
+                out_handle.write(data)
+            index_offset = out_handle.tell()
+            pickle.dump(index, out_handle, pickle.HIGHEST_PROTOCOL)
+            out_handle.seek(len(ComponentStore.MAGIC))
+            out_handle.write(ComponentStore.HEADER.pack(index_offset))
+        except:
+            out_handle.close()
+            os.remove(tmp_path)
+            raise
+        finally:
+            in_handle.close()
+            out_handle.close()
+        os.rename(tmp_path, store_path)
+        return len(index)
+
+    def __init__(self, store_path):
+        """
+        Opens the store and reads its index
+        :param store_path: path to store created by ComponentStore.build
+        :raises IOError: if the file is not a component store
+        """
+        self._path = store_path
+        self._entries = {}
+        handle = open(store_path, 'rb')
+        try:
+            if handle.read(len(ComponentStore.MAGIC)) != ComponentStore.MAGIC:
+                raise IOError(store_path + ' is not a component store')
+            index_offset, = ComponentStore.HEADER.unpack(handle.read(ComponentStore.HEADER.size))
+            handle.seek(index_offset)
+            self._index = pickle.load(handle)
+        finally:
+            handle.close()
+        self._handle = None
+        self._handle_pid = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, resname):
+        return resname in self._index
+
+    def get(self, resname):
+        """
+        Returns the entry for the resname, reading it from disk on first request
+        :param resname: (string) the resname used by the PDB for the ligand
+        :return: entry dict or None if resname is not in the store
+        """
+        entry = self._entries.get(resname)
+        if entry is not None:
+            return entry
+        location = self._index.get(resname)
+        if location is None:
+            return None
+        # forked worker processes must not share the file offset of the parent
+        if self._handle is None or self._handle_pid != os.getpid():
+            self._handle = open(self._path, 'rb')
+            self._handle_pid = os.getpid()
+        self._handle.seek(location[0])
+        entry = pickle.loads(self._handle.read(location[1]))
+        self._entries[resname] = entry
+        return entry
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
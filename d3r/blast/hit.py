@@ -11,14 +11,10 @@ from d3r.blast.base import Base
 from d3r.blast.ligand import Ligand
 from d3r.filter import filtering_sets as filtering_sets
 from d3r.blast.hit_sequence import HitSequence
+from d3r.blast.structure import StructureCache
 
 logger = logging.getLogger(__name__)
 
-try:
-    from Bio.PDB import *
-except ImportError:
-    logger.exception('Unable to import Bio.PDB Hit class may not work')
-
 
 class RegDict(dict):
     def get_matching(self, event):
@@ -32,6 +28,18 @@ class Hit(Base):
 
     pdb_dir = None
     pdb_dict = RegDict()
+    pdb_index = {}
+    structure_cache = StructureCache()
+
+    @staticmethod
+    def set_structure_cache(cache_dir=None, max_entries=StructureCache.DEFAULT_MAX_ENTRIES):
+        """
+        Replaces the cache used by read_pdb with one that keeps up to max_entries structures in memory, and if
+        cache_dir is set, also stores the parsed structures in cache_dir so they are reused across runs.
+        :param cache_dir: (string) path to cache directory or None
+        :param max_entries: (int) number of structures to keep in memory
+        """
+        Hit.structure_cache = StructureCache(cache_dir, max_entries)
 
     @staticmethod
     def set_pdb_dir(pdb_path):
@@ -46,6 +54,7 @@ class Hit(Base):
         Each PDB ID is mapped to a list of sequences, one sequence for each of its chains. This information is stored
         in a class-wide default dictionary pdb_dict, with the following structure
         pdb_dict = { 'pdbid_chainid' : Bio.SeqRecord }
+        Once pdb_dict is filled, the per PDB ID index, pdb_index, used by fill_sequence is built.
         :param fasta: path to the PDB sequences stored in FASTA format, i.e. "pdb_seqres.txt"
         """
         try:
@@ -64,12 +73,38 @@ class Hit(Base):
                 # default SingleLetterAlphabet() assigned
 
         fasta_handle.close()
+        Hit.index_pdb_dict()
+
+    @staticmethod
+    def index_pdb_dict():
+        """
+        Builds pdb_index, which maps each PDB ID to the list of (pdbid_chainid, Bio.SeqRecord) entries of its chains
+        stored in pdb_dict
+        pdb_index = { 'pdbid' : [ ('pdbid_chainid', Bio.SeqRecord), ... ] }
+        The entries of each list are in the same order RegDict.get_matching would return them, so lookups through
+        the index give the same results as a scan of pdb_dict without visiting every key.
+        """
+        Hit.pdb_index = {}
+        for id in Hit.pdb_dict:
+            Hit.pdb_index.setdefault(id.split('_')[0], []).append((id, Hit.pdb_dict[id]))
+
+    @staticmethod
+    def get_chain_records(pdb_id):
+        """
+        Returns a list of (pdbid_chainid, Bio.SeqRecord) tuples for each chain of the input PDB ID found in pdb_dict.
+        The index is built on first use if pdb_dict was filled without calling set_pdb_dict.
+        :param pdb_id: 4-letter pdb id
+        :return: list of tuples
+        """
+        if Hit.pdb_dict and not Hit.pdb_index:
+            Hit.index_pdb_dict()
+        return Hit.pdb_index.get(pdb_id, [])
 
     def __init__(self):
         super(Hit, self).__init__()
         self.retain = None              # True if the test object is retained for docking, False if not.
         self.reasons_to_retain = []     # A list that stores the reasons the test object was retained for docking.
-        self.pdb = None                 # Bio.PDB structure object
+        self.pdb = None                 # d3r.blast.structure.CompactStructure object
         self.chain_count = 0            # an integer count of the number of PDB chains, which may correspond to -->
                                         # --> identical sequences.
         self.resolution = None          # structural resolution (angstroms)
@@ -184,7 +219,8 @@ class Hit(Base):
     def read_pdb(self):
         """
         Reads the PDB file corresponding to the Test objects wwPDB ID, self.pdb_id, and stores the results as a
-        Bio.PDB structure object. If reading the file and assigning the Bio.PDB structure object is successful, True
+        d3r.blast.structure.CompactStructure object. The file is only parsed if it is not found in
+        Hit.structure_cache. If reading the file and assigning the structure object is successful, True
         is returned. Otherwise, False is returned. Prior to calling the method, the pdb_id attribute must be set. E.g.
         typical usage follows
             test = d3r.blast.Test()
@@ -204,8 +240,7 @@ class Hit(Base):
             logger.exception('Problems when assigning the ligrand for wwPDB ID: ' + self.pdb_id)
             return False
         try:
-            parser = PDBParser()
-            self.pdb = parser.get_structure(format(self.pdb_id), pdb_file)
+            self.pdb = Hit.structure_cache.get_structure(self.pdb_id, pdb_file)
             if not self.pdb:
                 logger.error('Unable to get structure for pdb')
                 return False
@@ -264,7 +299,7 @@ class Hit(Base):
         be called after the set_hits method is called
         """
         logger.debug('In fill_sequence()')
-        for id, seq_record in Hit.pdb_dict.get_matching(self.pdb_id):
+        for id, seq_record in Hit.get_chain_records(self.pdb_id):
             if id in self.sequence_membership.keys():
                 # the chain exists in the sequence list, so no need to do anything
                 continue
@@ -315,18 +350,9 @@ class Hit(Base):
             test.set_ligands()
         """
         logger.debug('In set_ligands()')
-        model_list = Selection.unfold_entities(self.pdb, 'M')
-        chain_list = Selection.unfold_entities(model_list[0], 'C')
-        chain_format = "<Chain id=%s>"%chain_id
-        chain_index = 0 
-        for (index, chain_object) in enumerate(chain_list):
-            if str(chain_object) == chain_format:
-                chain_index = index
-        #print "Chain index", chain_index
-        res_list = Selection.unfold_entities(chain_list[chain_index], 'R')
-        hetero_list = [res for res in res_list if 'H_' in res.id[0] and res.id[0] != 'H_MSE']
+        hetero_list = [res for res in self.pdb.get_heteros(chain_id) if res[0] != 'H_MSE']
         #modified by sliu 08/04, add chain info for ligand
-        for hetero in hetero_list:
+        for hetflag, resseq, icode, hetero_resname, atoms in hetero_list:
             assigned = []
             for l in self.dock:
                 ligand_info = (l.resname, l.chain)
@@ -335,7 +361,7 @@ class Hit(Base):
                 ligand_info = (l.resname, l.chain)
                 assigned.append(ligand_info)
 
-            resname = hetero.resname.strip()
+            resname = hetero_resname.strip()
             if (resname, chain_id) in assigned:
                 #the resname, chain id info is already in stored
                 continue
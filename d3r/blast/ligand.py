@@ -3,6 +3,7 @@ __author__ = 'robswift'
 import sys
 
 from d3r.blast.mcss import MCSS
+from d3r.blast.component_store import ComponentStore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,23 @@ class Ligand(object):
     # timeout in seconds for rdkit to find maximum common substructure
     FINDMCS_TIMEOUT = 60
     inchi_component = {}
+    # d3r.blast.mcss.MCSSCache used by mcss_and_tanimoto, None disables caching
+    mcss_cache = None
+    # d3r.blast.component_store.ComponentStore used in place of inchi_component when set
+    component_store = None
+
+    @staticmethod
+    def set_component_store(store_path):
+        """
+        Opens the component store built from Components-inchi.ich by ComponentStore.build. Once set, ligands are
+        created from the precomputed rdkit molecules and fingerprints in the store, which are loaded on demand,
+        instead of from inchi_component.
+        :param store_path: path to the component store
+        """
+        store = ComponentStore(store_path)
+        if len(store) < 20000:
+            raise IOError('There is a problem with the component store ' + store_path)
+        Ligand.component_store = store
 
     @staticmethod
     def set_inchi_component(compinchi):
@@ -68,6 +86,7 @@ class Ligand(object):
         #self.tanimoto = []              # A list of (tanimoto_score, reference_ligand_name)
         self.tanimoto = {}              # A dic of reference_ligand_name:tanimoto_score
         self.mcss_error = None          # set to True, False or None
+        self.fingerprint = None         # rdkit fingerprint of rd_mol, set on first use
 
     def set_rd_mol_from_inchi(self, inchi = None):
         """
@@ -84,6 +103,7 @@ class Ligand(object):
             inchi = self.inchi
         try:
             self.rd_mol = Chem.MolFromInchi(format(inchi), removeHs=False, sanitize=False, treatWarningAsError=True)
+            self.fingerprint = None
             return True
         except:
             logger.exception('Unable to create rdkt.Chem.rdmol Mol object')
@@ -96,10 +116,21 @@ class Ligand(object):
         :param resname: a wwPDB ID (string)
         :return: Boolean
         """
+        if Ligand.component_store is not None:
+            entry = Ligand.component_store.get(resname)
+            if entry is not None and entry['rd_mol'] is not None:
+                self.rd_mol = entry['rd_mol']
+                self.inchi = entry['inchi']
+                self.fingerprint = entry['fingerprint']
+                return True
         try:
-            inchi = Ligand.inchi_component[resname]
+            if Ligand.component_store is not None:
+                inchi = Ligand.component_store.get(resname)['inchi']
+            else:
+                inchi = Ligand.inchi_component[resname]
             self.rd_mol = Chem.MolFromInchi(format(inchi), removeHs=False, sanitize=False, treatWarningAsError=True)
             self.inchi = inchi
+            self.fingerprint = None
             return True
         except:
             logger.exception('Unable to create rdkit.Chem.rdmol from resname')
@@ -162,28 +193,81 @@ class Ligand(object):
         :param reference: d3r.blast.Ligand object with the rd_mol attribute set
         :return: the MCSS (rd mol object) or None
         """
+        mcss, smarts, timed_out = self._find_mcss(reference)
+        return mcss
+
+    def _find_mcss(self, reference):
+        """
+        Runs rdFMCS.FindMCS between the reference ligand and itself
+        :param reference: d3r.blast.Ligand object with the rd_mol attribute set
+        :return: tuple (the MCSS (rd mol object) or None, MCSS SMARTS or None, True if FindMCS timed out)
+        """
         try:
             logger.debug('Trying to find MCS')
 
             res = rdFMCS.FindMCS([reference.rd_mol, self.rd_mol], timeout=Ligand.FINDMCS_TIMEOUT)
             mcss = Chem.MolFromSmarts(res.smartsString)
-            return mcss
+            return mcss, res.smartsString, bool(res.canceled)
         except:
             logger.exception('Caught exception attempting to run rdkit FindMCS or MolFromSmarts')
-            return None
+            return None, None, False
+
+    def mcss_and_tanimoto(self, reference):
+        """
+        Returns the maximum common substructure and the tanimoto similarity between the reference ligand and itself,
+        as returned by mcss and calc_tanimoto. If Ligand.mcss_cache is set, results are looked up in and stored to
+        the cache, keyed on the InChI of the reference ligand and the resname of this ligand. A cached result for
+        which FindMCS timed out is recomputed only if Ligand.FINDMCS_TIMEOUT has been raised since.
+        :param reference: d3r.blast.Ligand object with the rd_mol attribute set
+        :return: tuple (the MCSS (rd mol object) or None, tanimoto score or None)
+        """
+        cache = Ligand.mcss_cache
+        if cache is None or not reference.inchi or not self.resname:
+            return self.mcss(reference), self.calc_tanimoto(reference)
+        entry = cache.get(reference.inchi, self.resname, Ligand.FINDMCS_TIMEOUT)
+        if entry is not None:
+            size, smarts, tanimoto, timeout = entry
+            if smarts is None:
+                return None, tanimoto
+            try:
+                return Chem.MolFromSmarts(smarts), tanimoto
+            except:
+                logger.exception('Unable to create rd mol from cached MCSS SMARTS')
+                return None, tanimoto
+        mcss, smarts, timed_out = self._find_mcss(reference)
+        tanimoto = self.calc_tanimoto(reference)
+        if mcss is not None:
+            size = len(mcss.GetAtoms())
+        else:
+            smarts = None
+            size = None
+        timeout = None
+        if timed_out:
+            timeout = Ligand.FINDMCS_TIMEOUT
+        cache.put(reference.inchi, self.resname, (size, smarts, tanimoto, timeout))
+        return mcss, tanimoto
 
     def calc_tanimoto(self, reference):
         """
         Determin the tanimoto similarity score based on the rd mol fingureprint
         """
         try:
-            fps_ref = FingerprintMols.FingerprintMol(reference.rd_mol)
-            fps_self = FingerprintMols.FingerprintMol(self.rd_mol)
+            fps_ref = reference.get_fingerprint()
+            fps_self = self.get_fingerprint()
             tanimoto = DataStructs.FingerprintSimilarity(fps_ref, fps_self)
             return tanimoto
         except:
             logger.exception('Caught exception attempting to run rdkit FingerprintMols.FingerprintMol or DataStructs.FingerprintSimilarity')
             return None
+
+    def get_fingerprint(self):
+        """
+        Returns the rdkit fingerprint of rd_mol, computing it on the first call
+        """
+        if self.fingerprint is None:
+            self.fingerprint = FingerprintMols.FingerprintMol(self.rd_mol)
+        return self.fingerprint
+
     def set_mcss(self, reference, mcss_mol, tanimoto_score):
         """
         Creates an Mcss object and appends it to the list, Ligand.mcsss. It's assumed that the input maximum common
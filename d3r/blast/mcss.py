@@ -1,5 +1,11 @@
 __author__ = 'robswift'
 
+import os
+import logging
+import cPickle as pickle
+
+logger = logging.getLogger(__name__)
+
 class MCSS(object):
     """
     Stores a maximum common substructure be
@@ -34,3 +40,136 @@ class MCSS(object):
             pass
         else:
             self.heavy = self.rd_mol.GetNumHeavyAtoms()
+
+
+class MCSSCache(object):
+    """
+    Size-bounded cache of maximum common substructure and tanimoto results. Entries are keyed on the
+    (query ligand InChI, hit ligand resname) pair and each entry is a tuple
+        (MCSS size or None, MCSS SMARTS or None, tanimoto score or None, FindMCS timeout or None)
+    where the last value is the timeout in seconds that FindMCS hit, or None if it finished. A timed out entry is
+    only reported as a miss by get() if the timeout asked for is larger than the one it hit. If a path is given, the
+    cache is loaded from that file on creation and written back by save(). Once the number of entries goes over
+    max_entries, the least recently used entries are dropped.
+    """
+    VERSION = 2
+    DEFAULT_MAX_ENTRIES = 200000
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self._path = path
+        self._max_entries = max_entries
+        self._entries = {}              # { (inchi, resname) : [entry, last used tick] }
+        self._tick = 0
+        self._changes = {}              # entries added since the last call to pop_changes
+        self._change_hits = 0
+        self._change_misses = 0
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """
+        Loads entries from the cache file. A missing or unreadable file leaves the cache empty.
+        """
+        if self._path is None or not os.path.isfile(self._path):
+            return
+        try:
+            handle = open(self._path, 'rb')
+            try:
+                data = pickle.load(handle)
+            finally:
+                handle.close()
+        except Exception:
+            logger.exception('Unable to load mcss cache ' + self._path)
+            return
+        if data.get('version') != MCSSCache.VERSION:
+            logger.warning('Ignoring mcss cache ' + self._path + ' with different version')
+            return
+        self._entries = data['entries']
+        for entry_tick in self._entries.values():
+            self._tick = max(self._tick, entry_tick[1])
+
+    def save(self):
+        """
+        Writes the entries to the cache file, if one was set
+        """
+        if self._path is None:
+            return
+        self._evict()
+        tmp_file = self._path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            handle = open(tmp_file, 'wb')
+            pickle.dump({'version': MCSSCache.VERSION, 'entries': self._entries}, handle,
+                        pickle.HIGHEST_PROTOCOL)
+            handle.close()
+            os.rename(tmp_file, self._path)
+        except (IOError, OSError):
+            logger.exception('Caught exception writing mcss cache ' + self._path)
+
+    def _evict(self):
+        """
+        Drops the least recently used entries until there are no more than max_entries. To avoid sorting on every
+        insert, 10% extra entries are dropped each time.
+        """
+        if len(self._entries) <= self._max_entries:
+            return
+        keep = int(self._max_entries * 0.9)
+        by_use = sorted(self._entries.keys(), key=lambda k: self._entries[k][1], reverse=True)
+        for key in by_use[keep:]:
+            del self._entries[key]
+
+    def get(self, inchi, resname, timeout=None):
+        """
+        :param timeout: FindMCS timeout in seconds the result is wanted for, None accepts any timed out entry
+        :return: the cached entry tuple for the pair, or None if there is none or it timed out with a smaller timeout
+        """
+        entry_tick = self._entries.get((inchi, resname))
+        if entry_tick is None or (entry_tick[0][3] is not None and timeout is not None and
+                                  timeout > entry_tick[0][3]):
+            self.misses += 1
+            self._change_misses += 1
+            return None
+        self._tick += 1
+        entry_tick[1] = self._tick
+        self.hits += 1
+        self._change_hits += 1
+        return entry_tick[0]
+
+    def put(self, inchi, resname, entry):
+        """
+        Stores entry for the pair
+        :param entry: (size, smarts, tanimoto, timeout) tuple
+        """
+        self._tick += 1
+        self._entries[(inchi, resname)] = [entry, self._tick]
+        self._changes[(inchi, resname)] = entry
+        self._evict()
+
+    def pop_changes(self):
+        """
+        Returns the entries added and the hit and miss counts since the previous call, for a worker process to
+        send back to the parent process, and resets them.
+        :return: tuple ({ (inchi, resname) : entry }, hits, misses)
+        """
+        changes = (self._changes, self._change_hits, self._change_misses)
+        self._changes = {}
+        self._change_hits = 0
+        self._change_misses = 0
+        return changes
+
+    def merge_changes(self, changes):
+        """
+        Adds the entries and hit and miss counts returned by pop_changes in another process
+        :param changes: value returned by pop_changes
+        """
+        entries, hits, misses = changes
+        for key, entry in entries.items():
+            self._tick += 1
+            self._entries[key] = [entry, self._tick]
+        self._evict()
+        self.hits += hits
+        self.misses += misses
@@ -1,7 +1,10 @@
 __author__ = 'robswift'
 
 import os
+import glob
+import hashlib
 import logging
+import cPickle as pickle
 from StringIO import StringIO
 from Bio.Blast.Applications import NcbiblastpCommandline
 from Bio.Blast import NCBIXML
@@ -33,6 +36,142 @@ class Query(Base):
       ligand and the InChI was successfully converted. Set to None if the Target object is Apo, or contains no dockable
       ligand.
     """
+    # evalue cutoff passed to blastp
+    BLASTP_EVALUE = 0.001
+    # directory where blastp results are persisted across runs, None disables the on-disk cache
+    blast_cache_dir = None
+    # { 'cache key' : pickled Bio.blast.Record } for results found during this run
+    blast_records = {}
+
+    @staticmethod
+    def set_blast_cache_dir(cache_dir):
+        """
+        Sets the directory where blastp results are cached. The directory is created if it does not exist.
+        :param cache_dir: (string) path to the cache directory
+        """
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        Query.blast_cache_dir = cache_dir
+
+    @staticmethod
+    def get_database_fingerprint(pdb_db):
+        """
+        Returns a string that changes whenever the files of the BLASTP database change. The fingerprint is built from
+        the name, size and modification time of each pdb_db.* file.
+        :param pdb_db: (string) The absolute path to a BLASTP database
+        :return: (string) hex digest
+        """
+        digest = hashlib.sha1(pdb_db)
+        for db_file in sorted(glob.glob(pdb_db + '.*')):
+            stat = os.stat(db_file)
+            digest.update('{name}:{size}:{mtime}'.format(name=os.path.basename(db_file), size=stat.st_size,
+                                                         mtime=stat.st_mtime))
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_blast_cache_key(seq, db_fingerprint, evalue=None):
+        """
+        Returns the key under which the blastp result of the input sequence is cached
+        :param seq: (string) protein sequence
+        :param db_fingerprint: (string) value returned by get_database_fingerprint
+        :param evalue: (float) blastp evalue cutoff, Query.BLASTP_EVALUE if None
+        :return: (string) hex digest
+        """
+        if evalue is None:
+            evalue = Query.BLASTP_EVALUE
+        seq_hash = hashlib.sha1(str(seq).upper()).hexdigest()
+        return hashlib.sha1('{seq}:{db}:{evalue!r}'.format(seq=seq_hash, db=db_fingerprint,
+                                                           evalue=float(evalue))).hexdigest()
+
+    @staticmethod
+    def get_cached_record(key):
+        """
+        Returns a new copy of the Bio.blast.Record cached under key, or None if there is no cached result. The
+        in-memory results are checked first, followed by the on-disk cache if Query.blast_cache_dir is set.
+        :param key: (string) value returned by get_blast_cache_key
+        :return: Bio.blast.Record object or None
+        """
+        data = Query.blast_records.get(key)
+        if data is None and Query.blast_cache_dir:
+            cache_file = os.path.join(Query.blast_cache_dir, key + '.pickle')
+            if os.path.isfile(cache_file):
+                try:
+                    handle = open(cache_file, 'rb')
+                    data = handle.read()
+                    handle.close()
+                    Query.blast_records[key] = data
+                except IOError:
+                    logger.exception('Caught exception reading ' + cache_file)
+                    data = None
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            logger.exception('Unable to load cached blast record ' + key)
+            return None
+
+    @staticmethod
+    def cache_record(key, record):
+        """
+        Stores the input Bio.blast.Record under key. If Query.blast_cache_dir is set, the record is also written
+        to disk so later runs can reuse it.
+        :param key: (string) value returned by get_blast_cache_key
+        :param record: Bio.blast.Record object
+        """
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        Query.blast_records[key] = data
+        if not Query.blast_cache_dir:
+            return
+        cache_file = os.path.join(Query.blast_cache_dir, key + '.pickle')
+        tmp_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+        try:
+            handle = open(tmp_file, 'wb')
+            handle.write(data)
+            handle.close()
+            os.rename(tmp_file, cache_file)
+        except (IOError, OSError):
+            logger.exception('Caught exception writing ' + cache_file)
+
+    @staticmethod
+    def blastp_batch(queries, pdb_db, out_dir, num_threads=1):
+        """
+        Runs a single BLASTP search over the unique sequences of all the input queries and caches the result of
+        each sequence, so later calls to run_blast on these queries do not need to start blastp. Sequences with a
+        cached result are skipped.
+        :param queries: a list of Query objects
+        :param pdb_db: (string) The absolute path to a BLASTP database
+        :param out_dir: (string) The absolute path to the output directory. The multi-record fasta file is written
+        here and deleted after the BLASTP search is completed.
+        :param num_threads: (int) value passed to the blastp -num_threads flag
+        :return: (int) the number of sequences searched
+        """
+        db_fingerprint = Query.get_database_fingerprint(pdb_db)
+        pending = {}
+        for query in queries:
+            for sequence in query.sequences:
+                key = Query.get_blast_cache_key(sequence.seq, db_fingerprint)
+                if key in pending or Query.get_cached_record(key) is not None:
+                    continue
+                pending[key] = SeqRecord(sequence.seq, id=key, description='')
+        if not pending:
+            logger.debug('All query sequences have cached blast results')
+            return 0
+        fasta = os.path.join(os.path.abspath(out_dir), 'batch_query.fasta')
+        logger.debug('Writing ' + str(len(pending)) + ' sequences to ' + fasta)
+        SeqIO.write(pending.values(), fasta, 'fasta')
+        try:
+            cline = NcbiblastpCommandline(cmd='blastp', query=fasta, db=pdb_db, evalue=Query.BLASTP_EVALUE,
+                                          outfmt=5, num_threads=num_threads)
+            std_out, std_err = cline()
+        finally:
+            os.remove(fasta)
+        for record in NCBIXML.parse(StringIO(std_out)):
+            key = record.query.split()[0]
+            if key in pending:
+                Query.cache_record(key, record)
+        return len(pending)
+
     def __init__(self):
         super(Query, self).__init__()              # inherit superclass constructor
         self.hits = []                            # [test object, test object, ... ]
@@ -134,6 +273,10 @@ class Query(Base):
             logger.exception('Caught exception logging debug information')
         
         for sequence in self.sequences:
+            record = self.get_blast_record(sequence, pdb_db)
+            if record:
+                records.append(record)
+                return records
             fasta = self.write_fasta(sequence, out_dir)
             if fasta:
                 logger.debug('Starting blastp of ' + fasta)
@@ -141,6 +284,7 @@ class Query(Base):
                 logger.debug('Removing file ' + fasta)
                 os.remove(fasta)
                 if record:
+                    self.set_blast_record(sequence, pdb_db, record)
                     records.append(record)
                 return records
 
@@ -157,10 +301,16 @@ class Query(Base):
         except:
             logger.exception('Caught exception logging debug information')
         for sequence in self.sequences:
+            record = self.get_blast_record(sequence, pdb_db)
+            if record:
+                records.append(record)
+                continue
             fasta = self.write_fasta(sequence, out_dir)
             if fasta:
                 logger.debug('Starting blastp of ' + fasta)
-                records.append(self.blastp(fasta, pdb_db))
+                record = self.blastp(fasta, pdb_db)
+                self.set_blast_record(sequence, pdb_db, record)
+                records.append(record)
                 logger.debug('Removing ' + fasta + ' file')
                 os.remove(fasta)
         if records:
@@ -204,6 +354,37 @@ class Query(Base):
             for index in delete:
                 del record.alignments[index]
 
+    def get_blast_record(self, sequence, pdb_db):
+        """
+        Returns the cached blastp result for the input sequence, or None if the sequence has not been searched
+        against the current contents of pdb_db. The query field of the returned record is set to the id of
+        the input sequence, as if blastp had been run on the fasta written by write_fasta.
+        :param sequence: (Bio.SeqRecord)
+        :param pdb_db: (string) The absolute path to a BLASTP database
+        :return: Bio.blast.Record object or None
+        """
+        if not Query.blast_records and not Query.blast_cache_dir:
+            return None
+        key = Query.get_blast_cache_key(sequence.seq, Query.get_database_fingerprint(pdb_db))
+        record = Query.get_cached_record(key)
+        if record is None:
+            return None
+        logger.debug('Using cached blastp result for ' + sequence.id)
+        record.query = sequence.id
+        return record
+
+    def set_blast_record(self, sequence, pdb_db, record):
+        """
+        Caches the blastp result of the input sequence. Nothing is cached unless Query.blast_cache_dir is set.
+        :param sequence: (Bio.SeqRecord)
+        :param pdb_db: (string) The absolute path to a BLASTP database
+        :param record: Bio.blast.Record object
+        """
+        if not Query.blast_cache_dir or not record:
+            return
+        key = Query.get_blast_cache_key(sequence.seq, Query.get_database_fingerprint(pdb_db))
+        Query.cache_record(key, record)
+
     def blastp(self, fasta, pdb_db):
         """
         Runs BLASTP locally on a input fasta file and specified BLASTP database
@@ -212,7 +393,7 @@ class Query(Base):
         :return: Bio.blast.Record object
         """
         logger.debug('Running blastp ' + fasta)
-        cline = NcbiblastpCommandline(cmd='blastp', query=fasta, db=pdb_db, evalue=0.001, outfmt=5)
+        cline = NcbiblastpCommandline(cmd='blastp', query=fasta, db=pdb_db, evalue=Query.BLASTP_EVALUE, outfmt=5)
         std_out, std_err = cline()
         blast_records = NCBIXML.parse(StringIO(std_out))
         record = next(blast_records)
@@ -0,0 +1,178 @@
+__author__ = 'churas'
+
+import os
+import hashlib
+import logging
+import cPickle as pickle
+
+logger = logging.getLogger(__name__)
+
+try:
+    from Bio.PDB import PDBParser
+    from Bio.PDB import Selection
+except ImportError:
+    logger.exception('Unable to import Bio.PDB CompactStructure class may not work')
+
+
+class CompactStructure(object):
+    """
+    Holds the parts of a Bio.PDB structure used by d3r.blast.Hit, which are the header fields, the chains of the
+    first model and the hetero residues of each chain, along with the coordinates of their atoms. Unlike the
+    Bio.PDB structure it is small and cheap to pickle.
+        - header    - {'resolution' : float or None, 'structure_method' : string or None}
+        - chains    - [ (chain_id, [ (hetflag, resseq, icode, resname, [ (atom_name, x, y, z), ... ]), ... ]), ... ]
+    """
+    def __init__(self, header=None, chains=None):
+        if header is None:
+            header = {}
+        if chains is None:
+            chains = []
+        self.header = header
+        self.chains = chains
+
+    @staticmethod
+    def from_bio_structure(structure):
+        """
+        Creates a CompactStructure from a Bio.PDB structure object
+        :param structure: Bio.PDB structure object
+        :return: CompactStructure
+        """
+        header = {'resolution': structure.header.get('resolution'),
+                  'structure_method': structure.header.get('structure_method')}
+        chains = []
+        model_list = Selection.unfold_entities(structure, 'M')
+        if model_list:
+            for chain in Selection.unfold_entities(model_list[0], 'C'):
+                heteros = []
+                for res in Selection.unfold_entities(chain, 'R'):
+                    if 'H_' not in res.id[0]:
+                        continue
+                    atoms = [(atom.get_name(),) + tuple(float(c) for c in atom.get_coord()) for atom in res]
+                    heteros.append((res.id[0], res.id[1], res.id[2], res.resname, atoms))
+                chains.append((chain.id, heteros))
+        return CompactStructure(header, chains)
+
+    def get_chain_ids(self):
+        """
+        :return: list of chain ids of the first model
+        """
+        return [chain_id for chain_id, heteros in self.chains]
+
+    def get_heteros(self, chain_id):
+        """
+        Returns the hetero residues of the chain with the input chain id. As in the original Hit.set_ligands
+        implementation, the first chain is used if no chain has the input id.
+        :param chain_id: (string) chain id, e.g. 'A'
+        :return: list of (hetflag, resseq, icode, resname, atoms) tuples
+        """
+        if not self.chains:
+            return []
+        for cur_id, heteros in self.chains:
+            if cur_id == chain_id:
+                return heteros
+        return self.chains[0][1]
+
+
+class StructureCache(object):
+    """
+    Cache of CompactStructure objects keyed on the path, size and modification time of the PDB file they were
+    parsed from. Recently used structures are kept in memory, up to max_entries, and if cache_dir is set every
+    structure is also pickled to that directory so other processes and later runs can skip parsing.
+    """
+    # bump when the layout of CompactStructure changes so old cache files are ignored
+    CACHE_VERSION = '1'
+    DEFAULT_MAX_ENTRIES = 256
+
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+        self._entries = {}
+        self._lru = []
+        self.hits = 0
+        self.misses = 0
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_cache_dir(self):
+        return self._cache_dir
+
+    def get_key(self, pdb_file):
+        """
+        Returns the cache key of the input PDB file
+        :param pdb_file: (string) path to PDB file
+        :return: (string) hex digest
+        """
+        stat = os.stat(pdb_file)
+        return hashlib.sha1('{version}:{path}:{size}:{mtime!r}'.format(version=StructureCache.CACHE_VERSION,
+                                                                       path=os.path.abspath(pdb_file),
+                                                                       size=stat.st_size,
+                                                                       mtime=stat.st_mtime)).hexdigest()
+
+    def _remember(self, key, structure):
+        """
+        Adds the structure to the in memory cache evicting the least recently used entry if needed
+        """
+        if key in self._entries:
+            self._lru.remove(key)
+        elif len(self._lru) >= self._max_entries:
+            del self._entries[self._lru.pop(0)]
+        self._entries[key] = structure
+        self._lru.append(key)
+
+    def _read_cache_file(self, key):
+        if self._cache_dir is None:
+            return None
+        cache_file = os.path.join(self._cache_dir, key + '.pickle')
+        if not os.path.isfile(cache_file):
+            return None
+        try:
+            handle = open(cache_file, 'rb')
+            try:
+                return pickle.load(handle)
+            finally:
+                handle.close()
+        except Exception:
+            logger.exception('Unable to load cached structure ' + cache_file)
+            return None
+
+    def _write_cache_file(self, key, structure):
+        if self._cache_dir is None:
+            return
+        cache_file = os.path.join(self._cache_dir, key + '.pickle')
+        tmp_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+        try:
+            handle = open(tmp_file, 'wb')
+            pickle.dump(structure, handle, pickle.HIGHEST_PROTOCOL)
+            handle.close()
+            os.rename(tmp_file, cache_file)
+        except (IOError, OSError):
+            logger.exception('Caught exception writing ' + cache_file)
+
+    def get_structure(self, pdb_id, pdb_file):
+        """
+        Returns the CompactStructure for the input PDB file, parsing the file with Bio.PDB.PDBParser only if it is
+        not already in the in memory or on disk cache.
+        :param pdb_id: (string) 4 letter PDB ID
+        :param pdb_file: (string) path to PDB file
+        :return: CompactStructure or None if the file could not be parsed
+        """
+        key = self.get_key(pdb_file)
+        structure = self._entries.get(key)
+        if structure is None:
+            structure = self._read_cache_file(key)
+            if structure is not None:
+                self._remember(key, structure)
+        else:
+            self._remember(key, structure)
+        if structure is not None:
+            self.hits += 1
+            return structure
+        self.misses += 1
+        parser = PDBParser()
+        bio_structure = parser.get_structure(format(pdb_id), pdb_file)
+        if not bio_structure:
+            return None
+        structure = CompactStructure.from_bio_structure(bio_structure)
+        self._remember(key, structure)
+        self._write_cache_file(key, structure)
+        return structure
@@ -47,6 +47,34 @@ def _parse_arguments(desc, args):
                         help='PDB Database directory')
     parser.add_argument("--compinchi", required=True,
                         help='Components.inchi file')
+    parser.add_argument("--componentstore", default=None,
+                        help='Component store built from the --compinchi '
+                             'file by buildcomponentstore.py. If set, '
+                             'ligand molecules and fingerprints are loaded '
+                             'from this store (default not used)')
+    parser.add_argument("--numworkers", default=1, type=int,
+                        help='Number of worker processes used to process '
+                             'queries concurrently (default 1)')
+    parser.add_argument("--batchblast", action='store_true',
+                        help='Search the sequences of all queries with a '
+                             'single blastp invocation')
+    parser.add_argument("--blastthreads", default=1, type=int,
+                        help='Number of threads passed to blastp in '
+                             '--batchblast mode (default 1)')
+    parser.add_argument("--blastcachedir", default=None,
+                        help='Directory where blastp results are cached '
+                             'and reused across runs (default no cache)')
+    parser.add_argument("--structurecachedir", default=None,
+                        help='Directory where parsed PDB structures are '
+                             'cached and reused across runs '
+                             '(default no cache)')
+    parser.add_argument("--mcsscache", default=None,
+                        help='File where MCSS and tanimoto results are '
+                             'cached and reused across runs '
+                             '(default no cache)')
+    parser.add_argument("--mcsscachesize", default=200000, type=int,
+                        help='Maximum number of entries kept in the '
+                             '--mcsscache file (default 200000)')
     parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
                         'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         help="Set the logging level",
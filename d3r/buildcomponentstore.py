@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+__author__ = 'churas'
+
+import sys
+import logging
+import argparse
+
+import d3r
+from d3r.celpp import util
+from d3r.blast.component_store import ComponentStore
+
+# create logger
+logger = logging.getLogger('d3r.buildcomponentstore')
+
+
+class CommandLineParameters(object):
+    """Holds command line arguments
+    """
+    pass
+
+
+def _parse_arguments(desc, args):
+    """Parses command line arguments using argparse.
+    """
+    parsed_arguments = CommandLineParameters()
+
+    help_formatter = argparse.RawDescriptionHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_formatter)
+    parser.add_argument("--compinchi", required=True,
+                        help='Components-inchi.ich file')
+    parser.add_argument("--out", required=True,
+                        help='Path of component store to write')
+    parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
+                        'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                        help="Set the logging level",
+                        default='WARNING')
+    parser.add_argument('--version', action='version',
+                        version=('%(prog)s ' + d3r.__version__))
+    return parser.parse_args(args, namespace=parsed_arguments)
+
+
+def main(args):
+    desc = """
+              Version {version}
+
+              Builds an indexed store of the ligands in the wwPDB
+              Components-inchi.ich file set by --compinchi and writes
+              it to the path set by --out.
+
+              Each entry of the store is keyed on the ligand resname
+              and holds the InChI string along with the rdkit molecule,
+              atom counts and fingerprint created from it. If rdkit
+              cannot be imported only the InChI strings are stored.
+
+              Blastnfilter loads entries from the store on demand when
+              invoked with --componentstore.
+              """.format(version=d3r.__version__)
+    theargs = _parse_arguments(desc, args[1:])
+    theargs.program = args[0]
+    theargs.version = d3r.__version__
+
+    util.setup_logging(theargs)
+    try:
+        count = ComponentStore.build(theargs.compinchi, theargs.out)
+        logger.info('Wrote ' + str(count) + ' entries to ' + theargs.out)
+    except Exception:
+        logger.exception("Error caught exception")
+        return 2
+    return 0
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main(sys.argv))
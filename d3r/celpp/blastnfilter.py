@@ -247,6 +247,14 @@ class BlastNFilterTask(D3RTask):
             file_list.append(bnf_log_file)
         return file_list
 
+    def get_dependencies(self):
+        """Returns `MakeBlastDBTask` and `DataImportTask` which
+           can_run() requires to be complete
+           :return: list of tasks
+        """
+        return [MakeBlastDBTask(self._path, self._args),
+                DataImportTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -362,6 +370,10 @@ class BlastNFilterTask(D3RTask):
                       loglevel +
                       ' --outdir ' + self.get_dir())
 
+        if os.path.isfile(data_import.get_component_store_file()):
+            cmd_to_run += (' --componentstore ' +
+                           data_import.get_component_store_file())
+
         blastnfilter_name = os.path.basename(self.get_args().blastnfilter)
 
         self.run_external_command(blastnfilter_name,
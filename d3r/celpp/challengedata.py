@@ -1,14 +1,15 @@
 __author__ = 'churas'
 
 import os
+import time
 import logging
-import tarfile
 import shutil
 
 from d3r.celpp import util
 from d3r.celpp.task import D3RTask
 from d3r.celpp.blastnfilter import BlastNFilterTask
 from d3r.celpp.dataimport import DataImportTask
+from d3r.celpp.parallelgzip import ParallelTarGzWriter
 
 logger = logging.getLogger(__name__)
 
@@ -21,8 +22,10 @@ class ChallengeDataTask(D3RTask):
     TAR_EXCLUDE_DIRS = ['error_container']
     TAR_EXCLUDE_FILES = ['final.log']
     TAR_GZ_SUFFIX = ".tar.gz"
+    MANIFEST_SUFFIX = ".sha256"
     README_TXT_FILE = "readme.txt"
     LATEST_TXT = "latest.txt"
+    GENCHALLENGE_TIMING = "Generated challenge data for "
 
     README_BODY = """CELPP Weekly Pose Prediction Challenge
 ======================================
@@ -195,6 +198,10 @@ Blastnfilter Summary
         else:
             logger.warning('No tar file found!!!')
 
+        manifest = self.get_celpp_challenge_data_manifest_file()
+        if os.path.isfile(manifest):
+            file_list.append(manifest)
+
         return file_list
 
     def get_celpp_challenge_data_tar_file(self):
@@ -204,6 +211,13 @@ Blastnfilter Summary
                             self.get_celpp_challenge_data_dir_name() +
                             ".tar.gz")
 
+    def get_celpp_challenge_data_manifest_file(self):
+        """Returns path to SHA-256 manifest of challenge tar ball
+        """
+        return os.path.join(self.get_dir(),
+                            self.get_celpp_challenge_data_dir_name() +
+                            ChallengeDataTask.MANIFEST_SUFFIX)
+
     def get_celpp_challenge_data_dir_name(self):
         """Returns path to celpp challenge data directory name
         """
@@ -289,6 +303,11 @@ Blastnfilter Summary
 
     def _tar_challenge_dir(self, challenge_dir_name):
         """Creates compressed tarball of challenge directory
+
+        The tarball is compressed by several threads with
+        `ParallelGzipFile` and the SHA-256 of every file put in it,
+        and of the tarball itself, is written in sha256sum format to
+        the file returned by `get_celpp_challenge_data_manifest_file`
         """
 
         tfile = os.path.join(self.get_dir(),
@@ -296,37 +315,61 @@ Blastnfilter Summary
                              ChallengeDataTask.TAR_GZ_SUFFIX)
 
         logger.debug('Creating tar file: ' + tfile)
-
-        tar = tarfile.open(tfile, 'w:gz')
+        start_time = time.time()
+        tar = ParallelTarGzWriter(tfile)
         challenge_dir = os.path.join(self.get_dir(), challenge_dir_name)
 
-        for entry in os.listdir(challenge_dir):
-            fullpath = os.path.join(challenge_dir, entry)
-            if os.path.isdir(fullpath):
-                if entry in ChallengeDataTask.TAR_EXCLUDE_DIRS:
-                    logger.debug('Skipping insertion of ' + entry +
-                                 ' into tar file')
-                    continue
-
-                logger.debug('Adding directory to tarball: ' + entry)
-                tar.add(fullpath, arcname=challenge_dir_name + '/' + entry)
-                continue
-            if os.path.isfile(fullpath):
-                if entry in ChallengeDataTask.TAR_EXCLUDE_FILES:
-                    logger.debug('Skipping insertion of ' + entry +
-                                 ' into tar file')
+        try:
+            for entry in sorted(os.listdir(challenge_dir)):
+                fullpath = os.path.join(challenge_dir, entry)
+                if os.path.isdir(fullpath):
+                    if entry in ChallengeDataTask.TAR_EXCLUDE_DIRS:
+                        logger.debug('Skipping insertion of ' + entry +
+                                     ' into tar file')
+                        continue
+
+                    logger.debug('Adding directory to tarball: ' + entry)
+                    tar.add(fullpath, challenge_dir_name + '/' + entry)
                     continue
-                logger.debug('Adding file to tarball: ' + entry)
-                tar.add(fullpath, challenge_dir_name + '/' + entry)
+                if os.path.isfile(fullpath):
+                    if entry in ChallengeDataTask.TAR_EXCLUDE_FILES:
+                        logger.debug('Skipping insertion of ' + entry +
+                                     ' into tar file')
+                        continue
+                    logger.debug('Adding file to tarball: ' + entry)
+                    tar.add(fullpath, challenge_dir_name + '/' + entry)
+        finally:
+            tar.close()
+        duration = time.time() - start_time
+
+        manifest = tar.get_manifest()
+        manifest.append(tar.get_sha256_hexdigest() + '  ' +
+                        os.path.basename(tfile))
+        f = open(os.path.join(self.get_dir(), challenge_dir_name +
+                              ChallengeDataTask.MANIFEST_SUFFIX), 'w')
+        f.write('\n'.join(manifest) + '\n')
+        f.close()
 
-        tar.close()
         tfile_size = str(os.path.getsize(tfile))
         logger.debug('Tarfile created and is: ' +
                      tfile_size + 'bytes in size')
         self.append_to_email_log('Tarfile: ' + tfile + ' (' +
                                  tfile_size + ' bytes) created.')
+        self.append_to_email_log(' Compressed ' + str(tar.get_size()) +
+                                 ' bytes in ' + '%.2f' % duration +
+                                 ' seconds (' + '%.1f' %
+                                 (tar.get_size() / max(duration, 0.001) /
+                                  1048576.0) + ' MB/s), sha256 ' +
+                                 tar.get_sha256_hexdigest() + '\n')
         return tfile
 
+    def get_dependencies(self):
+        """Returns `BlastNFilterTask` which can_run() requires
+           to be complete
+           :return: list of tasks
+        """
+        return [BlastNFilterTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -425,6 +468,35 @@ Blastnfilter Summary
                                        ChallengeDataTask.LATEST_TXT) is False:
             raise Exception(uploader.get_error_msg())
 
+    def _get_genchallenge_workers(self):
+        """Gets number of worker processes genchallenge should use
+           from genchallengeworkers in arguments, 1 if unset
+        """
+        try:
+            numworkers = self.get_args().genchallengeworkers
+        except AttributeError:
+            return 1
+        if numworkers is None:
+            return 1
+        return int(numworkers)
+
+    def _append_genchallenge_timing_to_email_log(self, genchallenge_name):
+        """Appends timing line written to standard out by genchallenge
+           script, which reports number of workers and speedup, to email
+           log.  Nothing is appended if no such line is found
+        """
+        stdout_file = os.path.join(self.get_dir(), genchallenge_name +
+                                   D3RTask.STDOUT_SUFFIX)
+        if not os.path.isfile(stdout_file):
+            return
+        f = open(stdout_file, 'r')
+        try:
+            for line in f:
+                if line.startswith(ChallengeDataTask.GENCHALLENGE_TIMING):
+                    self.append_to_email_log('\n' + line.rstrip() + '\n')
+        finally:
+            f.close()
+
     def run(self):
         """Runs ChallengeDataTask after verifying blastnfilter was good
 
@@ -481,9 +553,14 @@ Blastnfilter Summary
                       ' --pdbdb ' + self.get_args().pdbdb +
                       ' --outdir ' + challenge_dir)
 
+        numworkers = self._get_genchallenge_workers()
+        if numworkers > 1:
+            cmd_to_run += ' --numworkers ' + str(numworkers)
+
         genchallenge_name = os.path.basename(self.get_args().genchallenge)
         self.run_external_command(genchallenge_name, cmd_to_run,
                                   True)
+        self._append_genchallenge_timing_to_email_log(genchallenge_name)
 
         try:
             # create readme.txt file
@@ -8,6 +8,7 @@ import time
 from d3r.celpp.task import D3RTask
 from d3r.celpp import util
 from d3r.celpp.makeblastdb import MakeBlastDBTask
+from d3r.celpp.downloadmanager import DownloadManager
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +31,7 @@ class DataImportTask(D3RTask):
     SEQUENCE_TSV = "new_release_structure_sequence_canonical.tsv"
     CRYSTALPH_TSV = "new_release_crystallization_pH.tsv"
     COMPINCHI_ICH = "Components-inchi.ich"
+    COMPONENT_STORE = "Components-inchi.store"
 
     # standard to append to NON_POLYMER_TSV file
     NONPOLYMER_TSV_STANDARD = "1FCZ    156     InChI=1S/C24H26O3/c1-23(2)13-" \
@@ -58,6 +60,8 @@ class DataImportTask(D3RTask):
         self.set_status(D3RTask.UNKNOWN_STATUS)
         self._maxretries = 3
         self._retrysleep = 1
+        self._maxparalleldownloads = 5
+        self._download_summary = None
 
     def get_uploadable_files(self):
         """Returns list of files that can be uploaded to remote server
@@ -136,6 +140,41 @@ class DataImportTask(D3RTask):
         return os.path.join(self.get_dir(),
                             DataImportTask.COMPINCHI_ICH)
 
+    def get_component_store_file(self):
+        """Returns path to Components-inchi.store file
+        :return: full path to DataImportTask.COMPONENT_STORE file
+        """
+        return os.path.join(self.get_dir(),
+                            DataImportTask.COMPONENT_STORE)
+
+    def _build_component_store(self):
+        """Builds component store from Components-inchi.ich file
+
+           Runs script set in `self._args.buildcomponentstore` to
+           create `get_component_store_file()`.  If the argument is
+           not set this method does nothing.  Failure to build the
+           store is not considered fatal since blastnfilter falls
+           back to reading Components-inchi.ich file
+        """
+        try:
+            buildcomponentstore = self.get_args().buildcomponentstore
+        except AttributeError:
+            logger.debug('buildcomponentstore not set, skipping build '
+                         'of component store')
+            return
+
+        if buildcomponentstore is None:
+            logger.debug('buildcomponentstore not set, skipping build '
+                         'of component store')
+            return
+
+        cmd_to_run = (buildcomponentstore + ' --compinchi ' +
+                      self.get_components_inchi_file() +
+                      ' --out ' + self.get_component_store_file())
+
+        self.run_external_command(os.path.basename(buildcomponentstore),
+                                  cmd_to_run, False)
+
     def get_set_of_pdbid_from_crystalph_tsv(self):
         """Gets set of PDBID by parsing `DataImportTask.CRYSTALPH_TSV`
 
@@ -315,6 +354,13 @@ class DataImportTask(D3RTask):
             val = util.has_url_been_updated_since_start_of_celpp_week(url)
             counter += 1
 
+    def get_dependencies(self):
+        """Returns `MakeBlastDBTask` which can_run() requires
+           to be complete
+           :return: list of tasks
+        """
+        return [MakeBlastDBTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -354,60 +400,53 @@ class DataImportTask(D3RTask):
         return True
 
     def _download_files(self, url):
-
+        """Downloads tsv files from `url` and Components-inchi.ich
+
+           Waits for each tsv file to be updated then downloads all the
+           files at once via `DownloadManager`.  The summary of the
+           downloads, with throughput of each file, is saved for
+           `run` to add to email log.
+           :returns: True upon success otherwise False after setting
+                     error and calling end()
+        """
+        tsv_files = [(DataImportTask.NONPOLYMER_TSV,
+                      self.get_nonpolymer_tsv()),
+                     (DataImportTask.SEQUENCE_TSV,
+                      self.get_sequence_tsv()),
+                     (DataImportTask.OLDSEQUENCE_TSV,
+                      self.get_oldsequence_tsv()),
+                     (DataImportTask.CRYSTALPH_TSV,
+                      self.get_crystalph_tsv())]
+        download_path = tsv_files[0][1]
         try:
-            nonpolyurl = url + '/' + DataImportTask.NONPOLYMER_TSV
-
-            self._wait_for_url_to_be_updated(nonpolyurl)
-
-            download_path = self.get_nonpolymer_tsv()
-            util.download_url_to_file(nonpolyurl,
-                                      download_path,
-                                      self._maxretries,
-                                      self._retrysleep)
-
-            sequence = url + '/' + DataImportTask.SEQUENCE_TSV
-            self._wait_for_url_to_be_updated(sequence)
-
-            download_path = self.get_sequence_tsv()
-            util.download_url_to_file(sequence,
-                                      download_path,
-                                      self._maxretries,
-                                      self._retrysleep)
-
-            oldsequence = url + '/' + DataImportTask.OLDSEQUENCE_TSV
-            self._wait_for_url_to_be_updated(oldsequence)
+            manager = DownloadManager(self._maxparalleldownloads,
+                                      self._maxretries, self._retrysleep)
+            base_urls = {}
+            for (name, download_path) in tsv_files:
+                tsv_url = url + '/' + name
+                self._wait_for_url_to_be_updated(tsv_url)
+                base_urls[manager.add(tsv_url, download_path)] = url
 
-            download_path = self.get_oldsequence_tsv()
-            util.download_url_to_file(oldsequence,
-                                      download_path,
-                                      self._maxretries,
-                                      self._retrysleep)
-
-            crystal = url + '/' + DataImportTask.CRYSTALPH_TSV
-
-            self._wait_for_url_to_be_updated(crystal)
-            download_path = self.get_crystalph_tsv()
-            util.download_url_to_file(crystal,
-                                      download_path,
-                                      self._maxretries,
-                                      self._retrysleep)
-
-            url = self._args.compinchi
             download_path = self.get_components_inchi_file()
-            util.download_url_to_file(url +
-                                      '/' + DataImportTask.COMPINCHI_ICH,
-                                      download_path,
-                                      self._maxretries,
-                                      self._retrysleep)
-            return True
+            comp_download = manager.add(self._args.compinchi + '/' +
+                                        DataImportTask.COMPINCHI_ICH,
+                                        download_path)
+            base_urls[comp_download] = self._args.compinchi
+
+            manager.run()
+            self._download_summary = manager.get_summary()
+            failed = manager.get_failed_downloads()
+            if len(failed) == 0:
+                return True
+            url = base_urls[failed[0]]
+            download_path = failed[0].download_path
         except Exception:
             logger.exception('Caught Exception trying to download file(s)')
 
-            self.set_error('Unable to download file from ' +
-                           url + ' to ' + download_path)
-            # assess the result
-            self.end()
+        self.set_error('Unable to download file from ' +
+                       url + ' to ' + download_path)
+        # assess the result
+        self.end()
         return False
 
     def _download_participant_list_csv(self):
@@ -449,9 +488,13 @@ class DataImportTask(D3RTask):
 
            Downloads 3 files from url specified in `self._args.pdbfileurl`
            namely the ones mentioned in the constructor to get_dir() directory.
-           Each download will be retried up to self._maxretries time
-           which is set in constructor.  After which set_error()
-           will be set with message if file is still unable to be downloaded.
+           The files are downloaded at the same time and each download
+           will be retried, resuming where it left off when the server
+           supports it, up to self._maxretries time which is set in
+           constructor.  After which set_error() will be set with message
+           if file is still unable to be downloaded.
+           If `self._args.buildcomponentstore` is set, a component store
+           is then built from Components-inchi.ich.
            """
         super(DataImportTask, self).run()
 
@@ -487,6 +530,9 @@ class DataImportTask(D3RTask):
         # if its missing no biggy
         self._download_participant_list_csv()
 
+        if self._download_summary is not None:
+            self.append_to_email_log('\n' + self._download_summary + '\n')
+
         # Compare TSV files with pdb_seqres.txt file to see if there
         # are any duplicates issue #15
         try:
@@ -516,4 +562,6 @@ class DataImportTask(D3RTask):
 
         # Append internal standard
         self.append_standard_to_files()
+
+        self._build_component_store()
         self.end()
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import re
+import logging
+import threading
+import time
+import Queue
+import urllib2
+
+from d3r.celpp.util import DownloadError
+
+logger = logging.getLogger(__name__)
+
+
+class Download(object):
+    """Holds a url to download along with the result of the download
+    """
+    def __init__(self, url, download_path):
+        self.url = url
+        self.download_path = download_path
+        self.bytes_transferred = 0
+        self.duration = 0
+        self.resumed_from = 0
+        self.attempts = 0
+        self.error = None
+
+    def get_partial_path(self):
+        """Gets path data is written to until download completes
+        """
+        return self.download_path + DownloadManager.PARTIAL_SUFFIX
+
+    def get_validator_path(self):
+        """Gets path of file holding the ETag or Last-Modified value
+           of the response the partial file was started from
+        """
+        return self.get_partial_path() + DownloadManager.VALIDATOR_SUFFIX
+
+    def get_summary(self):
+        """Gets one line summary of download with throughput
+        """
+        if self.error is not None:
+            return (os.path.basename(self.download_path) + ' : failed after ' +
+                    str(self.attempts) + ' attempt(s) : ' + self.error)
+        line = ('%s : %d bytes in %.3f seconds (%.1f KB/s)' %
+                (os.path.basename(self.download_path),
+                 self.bytes_transferred, self.duration,
+                 self.bytes_transferred / max(self.duration, 0.001) /
+                 1024.0))
+        if self.resumed_from > 0:
+            line += ' resumed at byte ' + str(self.resumed_from)
+        return line
+
+
+class DownloadManager(object):
+    """Downloads a set of urls concurrently
+
+       Each url is streamed to a partial file next to its destination
+       which is renamed to the destination once the number of bytes
+       received matches the length reported by the server.  When a
+       transfer fails, or ends early, it is retried and, if a partial
+       file exists, an HTTP Range request is made for the remaining
+       bytes.  The ETag, or Last-Modified value if there is no strong
+       ETag, of the response is saved next to the partial file and sent
+       as If-Range so a file changed on the server is downloaded from
+       the start instead of appended to the old data.  Partial files
+       without a saved value are removed.  Servers that ignore the Range
+       header, and non http urls, get the whole file again.
+    """
+    PARTIAL_SUFFIX = '.part'
+    VALIDATOR_SUFFIX = '.validator'
+    CHUNK_SIZE = 1048576
+    CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+    def __init__(self, max_parallel_downloads=4, num_retries=3,
+                 retry_sleep_time_secs=1, timeout=60):
+        """Constructor
+
+           :param max_parallel_downloads: maximum number of urls to
+                                          download at once
+           :param num_retries: number of retries per url, 0 means none
+           :param retry_sleep_time_secs: seconds to wait between retries
+           :param timeout: socket timeout in seconds for each request
+        """
+        if max_parallel_downloads < 1:
+            max_parallel_downloads = 1
+        self._max_parallel_downloads = max_parallel_downloads
+        if num_retries is None:
+            num_retries = 0
+        self._num_retries = num_retries
+        if retry_sleep_time_secs is None:
+            retry_sleep_time_secs = 0
+        if retry_sleep_time_secs < 0:
+            raise DownloadError('retry sleep time cannot be negative')
+        self._retry_sleep_time_secs = retry_sleep_time_secs
+        self._timeout = timeout
+        self._downloads = []
+
+    def add(self, url, download_path):
+        """Adds `url` to be downloaded to `download_path` by `run`
+           :returns: `Download` object which will hold result
+           :raises: DownloadError if `url` or `download_path` is None
+        """
+        if url is None:
+            raise DownloadError('url is not set')
+        if download_path is None:
+            raise DownloadError('download_path is not set')
+        download = Download(url, download_path)
+        self._downloads.append(download)
+        return download
+
+    def get_downloads(self):
+        """Gets `Download` objects in order added
+        """
+        return self._downloads
+
+    def get_failed_downloads(self):
+        """Gets `Download` objects whose download failed in order added
+        """
+        return [d for d in self._downloads if d.error is not None]
+
+    def get_summary(self):
+        """Gets summary of `run` with one line per download
+        """
+        total_bytes = 0
+        for download in self._downloads:
+            total_bytes += download.bytes_transferred
+        summary = (str(len(self._downloads) -
+                       len(self.get_failed_downloads())) + ' of ' +
+                   str(len(self._downloads)) + ' files (' +
+                   str(total_bytes) + ' bytes) downloaded')
+        for download in self._downloads:
+            summary += '\n  ' + download.get_summary()
+        return summary
+
+    def _get_expected_size(self, resp, offset):
+        """Gets total size of file from response headers
+
+           :returns: tuple (offset data in response starts at, total size
+                     or None if server did not report one)
+           :raises: DownloadError if partial content does not start
+                    at `offset`
+        """
+        code = resp.getcode()
+        headers = resp.info()
+        if code == 206:
+            content_range = headers.getheader('Content-Range')
+            match = None
+            if content_range is not None:
+                match = DownloadManager.CONTENT_RANGE_RE.match(
+                    content_range.strip())
+            if match is None:
+                raise DownloadError('Invalid Content-Range in response: ' +
+                                    str(content_range))
+            if int(match.group(1)) != offset:
+                raise DownloadError('Server returned data starting at ' +
+                                    match.group(1) + ' instead of ' +
+                                    str(offset))
+            if match.group(3) == '*':
+                return offset, None
+            return offset, int(match.group(3))
+
+        content_length = headers.getheader('Content-Length')
+        if content_length is None:
+            return 0, None
+        return 0, int(content_length)
+
+    def _get_validator(self, resp):
+        """Gets strong ETag, or Last-Modified value, from response headers
+
+           :returns: string or None if response has neither
+        """
+        headers = resp.info()
+        etag = headers.getheader('ETag')
+        if etag is not None and not etag.strip().startswith('W/'):
+            return etag.strip()
+        last_modified = headers.getheader('Last-Modified')
+        if last_modified is not None:
+            return last_modified.strip()
+        return None
+
+    def _read_validator(self, download):
+        """Reads value saved by `_write_validator`
+
+           :returns: string or None if not saved
+        """
+        validator_path = download.get_validator_path()
+        if not os.path.isfile(validator_path):
+            return None
+        f = open(validator_path, 'r')
+        try:
+            validator = f.read().strip()
+        finally:
+            f.close()
+        if not validator:
+            return None
+        return validator
+
+    def _write_validator(self, download, validator):
+        """Saves `validator` next to partial file, removing any saved
+           value if `validator` is None
+        """
+        validator_path = download.get_validator_path()
+        if validator is None:
+            if os.path.isfile(validator_path):
+                os.unlink(validator_path)
+            return
+        f = open(validator_path, 'w')
+        try:
+            f.write(validator + '\n')
+        finally:
+            f.close()
+
+    def _remove_partial(self, download):
+        """Removes partial file and its saved validator
+        """
+        partial_path = download.get_partial_path()
+        if os.path.isfile(partial_path):
+            os.unlink(partial_path)
+        self._write_validator(download, None)
+
+    def _download_once(self, download):
+        """Makes one attempt to download `download.url`, resuming
+           from partial file if one exists
+
+           :returns: True if download is complete
+           :raises: Exception if download failed
+        """
+        partial_path = download.get_partial_path()
+        offset = 0
+        validator = None
+        if os.path.isfile(partial_path):
+            validator = self._read_validator(download)
+            if validator is None:
+                logger.debug('No ETag or Last-Modified saved for partial '
+                             'file of ' + download.url + ', removing it')
+                self._remove_partial(download)
+            else:
+                offset = os.path.getsize(partial_path)
+
+        req = urllib2.Request(download.url)
+        if offset > 0:
+            req.add_header('Range', 'bytes=' + str(offset) + '-')
+            req.add_header('If-Range', validator)
+        try:
+            resp = urllib2.urlopen(req, timeout=self._timeout)
+        except urllib2.HTTPError as e:
+            if e.code == 416 and offset > 0:
+                logger.debug('Range not satisfiable for ' + download.url +
+                             ', removing partial file')
+                self._remove_partial(download)
+                return False
+            raise
+
+        try:
+            start, total_size = self._get_expected_size(resp, offset)
+            resp_validator = self._get_validator(resp)
+            if start > 0:
+                if resp_validator is not None and resp_validator != validator:
+                    logger.debug(download.url + ' changed since partial file '
+                                 'was started, removing partial file')
+                    self._remove_partial(download)
+                    return False
+                logger.debug('Resuming download of ' + download.url +
+                             ' at byte ' + str(start))
+                download.resumed_from = start
+                mode = 'ab'
+            else:
+                download.resumed_from = 0
+                mode = 'wb'
+                self._write_validator(download, resp_validator)
+
+            f = open(partial_path, mode)
+            try:
+                while True:
+                    chunk = resp.read(DownloadManager.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    download.bytes_transferred += len(chunk)
+            finally:
+                f.close()
+        finally:
+            resp.close()
+
+        size = os.path.getsize(partial_path)
+        if total_size is not None and size != total_size:
+            raise DownloadError('Received ' + str(size) + ' of ' +
+                                str(total_size) + ' bytes from ' +
+                                download.url)
+        os.rename(partial_path, download.download_path)
+        self._write_validator(download, None)
+        return True
+
+    def _download(self, download):
+        """Downloads `download.url` retrying up to `num_retries` times
+           setting `download.error` if all attempts fail
+        """
+        start_time = time.time()
+        try:
+            while download.attempts <= self._num_retries:
+                logger.debug('Try # ' + str(download.attempts) + ' of ' +
+                             str(self._num_retries) + ' to download ' +
+                             download.download_path + ' from ' +
+                             download.url)
+                try:
+                    if self._download_once(download) is True:
+                        download.error = None
+                        return
+                    # partial file was removed, start over right away
+                    continue
+                except Exception as e:
+                    logger.exception('Caught exception trying to download ' +
+                                     download.url)
+                    download.error = str(e)
+                download.attempts += 1
+                if download.attempts <= self._num_retries:
+                    logger.debug('Download failed, sleeping ' +
+                                 str(self._retry_sleep_time_secs) +
+                                 ' seconds')
+                    time.sleep(self._retry_sleep_time_secs)
+        finally:
+            download.duration = time.time() - start_time
+
+    def _worker(self, download_queue):
+        while True:
+            try:
+                download = download_queue.get_nowait()
+            except Queue.Empty:
+                return
+            self._download(download)
+
+    def run(self):
+        """Downloads all urls added via `add` using up to
+           `max_parallel_downloads` threads
+
+           :returns: True if all downloads succeeded otherwise False,
+                     check `get_failed_downloads` for errors
+        """
+        download_queue = Queue.Queue()
+        for download in self._downloads:
+            download.bytes_transferred = 0
+            download.resumed_from = 0
+            download.attempts = 0
+            download.error = None
+            download_queue.put(download)
+
+        num_workers = min(self._max_parallel_downloads,
+                          len(self._downloads))
+        logger.debug('Downloading ' + str(len(self._downloads)) +
+                     ' files with ' + str(num_workers) + ' threads')
+        threads = []
+        for i in range(1, num_workers):
+            thread = threading.Thread(target=self._worker,
+                                      args=(download_queue,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        self._worker(download_queue)
+        for thread in threads:
+            thread.join()
+        return len(self.get_failed_downloads()) == 0
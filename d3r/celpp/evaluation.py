@@ -342,6 +342,7 @@ class EvaluationTask(D3RTask):
     FINAL_LOG = 'final.log'
     RMSD_TXT = 'RMSD.txt'
     RMSD_PICKLE = 'RMSD.pickle'
+    RMSD_JOURNAL = 'RMSD.journal'
     EXT_SUBMISSION_SUFFIX = '.extsubmission'
     SCORE_DIR = 'score'
     COMPLEX_SUFFIX = '_complex.pdb'
@@ -399,6 +400,34 @@ class EvaluationTask(D3RTask):
         """
         return os.path.join(self.get_dir(), EvaluationTask.RMSD_PICKLE)
 
+    def get_rmsd_journal(self):
+        """Returns full path to RMSD.journal file
+        :returns: full path to RMSD.journal file
+        """
+        return os.path.join(self.get_dir(), EvaluationTask.RMSD_JOURNAL)
+
+    def _compact_evaluation_journal(self):
+        """Writes RMSD.pickle, RMSD.csv and RMSD.txt from the RMSD.journal
+           left behind by an evaluation that did not finish, such as
+           one stopped by the evaluation timeout, so the results of the
+           targets it evaluated are summarized and uploaded
+        """
+        if not os.path.isfile(self.get_rmsd_journal()):
+            return
+        try:
+            from d3r import evaluate
+            finished = evaluate.compact_journal(self.get_dir())
+            self.append_to_email_log('Evaluation did not finish, wrote '
+                                     'results of ' + str(len(finished)) +
+                                     ' evaluated targets from ' +
+                                     EvaluationTask.RMSD_JOURNAL + '\n')
+        except Exception as e:
+            logger.exception('Caught exception compacting ' +
+                             self.get_rmsd_journal())
+            self.append_to_email_log('Unable to write results from ' +
+                                     EvaluationTask.RMSD_JOURNAL + ': ' +
+                                     str(e) + '\n')
+
     def get_evaluation_summary(self):
         """Parses RMSD.txt and generates human readable summary
         evaluating docking
@@ -488,6 +517,13 @@ class EvaluationTask(D3RTask):
             logger.exception('Caught exception looking for pbdid folders')
         return file_list
 
+    def get_dependencies(self):
+        """Returns docking task and `BlastNFilterTask` which
+           can_run() requires to be complete
+           :return: list of tasks
+        """
+        return [self._docktask, BlastNFilterTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -601,6 +637,16 @@ class EvaluationTask(D3RTask):
                       ' --challengedir ' + challdir +
                       ' --outdir ' + self.get_dir())
 
+        try:
+            numworkers = self.get_args().evaluationworkers
+            logger.debug('Setting evaluation workers to ' +
+                         str(numworkers))
+        except AttributeError:
+            numworkers = None
+
+        if numworkers is not None and numworkers > 1:
+            cmd_to_run += ' --numworkers ' + str(numworkers)
+
         eval_name = os.path.basename(self.get_args().evaluation)
 
         self.run_external_command(eval_name, cmd_to_run,
@@ -608,6 +654,8 @@ class EvaluationTask(D3RTask):
                                   timeout=evaltimeout,
                                   kill_delay=killdelay)
 
+        self._compact_evaluation_journal()
+
         # attempt to send evaluation email
         try:
             self._emailer.send_evaluation_email(self)
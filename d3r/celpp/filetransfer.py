@@ -4,6 +4,10 @@
 import logging
 import os
 import time
+import hashlib
+import threading
+import Queue
+from ftplib import error_perm
 from ftpretty import ftpretty
 import easywebdav
 
@@ -16,6 +20,141 @@ class InvalidFtpConfigException(Exception):
     pass
 
 
+class FtpConnectionPool(object):
+    """Pool of logged in ftp connections to a host
+
+       Connections released back to the pool are left open and handed
+       out again by `acquire` so a series of uploads, even by
+       different `FtpFileTransfer` objects, only pays for the connect
+       and login once.  Pools are shared per host, user and password
+       and obtained via `get_pool`.  Idle connections are checked
+       with a NOOP before being reused.
+    """
+    DEFAULT_MAX_IDLE = 8
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, host, user, password, timeout,
+                 max_idle=DEFAULT_MAX_IDLE):
+        """Constructor
+        """
+        self._host = host
+        self._user = user
+        self._password = password
+        self._timeout = timeout
+        self._max_idle = max_idle
+        self._idle = []
+        self._home_dirs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_pool(host, user, password, timeout):
+        """Gets shared pool for `host`, `user`, and `password`
+
+           :param timeout: connect timeout used if pool has to be created
+           :returns: FtpConnectionPool
+        """
+        key = (host, user, password)
+        with FtpConnectionPool._pools_lock:
+            pool = FtpConnectionPool._pools.get(key)
+            if pool is None:
+                pool = FtpConnectionPool(host, user, password, timeout)
+                FtpConnectionPool._pools[key] = pool
+            return pool
+
+    @staticmethod
+    def close_all():
+        """Closes idle connections of all shared pools and removes them
+        """
+        with FtpConnectionPool._pools_lock:
+            pools = list(FtpConnectionPool._pools.values())
+            FtpConnectionPool._pools = {}
+        for pool in pools:
+            pool.close()
+
+    def get_idle_count(self):
+        """Gets number of idle connections in pool
+        """
+        with self._lock:
+            return len(self._idle)
+
+    def _create_connection(self):
+        """Opens new ftpretty connection and records its
+           working directory which `release` returns it to
+        """
+        logger.debug('Opening ftp connection to ' + str(self._host) +
+                     ' with user ' + str(self._user))
+        con = ftpretty(self._host, self._user, self._password,
+                       timeout=self._timeout)
+        with self._lock:
+            self._home_dirs[id(con)] = con.pwd()
+        return con
+
+    def _close_connection(self, con):
+        with self._lock:
+            self._home_dirs.pop(id(con), None)
+        try:
+            con.close()
+        except:
+            logger.exception('Caught exception attempting to close '
+                             'connection')
+
+    def acquire(self):
+        """Gets an open connection from the pool, opening a new one
+           if none of the idle connections respond
+
+           :returns: ftpretty connection
+           :raises: Exception if a new connection could not be opened
+        """
+        while True:
+            with self._lock:
+                if len(self._idle) == 0:
+                    break
+                con = self._idle.pop()
+            try:
+                con.voidcmd('NOOP')
+                return con
+            except:
+                logger.debug('Idle ftp connection did not respond, '
+                             'discarding')
+                self._close_connection(con)
+        return self._create_connection()
+
+    def release(self, con, discard=False):
+        """Returns `con` to the pool
+
+           The connection is closed instead if `discard` is True, the
+           pool already holds the maximum number of idle connections,
+           or it cannot change back to its original working directory.
+        """
+        if con is None:
+            return
+        if discard is False:
+            with self._lock:
+                home_dir = self._home_dirs.get(id(con))
+                full = len(self._idle) >= self._max_idle
+            if home_dir is not None and not full:
+                try:
+                    con.cwd(home_dir)
+                    with self._lock:
+                        self._idle.append(con)
+                    return
+                except:
+                    logger.debug('Unable to reset working directory of '
+                                 'ftp connection, discarding')
+        self._close_connection(con)
+
+    def close(self):
+        """Closes all idle connections
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for con in idle:
+            self._close_connection(con)
+
+
 class FileTransfer(object):
     """FileTransfer
     """
@@ -26,6 +165,8 @@ class FileTransfer(object):
     CONTESTANTID = 'contestantid'
     CHALLENGEPATH = 'challengepath'
     SUBMISSIONPATH = 'submissionpath'
+    CONNECTIONS = 'connections'
+    VERIFYCHECKSUM = 'verifychecksum'
 
     def __init__(self, config):
         """Constructor
@@ -36,6 +177,11 @@ class FileTransfer(object):
         self._files_transferred = 0
         self._bytes_transferred = 0
         self._duration = 0
+        self._file_stats = []
+        self._max_connections = 1
+        self._verify_checksum = False
+        self._resume = True
+        self._retries = 2
         self._alt_ftp_con = None
         self._ftp_host = None
         self._ftp_user = None
@@ -64,6 +210,8 @@ class FileTransfer(object):
            contestantid <CELPP CONTESTANT ID>
            challengepath <BASE PATH ON REMOTE SERVER ie /challenge>
            submissionpath <BASE PATH ON REMOTE SERVER ie /submission>
+           connections <MAX PARALLEL CONNECTIONS FOR UPLOAD ie 4>
+           verifychecksum <true to compare md5 of uploaded files>
 
            Example:
 
@@ -76,8 +224,9 @@ class FileTransfer(object):
            submissionpath /usersubmissions
 
            The above format matches the standard used
-           by NCFTP with the exception of `path` and `contestantid`
-           which are custom to this class
+           by NCFTP with the exception of `path`, `contestantid`,
+           `challengepath`, `submissionpath`, `connections`, and
+           `verifychecksum` which are custom to this class and optional
 
            :param ftp_config: Path to ftp config file
            :raises IOError: If there was an error opening the file
@@ -106,6 +255,16 @@ class FileTransfer(object):
                     self.set_remote_challenge_dir(split_line[1].rstrip())
                 elif split_line[0] == FileTransfer.SUBMISSIONPATH:
                     self.set_remote_submission_dir(split_line[1].rstrip())
+                elif split_line[0] == FileTransfer.CONNECTIONS:
+                    try:
+                        self.set_max_connections(int(split_line[1]))
+                    except ValueError:
+                        logger.warning('Ignoring invalid ' +
+                                       FileTransfer.CONNECTIONS +
+                                       ' value: ' + split_line[1].rstrip())
+                elif split_line[0] == FileTransfer.VERIFYCHECKSUM:
+                    self.set_verify_checksum(
+                        split_line[1].rstrip().lower() == 'true')
 
         finally:
             if f is not None:
@@ -197,6 +356,43 @@ class FileTransfer(object):
     def set_connect_timeout(self, timeout):
         self._connect_timeout = timeout
 
+    def set_max_connections(self, max_connections):
+        """Sets maximum number of connections `upload_files` uses
+           to upload files in parallel.  Values less then 1 are set to 1
+        """
+        if max_connections < 1:
+            max_connections = 1
+        self._max_connections = max_connections
+
+    def get_max_connections(self):
+        return self._max_connections
+
+    def set_verify_checksum(self, verify_checksum):
+        """Sets whether `upload_files` compares md5 checksum of each
+           uploaded file with the local file
+        """
+        self._verify_checksum = verify_checksum
+
+    def get_verify_checksum(self):
+        return self._verify_checksum
+
+    def set_resume(self, resume):
+        """Sets whether `upload_files` resumes partially uploaded files
+        """
+        self._resume = resume
+
+    def get_resume(self):
+        return self._resume
+
+    def set_retries(self, retries):
+        """Sets number of times `upload_files` retries a failed upload
+           of a file before giving up
+        """
+        self._retries = retries
+
+    def get_retries(self):
+        return self._retries
+
     def get_connect_timeout(self):
         return self._connect_timeout
 
@@ -249,12 +445,32 @@ class FileTransfer(object):
         self._error_msg = 'upload_files not implemented'
         return False
 
+    def _get_file_stats_summary(self):
+        """Gets throughput of each file uploaded by previous
+           `upload_files` invocation, one file per line
+        """
+        summary = ''
+        for stat in sorted(self._file_stats):
+            (file, num_bytes, duration, offset, skipped) = stat
+            line = '\n  ' + file + ' : '
+            if skipped is True:
+                summary += line + 'already uploaded'
+                continue
+            line += ('%d bytes in %.3f seconds (%.1f KB/s)' %
+                     (num_bytes, duration,
+                      num_bytes / max(duration, 0.001) / 1024.0))
+            if offset > 0:
+                line += ' resumed at byte ' + str(offset)
+            summary += line
+        return summary
+
     def get_upload_summary(self):
         """Gets summary of previous `upload_files` invocation
 
             :returns: Human readable string summary of format
             # files (# bytes) files uploaded in # seconds to
-            host HOST:REMOTE_DIR
+            host HOST:REMOTE_DIR followed by a line per file uploaded
+            with its size, time, and throughput
         """
         summary = ''
         if self._error_msg is not None:
@@ -275,6 +491,7 @@ class FileTransfer(object):
                     ' bytes) files uploaded in ' +
                     str(self._duration) + ' seconds to host ' +
                     host + ':' + remote_dir)
+        summary += self._get_file_stats_summary()
         logger.debug('upload summary: ' + summary)
         return summary
 
@@ -286,19 +503,27 @@ class FtpFileTransfer(FileTransfer):
     def __init__(self, config):
         """Constructor
         """
+        self._pool = None
+        self._stats_lock = threading.Lock()
+        self._remote_dirs = set()
         super(FtpFileTransfer, self).__init__(config)
 
     def connect(self):
+        """Gets connection to ftp host from the `FtpConnectionPool`
+           shared by all `FtpFileTransfer` objects with the same
+           host, user, and password, unless `set_connection` was called
+           in which case that connection is used
+        """
         if self._alt_ftp_con is None:
             try:
 
                 logger.debug('Connecting to ' +
                              str(self.get_host()) + ' with user ' +
                              str(self.get_user()))
-                self._ftp = ftpretty(self.get_host(),
-                                     self.get_user(),
-                                     self.get_password(),
-                                     timeout=self.get_connect_timeout())
+                self._pool = FtpConnectionPool.get_pool(
+                    self.get_host(), self.get_user(), self.get_password(),
+                    self.get_connect_timeout())
+                self._ftp = self._pool.acquire()
                 return True
             except:
                 logger.exception('Unable to connect to ftp host')
@@ -308,6 +533,10 @@ class FtpFileTransfer(FileTransfer):
         return True
 
     def disconnect(self):
+        """Returns connection to the `FtpConnectionPool` it came from
+           leaving it open for the next `connect`.  Use
+           `FtpConnectionPool.close_all` to close pooled connections
+        """
         if self._ftp is None:
             logger.debug('ftp connection is None, just returning')
             return
@@ -316,6 +545,12 @@ class FtpFileTransfer(FileTransfer):
             logger.debug('external ftp connection used, skipping close')
             return
 
+        if self._pool is not None:
+            logger.debug('Returning ftp connection to pool')
+            self._pool.release(self._ftp)
+            self._ftp = None
+            return
+
         try:
             logger.debug('Attempting to close ftp connection')
             self._ftp.close()
@@ -559,11 +794,210 @@ class FtpFileTransfer(FileTransfer):
                                        os.sep + file)
         logger.debug('Uploading file: ' + file + ' to ' + remote_path)
 
+        start_time = time.time()
         size = self._ftp.put(file, remote_path)
 
         logger.debug('  Uploaded ' + str(size) + ' bytes')
-        self._bytes_transferred += size
-        self._files_transferred += 1
+        self._add_file_stat(file, size, time.time() - start_time, 0, False)
+
+    def _add_file_stat(self, file, num_bytes, duration, offset, skipped):
+        """Adds upload of `file` to totals and per file stats shown
+           by `get_upload_summary`.  Safe to call from multiple threads
+        """
+        with self._stats_lock:
+            self._bytes_transferred += num_bytes
+            self._files_transferred += 1
+            self._file_stats.append((file, num_bytes, duration, offset,
+                                     skipped))
+
+    def _make_remote_dirs(self, ftp, remote_dir):
+        """Creates `remote_dir` and its parents on the ftp server
+           skipping any already created during this `upload_files` call
+        """
+        path = ''
+        for directory in remote_dir.split('/'):
+            if directory == '':
+                continue
+            path = directory if path == '' else path + '/' + directory
+            with self._stats_lock:
+                if path in self._remote_dirs:
+                    continue
+            try:
+                ftp.mkd(path)
+            except error_perm:
+                # directory most likely exists already
+                pass
+            with self._stats_lock:
+                self._remote_dirs.add(path)
+
+    def _get_remote_size(self, ftp, remote_path):
+        """Gets size of `remote_path` on ftp server
+           :returns: size in bytes or None if file does not exist
+        """
+        try:
+            return ftp.size(remote_path)
+        except error_perm:
+            return None
+
+    def _get_remote_md5(self, ftp, remote_path):
+        """Computes md5 of `remote_path` by streaming it from
+           the ftp server
+        """
+        md5 = hashlib.md5()
+        ftp.retrbinary('RETR ' + remote_path, md5.update)
+        return md5.hexdigest()
+
+    def _get_local_md5(self, file):
+        md5 = hashlib.md5()
+        f = open(file, 'rb')
+        try:
+            for chunk in iter(lambda: f.read(1048576), b''):
+                md5.update(chunk)
+        finally:
+            f.close()
+        return md5.hexdigest()
+
+    def _put_file(self, ftp, file, remote_path):
+        """Uploads `file` to `remote_path` on ftp server
+
+           If `remote_path` is smaller then `file` and resume is
+           enabled only the remaining bytes are sent by way of REST.
+           If `remote_path` is the same size as `file` and checksum
+           verification is enabled the upload is skipped when the
+           md5 checksums match.  The size, and if enabled the md5, of
+           `remote_path` is compared with `file` after upload.
+
+           :param ftp: ftplib.FTP connection
+           :param remote_path: path relative to login directory
+           :returns: tuple (bytes sent, offset resumed from, skipped)
+           :raises IOError: if uploaded file does not match local file
+        """
+        local_size = os.path.getsize(file)
+        self._make_remote_dirs(ftp, os.path.dirname(remote_path))
+        ftp.voidcmd('TYPE I')
+        remote_size = self._get_remote_size(ftp, remote_path)
+        offset = 0
+        if remote_size is not None and self.get_resume() is True:
+            if remote_size == local_size and self.get_verify_checksum():
+                if (self._get_remote_md5(ftp, remote_path) ==
+                        self._get_local_md5(file)):
+                    logger.debug(remote_path + ' already uploaded')
+                    return 0, 0, True
+            elif 0 < remote_size < local_size:
+                logger.debug('Resuming upload of ' + file + ' at byte ' +
+                             str(remote_size))
+                offset = remote_size
+
+        f = open(file, 'rb')
+        try:
+            if offset > 0:
+                f.seek(offset)
+                ftp.storbinary('STOR ' + remote_path, f, rest=offset)
+            else:
+                ftp.storbinary('STOR ' + remote_path, f)
+        finally:
+            f.close()
+
+        remote_size = self._get_remote_size(ftp, remote_path)
+        if remote_size != local_size:
+            raise IOError('Size of ' + remote_path + ' (' +
+                          str(remote_size) + ') does not match size of ' +
+                          file + ' (' + str(local_size) + ')')
+        if self.get_verify_checksum():
+            if (self._get_remote_md5(ftp, remote_path) !=
+                    self._get_local_md5(file)):
+                raise IOError('md5 of ' + remote_path +
+                              ' does not match md5 of ' + file)
+        return local_size - offset, offset, False
+
+    def _upload_pooled_file(self, holder, file):
+        """Uploads `file` with connection in `holder[0]` retrying
+           up to `get_retries()` times on a fresh connection from the
+           pool, which resumes the partial upload.  `holder[0]` is
+           updated to the connection last used
+        """
+        remote_path = os.path.normpath(self.get_remote_dir() +
+                                       os.sep + file)
+        logger.debug('Uploading file: ' + file + ' to ' + remote_path)
+        attempt = 0
+        while True:
+            start_time = time.time()
+            try:
+                (num_bytes, offset,
+                 skipped) = self._put_file(holder[0].conn, file,
+                                           remote_path.lstrip('/'))
+                logger.debug('  Uploaded ' + str(num_bytes) + ' bytes')
+                self._add_file_stat(file, num_bytes,
+                                    time.time() - start_time, offset,
+                                    skipped)
+                return
+            except Exception:
+                attempt += 1
+                if attempt > self.get_retries():
+                    raise
+                logger.exception('Caught exception uploading ' + file +
+                                 ' retrying with new connection')
+                self._pool.release(holder[0], discard=True)
+                holder[0] = None
+                holder[0] = self._pool.acquire()
+
+    def _upload_worker(self, holder, file_queue, errors):
+        """Uploads files from `file_queue` until it is empty or an
+           upload by any worker fails, in which case the exception is
+           appended to `errors`.  If `holder[0]` is None a connection
+           is obtained from the pool
+        """
+        try:
+            while len(errors) == 0:
+                try:
+                    file = file_queue.get_nowait()
+                except Queue.Empty:
+                    return
+                if holder[0] is None:
+                    holder[0] = self._pool.acquire()
+                self._upload_pooled_file(holder, file)
+        except Exception as e:
+            logger.exception('Caught exception')
+            errors.append(e)
+
+    def _upload_files_in_parallel(self, list_of_files):
+        """Uploads files in `list_of_files` using up to
+           `get_max_connections()` connections from the pool at once.
+           The connection obtained by `connect` is used by the first
+           worker, the rest are returned to the pool when done.
+           :raises: Exception raised by first failed upload
+        """
+        file_queue = Queue.Queue()
+        for file in list_of_files:
+            if file is None:
+                logger.error('File passed in is None')
+                continue
+            if not os.path.isfile(file):
+                logger.warning(file + ' is not a file')
+                continue
+            file_queue.put(file)
+
+        num_workers = min(self.get_max_connections(), file_queue.qsize())
+        self._remote_dirs = set()
+        errors = []
+        holders = [[self._ftp]]
+        threads = []
+        for i in range(1, num_workers):
+            holder = [None]
+            holders.append(holder)
+            thread = threading.Thread(target=self._upload_worker,
+                                      args=(holder, file_queue, errors))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        self._upload_worker(holders[0], file_queue, errors)
+        for thread in threads:
+            thread.join()
+        self._ftp = holders[0][0]
+        for holder in holders[1:]:
+            self._pool.release(holder[0])
+        if len(errors) > 0:
+            raise errors[0]
 
     def upload_files(self, list_of_files):
         """Uploads files in `list_of_files` to ftp server
@@ -587,18 +1021,27 @@ class FtpFileTransfer(FileTransfer):
            /home/joe/data.2 => /foo/home/joe/data.2
            /var/blah.txt => /foo/var/blah.txt
 
-           ftpretty is used for ftp upload and it makes
-           sure the directories exist on remote server
-           before uploading.
+           Directories are created on the remote server as
+           needed before uploading.
+
+           If `connect` obtained its connection from the
+           `FtpConnectionPool` then up to `get_max_connections()`
+           files are uploaded at once.  A failed upload is retried
+           on a new connection `get_retries()` times resuming from
+           the bytes already on the server and each uploaded file is
+           checked by size, and by md5 if `get_verify_checksum()`
+           is True.  Otherwise, files are uploaded one at a time
+           with put() on the connection passed to `set_connection`.
 
            This method will return False as soon as an
-           ftp upload raises an exception.
+           ftp upload fails.
 
            :returns: True upon success, False otherwise
         """
         self._error_msg = None
         self._bytes_transferred = 0
         self._files_transferred = 0
+        self._file_stats = []
         start_time = int(time.time())
         try:
             if list_of_files is None:
@@ -613,8 +1056,11 @@ class FtpFileTransfer(FileTransfer):
 
             try:
                 logger.debug('Uploading ' + str(len(list_of_files)) + ' files')
-                for file in list_of_files:
-                    self._upload_file(file)
+                if self._pool is not None and self._alt_ftp_con is None:
+                    self._upload_files_in_parallel(list_of_files)
+                else:
+                    for file in list_of_files:
+                        self._upload_file(file)
             except:
                 logger.exception('Caught exception')
                 self._error_msg = 'Error during upload'
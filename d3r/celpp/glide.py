@@ -73,6 +73,13 @@ class GlideTask(D3RTask):
             logger.exception('Caught exception looking for pbdid folders')
         return file_list
 
+    def get_dependencies(self):
+        """Returns `ProteinLigPrepTask` which can_run() requires
+           to be complete
+           :return: list of tasks
+        """
+        return [ProteinLigPrepTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -149,6 +156,15 @@ class GlideTask(D3RTask):
                       proteinligprep.get_dir() +
                       ' --outdir ' + self.get_dir())
 
+        try:
+            numworkers = self.get_args().glideworkers
+            logger.debug('Setting glide workers to ' + str(numworkers))
+        except AttributeError:
+            numworkers = None
+
+        if numworkers is not None and numworkers > 1:
+            cmd_to_run += ' --numworkers ' + str(numworkers)
+
         glide_name = os.path.basename(self.get_args().glide)
 
         self.run_external_command(glide_name, cmd_to_run,
@@ -3,6 +3,10 @@
 __author__ = 'churas'
 
 import os.path
+import re
+import json
+import struct
+import hashlib
 import logging
 import time
 from d3r.celpp.task import D3RTask
@@ -16,10 +20,37 @@ class MakeBlastDBTask(D3RTask):
 
        Downloads pdb_seqres.txt from rcsb, gunzips it and
        runs NCBI makeblastdb to generate a blast database
+
+       If incremental mode is enabled, via makeblastdbincremental
+       argument, the new pdb_seqres.txt is compared with the
+       pdb_seqres.txt of the last full build and makeblastdb is only
+       run on the new and changed sequences.  The resulting delta
+       database is combined with the database of the last full build
+       through a BLAST alias database named pdb_db, with the removed
+       and changed sequences of the full build excluded by an OID mask.
+       A full build is done every makeblastdbfullrebuild weeks or
+       whenever the last full build can not be used.
        """
 
     PDB_SEQRES_TXT = "pdb_seqres.txt"
     PDB_SEQRES_TXT_GZ = (PDB_SEQRES_TXT + ".gz")
+    PDB_SEQRES_DELTA_TXT = "pdb_seqres_delta.txt"
+
+    PDB_DB = 'pdb_db'
+    PDB_DB_BASE = 'pdb_db_base'
+    PDB_DB_DELTA = 'pdb_db_delta'
+
+    # json file recording how the database was built
+    SUMMARY_FILE = 'makeblastdb.summary'
+
+    FULL_MODE = 'full'
+    INCREMENTAL_MODE = 'incremental'
+
+    # weeks between full builds in incremental mode
+    DEFAULT_FULL_REBUILD_WEEKS = 4
+
+    # makeblastdb reports the number of sequences it added with this message
+    ADDED_SEQUENCES_RE = re.compile(r'added (\d+) sequences')
 
     # PDBID codes are currently 4 characters so plus 1 is 5
     LENGTH_OF_PDBID_PLUS_ONE = 5
@@ -70,6 +101,147 @@ class MakeBlastDBTask(D3RTask):
         """
         return os.path.join(self.get_dir(), MakeBlastDBTask.PDB_SEQRES_TXT)
 
+    def get_pdb_db(self):
+        """Returns path to pdb_db blast database
+        :return: full path to MakeBlastDBTask.PDB_DB database
+        """
+        return os.path.join(self.get_dir(), MakeBlastDBTask.PDB_DB)
+
+    def get_pdb_seqres_delta_txt(self):
+        """Returns path to pdb_seqres_delta.txt file
+        :return: full path to MakeBlastDBTask.PDB_SEQRES_DELTA_TXT file
+        """
+        return os.path.join(self.get_dir(),
+                            MakeBlastDBTask.PDB_SEQRES_DELTA_TXT)
+
+    def get_summary_file(self):
+        """Returns path to makeblastdb.summary file
+        :return: full path to MakeBlastDBTask.SUMMARY_FILE file
+        """
+        return os.path.join(self.get_dir(), MakeBlastDBTask.SUMMARY_FILE)
+
+    def get_summary(self):
+        """Gets the summary of the build written by run()
+
+           The summary is a dict with these keys
+
+           mode - MakeBlastDBTask.FULL_MODE or INCREMENTAL_MODE
+           reason - why mode was chosen
+           seconds - time in seconds it took to build database
+           sequence_count - number of sequences in pdb_seqres.txt
+           residue_count - number of residues in pdb_seqres.txt
+           makeblastdb_sequence_count - number of sequences makeblastdb
+                                        reported adding or None
+           base_db - path to database of last full build
+           base_seqres - path to pdb_seqres.txt of last full build
+           weeks_since_full - 0 for full build otherwise number of
+                              weeks since base_db was built
+           delta_count - number of new or changed sequences
+           masked_count - number of sequences of base_db excluded
+
+           :returns: dict or None if file does not exist or can not
+                     be parsed
+        """
+        summary_file = self.get_summary_file()
+        if not os.path.isfile(summary_file):
+            return None
+        try:
+            f = open(summary_file, 'r')
+            try:
+                return json.load(f)
+            finally:
+                f.close()
+        except Exception:
+            logger.exception('Unable to parse ' + summary_file)
+        return None
+
+    def _write_summary(self, summary):
+        """Writes `summary` dict to get_summary_file() as json
+        """
+        f = open(self.get_summary_file(), 'w')
+        try:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+    @staticmethod
+    def read_fasta_entries(fasta):
+        """Generator that reads fasta file
+
+           :param fasta: path to fasta file
+           :returns: tuples of (id, defline, sequence) where id is
+                     the first word of the defline without the > and
+                     the sequence has all line breaks removed
+        """
+        f = open(fasta, 'r')
+        try:
+            defline = None
+            seq = []
+            for line in f:
+                if line.startswith('>'):
+                    if defline is not None:
+                        yield (defline[1:].split()[0], defline,
+                               ''.join(seq))
+                    defline = line.rstrip('\n')
+                    seq = []
+                elif defline is not None:
+                    seq.append(line.strip())
+            if defline is not None:
+                yield (defline[1:].split()[0], defline, ''.join(seq))
+        finally:
+            f.close()
+
+    @staticmethod
+    def _get_entry_digest(defline, seq):
+        return hashlib.md5(defline + '\n' + seq).digest()
+
+    @staticmethod
+    def write_oid_mask(mask_file, included):
+        """Writes BLAST OID mask file
+
+           Format is number of OIDs as 4 byte big endian unsigned
+           integer followed by a bit per OID, with the most significant
+           bit of the first byte set if OID 0 is included
+           :param mask_file: path to write to
+           :param included: list of booleans one per OID
+        """
+        bits = bytearray((len(included) + 7) // 8)
+        for oid, keep in enumerate(included):
+            if keep:
+                bits[oid // 8] |= 0x80 >> (oid % 8)
+        f = open(mask_file, 'wb')
+        try:
+            f.write(struct.pack('>I', len(included)))
+            f.write(str(bits))
+        finally:
+            f.close()
+
+    @staticmethod
+    def write_alias_file(alias_file, title, dblist, nseq, length,
+                         oidlist=None):
+        """Writes BLAST protein alias file (.pal)
+
+           :param alias_file: path to write to
+           :param title: title of database
+           :param dblist: list of databases to combine, either absolute
+                          or relative to the directory of `alias_file`
+           :param nseq: number of sequences in the combined database
+           :param length: number of residues in the combined database
+           :param oidlist: optional OID mask file name
+        """
+        f = open(alias_file, 'w')
+        try:
+            f.write('#\n# Alias file created by ' +
+                    MakeBlastDBTask.__name__ + '\n#\n')
+            f.write('TITLE ' + title + '\n')
+            f.write('DBLIST ' + ' '.join(dblist) + '\n')
+            if oidlist is not None:
+                f.write('OIDLIST ' + oidlist + '\n')
+            f.write('NSEQ ' + str(nseq) + '\n')
+            f.write('LENGTH ' + str(length) + '\n')
+        finally:
+            f.close()
+
     def _get_sequence_count_message(self):
         """Returns number of fasta sequences in get_pdb_seqres_txt() file
 
@@ -173,12 +345,228 @@ class MakeBlastDBTask(D3RTask):
         self._can_run = True
         return True
 
+    def _get_incremental_base(self):
+        """Finds full build to use as base for incremental build
+
+           :returns: tuple (base dict, reason) where base dict has
+                     base_db, base_seqres and weeks_since_full keys or
+                     is None if a full build is needed and reason is
+                     a human readable explanation
+        """
+        try:
+            if self.get_args().makeblastdbincremental is not True:
+                return None, 'incremental mode not enabled'
+        except AttributeError:
+            return None, 'incremental mode not enabled'
+
+        try:
+            full_rebuild_weeks = int(self.get_args().makeblastdbfullrebuild)
+        except (AttributeError, TypeError, ValueError):
+            full_rebuild_weeks = MakeBlastDBTask.DEFAULT_FULL_REBUILD_WEEKS
+
+        prev_week = util.find_previous_weekly_dataset(self.get_path())
+        if prev_week is None:
+            return None, 'no previous week found'
+
+        prev_task = MakeBlastDBTask(prev_week, self.get_args())
+        prev_task.update_status_from_filesystem()
+        if prev_task.get_status() != D3RTask.COMPLETE_STATUS:
+            return None, (prev_task.get_dir() + ' is not complete')
+
+        prev_summary = prev_task.get_summary()
+        if prev_summary is None:
+            return None, ('no ' + MakeBlastDBTask.SUMMARY_FILE +
+                          ' found in ' + prev_task.get_dir())
+
+        if prev_summary.get('mode') == MakeBlastDBTask.FULL_MODE:
+            if (prev_summary.get('makeblastdb_sequence_count') !=
+                    prev_summary.get('sequence_count')):
+                return None, ('number of sequences in ' +
+                              prev_task.get_pdb_db() + ' could not be '
+                              'verified')
+            base = {'base_db': prev_task.get_pdb_db(),
+                    'base_seqres': prev_task.get_pdb_seqres_txt(),
+                    'weeks_since_full': 1}
+        else:
+            base = {'base_db': prev_summary.get('base_db'),
+                    'base_seqres': prev_summary.get('base_seqres'),
+                    'weeks_since_full':
+                        int(prev_summary.get('weeks_since_full', 0)) + 1}
+
+        if base['weeks_since_full'] >= full_rebuild_weeks:
+            return None, ('periodic full rebuild after ' +
+                          str(base['weeks_since_full']) + ' weeks')
+
+        if base['base_db'] is None or \
+                not os.path.isfile(base['base_db'] + '.pin'):
+            return None, ('base database ' + str(base['base_db']) +
+                          ' not found')
+
+        if base['base_seqres'] is None or \
+                not os.path.isfile(base['base_seqres']):
+            return None, ('base sequence file ' + str(base['base_seqres']) +
+                          ' not found')
+        return base, ('diffed against full build ' + base['base_db'])
+
+    def _get_added_sequence_count(self, makeblastdb_name):
+        """Parses number of sequences added from makeblastdb standard out
+        :returns: number of sequences or None if not found
+        """
+        stdout_file = os.path.join(self.get_dir(), makeblastdb_name +
+                                   D3RTask.STDOUT_SUFFIX)
+        if not os.path.isfile(stdout_file):
+            return None
+        f = open(stdout_file, 'r')
+        try:
+            match = MakeBlastDBTask.ADDED_SEQUENCES_RE.search(f.read())
+        finally:
+            f.close()
+        if match is None:
+            return None
+        return int(match.group(1))
+
+    def _run_full_build(self, summary):
+        """Runs makeblastdb on get_pdb_seqres_txt()
+        :returns: exit code of makeblastdb
+        """
+        cmd_to_run = (self.get_args().makeblastdb + ' -in ' +
+                      self.get_pdb_seqres_txt() +
+                      ' -out ' + self.get_pdb_db() +
+                      ' -dbtype prot')
+
+        makeblastdb_name = os.path.basename(self.get_args().makeblastdb)
+
+        returncode = self.run_external_command(makeblastdb_name,
+                                               cmd_to_run, True)
+        seq_count = 0
+        res_count = 0
+        for entry_id, defline, seq in MakeBlastDBTask.read_fasta_entries(
+                self.get_pdb_seqres_txt()):
+            seq_count += 1
+            res_count += len(seq)
+        summary['mode'] = MakeBlastDBTask.FULL_MODE
+        summary['sequence_count'] = seq_count
+        summary['residue_count'] = res_count
+        summary['makeblastdb_sequence_count'] = \
+            self._get_added_sequence_count(makeblastdb_name)
+        summary['base_db'] = None
+        summary['base_seqres'] = None
+        summary['weeks_since_full'] = 0
+        summary['delta_count'] = None
+        summary['masked_count'] = None
+        return returncode
+
+    def _run_incremental_build(self, base, summary):
+        """Builds delta database and alias combining it with base
+
+           The sequences of base['base_seqres'] are compared with
+           get_pdb_seqres_txt() by id, defline and sequence.  Sequences
+           of the base that are unchanged are kept via an OID mask, the
+           OIDs of the base being the order of its sequences, and the
+           new and changed sequences are written to
+           get_pdb_seqres_delta_txt() and put in a delta database
+           :returns: True upon success otherwise False
+        """
+        new_entries = {}
+        seq_count = 0
+        res_count = 0
+        for entry_id, defline, seq in MakeBlastDBTask.read_fasta_entries(
+                self.get_pdb_seqres_txt()):
+            new_entries[entry_id] = MakeBlastDBTask._get_entry_digest(defline,
+                                                                      seq)
+            seq_count += 1
+            res_count += len(seq)
+
+        if len(new_entries) != seq_count:
+            logger.warning(self.get_pdb_seqres_txt() + ' has duplicate '
+                           'ids, unable to diff')
+            return False
+
+        included = []
+        base_res_count = 0
+        for entry_id, defline, seq in MakeBlastDBTask.read_fasta_entries(
+                base['base_seqres']):
+            digest = MakeBlastDBTask._get_entry_digest(defline, seq)
+            if new_entries.get(entry_id) == digest:
+                del new_entries[entry_id]
+                included.append(True)
+                base_res_count += len(seq)
+            else:
+                included.append(False)
+
+        delta_res_count = 0
+        f = open(self.get_pdb_seqres_delta_txt(), 'w')
+        try:
+            for entry_id, defline, seq in MakeBlastDBTask.read_fasta_entries(
+                    self.get_pdb_seqres_txt()):
+                if entry_id in new_entries:
+                    f.write(defline + '\n' + seq + '\n')
+                    delta_res_count += len(seq)
+        finally:
+            f.close()
+
+        delta_count = len(new_entries)
+        kept_count = included.count(True)
+        dblist = []
+        if kept_count > 0:
+            mask_file = os.path.join(self.get_dir(),
+                                     MakeBlastDBTask.PDB_DB_BASE + '.msk')
+            MakeBlastDBTask.write_oid_mask(mask_file, included)
+            MakeBlastDBTask.write_alias_file(
+                os.path.join(self.get_dir(),
+                             MakeBlastDBTask.PDB_DB_BASE + '.pal'),
+                MakeBlastDBTask.PDB_DB_BASE, [base['base_db']],
+                kept_count, base_res_count,
+                oidlist=os.path.basename(mask_file))
+            dblist.append(MakeBlastDBTask.PDB_DB_BASE)
+
+        if delta_count > 0:
+            makeblastdb_name = os.path.basename(self.get_args().makeblastdb)
+            cmd_to_run = (self.get_args().makeblastdb + ' -in ' +
+                          self.get_pdb_seqres_delta_txt() +
+                          ' -out ' +
+                          os.path.join(self.get_dir(),
+                                       MakeBlastDBTask.PDB_DB_DELTA) +
+                          ' -dbtype prot')
+            if self.run_external_command(makeblastdb_name,
+                                         cmd_to_run, False) != 0:
+                return False
+            added = self._get_added_sequence_count(makeblastdb_name)
+            if added is not None and added != delta_count:
+                logger.warning('makeblastdb added ' + str(added) +
+                               ' sequences, expected ' + str(delta_count))
+                return False
+            dblist.append(MakeBlastDBTask.PDB_DB_DELTA)
+
+        if not dblist:
+            logger.warning(self.get_pdb_seqres_txt() + ' has no sequences')
+            return False
+
+        MakeBlastDBTask.write_alias_file(
+            os.path.join(self.get_dir(), MakeBlastDBTask.PDB_DB + '.pal'),
+            MakeBlastDBTask.PDB_DB, dblist, seq_count, res_count)
+
+        summary['mode'] = MakeBlastDBTask.INCREMENTAL_MODE
+        summary['sequence_count'] = seq_count
+        summary['residue_count'] = res_count
+        summary['makeblastdb_sequence_count'] = None
+        summary['base_db'] = base['base_db']
+        summary['base_seqres'] = base['base_seqres']
+        summary['weeks_since_full'] = base['weeks_since_full']
+        summary['delta_count'] = delta_count
+        summary['masked_count'] = included.count(False)
+        return True
+
     def run(self):
         """Generates pdb blast database
 
            First downloads pdb_seqres.txt.gz file from rcsb ftp,
            then gunzips file, and finally runs makeblastdb
-           on file to generate blast database
+           on file to generate blast database.  In incremental mode
+           makeblastdb is only run on new and changed sequences if
+           a usable full build from a previous week is found.  How the
+           database was built is written to get_summary_file() and
+           appended to the email log.
         """
         super(MakeBlastDBTask, self).run()
 
@@ -229,17 +617,40 @@ class MakeBlastDBTask(D3RTask):
             self.end()
             return
 
-        # Run makeblastdb
-        cmd_to_run = (self.get_args().makeblastdb + ' -in ' +
-                      self.get_pdb_seqres_txt() +
-                      ' -out ' + os.path.join(self.get_dir(), 'pdb_db') +
-                      ' -dbtype prot')
-
-        makeblastdb_name = os.path.basename(self.get_args().makeblastdb)
-
-        self.run_external_command(makeblastdb_name, cmd_to_run, True)
+        start_time = time.time()
+        summary = {}
+        built = False
+        base, reason = self._get_incremental_base()
+        if base is not None:
+            try:
+                built = self._run_incremental_build(base, summary)
+            except Exception:
+                logger.exception('Caught exception running incremental '
+                                 'build')
+            if built is False:
+                reason = ('incremental build failed, falling back to full '
+                          'build')
+                logger.warning(reason)
+
+        if built is False:
+            self._run_full_build(summary)
+
+        summary['reason'] = reason
+        summary['seconds'] = round(time.time() - start_time, 3)
+        try:
+            self._write_summary(summary)
+        except IOError:
+            logger.exception('Unable to write ' + self.get_summary_file())
 
         self.append_to_email_log('\n' + self._get_sequence_count_message() +
                                  '\n')
+        self.append_to_email_log('Database build: ' + summary['mode'] +
+                                 ' (' + reason + ') took ' +
+                                 str(summary['seconds']) + ' seconds\n')
+        if summary['mode'] == MakeBlastDBTask.INCREMENTAL_MODE:
+            self.append_to_email_log('# new or changed sequence(s): ' +
+                                     str(summary['delta_count']) +
+                                     '\n# masked sequence(s) in base: ' +
+                                     str(summary['masked_count']) + '\n')
         # assess the result
         self.end()
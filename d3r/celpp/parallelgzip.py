@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import tarfile
+import multiprocessing
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = '\037\213'
+
+# size of uncompressed blocks handed to worker threads
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# gzip header os field, unix
+GZIP_OS_UNIX = 3
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _compress_block(args):
+    """Compresses a block as raw deflate data that can be concatenated
+       with the other blocks of the stream
+
+       Every block but the last ends with a sync flush which leaves the
+       output on a byte boundary without marking the end of the stream.
+       The last block is finished which marks the end of the stream.
+       Blocks do not refer back to earlier blocks so each one can be
+       compressed on its own
+    """
+    data, compresslevel, last = args
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED,
+                                  -zlib.MAX_WBITS)
+    if last:
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipFile(object):
+    """Write only file object that gzip compresses data written to it
+       using several threads
+
+       Data is split into blocks of `block_size` bytes which are
+       deflated by a pool of threads, zlib releases the interpreter
+       lock while compressing, and written out in order.  The result
+       is a single member gzip file with the usual header, crc32 and
+       size trailer, readable by gunzip, the gzip module and
+       tarfile.  Compression ratio is a bit lower than a single
+       stream because blocks do not share history.
+
+       The SHA-256 of the compressed bytes written is available from
+       `get_sha256_hexdigest` after `close`
+    """
+    def __init__(self, filename, compresslevel=9,
+                 block_size=DEFAULT_BLOCK_SIZE, threads=None):
+        """Constructor
+        :param filename: path of gzip file to write
+        :param compresslevel: zlib compression level 1-9
+        :param block_size: bytes of uncompressed data per block
+        :param threads: number of compression threads, None
+                        means number of cpus
+        :raises IOError: if `filename` cannot be opened for writing
+        """
+        self._fileobj = open(filename, 'wb')
+        self.name = filename
+        self._compresslevel = compresslevel
+        self._block_size = block_size
+        if threads is None:
+            threads = multiprocessing.cpu_count()
+        self._threads = max(threads, 1)
+        self._pool = ThreadPool(self._threads)
+        self._pending = deque()
+        self._buffer = []
+        self._buffer_len = 0
+        self._crc = zlib.crc32('')
+        self._size = 0
+        self._compressed_size = 0
+        self._sha256 = hashlib.sha256()
+        self.closed = False
+        self._write_raw(GZIP_MAGIC + '\010\000' +
+                        struct.pack('<L', long(time.time())) +
+                        '\000' + chr(GZIP_OS_UNIX))
+
+    def _write_raw(self, data):
+        self._fileobj.write(data)
+        self._sha256.update(data)
+        self._compressed_size += len(data)
+
+    def _drain(self, max_pending):
+        """Writes out compressed blocks, in order, until at most
+           `max_pending` blocks are still being compressed
+        """
+        while len(self._pending) > max_pending:
+            self._write_raw(self._pending.popleft().get())
+
+    def _submit(self, data, last):
+        self._pending.append(self._pool.apply_async(
+            _compress_block, ((data, self._compresslevel, last),)))
+        # bound memory held by blocks waiting to be written
+        self._drain(2 * self._threads)
+
+    def write(self, data):
+        """Compresses `data` into file
+        """
+        if self.closed:
+            raise ValueError('write on closed file')
+        if not data:
+            return
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer.append(data)
+        self._buffer_len += len(data)
+        if self._buffer_len < self._block_size:
+            return
+        data = ''.join(self._buffer)
+        offset = 0
+        while len(data) - offset >= self._block_size:
+            self._submit(data[offset:offset + self._block_size], False)
+            offset += self._block_size
+        self._buffer = [data[offset:]]
+        self._buffer_len = len(data) - offset
+
+    def tell(self):
+        """Gets number of uncompressed bytes written
+        """
+        return self._size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Compresses remaining data, writes gzip trailer and
+           closes file
+        """
+        if self.closed:
+            return
+        try:
+            self._submit(''.join(self._buffer), True)
+            self._buffer = []
+            self._drain(0)
+            self._write_raw(struct.pack('<L', self._crc & 0xffffffffL) +
+                            struct.pack('<L', self._size & 0xffffffffL))
+        finally:
+            self.closed = True
+            self._pool.close()
+            self._pool.join()
+            self._fileobj.close()
+
+    def get_size(self):
+        """Gets number of uncompressed bytes written
+        """
+        return self._size
+
+    def get_compressed_size(self):
+        """Gets number of bytes written to file
+        """
+        return self._compressed_size
+
+    def get_sha256_hexdigest(self):
+        """Gets SHA-256 of bytes written to file
+        """
+        return self._sha256.hexdigest()
+
+
+class _HashingReader(object):
+    """Wraps a file object updating a SHA-256 with data read from it
+    """
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._sha256.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+
+class ParallelTarGzWriter(object):
+    """Writes a tar.gz file through `ParallelGzipFile` recording
+       the SHA-256 of every regular file as it is streamed into the
+       archive
+
+       The manifest lines, in the format written by sha256sum, are
+       available from `get_manifest` and the SHA-256 of the
+       compressed archive from `get_sha256_hexdigest` after `close`
+    """
+    def __init__(self, filename, compresslevel=9,
+                 block_size=DEFAULT_BLOCK_SIZE, threads=None):
+        self._gz = ParallelGzipFile(filename, compresslevel=compresslevel,
+                                    block_size=block_size, threads=threads)
+        self._tar = tarfile.open(fileobj=self._gz, mode='w|',
+                                 bufsize=READ_CHUNK_SIZE)
+        self._manifest = []
+
+    def add(self, path, arcname):
+        """Adds `path` to archive as `arcname`, directories are
+           added recursively in sorted order
+        """
+        tarinfo = self._tar.gettarinfo(path, arcname)
+        if tarinfo is None:
+            logger.warning('Skipping unsupported file type: ' + path)
+            return
+        if tarinfo.isreg():
+            f = open(path, 'rb')
+            try:
+                reader = _HashingReader(f)
+                self._tar.addfile(tarinfo, reader)
+            finally:
+                f.close()
+            self._manifest.append(reader.hexdigest() + '  ' + arcname)
+            return
+        self._tar.addfile(tarinfo)
+        if tarinfo.isdir():
+            for entry in sorted(os.listdir(path)):
+                self.add(os.path.join(path, entry), arcname + '/' + entry)
+
+    def close(self):
+        """Finishes archive and closes file
+        """
+        try:
+            self._tar.close()
+        finally:
+            self._gz.close()
+
+    def get_manifest(self):
+        """Gets list of 'sha256  arcname' lines for regular files added
+        """
+        return self._manifest
+
+    def get_size(self):
+        """Gets size of uncompressed tar stream
+        """
+        return self._gz.get_size()
+
+    def get_compressed_size(self):
+        """Gets size of tar.gz file
+        """
+        return self._gz.get_compressed_size()
+
+    def get_sha256_hexdigest(self):
+        """Gets SHA-256 of tar.gz file
+        """
+        return self._gz.get_sha256_hexdigest()
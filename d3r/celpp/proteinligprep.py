@@ -68,6 +68,13 @@ class ProteinLigPrepTask(D3RTask):
             logger.exception('Caught exception looking for pbdid folders')
         return file_list
 
+    def get_dependencies(self):
+        """Returns `ChallengeDataTask` which can_run() requires
+           to be complete
+           :return: list of tasks
+        """
+        return [ChallengeDataTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -108,6 +115,26 @@ class ProteinLigPrepTask(D3RTask):
         self._can_run = True
         return True
 
+    def _get_workers_args(self):
+        """Gets --ligandworkers and --proteinworkers arguments for script
+
+           Arguments are only returned if prepligandworkers or
+           prepproteinworkers is greater then 1
+           :return: string with leading space or empty string
+        """
+        try:
+            ligand_workers = self.get_args().prepligandworkers
+        except AttributeError:
+            ligand_workers = 1
+        try:
+            protein_workers = self.get_args().prepproteinworkers
+        except AttributeError:
+            protein_workers = 1
+        if ligand_workers <= 1 and protein_workers <= 1:
+            return ''
+        return (' --ligandworkers ' + str(ligand_workers) +
+                ' --proteinworkers ' + str(protein_workers))
+
     def run(self):
         """Runs ProteinLigPrepTask after verifying ChallengeDataTask was good
 
@@ -157,6 +184,8 @@ class ProteinLigPrepTask(D3RTask):
 
         proteinligprep_name = os.path.basename(self.get_args().proteinligprep)
 
+        cmd_to_run += self._get_workers_args()
+
         self.run_external_command(proteinligprep_name, cmd_to_run,
                                   True)
         # assess the result
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import logging
+import threading
+import Queue
+
+logger = logging.getLogger(__name__)
+
+
+class TaskNode(object):
+    """Holds a task along with its place in the dependency graph
+       built by `TaskScheduler`
+    """
+    WAITING = 'waiting'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+    def __init__(self, task, stage):
+        self.task = task
+        self.stage = stage
+        self.dependencies = []
+        self.state = TaskNode.WAITING
+
+    def is_finished(self):
+        return self.state in (TaskNode.DONE, TaskNode.FAILED,
+                              TaskNode.SKIPPED)
+
+
+class StageEntry(object):
+    """Holds the lock and task nodes of a stage run by `TaskScheduler`
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lock = None
+        self.nodes = []
+        self.released = False
+
+    def is_finished(self):
+        for node in self.nodes:
+            if not node.is_finished():
+                return False
+        return True
+
+
+class TaskScheduler(object):
+    """Runs the tasks of a list of stages concurrently
+
+       Stages are added to the dependency graph in the order given.
+       For each stage the lock is obtained via `get_lock` and the
+       tasks via `get_task_list`, then each task is linked to the
+       tasks already in the graph whose directory matches one of the
+       tasks returned by its get_dependencies() method.  A task is
+       started, in its own thread, once all tasks it is linked to
+       have completed without error, with at most `max_parallel_tasks`
+       running at once.  If a task it is linked to fails the task is
+       skipped.
+
+       Stages in `barrier_stages` build their task list from the
+       output of earlier stages so they are only added to the graph
+       once all tasks already in it have finished.  As with the
+       serial runner, no more stages are added once a task fails.
+       The lock of a stage is released once all its tasks have
+       finished.
+    """
+    def __init__(self, max_parallel_tasks, get_task_list, get_lock,
+                 barrier_stages=None):
+        """Constructor
+
+           :param max_parallel_tasks: maximum number of tasks to run
+                                      at once
+           :param get_task_list: function that takes a stage name and
+                                 returns list of tasks
+           :param get_lock: function that takes a stage name and returns
+                            acquired lock with release() method
+           :param barrier_stages: names of stages that are added to
+                                  graph only after all earlier tasks
+                                  have finished
+        """
+        if max_parallel_tasks < 1:
+            max_parallel_tasks = 1
+        self._max_parallel_tasks = max_parallel_tasks
+        self._get_task_list = get_task_list
+        self._get_lock = get_lock
+        if barrier_stages is None:
+            barrier_stages = []
+        self._barrier_stages = barrier_stages
+        self._nodes = []
+        self._stages = []
+        self._running = 0
+        self._done_queue = Queue.Queue()
+
+    def get_nodes(self):
+        """Gets the task nodes added to the graph so far
+        :return: list of `TaskNode` objects in the order added
+        """
+        return self._nodes
+
+    def _add_stage(self, stage_name):
+        """Obtains lock and tasks for stage and adds them to the graph
+
+           :return: 0 upon success, 3 if task list is None or 2 if it
+                    is empty, matching celpprunner.run_tasks
+           :raises: Exception from `get_lock` or `get_task_list`
+        """
+        logger.info("Starting " + stage_name + " stage")
+        stage = StageEntry(stage_name)
+        stage.lock = self._get_lock(stage_name)
+        self._stages.append(stage)
+
+        task_list = self._get_task_list(stage_name)
+        if task_list is None:
+            logger.error('Task list is None')
+            return 3
+
+        if len(task_list) == 0:
+            logger.error('Task list is empty')
+            return 2
+
+        dir_to_node = {}
+        for node in self._nodes:
+            dir_to_node[node.task.get_dir()] = node
+
+        for task in task_list:
+            node = TaskNode(task, stage)
+            for dep in task.get_dependencies():
+                dep_node = dir_to_node.get(dep.get_dir())
+                if dep_node is not None:
+                    logger.debug(task.get_dir_name() + ' depends on ' +
+                                 dep_node.task.get_dir_name())
+                    node.dependencies.append(dep_node)
+            stage.nodes.append(node)
+            self._nodes.append(node)
+            dir_to_node[task.get_dir()] = node
+        return 0
+
+    def _run_task(self, node):
+        """Runs task of node, called in a separate thread
+        """
+        task = node.task
+        logger.info("Running task " + task.get_name())
+        try:
+            task.run()
+        except Exception as e:
+            logger.exception("Error caught exception")
+            if task.get_error() is None:
+                task.set_error('Caught Exception running task: ' + str(e))
+        finally:
+            self._done_queue.put(node)
+
+    def _start_ready_tasks(self):
+        """Starts waiting tasks whose dependencies completed and skips
+           those with a failed dependency
+           :return: True if any node changed state
+        """
+        changed = False
+        for node in self._nodes:
+            if node.state != TaskNode.WAITING:
+                continue
+            dep_states = [dep.state for dep in node.dependencies]
+            if TaskNode.FAILED in dep_states or \
+                    TaskNode.SKIPPED in dep_states:
+                logger.error('Skipping task ' + node.task.get_dir_name() +
+                             ' because a task it depends on failed')
+                node.state = TaskNode.SKIPPED
+                changed = True
+                continue
+            if len([s for s in dep_states if s != TaskNode.DONE]) > 0:
+                continue
+            if self._running >= self._max_parallel_tasks:
+                continue
+            node.state = TaskNode.RUNNING
+            self._running += 1
+            changed = True
+            thread = threading.Thread(target=self._run_task, args=(node,))
+            thread.daemon = True
+            thread.start()
+        return changed
+
+    def _release_finished_stages(self):
+        for stage in self._stages:
+            if stage.released is False and stage.is_finished():
+                self._release(stage)
+
+    def _release(self, stage):
+        stage.released = True
+        if stage.lock is not None:
+            logger.debug('Releasing lock for ' + stage.name + ' stage')
+            stage.lock.release()
+
+    def run(self, stage_names):
+        """Runs tasks of all stages in `stage_names`
+
+           :param stage_names: list of stage names
+           :return: 0 if all tasks ran without error, 1 if any task
+                    had an error, or 2 or 3 if a stage had an empty
+                    or None task list
+           :raises: Exception from `get_lock` or `get_task_list`
+                    after running tasks have finished
+        """
+        returnval = 0
+        pending = list(stage_names)
+        stop_adding = False
+        caught = None
+        try:
+            while True:
+                while pending and not stop_adding:
+                    if pending[0] in self._barrier_stages and \
+                            len([n for n in self._nodes
+                                 if not n.is_finished()]) > 0:
+                        break
+                    try:
+                        exit_code = self._add_stage(pending.pop(0))
+                    except Exception as e:
+                        caught = e
+                        stop_adding = True
+                        break
+                    if exit_code != 0:
+                        returnval = exit_code
+                        stop_adding = True
+
+                while self._start_ready_tasks():
+                    pass
+                self._release_finished_stages()
+
+                if self._running == 0:
+                    if stop_adding or not pending:
+                        break
+                    continue
+
+                node = self._done_queue.get()
+                self._running -= 1
+                task = node.task
+                logger.debug("Task " + task.get_name() +
+                             " has finished running " +
+                             " with status " + str(task.get_status()))
+                if task.get_error() is not None:
+                    logger.error('Error running task ' + task.get_name() +
+                                 ' ' + task.get_error())
+                    node.state = TaskNode.FAILED
+                    if returnval == 0:
+                        returnval = 1
+                    stop_adding = True
+                else:
+                    node.state = TaskNode.DONE
+        finally:
+            for stage in self._stages:
+                if stage.released is False:
+                    self._release(stage)
+
+        if caught is not None:
+            raise caught
+        return returnval
@@ -7,8 +7,6 @@ import logging
 import smtplib
 import platform
 import mimetypes
-import shutil
-import uuid
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.image import MIMEImage
@@ -486,6 +484,15 @@ class D3RTask(object):
                           D3RTask.COMPLETE_FILE), 'a').close()
         self._send_end_email()
 
+    def get_dependencies(self):
+        """Gets tasks that must be complete for this task to run
+
+           Derived classes should override this method to return
+           the tasks whose status is checked by can_run()
+           :return: list of tasks, empty in this base implementation
+        """
+        return []
+
     def can_run(self):
         """Always returns False
 
@@ -647,8 +654,12 @@ class D3RTask(object):
 
         Method runs external process logging the command
         run to email log.  Standard output and error are
-        written to current working directory `command_name`.stdout
-        and `command_name`.stderr respectively and if process.
+        streamed as they arrive to `command_name`.stdout
+        and `command_name`.stderr respectively in the task
+        directory.  Only the start and end of each stream, up to
+        D3RTask.MAX_CHARS_FOR_EMAIL_STR characters, are kept in
+        memory for the email log.  Wall time and peak resident
+        memory of the process are appended to the email log.
 
         :param command_name: Name of command, human readable version
                              used as prefix for .stderr and .stdout
@@ -660,6 +671,12 @@ class D3RTask(object):
                exception then status of task is set to
                D3RTask.ERROR_STATUS and failure message appended
                to email log and task.set_error is set
+        :param timeout: time in seconds to allow process to run
+                        before it is terminated, None for no limit
+        :param kill_delay: time in seconds after terminating
+                           process to kill it
+        :param polling_sleep_time: no longer used, output is read
+                                   as it arrives
         :return: exit code of process
         :raise: UnsetNameError if command_name is None
         :raise: UnsetCommandError if cmd_to_run is None
@@ -676,23 +693,19 @@ class D3RTask(object):
         logger.info("Running command " + cmd_to_run)
 
         self.append_to_email_log('Running command: ' + cmd_to_run + '\n')
-        cmd_tmp_dir = None
+        out_file = os.path.join(self.get_dir(),
+                                command_name + D3RTask.STDOUT_SUFFIX)
+        err_file = os.path.join(self.get_dir(),
+                                command_name + D3RTask.STDERR_SUFFIX)
+        max_chars = D3RTask.MAX_CHARS_FOR_EMAIL_STR
+        marker = '\n' + D3RTask.TEXT_TRUNCATED_STR
         try:
-            if timeout is not None:
-                cmd_tmp_dir = os.path.join(self.get_dir(),
-                                           command_name + str(uuid.uuid1()) +
-                                           D3RTask.TMP_DIR_SUFFIX)
-                os.makedirs(cmd_tmp_dir, mode=0o0775)
-                pst = polling_sleep_time  # trying to make flake8 happy
-
-                returncode, out, err = util.\
-                    run_external_command_with_timeout(cmd_to_run,
-                                                      cmd_tmp_dir,
-                                                      timeout=timeout,
-                                                      kill_delay=kill_delay,
-                                                      polling_sleep_time=pst)
-            else:
-                returncode, out, err = util.run_external_command(cmd_to_run)
+            returncode, out, err, stats = util.\
+                run_external_command_to_files(cmd_to_run, out_file, err_file,
+                                              max_chars=max_chars,
+                                              timeout=timeout,
+                                              kill_delay=kill_delay,
+                                              truncated_marker=marker)
         except Exception as e:
             logger.exception("Error caught exception")
             self.set_status(D3RTask.ERROR_STATUS)
@@ -700,12 +713,9 @@ class D3RTask(object):
                            cmd_to_run + " : " + str(e))
             self.end()
             return 1
-        finally:
-            if cmd_tmp_dir is not None:
-                shutil.rmtree(cmd_tmp_dir)
 
-        self.write_to_file(err, command_name + D3RTask.STDERR_SUFFIX)
-        self.write_to_file(out, command_name + D3RTask.STDOUT_SUFFIX)
+        self.append_to_email_log(self._get_command_stats_message(
+            command_name, stats))
 
         if returncode != 0:
             if command_failure_is_fatal:
@@ -714,21 +724,35 @@ class D3RTask(object):
                                " received. Standard out: " + out +
                                " Standard error: " + err)
             else:
-                max_chars = D3RTask.MAX_CHARS_FOR_EMAIL_STR
-                trunc_out = self._get_email_truncated_string(out,
-                                                             max_chars)
-                trunc_err = self._get_email_truncated_string(err,
-                                                             max_chars)
-
                 self.append_to_email_log("Although considered non fatal " +
                                          "for processing of stage a " +
                                          "non zero exit code: " +
                                          str(returncode) +
                                          "received. Standard out: " +
-                                         trunc_out +
-                                         " Standard error : " + trunc_err)
+                                         out +
+                                         " Standard error : " + err)
         return returncode
 
+    def _get_command_stats_message(self, command_name, stats):
+        """Creates summary line of wall and cpu time, peak memory use
+           and, if the command did not simply exit, its exit reason
+           for a command run by run_external_command
+        :param command_name: Name of command
+        :param stats: dict as returned by
+                      util.run_external_command_to_files
+        :return: string ending with newline
+        """
+        msg = ('Command ' + command_name + ' took ' +
+               '%.2f' % stats['wall_time'] + ' seconds (' +
+               '%.2f' % stats['user_time'] + ' user, ' +
+               '%.2f' % stats['sys_time'] + ' sys), peak RSS ' +
+               '%.1f' % (stats['max_rss_kb'] / 1024.0) + ' MB, ' +
+               str(stats['stdout_chars']) + ' bytes stdout, ' +
+               str(stats['stderr_chars']) + ' bytes stderr')
+        if stats['exit_reason'] != util.EXIT_REASON_EXITED:
+            msg += ', ' + stats['exit_reason']
+        return msg + '\n'
+
     def _get_email_truncated_string(self, val, max_chars):
         """Truncates string so it fits within a certain number of characters
         This method will remove characters from the start of the string so
@@ -8,7 +8,13 @@ import gzip
 import subprocess
 import shlex
 import time
+import errno
+import select
+import signal
+import atexit
+import threading
 import urllib2
+from collections import deque
 from dateutil.parser import parse
 from datetime import date
 from datetime import datetime
@@ -26,6 +32,26 @@ DATA_SET_WEEK_PREFIX = 'dataset.week.'
 
 LOG_FORMAT = "%(asctime)-15s %(levelname)s %(name)s %(message)s"
 
+EXIT_REASON_EXITED = 'exited'
+
+EXIT_REASON_SIGNALED = 'signaled'
+
+EXIT_REASON_TIMEOUT_TERM = 'timeout, terminated'
+
+EXIT_REASON_TIMEOUT_KILL = 'timeout, killed'
+
+# longest time in seconds between checks on a process whose pipes
+# are closed but which has a timeout that has not yet passed
+REAP_POLL_INTERVAL = 0.1
+
+# process group ids of commands started by _start_process that have
+# not been reaped yet, see stop_running_commands_on_exit
+_running_process_groups = set()
+
+_running_process_groups_lock = threading.Lock()
+
+_stop_on_exit_installed = False
+
 
 class DownloadError(Exception):
     """Exception to denote error downloading data
@@ -168,6 +194,51 @@ def find_latest_weekly_dataset(celppdir):
     return latest_entry
 
 
+def find_previous_weekly_dataset(week_dir):
+    """Given a weekly dataset directory find the one before it
+
+       Looks in the celpp directory two levels above `week_dir`
+       (ie celppdir/year/dataset.week.#) for the dataset.week.#
+       directory with the highest year and week number that is
+       still lower than the year and week number of `week_dir`.
+       This crosses year boundaries.
+       :param week_dir: full path to dataset.week.# directory
+       :return: Directory or None if none is found
+    """
+    if week_dir is None:
+        return None
+
+    week_dir = os.path.abspath(week_dir)
+    year_dir = os.path.dirname(week_dir)
+    celppdir = os.path.dirname(year_dir)
+    try:
+        current = (int(os.path.basename(year_dir)),
+                   int(re.sub(DATA_SET_WEEK_PREFIX, '',
+                              os.path.basename(week_dir))))
+    except ValueError:
+        logger.warning('Unable to get year and week from ' + week_dir)
+        return None
+
+    if not os.path.isdir(celppdir):
+        return None
+
+    previous = None
+    previous_dir = None
+    for year in get_all_celpp_years(celppdir):
+        full_year = os.path.join(celppdir, year)
+        if not os.path.isdir(full_year) or int(year) > current[0]:
+            continue
+        for week in get_all_celpp_weeks(full_year):
+            candidate = (int(year), int(week))
+            if candidate >= current:
+                continue
+            if previous is None or candidate > previous:
+                previous = candidate
+                previous_dir = os.path.join(full_year,
+                                            DATA_SET_WEEK_PREFIX + week)
+    return previous_dir
+
+
 def get_celpp_week_number_from_path(dir):
     """Given path extract the week number from it
 
@@ -429,12 +500,29 @@ def run_external_command_with_timeout(cmd_to_run, tmp_dir,
                                       kill_delay=10,
                                       polling_sleep_time=1):
     """Runs command passed in
+
+    Output of the command is read from its pipes as it arrives and
+    the timeout is enforced by waiting on those pipes, so nothing
+    is written to `tmp_dir`.  If the command closes its pipes and
+    keeps running, it is polled every REAP_POLL_INTERVAL seconds
+    until it exits or the timeout passes.  The command
+    runs in its own process group, in the session of this process,
+    and on timeout the whole group is sent SIGTERM and, `kill_delay`
+    seconds later, SIGKILL.  Since signals sent to the process group
+    of this process do not reach the command, callers should use
+    stop_running_commands_on_exit so the command is stopped along
+    with this process.
+    The exit reason and resource usage of the command are logged.
+
     :param cmd_to_run: command with arguments to run set as a string
-    :param tmp_dir: temporary directory where stdout.txt and stderr.txt
-                    files can be temporarily written
-    :param timeout: time in seconds to allow process to run before killing
-    :param polling_sleep_time: time in seconds to sleep between checks for
-                               command completion.
+    :param tmp_dir: directory that must exist, kept for compatibility
+                    with callers that passed a place for temporary
+                    output files
+    :param timeout: time in seconds to allow process to run before
+                    terminating it
+    :param kill_delay: time in seconds after terminating process to
+                       kill it
+    :param polling_sleep_time: no longer used
     :returns: tuple containing (exit code, stdout, stderr)
     """
     if cmd_to_run is None:
@@ -446,66 +534,346 @@ def run_external_command_with_timeout(cmd_to_run, tmp_dir,
     if not os.path.isdir(tmp_dir):
         return 254, '', 'Tmpdir must be a directory'
 
-    logger.info("Running command " + cmd_to_run)
-    tmp_stdout = os.path.join(tmp_dir, 'stdout.txt')
-    logger.debug('stdout file: ' + tmp_stdout)
+    start_time = time.time()
+    p = _start_process(cmd_to_run)
+    out_buf = HeadTailBuffer(None)
+    err_buf = HeadTailBuffer(None)
+    try:
+        returncode, stats = _wait_for_process(p, start_time,
+                                              {p.stdout.fileno(): [out_buf],
+                                               p.stderr.fileno(): [err_buf]},
+                                              timeout, kill_delay)
+    finally:
+        p.stdout.close()
+        p.stderr.close()
+    return returncode, out_buf.get_value(), err_buf.get_value()
+
+
+class HeadTailBuffer(object):
+    """Keeps the start and the end of text written to it in memory
+
+       Holds at most `max_chars` characters.  A quarter of them
+       are the first characters written and the rest are the
+       most recent ones, so memory stays bounded no matter how
+       much output passes through.  If `max_chars` is None or
+       negative all text is kept
+    """
+    def __init__(self, max_chars):
+        self._max_chars = max_chars
+        if max_chars is None or max_chars < 0:
+            self._head_chars = None
+        else:
+            self._head_chars = max_chars // 4
+        self._head = []
+        self._head_len = 0
+        self._tail = deque()
+        self._tail_len = 0
+        self._total_len = 0
+
+    def write(self, data):
+        """Adds `data` to buffer dropping the oldest text beyond the head
+           once more than `max_chars` characters have been written
+        """
+        self._total_len += len(data)
+        if self._head_chars is None:
+            self._head.append(data)
+            self._head_len += len(data)
+            return
+        if self._head_len < self._head_chars:
+            take = data[:self._head_chars - self._head_len]
+            self._head.append(take)
+            self._head_len += len(take)
+            data = data[len(take):]
+        if not data:
+            return
+        self._tail.append(data)
+        self._tail_len += len(data)
+        tail_chars = self._max_chars - self._head_chars
+        while self._tail_len > tail_chars:
+            extra = self._tail_len - tail_chars
+            if len(self._tail[0]) <= extra:
+                self._tail_len -= len(self._tail.popleft())
+            else:
+                self._tail[0] = self._tail[0][extra:]
+                self._tail_len -= extra
+
+    def get_total_length(self):
+        """Gets number of characters written to buffer
+        """
+        return self._total_len
+
+    def is_truncated(self):
+        """Returns True if text was dropped from the buffer
+        """
+        return self._total_len > self._head_len + self._tail_len
+
+    def get_value(self, truncated_marker='\n...\n'):
+        """Gets text held in buffer, with `truncated_marker` between
+           the head and the tail if text was dropped
+        """
+        head = ''.join(self._head)
+        tail = ''.join(self._tail)
+        if self.is_truncated():
+            return head + truncated_marker + tail
+        return head + tail
+
+
+def signal_running_commands(signum=signal.SIGTERM):
+    """Sends `signum` to the process group of every command started
+       by run_external_command_with_timeout or
+       run_external_command_to_files that has not exited yet
+    """
+    with _running_process_groups_lock:
+        pgids = list(_running_process_groups)
+    for pgid in pgids:
+        logger.info('Sending signal ' + str(signum) + ' to process '
+                    'group ' + str(pgid))
+        try:
+            os.killpg(pgid, signum)
+        except OSError:
+            pass
 
-    stdout_f = open(tmp_stdout, 'w')
-    tmp_stderr = os.path.join(tmp_dir, 'stderr.txt')
-    logger.debug('stderr file: ' + tmp_stderr)
 
-    stderr_f = open(tmp_stderr, 'w')
+def _stop_running_commands_and_exit(signum, frame):
+    """SIGTERM handler that stops running commands then lets
+       this process die from `signum` as it would without the handler
+    """
+    signal_running_commands(signal.SIGTERM)
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+def stop_running_commands_on_exit():
+    """Makes this process send SIGTERM to the process groups of the
+       commands it is running when it exits, including exits from an
+       uncaught exception such as KeyboardInterrupt from Ctrl-C and
+       from receiving SIGTERM
+
+       Commands run in their own process group so a timeout can signal
+       them and the processes they start without signaling this
+       process, which means Ctrl-C or a kill of the process group of
+       this process no longer reaches them directly.  This must be
+       called from the main thread since it installs a SIGTERM handler
+    """
+    global _stop_on_exit_installed
+    if _stop_on_exit_installed is False:
+        atexit.register(signal_running_commands)
+        _stop_on_exit_installed = True
+    signal.signal(signal.SIGTERM, _stop_running_commands_and_exit)
+
+
+def _start_process(cmd_to_run):
+    """Starts `cmd_to_run` with pipes for standard output and error
+       as leader of a new process group, in the session of this
+       process, so it and any processes it starts can be signaled
+       together.  The group is tracked until the command is reaped so
+       signal_running_commands can reach it
+    :raises: All exceptions from subprocess.Popen()
+    """
+    logger.info("Running command " + cmd_to_run)
     p = subprocess.Popen(shlex.split(cmd_to_run),
-                         stdout=stdout_f,
-                         stderr=stderr_f)
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE,
+                         preexec_fn=os.setpgrp)
+    with _running_process_groups_lock:
+        _running_process_groups.add(p.pid)
+    return p
 
-    logger.debug('Waiting for process to complete')
-    p.poll()
-    logger.debug('Polling returned None, looping until'
-                 ' p.returncode is not None')
 
-    if timeout is not None:
-        start_time = time.time()
-    else:
-        start_time = 0
-
-    terminate_invoked = False
+def _signal_process_group(p, signum):
+    """Sends `signum` to process group of `p` falling back to
+       `p` alone if the group no longer exists
+    """
+    try:
+        os.killpg(p.pid, signum)
+    except OSError:
+        try:
+            os.kill(p.pid, signum)
+        except OSError:
+            pass
 
-    while p.returncode is None:
-        if timeout is not None and int(time.time() - start_time) > timeout:
-            if terminate_invoked is False:
-                logger.info('Timeout of ' + str(timeout) +
-                            'exceeded invoking terminate')
-                p.terminate()
 
-                # pushing start time into future
-                # to give child process a chance to
-                # exit when SIGTERM is called
-                start_time += kill_delay
+def _signal_on_deadline(p, reason, kill_delay):
+    """Signals process group of `p` once its deadline has passed,
+       SIGTERM the first time and SIGKILL if it is still running
+       `kill_delay` seconds later
 
-                terminate_invoked = True
-            else:
-                logger.info('Timeout of ' + str(timeout + kill_delay) +
-                            'exceeded invoking kill')
-                p.kill()
-        time.sleep(polling_sleep_time)
-        p.poll()
-
-    logger.debug('Got a return code that is not None: ' +
-                 str(p.returncode))
-    stdout_f.flush()
-    stdout_f.close()
-    stderr_f.flush()
-    stderr_f.close()
-    logger.debug('Writing stderr and stdout to ' + tmp_dir)
-    fo = open(tmp_stdout, 'r')
-    out = fo.read()
-    fo.close()
-    fe = open(tmp_stderr, 'r')
-    err = fe.read()
-    fe.close()
+       :param reason: exit reason so far, None if nothing was sent
+       :returns: tuple (exit reason, next deadline or None)
+    """
+    if reason is None:
+        logger.info('Timeout exceeded sending SIGTERM to process '
+                    'group ' + str(p.pid))
+        _signal_process_group(p, signal.SIGTERM)
+        return EXIT_REASON_TIMEOUT_TERM, time.time() + kill_delay
+
+    logger.info('Timeout plus kill delay exceeded sending '
+                'SIGKILL to process group ' + str(p.pid))
+    _signal_process_group(p, signal.SIGKILL)
+    return EXIT_REASON_TIMEOUT_KILL, None
+
+
+def _read_pipes(p, outputs, deadline, kill_delay):
+    """Reads output of `p` from its pipes as it arrives until they
+       are closed, signaling the process group of `p` if `deadline`
+       passes
+
+       :param outputs: dict of pipe file descriptor to list of
+                       objects with a write method to pass data to
+       :param deadline: time.time() value when process group gets
+                        SIGTERM, None for no limit
+       :param kill_delay: seconds after SIGTERM to send SIGKILL
+       :returns: tuple (reason, deadline) where reason is
+                 EXIT_REASON_TIMEOUT_TERM if SIGTERM was sent,
+                 EXIT_REASON_TIMEOUT_KILL if SIGKILL was sent
+                 otherwise None and deadline is when the next
+                 signal is due or None
+    """
+    reason = None
+    while outputs:
+        wait_time = None
+        if deadline is not None:
+            wait_time = max(deadline - time.time(), 0)
+        try:
+            ready, w, x = select.select(list(outputs.keys()), [], [],
+                                        wait_time)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        for fd in ready:
+            data = os.read(fd, 65536)
+            if not data:
+                del outputs[fd]
+                continue
+            for writer in outputs[fd]:
+                writer.write(data)
+        if deadline is not None and time.time() >= deadline:
+            reason, deadline = _signal_on_deadline(p, reason, kill_delay)
+    return reason, deadline
+
+
+def _reap_process(p, reason, deadline, kill_delay):
+    """Waits for `p` to exit, a process can close its pipes and keep
+       running so `deadline` is still enforced while waiting
+
+       :returns: tuple (reason, status, rusage) with reason updated if
+                 a signal was sent and status and rusage as returned
+                 by os.wait4()
+    """
+    while True:
+        flags = 0
+        if deadline is not None:
+            flags = os.WNOHANG
+        try:
+            pid, status, rusage = os.wait4(p.pid, flags)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+            continue
+        if pid != 0:
+            return reason, status, rusage
+        if time.time() >= deadline:
+            reason, deadline = _signal_on_deadline(p, reason, kill_delay)
+            continue
+        time.sleep(min(REAP_POLL_INTERVAL,
+                       max(deadline - time.time(), 0)))
+
+
+def _wait_for_process(p, start_time, outputs, timeout, kill_delay):
+    """Streams output of `p` to `outputs` enforcing `timeout` then
+       reaps `p` collecting its resource usage
+
+       :returns: tuple (exit code, stats) where stats is a dict with
+                 'exit_reason' one of EXIT_REASON_EXITED,
+                 EXIT_REASON_SIGNALED, EXIT_REASON_TIMEOUT_TERM or
+                 EXIT_REASON_TIMEOUT_KILL, 'wall_time', 'user_time' and
+                 'sys_time' in seconds and 'max_rss_kb' peak resident
+                 set size of process in kilobytes
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = start_time + timeout
+    reason, deadline = _read_pipes(p, outputs, deadline, kill_delay)
+    reason, status, rusage = _reap_process(p, reason, deadline,
+                                           kill_delay)
+    with _running_process_groups_lock:
+        _running_process_groups.discard(p.pid)
+    if os.WIFSIGNALED(status):
+        p.returncode = -os.WTERMSIG(status)
+        if reason is None:
+            reason = EXIT_REASON_SIGNALED
+    else:
+        p.returncode = os.WEXITSTATUS(status)
+        if reason is None:
+            reason = EXIT_REASON_EXITED
+
+    stats = {'exit_reason': reason,
+             'wall_time': time.time() - start_time,
+             'user_time': rusage.ru_utime,
+             'sys_time': rusage.ru_stime,
+             'max_rss_kb': rusage.ru_maxrss}
+    logger.info('Command exited with code ' + str(p.returncode) +
+                ' (' + reason + ') wall ' + '%.2f' % stats['wall_time'] +
+                's user ' + '%.2f' % stats['user_time'] + 's sys ' +
+                '%.2f' % stats['sys_time'] + 's peak RSS ' +
+                str(stats['max_rss_kb']) + ' KB')
+    return p.returncode, stats
+
+
+def run_external_command_to_files(cmd_to_run, stdout_file, stderr_file,
+                                  max_chars=None, timeout=None,
+                                  kill_delay=10,
+                                  truncated_marker='\n...\n'):
+    """Runs command streaming its standard output and error to files
+
+       Output is written to `stdout_file` and `stderr_file` as it
+       arrives so memory used does not grow with the amount of
+       output.  Only the start and end of each stream, up to
+       `max_chars` characters, are kept in memory and returned.
+       The files are only created once the process has started.
+       On timeout the process group of the command is sent SIGTERM
+       and, `kill_delay` seconds later, SIGKILL.
 
-    return p.returncode, out, err
+       :param cmd_to_run: The command with arguments to run
+       :param stdout_file: path to write standard output to
+       :param stderr_file: path to write standard error to
+       :param max_chars: most characters of each stream to return,
+                         None to return everything
+       :param timeout: time in seconds to allow process to run before
+                       sending SIGTERM, None for no limit
+       :param kill_delay: time in seconds after SIGTERM to send SIGKILL
+       :param truncated_marker: text put between start and end of a
+                                stream longer than `max_chars`
+       :raises: All exceptions from subprocess.Popen()
+       :returns: tuple (exitcode, stdout, stderr, stats) where stats
+                 is the dict described in _wait_for_process plus
+                 'stdout_chars' and 'stderr_chars' the full size of
+                 each stream
+    """
+    start_time = time.time()
+    p = _start_process(cmd_to_run)
+    out_buf = HeadTailBuffer(max_chars)
+    err_buf = HeadTailBuffer(max_chars)
+    out_f = open(stdout_file, 'w')
+    err_f = open(stderr_file, 'w')
+    try:
+        returncode, stats = _wait_for_process(p, start_time,
+                                              {p.stdout.fileno():
+                                               [out_f, out_buf],
+                                               p.stderr.fileno():
+                                               [err_f, err_buf]},
+                                              timeout, kill_delay)
+    finally:
+        out_f.close()
+        err_f.close()
+        p.stdout.close()
+        p.stderr.close()
+
+    stats['stdout_chars'] = out_buf.get_total_length()
+    stats['stderr_chars'] = err_buf.get_total_length()
+    return (returncode, out_buf.get_value(truncated_marker),
+            err_buf.get_value(truncated_marker), stats)
 
 
 def setup_logging(theargs):
@@ -513,9 +881,11 @@ def setup_logging(theargs):
 
     Loggers are setup for:
     d3r.blastnfilter
+    d3r.buildcomponentstore
     d3r.celpprunner
     d3r.celpp.blastnfilter
     d3r.celpp.dataimport
+    d3r.celpp.downloadmanager
     d3r.celpp.glide
     d3r.celpp.makeblastdb
     d3r.celpp.proteinligprep
@@ -525,10 +895,14 @@ def setup_logging(theargs):
     d3r.celpp.uploader
     d3r.celpp.chimeraprep
     d3r.celpp.participant
+    d3r.celpp.scheduler
+    d3r.blast.component_store
     d3r.blast.ligand
     d3r.blast.hit
     d3r.blast.hit_sequence
+    d3r.blast.mcss
     d3r.blast.query
+    d3r.blast.structure
     d3r.filter.filter
     d3r.utilities.analysis
     d3r.utilities.in_put
@@ -562,6 +936,8 @@ def setup_logging(theargs):
     # under celpp module
     logging.getLogger('d3r.blastnfilter')\
         .setLevel(theargs.numericloglevel)
+    logging.getLogger('d3r.buildcomponentstore')\
+        .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpprunner')\
         .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celppreports')\
@@ -571,6 +947,8 @@ def setup_logging(theargs):
     logging.getLogger('d3r.celpp.challengedata')\
         .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.dataimport').setLevel(theargs.numericloglevel)
+    logging.getLogger('d3r.celpp.downloadmanager')\
+        .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.glide').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.vina').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.makeblastdb')\
@@ -580,6 +958,8 @@ def setup_logging(theargs):
     logging.getLogger('d3r.celpp.evaluation').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.task').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.util').setLevel(theargs.numericloglevel)
+    logging.getLogger('d3r.celpp.scheduler')\
+        .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.filetransfer')\
         .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.chimeraprep')\
@@ -588,11 +968,16 @@ def setup_logging(theargs):
         .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.celpp.postevaluation')\
         .setLevel(theargs.numericloglevel)
+    logging.getLogger('d3r.blast.component_store')\
+        .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.blast.ligand').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.blast.hit').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.blast.hit_sequence')\
         .setLevel(theargs.numericloglevel)
+    logging.getLogger('d3r.blast.mcss').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.blast.query').setLevel(theargs.numericloglevel)
+    logging.getLogger('d3r.blast.structure')\
+        .setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.filter.filter').setLevel(theargs.numericloglevel)
     logging.getLogger('d3r.utilities.analysis')\
         .setLevel(theargs.numericloglevel)
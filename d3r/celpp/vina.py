@@ -15,6 +15,9 @@ class AutoDockVinaTask(D3RTask):
     """Performs Auto Dock Vina docking
 
     """
+    # name of file vinadocking.py writes preparation cache stats to
+    PREP_CACHE_SUMMARY = 'prepcache_summary.txt'
+
     def __init__(self, path, args):
         super(AutoDockVinaTask, self).__init__(path, args)
         self.set_name('autodockvina')
@@ -31,8 +34,42 @@ class AutoDockVinaTask(D3RTask):
         """
         # get the stderr/stdout files
         file_list = super(AutoDockVinaTask, self).get_uploadable_files()
+        summary_file = self.get_prep_cache_summary_file()
+        if os.path.isfile(summary_file):
+            file_list.append(summary_file)
         return file_list
 
+    def get_prep_cache_summary_file(self):
+        """Returns path to preparation cache summary file
+        """
+        return os.path.join(self.get_dir(),
+                            AutoDockVinaTask.PREP_CACHE_SUMMARY)
+
+    def _get_prep_cache_summary(self):
+        """Gets contents of preparation cache summary file
+           :return: string with contents of file or None if file
+                    does not exist or cannot be read
+        """
+        summary_file = self.get_prep_cache_summary_file()
+        if not os.path.isfile(summary_file):
+            return None
+        try:
+            f = open(summary_file, 'r')
+            try:
+                return f.read()
+            finally:
+                f.close()
+        except IOError:
+            logger.warning('Error reading ' + summary_file + ' file')
+        return None
+
+    def get_dependencies(self):
+        """Returns `ChimeraProteinLigPrepTask` which can_run()
+           requires to be complete
+           :return: list of tasks
+        """
+        return [ChimeraProteinLigPrepTask(self._path, self._args)]
+
     def can_run(self):
         """Determines if task can actually run
 
@@ -109,9 +146,35 @@ class AutoDockVinaTask(D3RTask):
                       ligprep.get_dir() +
                       ' --outdir ' + self.get_dir())
 
+        try:
+            numworkers = self.get_args().vinaworkers
+            logger.debug('Setting vina workers to ' + str(numworkers))
+        except AttributeError:
+            numworkers = None
+
+        if numworkers is not None and numworkers > 1:
+            cmd_to_run += ' --numworkers ' + str(numworkers)
+
+        try:
+            prep_cache = self.get_args().vinaprepcache
+        except AttributeError:
+            prep_cache = None
+
+        if prep_cache is not None:
+            cmd_to_run += ' --prepcache ' + prep_cache
+            try:
+                cmd_to_run += (' --prepcachesize ' +
+                               str(self.get_args().vinaprepcachesize))
+            except AttributeError:
+                pass
+
         vina_name = os.path.basename(self.get_args().vina)
 
         self.run_external_command(vina_name, cmd_to_run,
                                   True)
+
+        summary = self._get_prep_cache_summary()
+        if summary is not None:
+            self.append_to_email_log('\n' + summary)
         # assess the result
         self.end()
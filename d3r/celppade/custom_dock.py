@@ -8,10 +8,75 @@ import shutil
 import re
 import glob
 import logging
+import time
+import signal
+import tempfile
+import Queue
+import multiprocessing
 from d3r.utilities.readers import ReadText
 
 logger = logging.getLogger(__name__)
 
+# seconds between checks on running target worker processes
+WORKER_POLL_INTERVAL = 0.5
+
+# seconds to wait for the result of a worker that already exited
+WORKER_RESULT_TIMEOUT = 5
+
+
+def _dock_target(dock_obj, targ_name, targ_entry, abs_dock_dir):
+    """Calls dock_obj.dock_target() catching any exception so a failure
+       only affects its own target
+    :returns: tuple (target name, docked candidates or False, seconds,
+              error message or None)
+    """
+    start_time = time.time()
+    try:
+        docked_cands = dock_obj.dock_target(targ_name, targ_entry,
+                                            abs_dock_dir)
+        error = None
+        if docked_cands is False:
+            error = 'technical ligand preparation failed'
+    except Exception as e:
+        logging.info(sys.exc_info())
+        docked_cands = False
+        error = str(e)
+    return targ_name, docked_cands, time.time() - start_time, error
+
+
+def _dock_target_in_worker(dock_obj, targ_name, targ_entry, abs_dock_dir,
+                           log_file, result_queue):
+    """Entry point of a target worker process, sends log messages to
+       `log_file` instead of the handlers inherited from the parent and
+       puts the result of `_dock_target` on `result_queue`. The worker
+       leads its own process group so `_kill_worker` also stops any
+       programs started by the docking hooks
+    """
+    os.setpgrp()
+    root_logger = logging.getLogger()
+    handler = logging.FileHandler(log_file)
+    if root_logger.handlers:
+        handler.setFormatter(root_logger.handlers[0].formatter)
+    for old_handler in list(root_logger.handlers):
+        root_logger.removeHandler(old_handler)
+    root_logger.addHandler(handler)
+    os.chdir(abs_dock_dir)
+    result_queue.put(_dock_target(dock_obj, targ_name, targ_entry,
+                                  abs_dock_dir))
+    handler.close()
+
+
+def _kill_worker(proc):
+    """Kills target worker `proc` along with every process in its
+       process group
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        # worker has not made its own process group yet
+        proc.terminate()
+    proc.join()
+
 class Dock(object):
     """Abstract class defining methods for a custom docking solution
     for CELPP
@@ -28,6 +93,13 @@ class Dock(object):
     SCI_PREPPED_LIG_SUFFIX = '_prepared.sdf'
     SCI_PREPPED_PROT_SUFFIX = '_prepared.pdb'
 
+    ## Number of targets run_dock() docks at once and the number of
+    ## seconds a target may take before it is abandoned (0 for no
+    ## limit). Subclasses may override these or pass numworkers and
+    ## target_timeout to run_dock()
+    NUM_WORKERS = 1
+    TARGET_TIMEOUT = 0
+
     def ligand_technical_prep(self, 
                               sci_prepped_lig, 
                               targ_info_dict={}):
@@ -157,7 +229,24 @@ class Dock(object):
 
 
 
-    def run_dock(self, prot_sci_prep_dir, lig_sci_prep_dir, dock_dir):
+    def run_dock(self, prot_sci_prep_dir, lig_sci_prep_dir, dock_dir,
+                 numworkers=None, target_timeout=None):
+        """Finds the targets with a valid ligand and candidate
+           receptors and docks them via dock_target()
+
+           With more than one worker, or with a target timeout, each
+           target is docked in a separate process, at most `numworkers`
+           at a time. Targets are independent so a failing or timed out
+           target does not affect the others.
+        :param numworkers: Number of targets to dock at once, if None
+                           NUM_WORKERS is used
+        :param target_timeout: Seconds a target may take before its
+                               process is killed, if None
+                               TARGET_TIMEOUT is used. 0 means no limit
+        :returns: list of (target name, docked candidates as returned
+                  by dock_target(), seconds, error message or None)
+                  tuples sorted by target name
+        """
         #os.chdir(prep_result_dir)
         abs_lig_sci_prep_dir = os.path.abspath(lig_sci_prep_dir)
         abs_prot_sci_prep_dir = os.path.abspath(prot_sci_prep_dir)
@@ -235,201 +324,313 @@ class Dock(object):
         targ_names = [i for i in targ_names if targ_dic[i]['valid_targ']==True]
         targ_names.sort()
 
-        # Begin populating the target directory
+        if numworkers is None:
+            numworkers = self.NUM_WORKERS
+        if target_timeout is None:
+            target_timeout = self.TARGET_TIMEOUT
+
+        # Dock the targets, each target is docked from within abs_dock_dir
+        start_time = time.time()
+        if numworkers <= 1 and not target_timeout:
+            results = []
+            for targ_name in targ_names:
+                os.chdir(abs_dock_dir)
+                results.append(_dock_target(self, targ_name,
+                                            targ_dic[targ_name],
+                                            abs_dock_dir))
+        else:
+            results = self._dock_targets_in_processes(targ_names, targ_dic,
+                                                      abs_dock_dir,
+                                                      numworkers,
+                                                      target_timeout)
         os.chdir(abs_dock_dir)
-        for targ_name in targ_names:
-            pocket_center = targ_dic[targ_name]['pocket_center']
-            os.chdir(abs_dock_dir)
-            # Make the target directory
-            os.mkdir(targ_name)
-            os.chdir(targ_name)
-            abs_targ_dock_dir = os.getcwd()
+
+        for targ_name, docked_cands, secs, error in results:
+            if error is not None:
+                logging.info('Docking of target %s failed after %.1f seconds: %s' %(targ_name, secs, error))
+            else:
+                logging.info('Docking of target %s took %.1f seconds and docked candidates %r' %(targ_name, secs, docked_cands))
+        logging.info('Docked %d targets with %d worker(s) in %.1f seconds' %(len(results), max(1, numworkers), time.time() - start_time))
+        return results
+
+    def _dock_targets_in_processes(self, targ_names, targ_dic, abs_dock_dir,
+                                   numworkers, target_timeout):
+        """Docks each target in its own process running at most
+           `numworkers` processes at once. A process still running
+           `target_timeout` seconds after it started is killed along
+           with the programs it started.
+           Log messages of a target go to a temporary file that is
+           copied into this process log, in target order, once all
+           targets are done.
+        :returns: list of results as returned by `_dock_target` in
+                  the same order as `targ_names`
+        """
+        log_dir = tempfile.mkdtemp()
+        result_queue = multiprocessing.Queue()
+        pending = list(targ_names)
+        running = {}
+        results = {}
+        try:
+            while pending or running:
+                while pending and len(running) < max(1, numworkers):
+                    targ_name = pending.pop(0)
+                    log_file = os.path.join(log_dir, targ_name + '.log')
+                    proc = multiprocessing.Process(
+                        target=_dock_target_in_worker,
+                        args=(self, targ_name, targ_dic[targ_name],
+                              abs_dock_dir, log_file, result_queue))
+                    proc.start()
+                    running[targ_name] = (proc, time.time())
+                try:
+                    res = result_queue.get(timeout=WORKER_POLL_INTERVAL)
+                    results[res[0]] = res
+                except Queue.Empty:
+                    pass
+                for targ_name, (proc, proc_start) in running.items():
+                    secs = time.time() - proc_start
+                    if not proc.is_alive():
+                        proc.join()
+                        del running[targ_name]
+                        if proc.exitcode != 0:
+                            results[targ_name] = (targ_name, False, secs,
+                                                  'worker exited with code '
+                                                  '%s' % proc.exitcode)
+                    elif target_timeout and secs > target_timeout:
+                        _kill_worker(proc)
+                        del running[targ_name]
+                        results[targ_name] = (targ_name, False, secs,
+                                              'timed out after %d seconds'
+                                              % target_timeout)
+
+            # collect results of workers that exited before their
+            # result was read off the queue
+            while len(results) < len(targ_names):
+                try:
+                    res = result_queue.get(timeout=WORKER_RESULT_TIMEOUT)
+                except Queue.Empty:
+                    break
+                results[res[0]] = res
+
+            for targ_name in targ_names:
+                log_file = os.path.join(log_dir, targ_name + '.log')
+                if os.path.isfile(log_file):
+                    f = open(log_file, 'r')
+                    logging.info('----- Log of target %s -----\n%s' %(targ_name, f.read().rstrip()))
+                    f.close()
+        finally:
+            for proc, proc_start in running.values():
+                _kill_worker(proc)
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+        return [results.get(targ_name,
+                            (targ_name, False, 0.0, 'no result from worker'))
+                for targ_name in targ_names]
+
+    def dock_target(self, targ_name, targ_entry, abs_dock_dir):
+        """Runs technical prep and docking of one target in a new
+           directory named `targ_name` under `abs_dock_dir`
+        :param targ_name: Name of the target
+        :param targ_entry: Dictionary about the target built by
+                           run_dock() holding the pocket center, the
+                           ligand file and the valid candidates
+        :param abs_dock_dir: Absolute path to the docking output directory
+        :returns: list of (category, target id, candidate id) tuples
+                  of the candidates docked successfully or False if
+                  technical prep of the ligand failed
+        """
+        # Make the target directory
+        os.chdir(abs_dock_dir)
+        os.mkdir(targ_name)
+        os.chdir(targ_name)
+        abs_targ_dock_dir = os.getcwd()
 
 
-            # Copy the targ.txt file in 
-            copy_dest = '%s/%s' %(abs_targ_dock_dir, os.path.basename(targ_dic[targ_name]['targ_txt_file']))
-            shutil.copyfile(targ_dic[targ_name]['targ_txt_file'], copy_dest)
-            # Parse the targ.txt file
-            ReadText_obj = ReadText()
-            targ_info_dict = ReadText_obj.parse_txt(copy_dest)
-            targ_info_dict['pocket_center'] = pocket_center
+        # Copy the targ.txt file in 
+        copy_dest = '%s/%s' %(abs_targ_dock_dir, os.path.basename(targ_entry['targ_txt_file']))
+        shutil.copyfile(targ_entry['targ_txt_file'], copy_dest)
+        # Parse the targ.txt file
+        ReadText_obj = ReadText()
+        targ_info_dict = ReadText_obj.parse_txt(copy_dest)
+        targ_info_dict['pocket_center'] = targ_entry['pocket_center']
 
-            #### Run CELPPade technical prep
+        #### Run CELPPade technical prep
 
-            ### Ligand technical prep
+        ### Ligand technical prep
 
-            ## Ligand technical prep setup
-            lig_tech_prep_dir = 'lig_%s_tech_prep' %(targ_dic[targ_name]['lig_prefix'])
-            os.mkdir(lig_tech_prep_dir)
+        ## Ligand technical prep setup
+        lig_tech_prep_dir = 'lig_%s_tech_prep' %(targ_entry['lig_prefix'])
+        os.mkdir(lig_tech_prep_dir)
 
 
 
-            # Copy the sci prepped ligand in
-            copy_dest = '%s/%s' %(lig_tech_prep_dir, os.path.basename(targ_dic[targ_name]['lig_file']))
-            shutil.copyfile(targ_dic[targ_name]['lig_file'], copy_dest)
+        # Copy the sci prepped ligand in
+        copy_dest = '%s/%s' %(lig_tech_prep_dir, os.path.basename(targ_entry['lig_file']))
+        shutil.copyfile(targ_entry['lig_file'], copy_dest)
+    
+        lig_base_filename = os.path.basename(targ_entry['lig_file'])
+        os.chdir(lig_tech_prep_dir)
+    
+        ## Call user-defined ligand technical prep
+        try:
+            tech_prepped_lig_file_list = self.ligand_technical_prep(lig_base_filename, targ_info_dict=targ_info_dict)
+        except:
+            logging.info(sys.exc_info())
+            logging.info('try/except statement caught error in function lig_technical_prep. Skipping target %s.' %(targ_name))
+            return False
+    
+        ## Ensure that ligand technical prep was successful
+        # Check for function-reported failure
+        if tech_prepped_lig_file_list == False:
+            logging.info('Technical ligand preparation failed on %s. Skipping target %s.' %(os.path.abspath(lig_base_filename), targ_name))
+            return False
+
+        # Ensure that ligand technical prep returns a list of filenames
+        if not(type(tech_prepped_lig_file_list) is list):
+            logging.info('Technical ligand preparation for %s did not return a list of filenames. Skipping target %s.' %(os.path.abspath(lig_base_filename), targ_name))
+            return False
+
+        # Ensure that all files in list really exist
+        for filename in tech_prepped_lig_file_list:
+            if not(os.path.exists(filename)):
+                logging.info('Technical ligand preparation for %s returned file list %r, but file %s does not exist. Skipping target %s.' %(os.path.abspath(lig_base_filename), tech_prepped_lig_file_list, filename, targ_name))
+                continue
+        
+
+        ## Prepare to copy these files for later
+        tech_prepped_lig_file_list = [os.path.abspath(i) for i in tech_prepped_lig_file_list]
+        targ_entry['tech_prepped_lig_files'] = tech_prepped_lig_file_list
+
+        logging.info('Technical ligand prep successful for %s. All files exist from returned list %r. ' %(os.path.abspath(lig_base_filename), tech_prepped_lig_file_list))
+
+        ### Candidate tech prep
+        docked_cands = []
+        for cand_file, category, targ_id, cand_id in targ_entry['valid_cands']:
+            os.chdir(abs_targ_dock_dir)
         
-            lig_base_filename = os.path.basename(targ_dic[targ_name]['lig_file'])
-            os.chdir(lig_tech_prep_dir)
+            ## Candidate tech prep setup
+            cand_tech_prep_dir = '%s_%s_tech_prep/' %(category, cand_id)
+            os.mkdir(cand_tech_prep_dir)
+            copy_dest = '%s/%s' %(cand_tech_prep_dir, os.path.basename(cand_file))
+            shutil.copyfile(cand_file, copy_dest)
+            prot_base_filename = os.path.basename(cand_file)
+            os.chdir(cand_tech_prep_dir)
         
-            ## Call user-defined ligand technical prep
+            ## Call user-defined protein technical prep
             try:
-                tech_prepped_lig_file_list = self.ligand_technical_prep(lig_base_filename, targ_info_dict=targ_info_dict)
+                tech_prepped_prot_file_list = self.receptor_technical_prep(prot_base_filename, targ_entry['pocket_center'], targ_info_dict=targ_info_dict)
             except:
                 logging.info(sys.exc_info())
-                logging.info('try/except statement caught error in function lig_technical_prep. Skipping target %s.' %(targ_name))
-
+                logging.info('try/except statement caught error in function receptor_technical_prep.  Skipping candidate %s for target %s.' %(cand_id, targ_name))
                 continue
-        
-            ## Ensure that ligand technical prep was successful
+
+            ## Ensure that receptor technical prep was successful
             # Check for function-reported failure
-            if tech_prepped_lig_file_list == False:
-                logging.info('Technical ligand preparation failed on %s. Skipping target %s.' %(os.path.abspath(lig_base_filename), targ_name))
+            if tech_prepped_prot_file_list == False:
+                logging.info('Technical protein preparation failed on %s. Skipping candidate %s for target %s.' %(os.path.abspath(prot_base_filename), cand_id, targ_name))
                 continue
 
-            # Ensure that ligand technical prep returns a list of filenames
-            if not(type(tech_prepped_lig_file_list) is list):
-                logging.info('Technical ligand preparation for %s did not return a list of filenames. Skipping target %s.' %(os.path.abspath(lig_base_filename), targ_name))
+            # Ensure that receptor technical prep returns a list of filenames
+            if not(type(tech_prepped_prot_file_list) is list):
+                logging.info('Technical protein preparation for %s did not return a list of filenames. Skipping candidate %s for target %s.' %(os.path.abspath(prot_base_filename), cand_id, targ_name))
                 continue
 
             # Ensure that all files in list really exist
-            for filename in tech_prepped_lig_file_list:
+            for filename in tech_prepped_prot_file_list:
                 if not(os.path.exists(filename)):
-                    logging.info('Technical ligand preparation for %s returned file list %r, but file %s does not exist. Skipping target %s.' %(os.path.abspath(lig_base_filename), tech_prepped_lig_file_list, filename, targ_name))
+                    logging.info('Technical protein preparation for %s returned file list %r, but file %s does not exist. Skipping candidate %s for target %s.' %(os.path.abspath(lig_base_filename), tech_prepped_lig_file_list, filename, cand_id, targ_name))
                     continue
-            
-
-            ## Prepare to copy these files for later
-            tech_prepped_lig_file_list = [os.path.abspath(i) for i in tech_prepped_lig_file_list]
-            targ_dic[targ_name]['tech_prepped_lig_files'] = tech_prepped_lig_file_list
-
-            logging.info('Technical ligand prep successful for %s. All files exist from returned list %r. ' %(os.path.abspath(lig_base_filename), tech_prepped_lig_file_list))
+        
+            ## Prepare to copy these files for docking step
+            tech_prepped_prot_file_list = [os.path.abspath(i) for i in tech_prepped_prot_file_list]
 
-            ### Candidate tech prep
-            for cand_file, category, targ_id, cand_id in targ_dic[targ_name]['valid_cands']:
-                os.chdir(abs_targ_dock_dir)
-            
-                ## Candidate tech prep setup
-                cand_tech_prep_dir = '%s_%s_tech_prep/' %(category, cand_id)
-                os.mkdir(cand_tech_prep_dir)
-                copy_dest = '%s/%s' %(cand_tech_prep_dir, os.path.basename(cand_file))
-                shutil.copyfile(cand_file, copy_dest)
-                prot_base_filename = os.path.basename(cand_file)
-                os.chdir(cand_tech_prep_dir)
-            
-                ## Call user-defined protein technical prep
-                try:
-                    tech_prepped_prot_file_list = self.receptor_technical_prep(prot_base_filename, pocket_center, targ_info_dict=targ_info_dict)
-                except:
-                    logging.info(sys.exc_info())
-                    logging.info('try/except statement caught error in function receptor_technical_prep.  Skipping candidate %s for target %s.' %(cand_id, targ_name))
-                    continue
+            logging.info('Protein technical prep successful for %s. All files exist from returned list %r.'%(cand_file, tech_prepped_prot_file_list))
+        
+    
+            #### Run CELPPade docking
 
-                ## Ensure that receptor technical prep was successful
-                # Check for function-reported failure
-                if tech_prepped_prot_file_list == False:
-                    logging.info('Technical protein preparation failed on %s. Skipping candidate %s for target %s.' %(os.path.abspath(prot_base_filename), cand_id, targ_name))
-                    continue
+            os.chdir(abs_targ_dock_dir)
+            cand_dock_dir = '%s_%s_docking' %(category, cand_id)
+            os.mkdir(cand_dock_dir)
+            os.chdir(cand_dock_dir)
 
-                # Ensure that receptor technical prep returns a list of filenames
-                if not(type(tech_prepped_prot_file_list) is list):
-                    logging.info('Technical protein preparation for %s did not return a list of filenames. Skipping candidate %s for target %s.' %(os.path.abspath(prot_base_filename), cand_id, targ_name))
-                    continue
+            ## Prepare expected file names
+            output_receptor_pdb = '%s-%s_%s_docked.pdb' %(category,
+                                                          targ_id,
+                                                          cand_id)
+            output_lig_mol = '%s-%s_%s_docked.mol' %(category,
+                                                     targ_id,
+                                                     cand_id)
 
-                # Ensure that all files in list really exist
-                for filename in tech_prepped_prot_file_list:
-                    if not(os.path.exists(filename)):
-                        logging.info('Technical protein preparation for %s returned file list %r, but file %s does not exist. Skipping candidate %s for target %s.' %(os.path.abspath(lig_base_filename), tech_prepped_lig_file_list, filename, cand_id, targ_name))
-                        continue
+            ## Copy in tech prepped files
+            for filename in tech_prepped_lig_file_list:
+                file_base_name = os.path.basename(filename)
+                shutil.copyfile(filename,file_base_name)
+            for filename in tech_prepped_prot_file_list:
+                file_base_name = os.path.basename(filename)
+                shutil.copyfile(filename,file_base_name)
             
-                ## Prepare to copy these files for docking step
-                tech_prepped_prot_file_list = [os.path.abspath(i) for i in tech_prepped_prot_file_list]
+            ## Do the actual docking
+            try:
+                dock_results = self.dock(tech_prepped_lig_file_list,
+                                         tech_prepped_prot_file_list,
+                                         output_receptor_pdb,
+                                         output_lig_mol,
+                                         targ_info_dict=targ_info_dict)
+            except:
+                logging.info(sys.exc_info())
+                logging.info('try/except statement caught error in dock() function. Docking was given '
+                             'inputs tech_prepped_lig_file_list=%r tech_prepped_prot_file_list=%r '
+                             'output_receptor_pdb=%r output_lig_mol=%r. Skipping docking to this '
+                             'candidate.'
+                             %(tech_prepped_lig_file_list,
+                               tech_prepped_prot_file_list,
+                               output_receptor_pdb, output_lig_mol))
+                continue
 
-                logging.info('Protein technical prep successful for %s. All files exist from returned list %r.'%(cand_file, tech_prepped_prot_file_list))
-            
+            ## Check for success
+            # Check for self-reported failure
+            if dock_results == False:
+                logging.info('Docking returned False given inputs: tech_prepped_lig_file_list=%r   '
+                             'tech_prepped_prot_file_list=%r    output_receptor_pdb=%r     output_lig_mol=%r. '
+                             'Skipping docking to this candidate.' %(tech_prepped_lig_file_list,
+                                                                    tech_prepped_prot_file_list,
+                                                                    output_receptor_pdb,
+                                                                    output_lig_mol))
+                continue
+            # Ensure that correct output files exist
+            if not(os.path.exists(output_receptor_pdb)) or (os.path.getsize(output_receptor_pdb)==0):
+                logging.info('Docking did not create receptor pdb file %s given inputs:   '
+                             'tech_prepped_lig_file_list=%r   tech_prepped_prot_file_list=%r    '
+                             'output_receptor_pdb=%r     output_lig_mol=%r. Skipping docking '
+                             'to this candidate.' %(output_receptor_pdb,
+                                                    tech_prepped_lig_file_list,
+                                                    tech_prepped_prot_file_list,
+                                                    output_receptor_pdb,
+                                                    output_lig_mol))
+                continue
+            if not(os.path.exists(output_lig_mol)) or (os.path.getsize(output_lig_mol)==0):
+                logging.info('Docking did not create ligand mol file %s given inputs:   '
+                             'tech_prepped_lig_file_list=%r   tech_prepped_prot_file_list=%r    '
+                             'output_receptor_pdb=%r     output_lig_mol=%r. Skipping docking '
+                             'to this candidate.' %(output_lig_mol,
+                                                    tech_prepped_lig_file_list,
+                                                    tech_prepped_prot_file_list,
+                                                    output_receptor_pdb,
+                                                    output_lig_mol))
+                continue
         
-                #### Run CELPPade docking
-
-                os.chdir(abs_targ_dock_dir)
-                cand_dock_dir = '%s_%s_docking' %(category, cand_id)
-                os.mkdir(cand_dock_dir)
-                os.chdir(cand_dock_dir)
-
-                ## Prepare expected file names
-                output_receptor_pdb = '%s-%s_%s_docked.pdb' %(category,
-                                                              targ_id,
-                                                              cand_id)
-                output_lig_mol = '%s-%s_%s_docked.mol' %(category,
-                                                         targ_id,
-                                                         cand_id)
-
-                ## Copy in tech prepped files
-                for filename in tech_prepped_lig_file_list:
-                    file_base_name = os.path.basename(filename)
-                    shutil.copyfile(filename,file_base_name)
-                for filename in tech_prepped_prot_file_list:
-                    file_base_name = os.path.basename(filename)
-                    shutil.copyfile(filename,file_base_name)
-                
-                ## Do the actual docking
-                try:
-                    dock_results = self.dock(tech_prepped_lig_file_list,
-                                             tech_prepped_prot_file_list,
-                                             output_receptor_pdb,
-                                             output_lig_mol,
-                                             targ_info_dict=targ_info_dict)
-                except:
-                    logging.info(sys.exc_info())
-                    logging.info('try/except statement caught error in dock() function. Docking was given '
-                                 'inputs tech_prepped_lig_file_list=%r tech_prepped_prot_file_list=%r '
-                                 'output_receptor_pdb=%r output_lig_mol=%r. Skipping docking to this '
-                                 'candidate.'
-                                 %(tech_prepped_lig_file_list,
-                                   tech_prepped_prot_file_list,
-                                   output_receptor_pdb, output_lig_mol))
-                    continue
-
-                ## Check for success
-                # Check for self-reported failure
-                if dock_results == False:
-                    logging.info('Docking returned False given inputs: tech_prepped_lig_file_list=%r   '
-                                 'tech_prepped_prot_file_list=%r    output_receptor_pdb=%r     output_lig_mol=%r. '
-                                 'Skipping docking to this candidate.' %(tech_prepped_lig_file_list,
-                                                                        tech_prepped_prot_file_list,
-                                                                        output_receptor_pdb,
-                                                                        output_lig_mol))
-                    continue
-                # Ensure that correct output files exist
-                if not(os.path.exists(output_receptor_pdb)) or (os.path.getsize(output_receptor_pdb)==0):
-                    logging.info('Docking did not create receptor pdb file %s given inputs:   '
-                                 'tech_prepped_lig_file_list=%r   tech_prepped_prot_file_list=%r    '
-                                 'output_receptor_pdb=%r     output_lig_mol=%r. Skipping docking '
-                                 'to this candidate.' %(output_receptor_pdb,
-                                                        tech_prepped_lig_file_list,
-                                                        tech_prepped_prot_file_list,
-                                                        output_receptor_pdb,
-                                                        output_lig_mol))
-                    continue
-                if not(os.path.exists(output_lig_mol)) or (os.path.getsize(output_lig_mol)==0):
-                    logging.info('Docking did not create ligand mol file %s given inputs:   '
-                                 'tech_prepped_lig_file_list=%r   tech_prepped_prot_file_list=%r    '
-                                 'output_receptor_pdb=%r     output_lig_mol=%r. Skipping docking '
-                                 'to this candidate.' %(output_lig_mol,
-                                                        tech_prepped_lig_file_list,
-                                                        tech_prepped_prot_file_list,
-                                                        output_receptor_pdb,
-                                                        output_lig_mol))
-                    continue
-            
-                logging.info('Docking was successful for %s. Final receptor and ligand '
-                             'files %s and %s exist and are nonzero size.' %(cand_file,
-                                                                             output_receptor_pdb,
-                                                                             output_lig_mol))
-
-                # Prepare to copy docking results into final result directory
-                abs_output_receptor_pdb = os.path.abspath(output_receptor_pdb)
-                abs_output_lig_mol = os.path.abspath(output_lig_mol)
-            
-                # Copy the files one directory up
-                os.chdir(abs_targ_dock_dir)
-                shutil.copyfile(abs_output_receptor_pdb, output_receptor_pdb)
-                shutil.copyfile(abs_output_lig_mol, output_lig_mol)
+            logging.info('Docking was successful for %s. Final receptor and ligand '
+                         'files %s and %s exist and are nonzero size.' %(cand_file,
+                                                                         output_receptor_pdb,
+                                                                         output_lig_mol))
+
+            # Prepare to copy docking results into final result directory
+            abs_output_receptor_pdb = os.path.abspath(output_receptor_pdb)
+            abs_output_lig_mol = os.path.abspath(output_lig_mol)
+        
+            # Copy the files one directory up
+            os.chdir(abs_targ_dock_dir)
+            shutil.copyfile(abs_output_receptor_pdb, output_receptor_pdb)
+            shutil.copyfile(abs_output_lig_mol, output_lig_mol)
+            docked_cands.append((category, targ_id, cand_id))
+        return docked_cands
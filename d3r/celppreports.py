@@ -2,6 +2,7 @@
 
 import sys
 import os
+import json
 import argparse
 import logging
 
@@ -16,6 +17,10 @@ LOG_FORMAT = "%(asctime)-15s %(levelname)s %(name)s %(message)s"
 
 BLASTNFILTER_SUMMARY_CSV = 'blastnfilter.summary.csv'
 
+REPORT_INDEX_JSON = 'celppreports.index.json'
+
+REPORT_INDEX_VERSION = 1
+
 
 def _setup_logging(theargs):
     """Sets up the logging for application
@@ -74,8 +79,64 @@ def _setup_logging(theargs):
         .setLevel(theargs.numericloglevel)
 
 
+def _get_summary_file_key(summary_file):
+    """Gets value that changes whenever `summary_file` changes
+    :returns: list [mtime, size] of file or None if file does not exist
+    """
+    try:
+        st = os.stat(summary_file)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+
+def _load_report_index(index_file):
+    """Loads rows parsed in earlier runs from `index_file`
+
+    :returns: dict of week directory, relative to celppdir, to dict
+              with 'key' as returned by _get_summary_file_key for
+              summary.txt of week and 'csv' row made from it. Empty
+              if file does not exist or cannot be read
+    """
+    if not os.path.isfile(index_file):
+        return {}
+    try:
+        f = open(index_file, 'r')
+        try:
+            index = json.load(f)
+        finally:
+            f.close()
+        if index.get('version') != REPORT_INDEX_VERSION:
+            logger.info('Ignoring index ' + index_file + ' with version ' +
+                        str(index.get('version')))
+            return {}
+        return index['weeks']
+    except Exception:
+        logger.exception('Unable to read index ' + index_file +
+                         ' parsing all weeks')
+        return {}
+
+
+def _save_report_index(index_file, weeks):
+    """Writes `weeks` to `index_file` replacing it atomically
+    """
+    tmp_file = index_file + '.tmp'
+    f = open(tmp_file, 'w')
+    try:
+        json.dump({'version': REPORT_INDEX_VERSION, 'weeks': weeks}, f)
+    finally:
+        f.close()
+    os.rename(tmp_file, index_file)
+
+
 def generate_reports(theargs):
     """Generates reports
+
+    Rows parsed from each week's summary.txt are stored in
+    REPORT_INDEX_JSON under --outdir along with the mtime and size
+    of summary.txt, so later runs only parse weeks that are new or
+    whose summary.txt changed.  Set theargs.rebuildindex to True
+    to parse every week
     """
     celpp_years = util.get_all_celpp_years(theargs.celppdir)
 
@@ -85,6 +146,19 @@ def generate_reports(theargs):
     if not os.path.isdir(theargs.outdir):
         os.makedirs(theargs.outdir)
 
+    index_file = os.path.join(theargs.outdir, REPORT_INDEX_JSON)
+    try:
+        rebuild_index = theargs.rebuildindex
+    except AttributeError:
+        rebuild_index = False
+
+    if rebuild_index is True:
+        old_weeks = {}
+    else:
+        old_weeks = _load_report_index(index_file)
+    weeks = {}
+    parsed_count = 0
+
     f = open(os.path.join(theargs.outdir, BLASTNFILTER_SUMMARY_CSV), 'w')
     f.write('Week #, Year, Complexes, Dockable complexes, Dockable monomers, '
             'Targets Found\n')
@@ -93,13 +167,23 @@ def generate_reports(theargs):
         for week in util.get_all_celpp_weeks(os.path.join(theargs.celppdir,
                                                           year)):
             logger.debug('Examining week ' + week)
-            the_dir = os.path.join(theargs.celppdir, year,
-                                   util.DATA_SET_WEEK_PREFIX + week)
+            week_name = os.path.join(year, util.DATA_SET_WEEK_PREFIX + week)
+            the_dir = os.path.join(theargs.celppdir, week_name)
             blast = BlastNFilterTask(the_dir, theargs)
-            summary = blast.get_blastnfilter_summary()
-            f.write(summary.get_csv() + '\n')
+            key = _get_summary_file_key(
+                blast.get_blastnfilter_summary_file())
+            entry = old_weeks.get(week_name)
+            if entry is None or entry['key'] != key:
+                summary = blast.get_blastnfilter_summary()
+                entry = {'key': key, 'csv': summary.get_csv()}
+                parsed_count += 1
+            weeks[week_name] = entry
+            f.write(entry['csv'] + '\n')
     f.flush()
     f.close()
+    logger.info('Parsed ' + str(parsed_count) + ' of ' + str(len(weeks)) +
+                ' weeks, rest were found in ' + index_file)
+    _save_report_index(index_file, weeks)
 
 
 def _parse_arguments(desc, args):
@@ -114,6 +198,9 @@ def _parse_arguments(desc, args):
                         help='Directory to write output reports to ')
     parser.add_argument("celppdir",
                         help='Directory where celpp yearly runs reside')
+    parser.add_argument("--rebuildindex", action='store_true',
+                        help='Ignore index of weeks parsed in earlier runs '
+                             'stored under --outdir and parse every week')
     parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
                         'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         help="Set the logging level",
@@ -149,6 +236,11 @@ def main(args):
               for each week found in the CELPP directory passed into this
               program.
 
+              Values parsed from each week are kept in
+              celppreports.index.json under --outdir so later runs only
+              parse weeks that are new or whose summary.txt changed. Pass
+              --rebuildindex to parse every week again.
+
               Example content of blastnfilter.summary.csv:
 
               Week #, Year, Complexes, Dockable complexes, Dockable monomers,
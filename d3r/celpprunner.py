@@ -32,7 +32,9 @@ from d3r.celpp.postevaluation import PostEvaluationTask
 from d3r.celpp.challengedata import ChallengeDataTask
 from d3r.celpp.chimeraprep import ChimeraProteinLigPrepTask
 from d3r.celpp.filetransfer import FtpFileTransfer
+from d3r.celpp.filetransfer import FtpConnectionPool
 from d3r.celpp.extsubmission import ExternalDataSubmissionFactory
+from d3r.celpp.scheduler import TaskScheduler
 
 from lockfile.pidlockfile import PIDLockFile
 
@@ -41,6 +43,11 @@ CREATE_CHALLENGE = 'createchallenge'
 CHIMERA_PREP = 'chimeraprep'
 POST_EVAL = 'postevaluation'
 STAGE_FLAG = '--stage'
+EXT_SUBMISSION = 'extsubmission'
+EVALUATION = 'evaluation'
+
+# stages whose task list is built from the output of earlier stages
+BARRIER_STAGES = [EXT_SUBMISSION, EVALUATION, POST_EVAL]
 
 
 def _get_lock(theargs, stage):
@@ -139,6 +146,15 @@ def run_stages(theargs):
         logger.info("No weekly dataset found in path " +
                     updatedtheargs.celppdir)
         return 0
+
+    try:
+        max_parallel_tasks = int(updatedtheargs.maxparalleltasks)
+    except (AttributeError, TypeError, ValueError):
+        max_parallel_tasks = 1
+
+    if max_parallel_tasks > 1:
+        return run_stages_in_parallel(updatedtheargs, max_parallel_tasks)
+
     for stage_name in updatedtheargs.stage.split(','):
         logger.info("Starting " + stage_name + " stage")
         try:
@@ -160,6 +176,34 @@ def run_stages(theargs):
     return 0
 
 
+def run_stages_in_parallel(theargs, max_parallel_tasks):
+    """Runs all the stages set in theargs.stage parameter concurrently
+
+       Uses `TaskScheduler` to run the tasks of all stages in
+       theargs.stage, up to `max_parallel_tasks` at once, starting each
+       task as soon as the tasks its can_run() depends on have completed.
+       The lock file of each stage is created via _get_lock() before any
+       of its tasks run and released once they have all finished.
+       :param theargs: should contain theargs.latest_weekly & other params
+                       set via commandline
+       :param max_parallel_tasks: maximum number of tasks to run at once
+       :return: 0 upon success otherwise non zero exit code
+    """
+    def get_task_list(stage_name):
+        return get_task_list_for_stage(theargs, stage_name)
+
+    def get_lock(stage_name):
+        return _get_lock(theargs, stage_name)
+
+    scheduler = TaskScheduler(max_parallel_tasks, get_task_list, get_lock,
+                              barrier_stages=BARRIER_STAGES)
+    exit_code = scheduler.run(theargs.stage.split(','))
+    if exit_code != 0:
+        logger.error('Non zero exit code ' + str(exit_code) +
+                     ' from parallel run of stages ' + theargs.stage)
+    return exit_code
+
+
 def run_tasks(task_list):
     """Runs a specific stage
 
@@ -272,11 +316,11 @@ def get_task_list_for_stage(theargs, stage_name):
     if stage_name == CHIMERA_PREP:
         task_list.append(ChimeraProteinLigPrepTask(theargs.latest_weekly,
                                                    theargs))
-    if stage_name == 'extsubmission':
+    if stage_name == EXT_SUBMISSION:
         extfac = ExternalDataSubmissionFactory(theargs.latest_weekly, theargs)
         task_list.extend(extfac.get_external_data_submissions())
 
-    if stage_name == 'evaluation':
+    if stage_name == EVALUATION:
         # use util function call to get all evaluation tasks
         # append them to the task_list
         eval_task_factory = EvaluationTaskFactory(theargs.latest_weekly,
@@ -308,6 +352,11 @@ def _parse_arguments(desc, args):
     parser = argparse.ArgumentParser(description=desc,
                                      formatter_class=help_formatter)
     parser.add_argument("celppdir", help='Base celpp directory')
+    parser.add_argument("--maxparalleltasks", default=1, type=int,
+                        help='Maximum number of tasks to run at once. If '
+                             'greater then 1, tasks of all stages set via ' +
+                             STAGE_FLAG + ' are started as soon as the '
+                             'tasks they depend on complete (default 1)')
     parser.add_argument("--email", dest="email",
                         help='Comma delimited list of email addresses '
                              'to receive an email when each task starts'
@@ -337,12 +386,21 @@ def _parse_arguments(desc, args):
     parser.add_argument("--blastnfilter", default='blastnfilter.py',
                         help='Path to BlastnFilter script '
                              '(default blastnfilter.py)')
+    parser.add_argument("--buildcomponentstore", default=None,
+                        help='Path to buildcomponentstore.py script. If set '
+                             'import stage builds a component store from '
+                             'the Components ich file which blast stage '
+                             'passes to blastnfilter (default not set)')
     parser.add_argument("--blastnfiltertimeout", default=86400, type=int,
                         help='Time in seconds script is allowed to run before'
                              'being killed (default 86400)')
     parser.add_argument("--evaluationtimeout", default=43200, type=int,
                         help='Time in seconds script is allowed to run before'
                              'SIGTERM is sent (default 43200)')
+    parser.add_argument("--evaluationworkers", default=1, type=int,
+                        help='Number of worker processes --evaluation '
+                             'script uses to evaluate targets in parallel '
+                             '(default 1)')
     parser.add_argument("--evaluationtimeoutkilldelay", default=120, type=int,
                         help='Time in seconds script after SIGTERM is sent'
                              'when SIGKILL is sent(default 120)')
@@ -355,15 +413,41 @@ def _parse_arguments(desc, args):
     parser.add_argument("--genchallenge", default='genchallengedata.py',
                         help='Path to genchallengedata script '
                              '(default genchallengedata.py)')
+    parser.add_argument("--genchallengeworkers", default=1, type=int,
+                        help='Number of worker processes --genchallenge '
+                             'script uses to generate targets in parallel '
+                             '(default 1)')
     parser.add_argument("--chimeraprep", default='chimera_proteinligprep.py',
                         help='Path to chimera_proteinligprep script '
                              '(default chimera_proteinligprep.py)')
+    parser.add_argument("--prepligandworkers", default=1, type=int,
+                        help='Number of worker processes --proteinligprep '
+                             'and --chimeraprep scripts use to prepare '
+                             'ligands (default 1)')
+    parser.add_argument("--prepproteinworkers", default=1, type=int,
+                        help='Number of worker processes --proteinligprep '
+                             'and --chimeraprep scripts use to prepare '
+                             'candidate proteins (default 1)')
     parser.add_argument("--glide", default='glidedocking.py',
                         help='Path to glide docking script '
                              '(default glidedocking.py)')
+    parser.add_argument("--glideworkers", default=1, type=int,
+                        help='Maximum number of Schrodinger grid and dock '
+                             'jobs --glide script runs at once (default 1)')
     parser.add_argument("--vina", default='vinadocking.py',
                         help='Path to auto dock vina docking script '
                              '(default vinadocking.py)')
+    parser.add_argument("--vinaworkers", default=1, type=int,
+                        help='Number of worker processes --vina script '
+                             'uses to dock target and candidate pairs in '
+                             'parallel (default 1)')
+    parser.add_argument("--vinaprepcache", default=None,
+                        help='Directory, shared between weeks, where --vina '
+                             'script caches prepared receptor and ligand '
+                             'files (default no cache)')
+    parser.add_argument("--vinaprepcachesize", default=1024, type=int,
+                        help='Size in megabytes --vinaprepcache is trimmed '
+                             'to after each run (default 1024)')
     parser.add_argument("--evaluation", default='evaluate.py',
                         help='Path to evaluation script (default evaluate.py)')
     parser.add_argument("--postevaluation", default='post_evaluation.py',
@@ -389,6 +473,19 @@ def _parse_arguments(desc, args):
     parser.add_argument("--makeblastdb", default='makeblastdb',
                         help='Path to NCBI Blast makeblastdb program '
                              'ie /usr/bin/makeblastdb (default makeblastdb)')
+    parser.add_argument("--makeblastdbincremental", action='store_true',
+                        help='If set, makeblastdb stage only runs makeblastdb '
+                             'on sequences that are new or changed since '
+                             'the last full build and combines them with '
+                             'that build through an alias database')
+    parser.add_argument("--makeblastdbfullrebuild",
+                        default=MakeBlastDBTask.DEFAULT_FULL_REBUILD_WEEKS,
+                        type=int,
+                        help='With --makeblastdbincremental, number of weeks '
+                             'after which a full build is done again '
+                             '(default ' +
+                             str(MakeBlastDBTask.DEFAULT_FULL_REBUILD_WEEKS) +
+                             ')')
     parser.add_argument("--pdbsequrl",
                         default='ftp://ftp.rcsb.org/pub/pdb/derived_data/'
                                 'pdb_seqres.txt.gz',
@@ -430,10 +527,12 @@ def _parse_arguments(desc, args):
                         ' configuration to connect to ftp server.  If set,'
                         ' data from stages run during this invocation will be'
                         ' uploaded after the stage completes.  Format is same'
-                        ' as ncftp config files with two added fields (' +
+                        ' as ncftp config files with added fields (' +
                         FtpFileTransfer.PATH + ', ' +
                         FtpFileTransfer.CHALLENGEPATH + ', ' +
-                        FtpFileTransfer.SUBMISSIONPATH + ') ' +
+                        FtpFileTransfer.SUBMISSIONPATH + ', ' +
+                        FtpFileTransfer.CONNECTIONS + ', ' +
+                        FtpFileTransfer.VERIFYCHECKSUM + ') ' +
                         'SEE: description of challengedata '
                         'stage above for example file')
     parser.add_argument('--replyto', dest='replytoaddress', default=None,
@@ -486,6 +585,16 @@ def main(args):
                      Also note order matters, ie putting blast,import will
                      cause celpprunner.py to run blast stage first.
 
+              If --maxparalleltasks is greater then 1, stages are not
+              run one after another. Instead a task is started as soon
+              as the tasks it depends on (ie glide depends on
+              proteinligprep, vina on {chimeraprep}) complete, so
+              independent tasks run concurrently. Tasks of the
+              extsubmission, evaluation and {postevaluation} stages are
+              only added once all earlier tasks have finished. If a task
+              fails the tasks depending on it are skipped and no further
+              stages are started.
+
               This program drops a pid lockfile
               (celpprunner.<stage>.lockpid) in celppdir to prevent duplicate
               invocation.
@@ -552,6 +661,15 @@ def main(args):
               (set by --makeblastdb) is run on it to create a blast
               database.  The files are stored in {makeblastdb_dirname}
 
+              If --makeblastdbincremental is set, the sequences are
+              compared with those of the last full build and
+              makeblastdb is only run on new and changed sequences,
+              which are combined with the last full build via a blast
+              alias database. A full build is still done every
+              --makeblastdbfullrebuild weeks or if the last full build
+              can not be used. The path taken and time it took are
+              written to {makeblastdb_summary} file.
+
               If {stageflag} 'import'
 
               In this stage 4 files are downloaded from urls specified
@@ -578,6 +696,12 @@ def main(args):
               tsv files and --importretry sets number of times to retry
               before giving up.
 
+              If --buildcomponentstore is set, the script it points to
+              is run once the files are downloaded to build an indexed
+              store of rdkit molecules and fingerprints from the
+              Components ich file. Failure to build the store is not
+              considered fatal.
+
               If {stageflag} 'blast'
 
               Verifies {dataimport_dirname} exists and has '{complete}'
@@ -599,7 +723,10 @@ def main(args):
               file.  If complete, this stage runs which invokes program
               set in --genchallenge flag to create a challenge dataset
               file.  The --pdbdb flag must also be set when calling this
-              stage. If --ftpconfig is set with {challengepath} field then
+              stage. If --genchallengeworkers is greater then 1, it is
+              passed to the --genchallenge script as --numworkers so
+              targets are generated in parallel.
+              If --ftpconfig is set with {challengepath} field then
               this stage will also upload the challenge dataset tarfile
               to the ftp server with path set by {challengepath}.  The
               code will also upload a {latest_txt} file containing name
@@ -614,6 +741,14 @@ def main(args):
               {path} /celpp
               {challengepath} /challenge
               {submissionpath} /submissions
+              {connections} 4
+              {verifychecksum} false
+
+              The optional {connections} field sets how many files are
+              uploaded at once over separate connections and
+              {verifychecksum} set to true compares the md5 of each
+              uploaded file with the local copy.  Partially uploaded
+              files are resumed.
 
 
               If {stageflag} '{chimeraprep}'
@@ -623,6 +758,8 @@ def main(args):
               set in --chimeraprep flag to prepare pdb and inchi files
               storing output in {chimeraprep_dirname}.  --pdbdb flag
               must also be set when calling this stage.
+              --prepligandworkers and --prepproteinworkers are passed
+              on as described for 'proteinligprep'.
 
               If {stageflag} 'proteinligprep'
 
@@ -630,7 +767,12 @@ def main(args):
               file.  If complete, this stage runs which invokes program
               set in --proteinligprep flag to prepare pdb and inchi files
               storing output in {proteinligprep_dirname}.  --pdbdb flag
-              must also be set when calling this stage.
+              must also be set when calling this stage. If
+              --prepligandworkers or --prepproteinworkers is greater
+              then 1, both are passed to the script as --ligandworkers
+              and --proteinworkers so ligands and proteins are prepared
+              in parallel on separate pools. Targets finished by an
+              earlier, interrupted run are skipped.
 
               If {stageflag} 'extsubmission'
 
@@ -655,14 +797,24 @@ def main(args):
               Verifies {proteinligprep_dirname} exists and has a '{complete}'
               file within it.  If complete, this stage runs which invokes
               program set in --glide flag to perform docking via glide
-              storing output in {glide_dirname}
+              storing output in {glide_dirname}. If --glideworkers is
+              greater then 1, it is passed to the --glide script as
+              --numworkers so grid and dock jobs of several candidates
+              run at once.
 
               If {stageflag} 'vina'
 
               Verifies {proteinligprep_dirname} exists and has a '{complete}'
               file within it.  If complete, this stage runs which invokes
               program set in --vina flag to perform docking via AutoDock Vina
-              storing output in {vina_dirname}
+              storing output in {vina_dirname}. If --vinaworkers is
+              greater then 1, it is passed to the --vina script as
+              --numworkers so target and candidate pairs are docked in
+              parallel. If --vinaprepcache is set, it is passed to the
+              --vina script as --prepcache along with --vinaprepcachesize
+              as --prepcachesize so prepared receptor and ligand files
+              are reused across weeks. Cache hit rates are added to the
+              summary of this stage.
 
               If {stageflag} 'evaluation'
 
@@ -670,7 +822,10 @@ def main(args):
               files in them which do not end in name '{webdata}' and runs
               script set via --evaluation parameter storing the result of
               the script into stage.{evalstage}.<algo>.evaluation. --pdbdb flag
-              must also be set when calling this stage.
+              must also be set when calling this stage. If
+              --evaluationworkers is greater then 1, it is passed to the
+              --evaluation script as --numworkers so targets are
+              evaluated in parallel.
 
               If {stageflag} '{postevaluation}'
 
@@ -683,6 +838,7 @@ def main(args):
               --summaryemail and --email lists.
 
               """.format(makeblastdb_dirname=makedb.get_dir_name(),
+                         makeblastdb_summary=MakeBlastDBTask.SUMMARY_FILE,
                          dataimport_dirname=dataimport.get_dir_name(),
                          blast_dirname=blasttask.get_dir_name(),
                          challenge_dirname=challenge.get_dir_name(),
@@ -708,6 +864,8 @@ def main(args):
                          path=FtpFileTransfer.PATH,
                          challengepath=FtpFileTransfer.CHALLENGEPATH,
                          submissionpath=FtpFileTransfer.SUBMISSIONPATH,
+                         connections=FtpFileTransfer.CONNECTIONS,
+                         verifychecksum=FtpFileTransfer.VERIFYCHECKSUM,
                          version=d3r.__version__,
                          stageflag=STAGE_FLAG,
                          postevaluation=POST_EVAL,
@@ -718,12 +876,15 @@ def main(args):
     theargs.version = d3r.__version__
 
     util.setup_logging(theargs)
+    util.stop_running_commands_on_exit()
 
     try:
         return run_stages(theargs)
     except Exception:
         logger.exception("Error caught exception")
         return 2
+    finally:
+        FtpConnectionPool.close_all()
 
 
 if __name__ == '__main__':  # pragma: no cover
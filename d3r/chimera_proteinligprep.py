@@ -6,6 +6,7 @@ import glob
 import logging
 import time
 import re 
+from d3r.utilities import prepjobs
 
 logger = logging.getLogger()
 logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.DEBUG )
@@ -88,6 +89,14 @@ def extract_info_from_s2(stage_2_out):
 #copy all the txt files from the output stage 2 location and create folder for each of this named by the query entry
 #check if it finished later needed 
 
+def write_script(script_file, script_text):
+    #write a helper script under a temporary name and rename it so jobs running side by side
+    #in the same target directory never run a partially written script
+    tmp_script_file = '%s.%d.tmp' %(script_file, os.getpid())
+    with open(tmp_script_file,'wb') as of:
+        of.write(script_text)
+    os.rename(tmp_script_file, script_file)
+
 def ligand_prepare(ligand_smile, out_lig_file, rdkit_python):
 #    commands.getoutput("$SCHRODINGER/ligprep -WAIT -i 0 -nt -s 1 -g -ismi %s -omae %s"%(ligand_smile, out_lig_file) ) 
 #    return os.path.isfile(out_lig_file)
@@ -97,8 +106,7 @@ def ligand_prepare(ligand_smile, out_lig_file, rdkit_python):
 
     # Prepare a 3D version of the ligand using babel
     unprep_lig_file_1 = ligand_smile.replace('.smi','_unprep_step1.sdf')
-    with open('rdkit_smiles_to_3d_sdf.py','wb') as of:
-        of.write(rdkit_smiles_to_3d_sdf_text)
+    write_script('rdkit_smiles_to_3d_sdf.py', rdkit_smiles_to_3d_sdf_text)
 
     rdkitpythonpath = os.path.join(rdkit_python, PYTHON_BINARY_NAME)
     commands.getoutput(rdkitpythonpath + ' rdkit_smiles_to_3d_sdf.py ' +
@@ -108,8 +116,7 @@ def ligand_prepare(ligand_smile, out_lig_file, rdkit_python):
     commands.getoutput('babel -isdf %s -omol2 %s' %(unprep_lig_file_1, unprep_lig_file_2))
     #unprep_lig_file = ligand_smile.replace('.smi','_unprep.mol2')
     #commands.getoutput('babel -ismi %s -omol2 %s --gen3D' %(ligand_smile,unprep_lig_file))
-    with open('chimeraPrep.py','wb') as of:
-        of.write(chimera_prep_text) 
+    write_script('chimeraPrep.py', chimera_prep_text)
     commands.getoutput('chimera --nogui --script "chimeraPrep.py %s %s" >& chimeraLigPrep.out' %(unprep_lig_file_2, out_lig_file))
     #time.sleep(sleep_time) 
     return os.path.isfile(out_lig_file)
@@ -125,9 +132,9 @@ def split_complex (part, complex_file, out_split):
 def prepare_protein (protein_file, prepared_protein, sleep_time = 300):
     #here the prepared protein should has ".mol2" as extension
     #commands.getoutput("$SCHRODINGER/utilities/prepwizard %s %s"%(protein_file, prepared_protein))
-    with open('chimeraPrep.py','wb') as of:
-        of.write(chimera_prep_text) 
-    commands.getoutput('chimera --nogui --script "chimeraPrep.py %s %s" >& chimeraProtPrep.out' %(protein_file, prepared_protein))
+    #chimera output goes to a file named after the protein as several proteins of a target may be prepared at once
+    write_script('chimeraPrep.py', chimera_prep_text)
+    commands.getoutput('chimera --nogui --script "chimeraPrep.py %s %s" >& %s_chimeraProtPrep.out' %(protein_file, prepared_protein, os.path.splitext(prepared_protein)[0]))
     #time.sleep(sleep_time) 
     if os.path.isfile(prepared_protein):
         return True
@@ -135,12 +142,60 @@ def prepare_protein (protein_file, prepared_protein, sleep_time = 300):
         return False
 
 
-def main_proteinprep (challenge_data_path, pdb_protein_path, working_folder, rdkit_python ):
+def prepare_candidate (candidate_filename):
+    #split and prepare one candidate protein, run from within its target directory
+    ## Parse the candidate name 
+    ## Get the method type, target, and candidate info from the filename
+    # for example, this will parse 'hiResApo-5hib_2eb2_docked.mol' into [('hiResApo', '5hib', '2eb2')]
+    
+    parsed_name = re.findall('([a-zA-Z0-9]+)-([a-zA-Z0-9]+)_([a-zA-Z0-9]+)-?([a-zA-Z0-9]*).pdb', candidate_filename)
+    if len(parsed_name) != 1:
+        logging.info('Failed to parse docked structure name "%s". Parsing yielded %r' %(candidate_filename, parsed_name))
+        return False
+    candidate_structure_type = parsed_name[0][0]
+    candidate_structure_target = parsed_name[0][1]
+    candidate_structure_candidate = parsed_name[0][2]
+    candidate_structure_ligand = parsed_name[0][2]
+
+    # Split the complex 
+    #candidate_prefix = candidate_filename.replace('.pdb','')
+    candidate_prefix = '%s-%s_%s' %(candidate_structure_type,
+                                    candidate_structure_target,
+                                    candidate_structure_candidate)
+    
+    out_split = candidate_prefix+ "_split.pdb"
+    out_receptor = split_complex("pdb", candidate_filename, out_split)
+    
+    
+    if not out_receptor:
+        logging.info("Unable to split this protein:%s"%(candidate_filename))
+        return False
+
+    logging.info("Successfully split this protein:%s, go to preparation step"%(candidate_filename))
+    prepared_protein_mol2 = candidate_prefix + "_prepared.mol2"
+    #pass the wizard sleep time here
+    preparation_result = prepare_protein(out_receptor,prepared_protein_mol2, 180 )
+    if not preparation_result:
+        logging.info("Unable to prepare this protein:%s"%(out_split))
+        return False
+    #convert into pdb format
+    out_prepare_pdb = candidate_prefix + "_prepared.pdb"
+    commands.getoutput("$SCHRODINGER/utilities/pdbconvert -imae %s -opdb %s"%(prepared_protein_mol2, out_prepare_pdb))
+    logging.info("Successfully prepared this protein:%s"%(out_prepare_pdb))
+    return True
+
+def main_proteinprep (challenge_data_path, pdb_protein_path, working_folder, rdkit_python, ligand_workers = 1, protein_workers = 1, retry_failed = False ):
+    #the ligand of each target and each of its candidate proteins are prepared by independent jobs, if either worker
+    #count is larger than 1 ligand jobs and protein jobs run on separate pools of that many processes. Targets whose
+    #jobs all ran in an earlier run, as recorded by their completion marker, are skipped unless retry_failed is set,
+    #in which case only the jobs the marker lists as failed are run again
+    challenge_data_path = os.path.abspath(challenge_data_path)
     os.chdir(working_folder)
     current_dir_layer_1 = os.getcwd()
 
     ## Get all potential target directories and candidates within
     valid_candidates = {}
+    retry_jobs = {}
     #target_ligands = {}
     pot_target_dirs = list(os.walk(challenge_data_path))[0][1]
     #target_ids = []
@@ -151,6 +206,13 @@ def main_proteinprep (challenge_data_path, pdb_protein_path, working_folder, rdk
         if len(pot_target_id) != 4:
             logging.info('Filtering potential target directories: %s is not 4 characters long. Skipping' %(pot_target_id))
             continue
+        if prepjobs.is_target_complete(pot_target_id):
+            failed_jobs = prepjobs.get_failed_jobs(pot_target_id)
+            if not retry_failed or not failed_jobs:
+                logging.info('Target %s was prepared by an earlier run. Skipping' %(pot_target_id))
+                continue
+            logging.info('Retrying failed preparation jobs of target %s: %s' %(pot_target_id, ', '.join(sorted([job[1] for job in failed_jobs]))))
+            retry_jobs[pot_target_id] = failed_jobs
         commands.getoutput('mkdir %s' %(pot_target_id))
         #target_ids.append(pot_target_dir)
         valid_candidates[pot_target_id] = []
@@ -174,7 +236,7 @@ def main_proteinprep (challenge_data_path, pdb_protein_path, working_folder, rdk
         LMCSS_ligand_filename = LMCSS_ligand_filenames[0]
         
         # Copy in each valid candidate
-        for candidate_file in glob.glob('%s/*-%s_*.pdb' %(target_dir_path, pot_target_id)):
+        for candidate_file in sorted(glob.glob('%s/*-%s_*.pdb' %(target_dir_path, pot_target_id))):
             # The LMCSS ligand will be in a pdb file called something like celpp_week19_2016/1fcz/LMCSS-1fcz_1fcz-156-lig.pdb
             # We want to make sure we don't treat this like a receptor
             if 'lig.pdb' in candidate_file:
@@ -183,60 +245,28 @@ def main_proteinprep (challenge_data_path, pdb_protein_path, working_folder, rdk
             candidate_local_file = os.path.basename(candidate_file)
             valid_candidates[pot_target_id].append((local_smiles_file, candidate_local_file))
                 
-    for target_id in valid_candidates.keys():
-        os.chdir(target_id)
-
-        ######################
-        #step 6, prepare all proteins
-        ######################
+    ######################
+    #step 6, prepare the ligand and all proteins
+    ######################
+    jobs = []
+    for target_id in sorted(valid_candidates.keys()):
+        if len(valid_candidates[target_id]) == 0:
+            continue
+        target_dir = os.path.join(current_dir_layer_1, target_id)
+        smiles_filename = valid_candidates[target_id][0][0]
+        target_jobs = []
+        target_jobs.append((prepjobs.LIGAND_JOB, target_dir, smiles_filename, ligand_prepare, (smiles_filename, smiles_filename.replace('.smi','_prepared.mol2'), rdkit_python)))
         for smiles_filename, candidate_filename in valid_candidates[target_id]:
-            ## Parse the candidate name 
-            ## Get the method type, target, and candidate info from the filename
-            # for example, this will parse 'hiResApo-5hib_2eb2_docked.mol' into [('hiResApo', '5hib', '2eb2')]
-            
-            parsed_name = re.findall('([a-zA-Z0-9]+)-([a-zA-Z0-9]+)_([a-zA-Z0-9]+)-?([a-zA-Z0-9]*).pdb', candidate_filename)
-            if len(parsed_name) != 1:
-                logging.info('Failed to parse docked structure name "%s". Parsing yielded %r' %(candidate_filename, parsed_name))
-                continue
-            candidate_structure_type = parsed_name[0][0]
-            candidate_structure_target = parsed_name[0][1]
-            candidate_structure_candidate = parsed_name[0][2]
-            candidate_structure_ligand = parsed_name[0][2]
-            
-            # Prepare the ligand
-            if not ligand_prepare(smiles_filename, smiles_filename.replace('.smi','_prepared.mol2'), rdkit_python):
-                logging.info("Unable to prepare the ligand for this query protein:%s"%target_id)
-                #os.chdir(current_dir_layer_1)
-                continue 
-
-            # Split the complex 
-            #candidate_prefix = candidate_filename.replace('.pdb','')
-            candidate_prefix = '%s-%s_%s' %(candidate_structure_type,
-                                            candidate_structure_target,
-                                            candidate_structure_candidate)
-            
-            out_split = candidate_prefix+ "_split.pdb"
-            out_receptor = split_complex("pdb", candidate_filename, out_split)
-            
-            
-            if not out_receptor:
-                logging.info("Unable to split this protein:%s"%(candidate_filename))
-                #os.chdir(current_dir_layer_1)
-                continue
-
-            logging.info("Successfully split this protein:%s, go to preparation step"%(candidate_filename))
-            prepared_protein_mol2 = candidate_prefix + "_prepared.mol2"
-            #pass the wizard sleep time here
-            preparation_result = prepare_protein(out_receptor,prepared_protein_mol2, 180 )
-            if not preparation_result:
-                logging.info("Unable to prepare this protein:%s"%(out_split))
-                #os.chdir(current_dir_layer_1)
-                continue
-            #convert into pdb format
-            out_prepare_pdb = candidate_prefix + "_prepared.pdb"
-            commands.getoutput("$SCHRODINGER/utilities/pdbconvert -imae %s -opdb %s"%(prepared_protein_mol2, out_prepare_pdb))
-            logging.info("Successfully prepared this protein:%s"%(out_prepare_pdb))
-        os.chdir(current_dir_layer_1)
+            target_jobs.append((prepjobs.PROTEIN_JOB, target_dir, candidate_filename, prepare_candidate, (candidate_filename,)))
+        if target_id in retry_jobs:
+            target_jobs = [job for job in target_jobs if (job[0], job[2]) in retry_jobs[target_id]]
+        jobs.extend(target_jobs)
+    results = prepjobs.run_prep_jobs(jobs, ligand_workers = ligand_workers, protein_workers = protein_workers)
+    for target_dir, kind, name, success, elapsed, error in results:
+        if kind == prepjobs.LIGAND_JOB and not success:
+            logging.info("Unable to prepare the ligand for this query protein:%s"%os.path.basename(target_dir))
+    os.chdir(current_dir_layer_1)
+    return results
                         
                 
 
@@ -250,6 +280,9 @@ if ("__main__") == (__name__):
                         help="Path for python build with new "
                              "version of rdkit.",
                         default="")
+    parser.add_argument("--ligandworkers", type = int, default = 1, help = "Number of worker processes preparing ligands, if this or --proteinworkers is larger than 1 ligands and proteins are prepared in parallel (default 1)")
+    parser.add_argument("--proteinworkers", type = int, default = 1, help = "Number of worker processes preparing candidate proteins (default 1)")
+    parser.add_argument("--retryfailed", default = False, action = "store_true", help = "Rerun the preparation jobs that failed for targets prepared by an earlier run, by default those targets are skipped")
     #parser.add_option("-s", "--sleep", metavar = "VALUE", help = "Sleep time for protein prep")
     #parser.add_option("-u", "--update", default = False, action = "store_true", help = "update the protein generation and docking step")
     logger = logging.getLogger()
@@ -262,7 +295,7 @@ if ("__main__") == (__name__):
     #sleep_time = opt.sleep
     #running under this dir
     running_dir = os.getcwd()
-    main_proteinprep(challenge_data_path, pdb_location, result_path, rdkit_python)
+    main_proteinprep(challenge_data_path, pdb_location, result_path, rdkit_python, ligand_workers = opt.ligandworkers, protein_workers = opt.proteinworkers, retry_failed = opt.retryfailed)
     #move the final log file to the result dir
     log_file_path = os.path.join(running_dir, 'final.log')
     commands.getoutput("mv %s %s"%(log_file_path, result_path))
@@ -1,43 +1,51 @@
 #! /usr/bin/env python
 
 import os
+import logging
 from Bio import PDB
 import commands
 import time
-from openeye.oechem import *
 import glob
 import re
 import pickle
+import json
+import shutil
 import numpy
+import multiprocessing
+from d3r.utilities import mcs_rmsd
+from d3r.utilities import geometry
+try:
+    from openeye.oechem import *
+    HAS_OPENEYE = True
+    MCS_BACKEND = "openeye"
+except ImportError:
+    #without OpenEye the MCS RMSDs are calculated with rdkit, __main__ logs a warning about it
+    HAS_OPENEYE = False
+    MCS_BACKEND = "rdkit"
+
+#most pairs of MCS matches looked at per pose, None for all of them
+MCS_MAX_MATCHES = None
+#write each MCS match out as match1_#.pdb and match2_#.pdb, for debugging only
+WRITE_MATCH_FILES = False
+#results of the evaluation, RMSD.journal holds the values registered so far while main_score runs
+RESULT_PICKLE = "RMSD.pickle"
+RESULT_PLAIN = "RMSD"
+RESULT_JOURNAL = "RMSD.journal"
+#the pickle and plain files are rewritten from the results so far after this many targets, so a run stopped
+#by its timeout still leaves the results of most targets behind
+RESULT_WRITE_INTERVAL = 10
 
 
 def get_distance (pos1, pos2):
-    _dist_0 = float(pos1.split(",")[0])-float(pos2.split(",")[0])
-    _dist_1 = float(pos1.split(",")[1])-float(pos2.split(",")[1])
-    _dist_2 = float(pos1.split(",")[2])-float(pos2.split(",")[2])
-    return (_dist_0**2 + _dist_1**2 + _dist_2**2)**0.5
+    return geometry.distance(geometry.parse_center(pos1), geometry.parse_center(pos2))
 
 def get_center(ligand_pdb):
-    xyz_lines = open(ligand_pdb, "r").readlines()
-    multi_ligand = False
-    atom_list = []
-    x = y = z = 0
-    for xyz_line in xyz_lines:
-        if "HETATM" in xyz_line:
-            #logging.debug("Check the get center of this protein: %s for this ligand: %s"%(protein_file, ligname))                                                                                                               
-            atom_name = xyz_line[12:16]
-            if atom_name in atom_list:
-                multi_ligand = True
-            else:
-                atom_list.append(atom_name)
-                try:
-                    x += float(xyz_line[30:38])
-                    y+= float(xyz_line[38:46])
-                    z+= float(xyz_line[46:54])                                  
-                except:                                                         
-                    logging.debug("Fatal error: Cannot find the XYZ coordinate for this ligand:%s"%ligand_pdb)
-                    return False                                                
-    lig_center = "%8.3f, %8.3f, %8.3f"%(x/len(atom_list), y/len(atom_list), z/len(atom_list))
+    try:
+        coords, multi_ligand = geometry.read_ligand_coords(ligand_pdb)
+    except ValueError:
+        logging.debug("Fatal error: Cannot find the XYZ coordinate for this ligand:%s"%ligand_pdb)
+        return False
+    lig_center = geometry.format_center(geometry.centroid(coords))
     logging.debug("Ligand center for this case:%s is %s"%(ligand_pdb, lig_center))        
     return lig_center                                                       
 
@@ -58,8 +66,10 @@ def extract_LMCSS_ligand_name (blastnfilter_result_txt):
             ligand_name = result_line.split(",")[2].strip()
     return ligand_name
 
-def mcs(ref_mol, fit_mol):
-    #do the mcs search and return OEMatch object.
+def mcs(ref_mol, fit_mol, max_matches = None, write_match_files = False):
+    #do the mcs search and return dict of OEMatch object to match info.
+    #at most max_matches pairs of matches are returned if it is set and the matches are written to
+    #match1_#.pdb and match2_#.pdb files only if write_match_files is True
     #ignore Hydrogen 
     OESuppressHydrogens(fit_mol)
     OESuppressHydrogens(ref_mol)
@@ -76,33 +86,53 @@ def mcs(ref_mol, fit_mol):
     j = 0
     for match1 in mcss.Match(ref_mol):                                      
         i += 1                                                              
-        #write out match1 molecule                                      
-        mol1 = OEGraphMol()
-        OESubsetMol(mol1,match1, True)                                      
-        ofs1 = oemolostream("match1_%s.pdb"%i)                              
-        OEWriteMolecule(ofs1, mol1)                                         
-        ofs1.close()                                                        
+        if write_match_files:
+            #write out match1 molecule                                      
+            mol1 = OEGraphMol()
+            OESubsetMol(mol1,match1, True)                                      
+            ofs1 = oemolostream("match1_%s.pdb"%i)                              
+            OEWriteMolecule(ofs1, mol1)                                         
+            ofs1.close()                                                        
         for match2 in mcss.Match(fit_mol):                                  
+            if max_matches is not None and j >= max_matches:
+                return new_match_dic
             j += 1                                                          
             check_list = []                                                 
-            #write out match2 molecule                                      
             new_match = OEMatch()                                           
-            mol2 = OEGraphMol()                                             
-            OESubsetMol(mol2,match2, True)                                  
-            ofs2 = oemolostream("match2_%s.pdb"%j)
-            OEWriteMolecule(ofs2, mol2)                                     
-            ofs2.close()                                                    
+            if write_match_files:
+                #write out match2 molecule                                      
+                mol2 = OEGraphMol()                                             
+                OESubsetMol(mol2,match2, True)                                  
+                ofs2 = oemolostream("match2_%s.pdb"%j)
+                OEWriteMolecule(ofs2, mol2)                                     
+                ofs2.close()                                                    
             for mp1, mp2 in zip(match1.GetAtoms(), match2.GetAtoms()):      
-                ref_name = mp1.target.GetName().strip()                     
-                fit_name = mp2.target.GetName().strip()                     
                 new_match.AddPair (mp1.target, mp2.target)                  
+                check_list.append((mp1.target.GetIdx(), mp2.target.GetIdx()))
             #store the match info
             new_match_list.append(new_match)                                
             new_match_dic[new_match] = (["match1_%s_vs_match2_%s"%(i,j), check_list ])
     return new_match_dic
 
-def rmsd_mcss(ref_struc, fit_struc):
+def get_coords_array(mol):
+    #coordinates of all atoms of the OpenEye molecule as numpy array indexed by atom index
+    coords = mol.GetCoords()
+    coords_array = numpy.zeros((mol.GetMaxAtomIdx(), 3))
+    for atom_idx in coords:
+        coords_array[atom_idx] = coords[atom_idx]
+    return coords_array
+
+def rmsd_mcss(ref_struc, fit_struc, max_matches = None, write_match_files = None):
     #This function use the openeye mcss calculation to get the atom mapping first and then calculate RMSD, if multiple atom mapping is avaiable, the lowest RMSM will be returned 
+    #the RMSD of each atom mapping is calculated in memory from the coordinates, with MCS_BACKEND set to rdkit the
+    #mcs search is done by rdkit instead. max_matches and write_match_files default to MCS_MAX_MATCHES and
+    #WRITE_MATCH_FILES
+    if max_matches is None:
+        max_matches = MCS_MAX_MATCHES
+    if write_match_files is None:
+        write_match_files = WRITE_MATCH_FILES
+    if MCS_BACKEND == "rdkit":
+        return mcs_rmsd.rdkit_rmsd_mcss(ref_struc, fit_struc, max_matches = max_matches)
     reffs = oemolistream()
     reffs.open(ref_struc)
     fitfs = oemolistream()
@@ -111,14 +141,17 @@ def rmsd_mcss(ref_struc, fit_struc):
     OEReadMolecule(reffs, refmol)
     for fitmol in fitfs.GetOEGraphMols():
         #get all possible matching 
-        ss = mcs(refmol, fitmol,)
+        ss = mcs(refmol, fitmol, max_matches = max_matches, write_match_files = write_match_files)
+        ref_coords = get_coords_array(refmol)
+        fit_coords = get_coords_array(fitmol)
         mcss_rmsd_list = []
         match_info = []
         for mcss in ss.keys():
             #calculate the RMSD based on atom mapping
-            mcss_rmsd = OERMSD(refmol, fitmol, mcss)
-            mcss_rmsd_list.append(mcss_rmsd)
-            match_info.append(ss[mcss])
+            mcss_rmsd = mcs_rmsd.match_rmsd(ref_coords, fit_coords, ss[mcss][1])
+            if mcss_rmsd is not None:
+                mcss_rmsd_list.append(mcss_rmsd)
+                match_info.append(ss[mcss])
     try:
         minimum_mcss = min(mcss_rmsd_list)
         return minimum_mcss
@@ -517,8 +550,11 @@ def calculate_average_min_max_medium(full_list_of_value):
     return average ,minimum , maximum, medium 
         
 class data_container(object):
+    #results can be journaled to a file, one line per registered value, which is appended to as the evaluation
+    #goes so the pickle and plain files only need to be written once at the end
     def __init__(self, ):
         self._data = {}
+        self._journal = None
     def register(self, target_ID, docked_type, value):
         #the docked type could be either "LMCSS" or "LMCSS_dis"
         # the value could be either rmsd or distance
@@ -528,10 +564,68 @@ class data_container(object):
             if docked_type:
                 if docked_type not in self._data[target_ID]:
                     self._data[target_ID][docked_type] = value
+                    self._append_to_journal({"target": target_ID, "type": docked_type, "value": value})
+    def _append_to_journal(self, entry):
+        #the line is flushed to disk right away so the journal holds every value registered before a crash
+        if self._journal:
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+    def open_journal(self, journal_filename):
+        #load the results of the targets finished by an earlier, interrupted run from journal_filename and append
+        #all values registered from now on to it. Values of targets which were not finished are dropped from the
+        #journal since those targets are evaluated again
+        #return the list of targets already finished
+        finished_targets = []
+        entries = []
+        if os.path.isfile(journal_filename):
+            journal_file = open(journal_filename, "r")
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    #the last line is incomplete if the run was killed while writing it
+                    logging.info("Skipping incomplete line in journal %s"%journal_filename)
+                    continue
+                if "finished" in entry:
+                    finished_targets.append(str(entry["target"]))
+                else:
+                    entries.append(entry)
+            journal_file.close()
+        kept_lines = []
+        for entry in entries:
+            target_ID = str(entry["target"])
+            if target_ID in finished_targets:
+                self.register(target_ID, str(entry["type"]), entry["value"])
+                kept_lines.append(json.dumps(entry) + "\n")
+        for target_ID in finished_targets:
+            kept_lines.append(json.dumps({"target": target_ID, "finished": True}) + "\n")
+        tmp_journal_filename = journal_filename + ".tmp"
+        tmp_journal = open(tmp_journal_filename, "w")
+        tmp_journal.writelines(kept_lines)
+        tmp_journal.flush()
+        os.fsync(tmp_journal.fileno())
+        tmp_journal.close()
+        os.rename(tmp_journal_filename, journal_filename)
+        self._journal = open(journal_filename, "a")
+        return finished_targets
+    def finish_target(self, target_ID):
+        #mark all values of target_ID as registered so a resumed run skips it
+        self._append_to_journal({"target": target_ID, "finished": True})
+    def close_journal(self):
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+    def merge(self, target_ID, target_data):
+        #register all values of one target from the data of another container, as from a worker process
+        for docked_type in target_data:
+            self.register(target_ID, docked_type, target_data[docked_type])
     def layout_pickle( self, pickle_filename = "RMSD.pickle"):
-        self._pf = open(pickle_filename, "w")
+        #write to a temporary file first so an interrupted write never leaves a partial pickle behind
+        self._pf = open(pickle_filename + ".tmp", "w")
         pickle.dump(self._data, self._pf)
         self._pf.close()
+        os.rename(pickle_filename + ".tmp", pickle_filename)
     def layout_plain (self,  plain_filename = "RMSD"):
         self._plain_filename = plain_filename
         self._combined_csv_filename = self._plain_filename + ".csv" 
@@ -585,14 +679,16 @@ class data_container(object):
                 self._new_line += "\n"
                 self._whole_data_lines.append(self._new_line)
         #write out csv file
-        self._plain_csv_file = open(self._combined_csv_filename, "w")
+        self._plain_csv_file = open(self._combined_csv_filename + ".tmp", "w")
         self._plain_csv_file.writelines(self._whole_data_lines)
         self._plain_csv_file.close()
+        os.rename(self._combined_csv_filename + ".tmp", self._combined_csv_filename)
         #write out txt file
         self._whole_data_lines_txt = [item.replace(",", " ") for item in self._whole_data_lines]
-        self._plain_txt_file = open(self._combined_txt_filename, "w")
+        self._plain_txt_file = open(self._combined_txt_filename + ".tmp", "w")
         self._plain_txt_file.writelines(self._whole_data_lines_txt)
         self._plain_txt_file.close()
+        os.rename(self._combined_txt_filename + ".tmp", self._combined_txt_filename)
     
      
         
@@ -627,139 +723,216 @@ def extract_crystal_file (crystal_pdbid, crystal_path):
     else:
         return False
 
-def main_score(dock_dir, pdb_protein_path, evaluate_dir, blastnfilter_dir, challenge_data_path, update= True):
+def score_target(target_dir, dock_dir, pdb_protein_path, current_dir, blastnfilter_dir, challenge_data_path, result_container):
+    #copy one target from the dock dir into current_dir (the evaluate dir) and register the rmsd and distance of
+    #each of its docked structures into result_container
+    #the working directory is current_dir when this returns
+    os.chdir(current_dir)
+    #valid target must have at least one RMSD value return, else this target is invalid
+    valid_target = False
+    
+    #copy the target dir to the evaluate dir
+    commands.getoutput("cp -r %s/%s %s"%(dock_dir,target_dir, current_dir))
+    target_name = os.path.basename(target_dir)
+    logging.info("=================We start to work on this target %s================="%target_name)
+    #2 switch into the individual case
+    os.chdir(target_name)
+    all_mol_files, all_receptor_files = get_submitted_file_list()
+    if not all_mol_files:
+        logging.info("For this folder %s, there is no valid docked structure"%target_dir)
+        result_container.register(target_dir, docked_type = None, value = None)
+        ######need to register into the result pickle and txt, csv 
+        os.chdir(current_dir)
+        return
+    else:
+        os.mkdir("score")
+        #copy the crystal structure first
+        crystal_ID = target_name
+        #extract the crystal ligand name from blastnfilter result txt file
+        blastnfilter_result_name = crystal_ID + ".txt"
+        blastnfilter_txt = os.path.join(blastnfilter_dir, blastnfilter_result_name)
+        ligand_name = extract_ligand_name(blastnfilter_txt) 
+        LMCSS_ligand_name = extract_LMCSS_ligand_name(blastnfilter_txt)
+        #get crystal structure location
+        crystal_file = extract_crystal_file(crystal_ID, pdb_protein_path)
+        if crystal_file:
+            pdbid_local_path = os.getcwd()
+            commands.getoutput("cp %s score/crystal.pdb"%(crystal_file))
+            try:
+                os.chdir("score")
+                crystal_obj = create_crystal_obj("crystal.pdb", ligand_name, crystal_ID)
+                logging.info("\tSuccessfully create the crystal object")
+                #calculate the distance between the LMCSS ligand and crystal ligand
+                #get the file location
+                LMCSS_ori_file_path = os.path.join(challenge_data_path, crystal_ID)
+                LMCSS_complex_only_list = []
+                LMCSS_ligand_only_list = []
+                all_LMCSS_files = glob.glob("%s/LMCSS*.pdb"%LMCSS_ori_file_path)
+                for LMCSS_file in all_LMCSS_files:
+                    if "-lig.pdb" not in os.path.basename(LMCSS_file):
+                        LMCSS_complex_only_list.append(LMCSS_file)
+                    else:
+                        LMCSS_ligand_only_list.append(LMCSS_file)
+                if len(LMCSS_complex_only_list) == 1 and len(LMCSS_ligand_only_list) == 1:
+                    LMCSS_complex = LMCSS_complex_only_list[0]
+                    LMCSS_ligand = LMCSS_ligand_only_list[0]
+                    ligand_info = get_ligand_info_from_ligand_file(LMCSS_ligand) 
+                    LMCSS_local = os.path.basename(LMCSS_complex)
+                    #copy locally
+                    commands.getoutput("cp %s %s"%(LMCSS_complex, LMCSS_local))
+                    #create the LMCSS obj
+                    LMCSS_obj = LMCSS(LMCSS_local, ligand_info, crystal_obj)
+                    #align the
+                    LMCSS_obj.align_LMCSS_onto_crystal(check_point_number = 10)
+                    #calculate the distance
+                    LMCSS_obj.calculate_distance()
+                    LMCSS_distance = LMCSS_obj._min_dis
+                    result_container.register(target_dir, docked_type = "LMCSS_ori", value = LMCSS_distance)
+                    logging.info("\tSuccessfully calculate the distance between original LMCSS ligand vs crstal ligand. Distance is %s"%LMCSS_distance)
+                else:
+                    logging.info("There are %s original LMCSS complex files, which is abnormal and need to check"%len(LMCSS_complex_only_list))
+                os.chdir(pdbid_local_path)
+            except Exception as ex:
+                result_container.register(target_dir, docked_type = None, value = None)
+                logging.exception("For this folder %s, could not create the crystal object"%target_dir)
+                os.chdir(current_dir)
+                return
+            #here get the crystal obj and loop all docked structure 
+            for mol_index, potential_mol in enumerate (all_mol_files):              
+                potential_pdb = all_receptor_files[mol_index]                       
+                commands.getoutput("cp %s score"%potential_mol)                     
+                commands.getoutput("cp %s score"%potential_pdb)                     
+                #change path to local score folder
+                os.chdir("score")
+                local_potential_mol = os.path.basename(potential_mol)               
+                local_potential_pdb = os.path.basename(potential_pdb)
+                parsed_name = re.findall('([a-zA-Z0-9]+)-([a-zA-Z0-9]+)_([a-zA-Z0-9]+)_docked.mol',local_potential_mol)
+                docked_structure_type = parsed_name[0][0]
+                try:
+                    docked_obj = docked(local_potential_mol, local_potential_pdb, docked_structure_type, crystal_obj)
+                    docked_obj.create_complex()                       
+                    docked_obj.align_complex_onto_crystal(check_point_number = 10)
+                    docked_obj.calculate_rmsd_and_distance()
+                    (rmsd, dis) = docked_obj._min_rmsd_dis
+                    docked_structure_type_dis = docked_structure_type + "_dis"
+                    #rmsd = docked_obj._min_rmsd_dis[0]
+                    valid_target = True
+                    result_container.register(target_dir, docked_type = docked_structure_type, value = rmsd) 
+                    result_container.register(target_dir, docked_type = docked_structure_type_dis, value = dis) 
+                    logging.info("\tSuccessfully calculate the rmsd for this category %s, the rmsd is %s"%(docked_structure_type, rmsd))
+                    os.chdir(pdbid_local_path)
+                except Exception as ex:
+                    result_container.register(target_dir, docked_type = docked_structure_type, value = None) 
+                    os.chdir(pdbid_local_path)
+                    logging.exception("For this type of strcutre: %s, the rmsd could not be calculated"%docked_structure_type)
+                    continue
+            logging.info("++++++++++++++++Finished for this target %s+++++++++++++++++"%target_name)
+            os.chdir(current_dir)
+        else:
+            result_container.register(target_dir, docked_type = None, value = None)
+            logging.info("For this folder %s, there is no valid crystal structure"%target_dir)
+            ######need to register into the result pickle and txt, csv 
+            os.chdir(current_dir)
+            return
+
+def _score_target_in_worker(args):
+    #worker pool entry point for score_target, the results of the target are registered into a container of
+    #their own and sent back to the parent which merges them into its journaled container
+    #return (target_dir, results of target or None, seconds spent on target)
+    start_time = time.time()
+    result_container = data_container()
+    score_target(*(args + (result_container,)))
+    return args[0], result_container._data.get(args[0]), time.time() - start_time
+
+def main_score(dock_dir, pdb_protein_path, evaluate_dir, blastnfilter_dir, challenge_data_path, update= True, numworkers = 1):
     #1 copy docked dir info into evaluate dir and create score for targe
     #2 create score dir and copy the ideal files into score dir
     #3 create submit obj and crystal obj in the crystal obj, and store the cyrstal obj directly 
     #4 after each calculation, append the crystal obj to the final result file in the upper level path
     #5 if for individual folder, the crystal obj is empty, also save it and skip it and go to the next case
+    #if numworkers is larger than 1 the targets are evaluated by a pool of numworkers processes, every worker
+    #changes directory in its own process only and the results are merged in target order
+    #results are appended to the RMSD.journal file as they are registered and written to the pickle and plain
+    #files every RESULT_WRITE_INTERVAL targets and once all targets are done. If the journal is left over from
+    #an interrupted run, the targets it marks as finished are not evaluated again
     #1 switch to evaluation folder
     os.chdir(evaluate_dir)
     current_dir = os.getcwd()
     result_container = data_container()
-    result_pickle = "RMSD.pickle"
-    pickle_full_path = os.path.join(current_dir, result_pickle) 
-    result_plain = "RMSD"
-    plain_full_path = os.path.join(current_dir, result_plain)
+    pickle_full_path = os.path.join(current_dir, RESULT_PICKLE)
+    plain_full_path = os.path.join(current_dir, RESULT_PLAIN)
+    journal_full_path = os.path.join(current_dir, RESULT_JOURNAL)
+    resuming = os.path.isfile(journal_full_path)
+    finished_targets = result_container.open_journal(journal_full_path)
     #get all target dir info from the docked dir
-    target_dirs = list(os.walk(dock_dir))[0][1]
-    for target_dir in target_dirs:
-        #valid target must have at least one RMSD value return, else this target is invalid
-        valid_target = False
-        
-        #copy the target dir to the evaluate dir
-        commands.getoutput("cp -r %s/%s %s"%(dock_dir,target_dir, evaluate_dir))
-        target_name = os.path.basename(target_dir)
-        logging.info("=================We start to work on this target %s================="%target_name)
-        #2 switch into the individual case
-        os.chdir(target_name)
-        all_mol_files, all_receptor_files = get_submitted_file_list()
-        if not all_mol_files:
-            logging.info("For this folder %s, there is no valid docked structure"%target_dir)
-            result_container.register(target_dir, docked_type = None, value = None)
-            ######need to register into the result pickle and txt, csv 
-            os.chdir(current_dir)
+    target_dirs = []
+    for target_dir in list(os.walk(dock_dir))[0][1]:
+        if target_dir in finished_targets:
+            logging.info("The target %s was evaluated by an earlier run, skip it"%target_dir)
             continue
-        else:
-            os.mkdir("score")
-            #copy the crystal structure first
-            crystal_ID = target_name
-            #extract the crystal ligand name from blastnfilter result txt file
-            blastnfilter_result_name = crystal_ID + ".txt"
-            blastnfilter_txt = os.path.join(blastnfilter_dir, blastnfilter_result_name)
-            ligand_name = extract_ligand_name(blastnfilter_txt) 
-            LMCSS_ligand_name = extract_LMCSS_ligand_name(blastnfilter_txt)
-            #get crystal structure location
-            crystal_file = extract_crystal_file(crystal_ID, pdb_protein_path)
-            if crystal_file:
-                pdbid_local_path = os.getcwd()
-                commands.getoutput("cp %s score/crystal.pdb"%(crystal_file))
-                try:
-                    os.chdir("score")
-                    crystal_obj = create_crystal_obj("crystal.pdb", ligand_name, crystal_ID)
-                    logging.info("\tSuccessfully create the crystal object")
-                    #calculate the distance between the LMCSS ligand and crystal ligand
-                    #get the file location
-                    LMCSS_ori_file_path = os.path.join(challenge_data_path, crystal_ID)
-                    LMCSS_complex_only_list = []
-                    LMCSS_ligand_only_list = []
-                    all_LMCSS_files = glob.glob("%s/LMCSS*.pdb"%LMCSS_ori_file_path)
-                    for LMCSS_file in all_LMCSS_files:
-                        if "-lig.pdb" not in os.path.basename(LMCSS_file):
-                            LMCSS_complex_only_list.append(LMCSS_file)
-                        else:
-                            LMCSS_ligand_only_list.append(LMCSS_file)
-                    if len(LMCSS_complex_only_list) == 1 and len(LMCSS_ligand_only_list) == 1:
-                        LMCSS_complex = LMCSS_complex_only_list[0]
-                        LMCSS_ligand = LMCSS_ligand_only_list[0]
-                        ligand_info = get_ligand_info_from_ligand_file(LMCSS_ligand) 
-                        LMCSS_local = os.path.basename(LMCSS_complex)
-                        #copy locally
-                        commands.getoutput("cp %s %s"%(LMCSS_complex, LMCSS_local))
-                        #create the LMCSS obj
-                        LMCSS_obj = LMCSS(LMCSS_local, ligand_info, crystal_obj)
-                        #align the
-                        LMCSS_obj.align_LMCSS_onto_crystal(check_point_number = 10)
-                        #calculate the distance
-                        LMCSS_obj.calculate_distance()
-                        LMCSS_distance = LMCSS_obj._min_dis
-                        result_container.register(target_dir, docked_type = "LMCSS_ori", value = LMCSS_distance)
-                        logging.info("\tSuccessfully calculate the distance between original LMCSS ligand vs crstal ligand. Distance is %s"%LMCSS_distance)
-                    else:
-                        logging.info("There are %s original LMCSS complex files, which is abnormal and need to check"%len(LMCSS_complex_only_list))
-                    os.chdir(pdbid_local_path)
-                except Exception as ex:
-                    result_container.register(target_dir, docked_type = None, value = None)
-                    logging.exception("For this folder %s, could not create the crystal object"%target_dir)
-                    os.chdir(current_dir)
-                    continue
-                #here get the crystal obj and loop all docked structure 
-                for mol_index, potential_mol in enumerate (all_mol_files):              
-                    potential_pdb = all_receptor_files[mol_index]                       
-                    commands.getoutput("cp %s score"%potential_mol)                     
-                    commands.getoutput("cp %s score"%potential_pdb)                     
-                    #change path to local score folder
-                    os.chdir("score")
-                    local_potential_mol = os.path.basename(potential_mol)               
-                    local_potential_pdb = os.path.basename(potential_pdb)
-                    parsed_name = re.findall('([a-zA-Z0-9]+)-([a-zA-Z0-9]+)_([a-zA-Z0-9]+)_docked.mol',local_potential_mol)
-                    docked_structure_type = parsed_name[0][0]
-                    try:
-                        docked_obj = docked(local_potential_mol, local_potential_pdb, docked_structure_type, crystal_obj)
-                        docked_obj.create_complex()                       
-                        docked_obj.align_complex_onto_crystal(check_point_number = 10)
-                        docked_obj.calculate_rmsd_and_distance()
-                        (rmsd, dis) = docked_obj._min_rmsd_dis
-                        docked_structure_type_dis = docked_structure_type + "_dis"
-                        #rmsd = docked_obj._min_rmsd_dis[0]
-                        valid_target = True
-                        result_container.register(target_dir, docked_type = docked_structure_type, value = rmsd) 
-                        result_container.register(target_dir, docked_type = docked_structure_type_dis, value = dis) 
-                        logging.info("\tSuccessfully calculate the rmsd for this category %s, the rmsd is %s"%(docked_structure_type, rmsd))
-                        #update the pickle and txt csv file if there is valid case found 
-                        result_container.layout_pickle (pickle_filename = pickle_full_path)
-                        result_container.layout_plain (plain_filename = plain_full_path)
-                        os.chdir(pdbid_local_path)
-                    except Exception as ex:
-                        result_container.register(target_dir, docked_type = docked_structure_type, value = None) 
-                        os.chdir(pdbid_local_path)
-                        logging.exception("For this type of strcutre: %s, the rmsd could not be calculated"%docked_structure_type)
-                        continue
-                logging.info("++++++++++++++++Finished for this target %s+++++++++++++++++"%target_name)
-                os.chdir(current_dir)
-            else:
-                result_container.register(target_dir, docked_type = None, value = None)
-                logging.info("For this folder %s, there is no valid crystal structure"%target_dir)
-                ######need to register into the result pickle and txt, csv 
-                os.chdir(current_dir)
-                continue
+        if resuming and os.path.isdir(os.path.join(current_dir, target_dir)):
+            #remove what the interrupted run left of this target
+            shutil.rmtree(os.path.join(current_dir, target_dir))
+        target_dirs.append(target_dir)
+
+    def finish_target(target_dir, finished_count):
+        result_container.finish_target(target_dir)
+        if finished_count % RESULT_WRITE_INTERVAL == 0 and finished_count < len(target_dirs):
+            logging.info("Writing results of the targets evaluated so far")
+            result_container.layout_pickle (pickle_filename = pickle_full_path)
+            result_container.layout_plain (plain_filename = plain_full_path)
+
+    start_time = time.time()
+    if numworkers > 1 and len(target_dirs) > 1:
+        logging.info("Evaluating %d targets with %d workers"%(len(target_dirs), numworkers))
+        jobs = [(target_dir, dock_dir, pdb_protein_path, current_dir, blastnfilter_dir, challenge_data_path) for target_dir in target_dirs]
+        pool = multiprocessing.Pool(processes = numworkers)
+        try:
+            for finished_count, (target_dir, target_data, elapsed) in enumerate(pool.imap(_score_target_in_worker, jobs), 1):
+                logging.info("Evaluated target %s in %.1f seconds"%(target_dir, elapsed))
+                if target_data:
+                    result_container.merge(target_dir, target_data)
+                finish_target(target_dir, finished_count)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        numworkers = 1
+        for finished_count, target_dir in enumerate(target_dirs, 1):
+            target_start_time = time.time()
+            score_target(target_dir, dock_dir, pdb_protein_path, current_dir, blastnfilter_dir, challenge_data_path, result_container)
+            finish_target(target_dir, finished_count)
+            logging.info("Evaluated target %s in %.1f seconds"%(target_dir, time.time() - target_start_time))
+    logging.info("Evaluated %d targets with %d worker(s) in %.1f seconds"%(len(target_dirs), numworkers, time.time() - start_time))
     #after loop all possible target, layout the pickle and plain files    
     result_container.layout_pickle (pickle_filename = pickle_full_path)
     result_container.layout_plain (plain_filename = plain_full_path)
+    #the journal is no longer needed once its results are in the pickle and plain files
+    result_container.close_journal()
+    os.remove(journal_full_path)
+
+def compact_journal(evaluate_dir):
+    #write the pickle and plain files in evaluate_dir from the RMSD.journal left behind by a run of main_score
+    #that was stopped, such as by a timeout, and remove the journal. Only targets the journal marks as finished
+    #are written out
+    #return the list of targets written out or None if there is no journal
+    journal_full_path = os.path.join(evaluate_dir, RESULT_JOURNAL)
+    if not os.path.isfile(journal_full_path):
+        return None
+    result_container = data_container()
+    finished_targets = result_container.open_journal(journal_full_path)
+    result_container.close_journal()
+    result_container.layout_pickle (pickle_filename = os.path.join(evaluate_dir, RESULT_PICKLE))
+    result_container.layout_plain (plain_filename = os.path.join(evaluate_dir, RESULT_PLAIN))
+    os.remove(journal_full_path)
+    logging.info("Wrote results of %d targets from journal %s"%(len(finished_targets), journal_full_path))
+    return finished_targets
             
 
 if ("__main__" == __name__) :
-    import logging
     logger = logging.getLogger()
     logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.INFO )
     from argparse import ArgumentParser
@@ -779,11 +952,37 @@ if ("__main__" == __name__) :
     parser.add_argument("-p", "--pdbdb", metavar="PATH",
                   help="PDB DATABANK which we will "
                        "get the crystal structure")
+
+    parser.add_argument("-n", "--numworkers", type=int, default=1,
+                  help="Number of worker processes evaluating "
+                       "targets in parallel (default 1)")
+
+    parser.add_argument("--mcsbackend", choices=["openeye", "rdkit"],
+                  default=MCS_BACKEND,
+                  help="Toolkit used to find the MCS of crystal and "
+                       "docked ligand (default %s)" % MCS_BACKEND)
+
+    parser.add_argument("--maxmcsmatches", type=int, default=None,
+                  help="Most pairs of MCS matches looked at per docked "
+                       "pose (default all)")
+
+    parser.add_argument("--writematchfiles", action="store_true",
+                  help="Write each MCS match to match1_#.pdb and "
+                       "match2_#.pdb files, for debugging")
     logger = logging.getLogger()
     logging.basicConfig(format='%(asctime)s: %(message)s',
                     datefmt='%m/%d/%y %I:%M:%S', filename='final.log',
                     filemode='w', level=logging.INFO)
     opt = parser.parse_args()
+    if opt.mcsbackend == "openeye" and not HAS_OPENEYE:
+        parser.error("--mcsbackend openeye requires the OpenEye toolkit "
+                     "which could not be imported")
+    if not HAS_OPENEYE:
+        logging.warning("OpenEye toolkit could not be imported, MCS RMSDs "
+                        "are calculated with the rdkit backend")
+    MCS_BACKEND = opt.mcsbackend
+    MCS_MAX_MATCHES = opt.maxmcsmatches
+    WRITE_MATCH_FILES = opt.writematchfiles
     dockDir = opt.dockdir
     evaluateDir = opt.outdir
     pdbloc = opt.pdbdb
@@ -791,7 +990,7 @@ if ("__main__" == __name__) :
     challengedataDir = opt.challengedir
     # running under this dir
     running_dir = os.getcwd()
-    pickle_result = main_score(dockDir, pdbloc, evaluateDir, blastnfilterDir, challengedataDir)
+    pickle_result = main_score(dockDir, pdbloc, evaluateDir, blastnfilterDir, challengedataDir, numworkers=opt.numworkers)
     # move the final log file to the result dir
     log_file_path = os.path.join(running_dir, 'final.log')
     commands.getoutput("mv %s %s" % (log_file_path, evaluateDir))
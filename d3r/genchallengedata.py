@@ -4,11 +4,16 @@ __author__ = 'sliu'
 import os
 import sys
 import glob
+import time
+import shutil
 import logging
+import subprocess
+import multiprocessing
 from rdkit import Chem
 from rdkit.Chem import AllChem as allChem
 import commands
 from Bio import PDB
+from d3r.utilities import geometry
 
 def split_chain(pdb_filename, out_path, pdb_id, chain_letters):
     parser = PDB.PDBParser()
@@ -54,10 +59,7 @@ def get_chain_length_and_position (pdb_filename, pdb_id):
             chain_dic[chain_id] = [chain_lenth, average_position]
     return chain_dic
 def get_distance (pos1, pos2):
-    _dist_0 = float(pos1[0])-float(pos2.split(",")[0])
-    _dist_1 = float(pos1[1])-float(pos2.split(",")[1])
-    _dist_2 = float(pos1[2])-float(pos2.split(",")[2])
-    return (_dist_0**2 + _dist_1**2 + _dist_2**2)**0.5
+    return geometry.distance(pos1, geometry.parse_center(pos2))
 def extract_chain(pdb_filename, pdb_id, ligand_center, chain_length = 100):
     #extract the chain in the pdb file which is the most closet to ligand center and have the chain length larger than the default chain length
     chain_dic = get_chain_length_and_position(pdb_filename, pdb_id)
@@ -122,26 +124,32 @@ def parse_txt (txt_filename):
     return info_dic  
 
 
-def align_proteins (target_protein, pre_prepare_protein, post_prepare_protein):
-    commands.getoutput("$SCHRODINGER/utilities/structalign %s %s"%(target_protein, pre_prepare_protein))
-    rotated_protein = "rot-" + pre_prepare_protein
+def align_proteins (target_protein, pre_prepare_protein, post_prepare_protein, working_dir = ""):
+    #structalign writes rot-<protein> to the directory it is run in so it is run with working_dir as its cwd
+    #instead of changing the directory of this process, the protein names are relative to working_dir
+    p = subprocess.Popen("$SCHRODINGER/utilities/structalign %s %s"%(target_protein, pre_prepare_protein), shell = True,
+                         cwd = working_dir or None, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+    p.communicate()
+    rotated_protein = os.path.join(working_dir, "rot-" + pre_prepare_protein)
     if os.path.isfile(rotated_protein):
-        commands.getoutput("mv %s %s"%(rotated_protein, post_prepare_protein))
+        shutil.move(rotated_protein, os.path.join(working_dir, post_prepare_protein))
         return True
     else:
         return False
 
-def generate_ligand (inchi, ligand_title, ):
+def generate_ligand (inchi, ligand_title, out_dir = ""):
     valid_inchi = "InChI="+inchi
     rd_mol = Chem.MolFromInchi(format(valid_inchi), removeHs=False, sanitize=False, treatWarningAsError=True)
     smiles = Chem.MolToSmiles(rd_mol, isomericSmiles=True)
-    smile_filename = "lig_" + ligand_title + ".smi"
+    smile_filename = os.path.join(out_dir, "lig_" + ligand_title + ".smi")
     smile_file = open(smile_filename, "w")
     smile_file.writelines(smiles)
-    inchi_filename = "lig_" + ligand_title + ".inchi"
+    smile_file.close()
+    inchi_filename = os.path.join(out_dir, "lig_" + ligand_title + ".inchi")
     inchi_file = open(inchi_filename, "w")
     inchi_file.writelines(valid_inchi)
-    mol_filename = "lig_" + ligand_title + ".mol"
+    inchi_file.close()
+    mol_filename = os.path.join(out_dir, "lig_" + ligand_title + ".mol")
     #rd_mol_H = Chem.AddHs(rd_mol)
     #allChem.EmbedMolecule(rd_mol_H)
     #allChem.UFFOptimizeMolecule(rd_mol_H)
@@ -170,177 +178,202 @@ def pull_ligand_out (proteinfile, ligname, ligandfile):
     return ligandfile
 
 def get_center(ligand_pdb):
-    xyz_lines = open(ligand_pdb,"r").readlines()
-    multi_ligand = False
-    atom_list = []
-    x = y = z = 0
-    for xyz_line in xyz_lines:
-        if "HETATM" in xyz_line:
-            #logging.debug("Check the get center of this protein: %s for this ligand: %s"%(protein_file, ligname))                                                                                                               
-            atom_name = xyz_line[12:16]
-            if atom_name in atom_list:
-                multi_ligand = True
-            else:
-                atom_list.append(atom_name)
-                try:
-                    x += float(xyz_line[30:38])
-                    y+= float(xyz_line[38:46])
-                    z+= float(xyz_line[46:54])
-                except:
-                    logging.debug("Fatal error: Cannot find the XYZ coordinate for this ligand:%s"%ligand_pdb)
-                    return False
+    try:
+        coords, multi_ligand = geometry.read_ligand_coords(ligand_pdb)
+    except ValueError:
+        logging.debug("Fatal error: Cannot find the XYZ coordinate for this ligand:%s"%ligand_pdb)
+        return False
     if not multi_ligand:
-        lig_center = "%8.3f, %8.3f, %8.3f"%(x/len(atom_list), y/len(atom_list), z/len(atom_list))
+        lig_center = geometry.format_center(geometry.centroid(coords))
         logging.debug("Ligand center for this case:%s is %s"%(ligand_pdb, lig_center))
         return lig_center
     else:
         logging.debug("Fatal error: Found multiple ligands in file:%s"%ligand_pdb)
         return False
-        
-def main_gendata (s3_result_path, path_2_ent, s4_result_path):
-    os.chdir(s4_result_path)
-    current_dir_layer_1 = os.getcwd()
-    blastnfilterout = glob.glob("%s/*.txt"%s3_result_path)
-    summary_file = "%s/summary.txt"%s3_result_path                         
-    if summary_file in blastnfilterout:                                    
-        blastnfilterout.remove(summary_file)
-    problem_cases = []
-    valid_cases = []
-    all_cases = []
-    for single_bfout in blastnfilterout:
-        valid = False
-        target_name = os.path.basename(single_bfout).split(".txt")[0]
-        all_cases.append(target_name)
-        if not os.path.isdir(target_name):
-            os.mkdir(target_name)
-        os.chdir(target_name)
-        commands.getoutput("cp %s ."%single_bfout)
-        try:
-            info_dic = parse_txt(single_bfout)
-        except:
-            logging.info("Could not parse this blasternfilter outfile: %s"%(single_bfout))
-            continue
-        #check if the is a protein start with LMCSS
-        if not "LMCSS" in info_dic:
-            logging.info("For this query protein: %s, there is no protein sharing the LMCSS ligand with. Not able to generate Docking grid, pass for this case..."%target_name)
-            os.chdir (current_dir_layer_1)
-            continue
-        elif len(info_dic["LMCSS"]) != 3:
-            logging.info("For this query protein: %s, the LMCSS protein has wrong number of informations associate with this id..."%target_name)
-            os.chdir(current_dir_layer_1)
-            continue
-        elif not "inchi" in info_dic:
-            logging.info("For this query protein: %s, there is no inchi info for the ligand..."%target_name)
-            os.chdir(current_dir_layer_1)
-            continue
-        else:
-            logging.info("============Start to work in this query protein: %s============"%target_name)
 
-        #get all ligand related files
-        try:
-            inchi = info_dic["inchi"]
-            ligand_title = info_dic["ligand"]
-        #probably will come back sliu
-            generate_ligand(inchi, ligand_title)
-        except:
-            logging.info("Could not generate the ligand for this case: %s"%(target_name))
-            os.chdir(current_dir_layer_1)                     
-            continue
-        #copy all ent file here and rename it
-        query_pro = info_dic["query"]
-        LMCSS_pro_id = info_dic["LMCSS"][0]
-        LMCSS_pro_ligand = info_dic["LMCSS"][1]
-        LMCSS_mcss_chain = info_dic["LMCSS"][2]
-        LMCSS_pdb_folder_name = LMCSS_pro_id[1:3]
-        LMCSS_ent_file = "pdb" + LMCSS_pro_id  + ".ent"
-        LMCSS_pdbloc = os.path.join(path_2_ent, LMCSS_pdb_folder_name, LMCSS_ent_file)
-        if not os.path.isfile(LMCSS_pdbloc):            
-            logging.info("Unable to find the ent file associate with the LMCSS pdb: %s at location %s"%(LMCSS_pro_id, LMCSS_pdbloc))
-            os.chdir(current_dir_layer_1)
-            continue
-        else:
-            #TC = target candidate                                
-            TC_id = "%s_%s"%(query_pro, LMCSS_pro_id)             
-            LMCSS_protein_name = "LMCSS-%s-%s.pdb"%(TC_id, LMCSS_pro_ligand)
-            LMCSS_ligand_name = "LMCSS-%s-%s-lig.pdb"%(TC_id, LMCSS_pro_ligand)
-            #try to extract the LMCSS ligand from the LMCSS protein
-            commands.getoutput("cp %s %s"%(LMCSS_pdbloc,LMCSS_protein_name))
-            #extract chain where contain the LMCSS mcss
-            split_chain(LMCSS_protein_name, LMCSS_protein_name, LMCSS_pro_id, LMCSS_mcss_chain)
-            if not pull_ligand_out (LMCSS_protein_name, LMCSS_pro_ligand, LMCSS_ligand_name):
-                os.chdir(current_dir_layer_1)
-                continue
-                
-            logging.info("Successfully generate this protein:%s"%LMCSS_protein_name)
-            ligand_center = get_center (LMCSS_ligand_name)
-            if not ligand_center:
-                logging.info("Unable to find the center of the ligand for the LMCSS candidate pdb: %s"%(pot_target_id))
-                os.chdir(current_dir_layer_1)
+def gen_target_data (single_bfout, path_2_ent, s4_result_path):
+    #generate the challenge data for one blastnfilter outfile in s4_result_path/<target name>
+    #all files are referred to by path under the target directory so this can run in a worker process
+    #return True if at least one aligned structure was generated for the target
+    valid = False
+    target_name = os.path.basename(single_bfout).split(".txt")[0]
+    target_dir = os.path.join(s4_result_path, target_name)
+    if not os.path.isdir(target_dir):
+        os.mkdir(target_dir)
+    shutil.copy(single_bfout, target_dir)
+    try:
+        info_dic = parse_txt(single_bfout)
+    except:
+        logging.info("Could not parse this blasternfilter outfile: %s"%(single_bfout))
+        return valid
+    #check if the is a protein start with LMCSS
+    if not "LMCSS" in info_dic:
+        logging.info("For this query protein: %s, there is no protein sharing the LMCSS ligand with. Not able to generate Docking grid, pass for this case..."%target_name)
+        return valid
+    elif len(info_dic["LMCSS"]) != 3:
+        logging.info("For this query protein: %s, the LMCSS protein has wrong number of informations associate with this id..."%target_name)
+        return valid
+    elif not "inchi" in info_dic:
+        logging.info("For this query protein: %s, there is no inchi info for the ligand..."%target_name)
+        return valid
+    else:
+        logging.info("============Start to work in this query protein: %s============"%target_name)
+
+    #get all ligand related files
+    try:
+        inchi = info_dic["inchi"]
+        ligand_title = info_dic["ligand"]
+    #probably will come back sliu
+        generate_ligand(inchi, ligand_title, target_dir)
+    except:
+        logging.info("Could not generate the ligand for this case: %s"%(target_name))
+        return valid
+    #copy all ent file here and rename it
+    query_pro = info_dic["query"]
+    LMCSS_pro_id = info_dic["LMCSS"][0]
+    LMCSS_pro_ligand = info_dic["LMCSS"][1]
+    LMCSS_mcss_chain = info_dic["LMCSS"][2]
+    LMCSS_pdb_folder_name = LMCSS_pro_id[1:3]
+    LMCSS_ent_file = "pdb" + LMCSS_pro_id  + ".ent"
+    LMCSS_pdbloc = os.path.join(path_2_ent, LMCSS_pdb_folder_name, LMCSS_ent_file)
+    if not os.path.isfile(LMCSS_pdbloc):
+        logging.info("Unable to find the ent file associate with the LMCSS pdb: %s at location %s"%(LMCSS_pro_id, LMCSS_pdbloc))
+        return valid
+    #TC = target candidate
+    TC_id = "%s_%s"%(query_pro, LMCSS_pro_id)
+    LMCSS_protein_name = "LMCSS-%s-%s.pdb"%(TC_id, LMCSS_pro_ligand)
+    LMCSS_ligand_name = "LMCSS-%s-%s-lig.pdb"%(TC_id, LMCSS_pro_ligand)
+    LMCSS_protein_path = os.path.join(target_dir, LMCSS_protein_name)
+    LMCSS_ligand_path = os.path.join(target_dir, LMCSS_ligand_name)
+    #try to extract the LMCSS ligand from the LMCSS protein
+    shutil.copy(LMCSS_pdbloc, LMCSS_protein_path)
+    #extract chain where contain the LMCSS mcss
+    split_chain(LMCSS_protein_path, LMCSS_protein_path, LMCSS_pro_id, LMCSS_mcss_chain)
+    if not pull_ligand_out (LMCSS_protein_path, LMCSS_pro_ligand, LMCSS_ligand_path):
+        return valid
+
+    logging.info("Successfully generate this protein:%s"%LMCSS_protein_name)
+    ligand_center = get_center (LMCSS_ligand_path)
+    if not ligand_center:
+        logging.info("Unable to find the center of the ligand for the LMCSS candidate pdb: %s"%(LMCSS_pro_id))
+        return valid
+    else:
+        with open(os.path.join(target_dir, "center.txt") , "w") as center_file:
+            center_file.writelines(ligand_center)
+    for rest_protein in ("SMCSS", "hiResHolo", "hiResApo", "hiTanimoto"):
+        if rest_protein in info_dic:
+            if len(info_dic[rest_protein]) == 3:
+                rest_protein_id = info_dic[rest_protein][0]
+                rest_ligand_id = info_dic[rest_protein][1]
+                rest_ligand_chain = info_dic[rest_protein][2]
+            else:
+                rest_protein_id = info_dic[rest_protein]
+                rest_ligand_id = False
+            rest_protein_folder_name = rest_protein_id[1:3]
+            rest_ent_file = "pdb" + rest_protein_id  + ".ent"
+            rest_pdbloc = os.path.join(path_2_ent, rest_protein_folder_name, rest_ent_file)
+            if not os.path.isfile(rest_pdbloc):
+                logging.info("Unable to find the ent file associate with the %s pdb with ID: %s at location %s"%(rest_protein, rest_protein_id, rest_pdbloc))
                 continue
             else:
-                with open("center.txt" , "w") as center_file:
-                    center_file.writelines(ligand_center)
-            for rest_protein in ("SMCSS", "hiResHolo", "hiResApo", "hiTanimoto"):
-                if rest_protein in info_dic:
-                    if len(info_dic[rest_protein]) == 3:
-                        rest_protein_id = info_dic[rest_protein][0] 
-                        rest_ligand_id = info_dic[rest_protein][1]
-                        rest_ligand_chain = info_dic[rest_protein][2]
-                    else:
-                        rest_protein_id = info_dic[rest_protein]
-                        rest_ligand_id = False
-                    rest_protein_folder_name = rest_protein_id[1:3]
-                    rest_ent_file = "pdb" + rest_protein_id  + ".ent"       
-                    rest_pdbloc = os.path.join(path_2_ent, rest_protein_folder_name, rest_ent_file)
-                    if not os.path.isfile(rest_pdbloc):       
-                        logging.info("Unable to find the ent file associate with the %s pdb with ID: %s at location %s"%(rest_protein, rest_protein_id, rest_pdbloc))
-                        #os.chdir(current_dir_layer_1)
-                        continue
-                    else:
-                        TC_id_rest = "%s_%s"%(query_pro, rest_protein_id)
-                        if rest_ligand_id:
-                            rest_protein_name = "%s-%s-%s.pdb"%(rest_protein, TC_id_rest, rest_ligand_id)
-                            commands.getoutput("cp %s %s"%(rest_pdbloc, rest_protein_name))
-                            #extract ligand chain from proteins with ligand, original just do this in LMCSS, 0908 sliu 
-                            split_chain(rest_protein_name, rest_protein_name, rest_protein_id, rest_ligand_chain)
-                        else:
-                            rest_protein_name = "%s-%s.pdb"%(rest_protein, TC_id_rest)
-                            commands.getoutput("cp %s %s"%(rest_pdbloc, rest_protein_name))
-                        #align all rest proteins onto the LMCSS protein
-                        
+                TC_id_rest = "%s_%s"%(query_pro, rest_protein_id)
+                if rest_ligand_id:
+                    rest_protein_name = "%s-%s-%s.pdb"%(rest_protein, TC_id_rest, rest_ligand_id)
+                    rest_protein_path = os.path.join(target_dir, rest_protein_name)
+                    shutil.copy(rest_pdbloc, rest_protein_path)
+                    #extract ligand chain from proteins with ligand, original just do this in LMCSS, 0908 sliu
+                    split_chain(rest_protein_path, rest_protein_path, rest_protein_id, rest_ligand_chain)
+                else:
+                    rest_protein_name = "%s-%s.pdb"%(rest_protein, TC_id_rest)
+                    rest_protein_path = os.path.join(target_dir, rest_protein_name)
+                    shutil.copy(rest_pdbloc, rest_protein_path)
+                #align all rest proteins onto the LMCSS protein
+
+                try:
+                    do_alignment = align_proteins (LMCSS_protein_name, rest_protein_name, rest_protein_name, target_dir)
+                    #if it's the Apo structure, need to extract the chain which is close to the ligand center in case the Apo have multiple chains
+                    if rest_protein == "hiResApo":
+                        #extract the chain based on the ligand center
                         try:
-                            do_alignment = align_proteins (LMCSS_protein_name, rest_protein_name, rest_protein_name)
-                            #if it's the Apo structure, need to extract the chain which is close to the ligand center in case the Apo have multiple chains
-                            if rest_protein == "hiResApo":
-                                #extract the chain based on the ligand center 
-                                try:
-                                    extract_chain (rest_protein_name, rest_protein_id, ligand_center, chain_length = 100) 
-                                    logging.info("Successfully extract the chain from Apo structure")
-                                except:
-                                    logging.info("The extraction of Apo chain is not finish...")
-                                    continue
+                            extract_chain (rest_protein_path, rest_protein_id, ligand_center, chain_length = 100)
+                            logging.info("Successfully extract the chain from Apo structure")
                         except:
-                            logging.info("The alignment could not be done for this protein:%s"%(rest_protein_name))
+                            logging.info("The extraction of Apo chain is not finish...")
                             continue
+                except:
+                    logging.info("The alignment could not be done for this protein:%s"%(rest_protein_name))
+                    continue
 
-                            #remove the "rot-%s"%LMCSS_protein_name
-                        if os.path.isfile("rot-%s"%LMCSS_protein_name):
-                            commands.getoutput("rm rot-%s"%LMCSS_protein_name) 
-                        
-                        logging.info("Successfully generate this protein:%s "%(rest_protein_name))
-                        #here we got the valid aligned structures
-                        valid = True
-        os.chdir(current_dir_layer_1)        
+                    #remove the "rot-%s"%LMCSS_protein_name
+                rotated_LMCSS = os.path.join(target_dir, "rot-%s"%LMCSS_protein_name)
+                if os.path.isfile(rotated_LMCSS):
+                    os.remove(rotated_LMCSS)
+
+                logging.info("Successfully generate this protein:%s "%(rest_protein_name))
+                #here we got the valid aligned structures
+                valid = True
+    return valid
+
+def _gen_target_data_timed (args):
+    #worker entry point, any unexpected error marks the target invalid so it ends up in the error_container
+    #return (valid, seconds spent on this target)
+    start_time = time.time()
+    try:
+        valid = gen_target_data(*args)
+    except:
+        logging.exception("Unexpected error generating the challenge data for: %s"%args[0])
+        valid = False
+    return valid, time.time() - start_time
+
+def main_gendata (s3_result_path, path_2_ent, s4_result_path, numworkers = 1):
+    #if numworkers is larger than 1 the targets are generated by a pool of numworkers processes, each target
+    #works only in its own directory so the result is the same as generating them one after another
+    s3_result_path = os.path.abspath(s3_result_path)
+    s4_result_path = os.path.abspath(s4_result_path)
+    blastnfilterout = glob.glob("%s/*.txt"%s3_result_path)
+    summary_file = "%s/summary.txt"%s3_result_path
+    if summary_file in blastnfilterout:
+        blastnfilterout.remove(summary_file)
+    problem_cases = []
+    valid_cases = []
+    all_cases = []
+    jobs = [(single_bfout, path_2_ent, s4_result_path) for single_bfout in blastnfilterout]
+    start_time = time.time()
+    if numworkers > 1 and len(jobs) > 1:
+        logging.info("Generating the challenge data for %d targets with %d workers"%(len(jobs), numworkers))
+        pool = multiprocessing.Pool(processes = numworkers)
+        try:
+            results = pool.map(_gen_target_data_timed, jobs)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        numworkers = 1
+        results = [_gen_target_data_timed(job) for job in jobs]
+    wall_time = time.time() - start_time
+    target_time = 0
+    for single_bfout, (valid, elapsed) in zip(blastnfilterout, results):
+        target_name = os.path.basename(single_bfout).split(".txt")[0]
+        all_cases.append(target_name)
+        target_time += elapsed
         #here remove all the folder which don't have full information because of all errors which showed in the final.log
         if valid:
             valid_cases.append(target_name)
+    error_container = os.path.join(s4_result_path, "error_container")
     for case in all_cases:
         if case not in valid_cases:
             problem_cases.append(case)
-            if not os.path.isdir("error_container"):
-                os.mkdir("error_container")
-            commands.getoutput("mv %s error_container"%case)
+            if not os.path.isdir(error_container):
+                os.mkdir(error_container)
+            shutil.move(os.path.join(s4_result_path, case), error_container)
     logging.info("Finish generating the challenge data. The problematic cases are: %s"%problem_cases)
+    #speedup is the time the targets took added up over the wall clock time, about 1.0 when run serially
+    timing = "Generated challenge data for %d targets with %d worker(s) in %.1f seconds, %.1f seconds of per target time, speedup %.2f"%(len(all_cases), numworkers, wall_time, target_time, target_time/max(wall_time, 0.001))
+    logging.info(timing)
+    print timing
 
 if ("__main__") == (__name__):
     from optparse import OptionParser
@@ -348,6 +381,7 @@ if ("__main__") == (__name__):
     parser.add_option("-p", "--pdbdb", metavar = "PATH", help = "PDB DATABANK which we will dock into")
     parser.add_option("-c", "--candidatedir", metavar="PATH", help = "PATH where we could find the stage 3 output")
     parser.add_option("-o", "--outdir", metavar = "PATH", help = "PATH where we run stage 4")
+    parser.add_option("-n", "--numworkers", type = "int", default = 1, help = "Number of worker processes generating targets in parallel (default 1)")
     logger = logging.getLogger()
     logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.DEBUG )
     (opt, args) = parser.parse_args()
@@ -355,6 +389,6 @@ if ("__main__") == (__name__):
     stage_3_result = opt.candidatedir
     stage_4_result = opt.outdir
     running_dir = os.getcwd()
-    main_gendata(stage_3_result, pdb_location, stage_4_result)
+    main_gendata(stage_3_result, pdb_location, stage_4_result, opt.numworkers)
     log_file_path = os.path.join(running_dir, 'final.log')
     commands.getoutput("mv %s %s"%(log_file_path,stage_4_result))
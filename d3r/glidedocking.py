@@ -5,13 +5,32 @@ import os
 import glob
 import logging
 import time
+import re
+import subprocess
+from collections import deque
 
 logger = logging.getLogger()
 logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.INFO )
 
 
-def grid (grid_center, prep_pro, prefix):
-    #protein_name = prep_pro.split(".")[0]
+#commands used to submit and monitor Schrodinger jobs, they are run through the shell
+GLIDE_CMD = '$SCHRODINGER/glide'
+JOBCONTROL_CMD = '$SCHRODINGER/jobcontrol'
+#job control statuses of jobs that are no longer running
+JOB_DONE_STATUSES = ('completed', 'finished', 'incorporated', 'exited', 'died', 'killed', 'stranded', 'fizzled')
+JOB_ACTIVE_STATUSES = ('submitted', 'launched', 'waiting', 'pending', 'running')
+#number of polls in a row a job must be missing from jobcontrol -list before it is taken as gone,
+#a single failed or empty listing happens when job control is busy and must not end a running job
+MAX_UNKNOWN_POLLS = 6
+
+def run_cmd(cmd, working_dir=None):
+    #run cmd through the shell in working_dir, the output is returned like commands.getoutput
+    p = subprocess.Popen(cmd, shell=True, cwd=working_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return p.communicate()[0].rstrip("\n")
+
+def write_grid_input(grid_center, prep_pro, prefix, working_dir='.'):
+    #write the grid generation input file for prep_pro in working_dir
+    #returns (grid input file, grid file the job will create)
     out_grid = prefix + ".zip"
     grid_in  = prefix +  "_grid.in"
     grid_1 = "GRID_CENTER \t %s \n"%grid_center
@@ -19,17 +38,24 @@ def grid (grid_center, prep_pro, prefix):
     grid_3 = "INNERBOX \t 10, 10, 10 \n"
     grid_4 = "OUTERBOX \t 30, 30, 30 \n"
     grid_5 = "RECEP_FILE \t %s \n"%prep_pro
-    f = open (grid_in, "w")
+    f = open (os.path.join(working_dir, grid_in), "w")
     for grid_line in (grid_1, grid_2, grid_3, grid_4, grid_5):
         f.writelines(grid_line)
     f.close()
-    commands.getoutput("$SCHRODINGER/glide -WAIT %s"%grid_in)
+    return grid_in, out_grid
+
+def grid (grid_center, prep_pro, prefix):
+    #protein_name = prep_pro.split(".")[0]
+    grid_in, out_grid = write_grid_input(grid_center, prep_pro, prefix)
+    commands.getoutput("%s -WAIT %s"%(GLIDE_CMD, grid_in))
     if os.path.isfile(out_grid):
         return out_grid
     else:
         return False
 
-def dock(ligand_file, out_grid, protein_title, precision='SP'):
+def write_dock_input(ligand_file, out_grid, protein_title, precision='SP', working_dir='.'):
+    #write the docking input file in working_dir
+    #returns (dock input file, pose viewer file the job will create)
     allowed_precisions = ['SP','XP']
     if not(precision in allowed_precisions):
         logging.info('Invalid precision setting %s. Must be one of %r. Switching precision to %s' %(precision, allowed_precisions, allowed_precisions[0]))
@@ -46,126 +72,262 @@ def dock(ligand_file, out_grid, protein_title, precision='SP'):
         dock_lines += ["POSTDOCK_XP_DELE \t 0.5 \n"]
         dock_lines += ["EXPANDED_SAMPLING \t True \n"]
         dock_lines += ["WRITE_XP_DESC \t False \n"]
-    f = open(dock_in, "w")
+    f = open(os.path.join(working_dir, dock_in), "w")
     for dock_line in dock_lines:
         f.writelines(dock_line)
     f.close()
     out_dock_file = protein_title + "_dock_pv.maegz"
-    commands.getoutput("$SCHRODINGER/glide -WAIT %s"%dock_in)
+    return dock_in, out_dock_file
+
+def dock(ligand_file, out_grid, protein_title, precision='SP'):
+    dock_in, out_dock_file = write_dock_input(ligand_file, out_grid, protein_title, precision=precision)
+    commands.getoutput("%s -WAIT %s"%(GLIDE_CMD, dock_in))
     return out_dock_file
 
-def main_glide (stage_3_result, stage_4_working, update= True, usexp=False):
-    if usexp:
-        precision = 'XP'
-    else:
-        precision = 'SP'
-    os.chdir(stage_4_working)
-    current_dir = os.getcwd()
+def submit_glide_job(input_file, working_dir):
+    #start a glide job through Schrodinger job control without waiting for it
+    #returns the job id printed by glide or None if the job could not be submitted
+    out = run_cmd('%s %s'%(GLIDE_CMD, input_file), working_dir)
+    match = re.search(r'JobId:\s*(\S+)', out)
+    if match is None:
+        logging.info("Unable to submit glide job for %s: %s"%(input_file, out))
+        return None
+    return match.group(1)
+
+def get_job_status(job_id):
+    #ask job control for the status of job_id, returns the status in lower case or 'unknown'
+    #if the job is not listed which happens once its record is cleaned up
+    out = run_cmd('%s -list %s'%(JOBCONTROL_CMD, job_id))
+    for line in out.split('\n'):
+        tokens = line.split()
+        if job_id not in tokens:
+            continue
+        for token in tokens:
+            if token.lower() in JOB_DONE_STATUSES + JOB_ACTIVE_STATUSES:
+                return token.lower()
+        return 'running'
+    return 'unknown'
+
+class GlideJob(object):
+    #a glide grid or dock job, on_done(job) is called by GlideJobScheduler once the job is no longer running
+    def __init__(self, name, input_file, working_dir, on_done = None):
+        self.name = name
+        self.input_file = input_file
+        self.working_dir = working_dir
+        self.on_done = on_done
+        self.job_id = None
+        self.status = None
+        self.queue_time = None
+        self.start_time = None
+        self.end_time = None
+        self.unknown_polls = 0
+
+class GlideJobScheduler(object):
+    #submits queued GlideJobs through Schrodinger job control keeping at most max_jobs running,
+    #polling their status every poll_interval seconds. Jobs added with first = True, such as the
+    #dock step of a finished grid, are submitted before the rest of the queue. A job is done once
+    #its status is in JOB_DONE_STATUSES or it was unknown for max_unknown_polls polls in a row
+    def __init__(self, max_jobs = 1, poll_interval = 5, max_unknown_polls = MAX_UNKNOWN_POLLS):
+        self.max_jobs = max(1, max_jobs)
+        self.poll_interval = poll_interval
+        self.max_unknown_polls = max(1, max_unknown_polls)
+        self.max_running = 0
+        self.finished = []
+        self._first = deque()
+        self._queue = deque()
+        self._running = []
+
+    def add(self, job, first = False):
+        job.queue_time = time.time()
+        if first:
+            self._first.append(job)
+        else:
+            self._queue.append(job)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.end_time = time.time()
+        self.finished.append(job)
+        logging.info("Glide job %s (%s) finished with status %s after %.1f seconds"%(job.name, job.job_id, status, job.end_time - job.start_time))
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                logging.info("Error handling end of glide job %s: %s"%(job.name, e))
+
+    def _submit_queued(self):
+        while (self._first or self._queue) and len(self._running) < self.max_jobs:
+            if self._first:
+                job = self._first.popleft()
+            else:
+                job = self._queue.popleft()
+            job.start_time = time.time()
+            job.job_id = submit_glide_job(job.input_file, job.working_dir)
+            if job.job_id is None:
+                self._finish(job, 'not submitted')
+                continue
+            logging.info("Submitted glide job %s as %s"%(job.name, job.job_id))
+            self._running.append(job)
+            self.max_running = max(self.max_running, len(self._running))
+
+    def run(self):
+        #run until every queued job, including ones added while running, is done
+        #returns the finished jobs in the order they finished
+        while self._first or self._queue or self._running:
+            self._submit_queued()
+            if not self._running:
+                continue
+            time.sleep(self.poll_interval)
+            for job in list(self._running):
+                status = get_job_status(job.job_id)
+                if status == 'unknown':
+                    job.unknown_polls += 1
+                    if job.unknown_polls < self.max_unknown_polls:
+                        logging.info("Status of glide job %s (%s) unknown, poll %d of %d"%(job.name, job.job_id, job.unknown_polls, self.max_unknown_polls))
+                        continue
+                else:
+                    job.unknown_polls = 0
+                if status in JOB_DONE_STATUSES or status == 'unknown':
+                    self._running.remove(job)
+                    self._finish(job, status)
+        return self.finished
+
+def get_dock_jobs(stage_3_result, stage_4_working):
+    #copy every target directory into stage_4_working and return the list of candidates to dock
+    #as tuples (target directory, candidate protein file, ligand file, grid center)
     dockable_paths = []
     for all_pdb_path in os.walk(stage_3_result): 
        if all_pdb_path[0] != stage_3_result:
             dockable_paths.append(all_pdb_path[0])
+    jobs = []
     for dockable_path in dockable_paths:
         commands.getoutput("cp -r %s %s" %(dockable_path, stage_4_working))
         target_name = os.path.basename(dockable_path)
-        os.chdir(target_name)
-        current_dir_layer_2 = os.getcwd()
+        target_dir = os.path.join(stage_4_working, target_name)
         ##################
         #Do the docking here
         
         #1, get the center
         try:
-            grid_center = open("center.txt","r").readlines()[0]
+            grid_center = open(os.path.join(target_dir, "center.txt"),"r").readlines()[0]
             logging.info("=============Start working on this case:%s=========="%target_name)
         except:
             logging.info("Fatal error: Unable to find the center file for this case %s"%target_name)
-            os.chdir(current_dir)
             continue
             
         # Get the candidate protein names in this directory
-        candidate_proteins = glob.glob('./*-????_????_prepared.mae')
+        candidate_proteins = sorted([os.path.basename(i) for i in glob.glob(os.path.join(target_dir, '*-????_????_prepared.mae'))])
         logging.info('Found candidates %r' %(candidate_proteins))
 
         # Get the ligand names in this directory
-        ligand_maes = glob.glob('lig_*_prepared.mae')
+        ligand_maes = [os.path.basename(i) for i in glob.glob(os.path.join(target_dir, 'lig_*_prepared.mae'))]
         ligand_maes = [i for i in ligand_maes if not "unprep" in i]
         if len(ligand_maes) == 0:
             logging.info('No ligand files found for target %s. Skipping.' %(dockable_path))
-            os.chdir(current_dir)
             continue
         if len(ligand_maes) > 1:
             logging.info('Multiple ligand files found for target %s (found ligands %r). The workflow currently should only be sending one ligand. Skipping. ' %(dockable_path, ligand_maes))
-            os.chdir(current_dir)
             continue
-            
-        #for possible_protein in ("LMCSS.maegz", "SMCSS.maegz", "hiResHolo.maegz", "hiResApo.maegz"):
+
         for candidate_protein in candidate_proteins:
-            candidate_prefix = candidate_protein.replace('_prepared.mae','')
-
-            #if os.path.isfile(candidate_protein):
-            logging.info( "Working on this receptor: %s"%candidate_prefix )
-            if not os.path.isdir(candidate_prefix):
-                os.mkdir(candidate_prefix)
-            os.chdir(candidate_prefix)
-            ##################
-            #do docking inside
-            commands.getoutput("cp ../%s ."%candidate_protein)
-
-            #generate grid
-            logging.info("Trying to get the grid file...")
-            if update: 
-                out_grid = grid(grid_center, candidate_protein, candidate_prefix) 
-                #time.sleep(200)
-            else:
-                #check if there is old grid
-                out_grid = candidate_prefix + ".zip"
-                if not os.path.isfile(out_grid):
-                    out_grid = grid(grid_center, candidate_protein, candidate_prefix)
-                    #time.sleep(200)
-            logging.info("Finished grid generation...")
-            
-            ## Dock each ligand
-            for ligand_mae in ligand_maes:
-                commands.getoutput("cp ../%s ." %(ligand_mae))
-                logging.info("Trying to dock...")
-                if update:
-                    out_dock = dock("ligand.mae", out_grid, candidate_prefix, precision=precision)
-                else:
-                    out_dock = candidate_prefix + "_dock_pv.maegz"
-                    if not os.path.isfile(out_dock):
-                        out_dock = dock(ligand_mae, out_grid, candidate_prefix, precision=precision)
-                logging.info("Finished docking, beginning post-docking file conversion")
-                
-                # Split the results into receptor and poses
-                intermediate_prefix = '%s_postdocking' %(candidate_prefix)
-                receptorMae = intermediate_prefix+'_receptor1.mae'
-            
-            
-                ## Split into a receptor mae file and one ligand mae for each pose
-                commands.getoutput('$SCHRODINGER/run split_structure.py -m ligand -many_files %s %s.mae' %(out_dock, intermediate_prefix))
-            
-                ## Convert the receptor mae into pdb
-                # This pdb is one of the final outputs from docking
-                outputReceptorPdb = '%s_docked.pdb' %(candidate_prefix)
-                commands.getoutput('$SCHRODINGER/utilities/structconvert %s %s' %(receptorMae, outputReceptorPdb))
-            
-                ## Convert the ligand maes into mols
-                docked_ligand_maes = glob.glob('./%s_ligand?.mae' %(intermediate_prefix))
-                for docked_ligand_mae in docked_ligand_maes:
-                    docked_ligand_mol = docked_ligand_mae.replace('.mae','.mol') 
-                    commands.getoutput('$SCHRODINGER/utilities/structconvert %s %s' %(docked_ligand_mae, docked_ligand_mol))
-
-            # Copy the top-ranked ligand mol to be one of the final outputs from this step
-            top_ligand_mol = intermediate_prefix+'_ligand1.mol'
-            output_ligand_mol = '%s_docked.mol' %(candidate_prefix)
-            commands.getoutput('cp %s %s' %(top_ligand_mol, output_ligand_mol))
-            commands.getoutput('cp %s ../' %(output_ligand_mol))
-            commands.getoutput('cp %s ../' %(outputReceptorPdb))
-      
-            ##################
-            os.chdir(current_dir_layer_2)
-        os.chdir(current_dir)
-        ##################
+            jobs.append((target_dir, candidate_protein, ligand_maes[0], grid_center))
+    return jobs
+
+def postdock_candidate(candidate_dir, candidate_prefix, out_dock):
+    #split the docking result of a candidate into receptor and poses and copy the top pose and
+    #receptor to the target directory
+    # Split the results into receptor and poses
+    intermediate_prefix = '%s_postdocking' %(candidate_prefix)
+    receptorMae = intermediate_prefix+'_receptor1.mae'
+
+    ## Split into a receptor mae file and one ligand mae for each pose
+    run_cmd('$SCHRODINGER/run split_structure.py -m ligand -many_files %s %s.mae' %(out_dock, intermediate_prefix), candidate_dir)
+
+    ## Convert the receptor mae into pdb
+    # This pdb is one of the final outputs from docking
+    outputReceptorPdb = '%s_docked.pdb' %(candidate_prefix)
+    run_cmd('$SCHRODINGER/utilities/structconvert %s %s' %(receptorMae, outputReceptorPdb), candidate_dir)
+
+    ## Convert the ligand maes into mols
+    docked_ligand_maes = sorted(glob.glob(os.path.join(candidate_dir, '%s_ligand?.mae' %(intermediate_prefix))))
+    for docked_ligand_mae in docked_ligand_maes:
+        docked_ligand_mae = os.path.basename(docked_ligand_mae)
+        docked_ligand_mol = docked_ligand_mae.replace('.mae','.mol') 
+        run_cmd('$SCHRODINGER/utilities/structconvert %s %s' %(docked_ligand_mae, docked_ligand_mol), candidate_dir)
+
+    # Copy the top-ranked ligand mol to be one of the final outputs from this step
+    top_ligand_mol = intermediate_prefix+'_ligand1.mol'
+    output_ligand_mol = '%s_docked.mol' %(candidate_prefix)
+    run_cmd('cp %s %s' %(top_ligand_mol, output_ligand_mol), candidate_dir)
+    run_cmd('cp %s ../' %(output_ligand_mol), candidate_dir)
+    run_cmd('cp %s ../' %(outputReceptorPdb), candidate_dir)
+
+def schedule_candidate(scheduler, target_dir, candidate_protein, ligand_mae, grid_center, update = True, precision = 'SP'):
+    #queue the grid job of a candidate, its dock job is queued as soon as the grid is ready
+    #and the post docking conversion runs once the dock job finished. Existing grid and dock
+    #files are reused when update is False
+    candidate_prefix = candidate_protein.replace('_prepared.mae','')
+    logging.info( "Working on this receptor: %s"%candidate_prefix )
+    candidate_dir = os.path.join(target_dir, candidate_prefix)
+    if not os.path.isdir(candidate_dir):
+        os.mkdir(candidate_dir)
+    ##################
+    #do docking inside
+    commands.getoutput("cp %s %s"%(os.path.join(target_dir, candidate_protein), candidate_dir))
+    out_grid = candidate_prefix + ".zip"
+
+    def dock_done(job):
+        out_dock = candidate_prefix + "_dock_pv.maegz"
+        logging.info("Finished docking %s, beginning post-docking file conversion"%candidate_prefix)
+        postdock_candidate(candidate_dir, candidate_prefix, out_dock)
+
+    def start_dock():
+        ## Dock the ligand
+        commands.getoutput("cp %s %s" %(os.path.join(target_dir, ligand_mae), candidate_dir))
+        if not update and os.path.isfile(os.path.join(candidate_dir, candidate_prefix + "_dock_pv.maegz")):
+            dock_done(None)
+            return
+        logging.info("Trying to dock %s..."%candidate_prefix)
+        dock_in, out_dock = write_dock_input(ligand_mae, out_grid, candidate_prefix, precision = precision, working_dir = candidate_dir)
+        scheduler.add(GlideJob(candidate_prefix + ' dock', dock_in, candidate_dir, on_done = dock_done), first = True)
+
+    def grid_done(job):
+        if not os.path.isfile(os.path.join(candidate_dir, out_grid)):
+            logging.info("Grid generation failed for %s, skipping docking"%candidate_prefix)
+            return
+        logging.info("Finished grid generation for %s"%candidate_prefix)
+        start_dock()
+
+    #generate grid unless there is an old grid and update is not set
+    if update or not os.path.isfile(os.path.join(candidate_dir, out_grid)):
+        logging.info("Trying to get the grid file for %s..."%candidate_prefix)
+        grid_in, out_grid = write_grid_input(grid_center, candidate_protein, candidate_prefix, working_dir = candidate_dir)
+        scheduler.add(GlideJob(candidate_prefix + ' grid', grid_in, candidate_dir, on_done = grid_done))
+    else:
+        start_dock()
+
+def main_glide (stage_3_result, stage_4_working, update= True, usexp=False, numworkers = 1, poll_interval = 5):
+    #grid and dock steps of every candidate are submitted as Schrodinger jobs without waiting, keeping
+    #at most numworkers jobs running. A candidate's dock job is submitted as soon as its grid is ready
+    #returns the finished GlideJobs which carry their timing
+    if usexp:
+        precision = 'XP'
+    else:
+        precision = 'SP'
+    stage_4_working = os.path.abspath(stage_4_working)
+    stage_3_result = os.path.abspath(stage_3_result)
+    os.chdir(stage_4_working)
+    start_time = time.time()
+    scheduler = GlideJobScheduler(max_jobs = numworkers, poll_interval = poll_interval)
+    for target_dir, candidate_protein, ligand_mae, grid_center in get_dock_jobs(stage_3_result, stage_4_working):
+        schedule_candidate(scheduler, target_dir, candidate_protein, ligand_mae, grid_center, update = update, precision = precision)
+    finished = scheduler.run()
+    job_time = 0
+    for job in finished:
+        job_time += job.end_time - job.start_time
+        logging.info("Glide job %s waited %.1f seconds and ran %.1f seconds, status %s"%(job.name, job.start_time - job.queue_time, job.end_time - job.start_time, job.status))
+    logging.info("Ran %d glide jobs with up to %d at once in %.1f seconds, %.1f seconds of job time"%(len(finished), scheduler.max_running, time.time() - start_time, job_time))
+    return finished
 
 if ("__main__") == (__name__):
     from argparse import ArgumentParser
@@ -174,6 +336,8 @@ if ("__main__") == (__name__):
     parser.add_argument("-o", "--outdir", metavar = "PATH", help = "PATH where we will put the docking output")
     parser.add_argument("-u", "--update", action = "store_true",  help = "Update the docking result", default = False) 
     parser.add_argument("-x", "--usexp", action = "store_true",  help = "Perform docking using glide XP instead of SP", default = False) 
+    parser.add_argument("-n", "--numworkers", type = int, default = 1, help = "Maximum number of glide grid and dock jobs running at once (default 1)")
+    parser.add_argument("-p", "--pollinterval", type = float, default = 5, help = "Seconds between job control status checks of running jobs (default 5)")
     logger = logging.getLogger()
     logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level = logging.INFO )
     opt = parser.parse_args()
@@ -186,7 +350,9 @@ if ("__main__") == (__name__):
     main_glide(proteinligprep_dir, 
                dock_result_dir, 
                update = update,
-               usexp = usexp)
+               usexp = usexp,
+               numworkers = opt.numworkers,
+               poll_interval = opt.pollinterval)
     #move the final log file to the result dir
     log_file_path = os.path.join(running_dir, 'final.log')
     commands.getoutput("mv %s %s"%(log_file_path, dock_result_dir))
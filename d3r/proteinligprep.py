@@ -6,9 +6,13 @@ import glob
 import logging
 import time
 import re
+from d3r.utilities import prepjobs
 logger = logging.getLogger()
 logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.DEBUG )
 
+#seconds to wait for prepwizard, which returns before the prepared protein is written
+PREPWIZARD_SLEEP_TIME = 180
+
 #s2_result_path = "/data/celpp/2015/dataset.week.47/stage.2.blastnfilter"
 #pdb_protein_location = "/data/pdb.extracted"
 #full_copy_location = ""
@@ -83,7 +87,53 @@ def prepare_protein (protein_file, prepared_protein, sleep_time = 300):
         return False
 
 
-def main_proteinprep ( challenge_data_path, pdb_protein_path, working_folder ):
+def prepare_candidate (candidate_filename):
+    #split and prepare one candidate protein, run from within its target directory
+    ## Parse the candidate name 
+    ## Get the method type, target, and candidate info from the filename
+    # for example, this will parse 'hiResApo-5hib_2eb2_docked.mol' into [('hiResApo', '5hib', '2eb2')]
+    
+    parsed_name = re.findall('([a-zA-Z0-9]+)-([a-zA-Z0-9]+)_([a-zA-Z0-9]+)-?([a-zA-Z0-9]*).pdb', candidate_filename)
+    if len(parsed_name) != 1:
+        logging.info('Failed to parse docked structure name "%s". Parsing yielded %r' %(candidate_filename, parsed_name))
+        return False
+    candidate_structure_type = parsed_name[0][0]
+    candidate_structure_target = parsed_name[0][1]
+    candidate_structure_candidate = parsed_name[0][2]
+    candidate_structure_ligand = parsed_name[0][2]
+
+    # Split the complex 
+    #candidate_prefix = candidate_filename.replace('.pdb','')
+    candidate_prefix = '%s-%s_%s' %(candidate_structure_type,
+                                    candidate_structure_target,
+                                    candidate_structure_candidate)
+    
+    out_split = candidate_prefix+ "_split.pdb"
+    out_receptor = split_complex("pdb", candidate_filename, out_split)
+    
+    if not(out_receptor):
+        logging.info("Unable to split this protein:%s"%(candidate_filename))
+        return False
+    
+    logging.info("Successfully split this protein:%s, go to preparation step"%(candidate_filename))
+    prepared_protein_maegz = candidate_prefix + "_prepared.mae"
+    #pass the wizard sleep time here
+    preparation_result = prepare_protein(out_receptor,prepared_protein_maegz, PREPWIZARD_SLEEP_TIME )
+    if not preparation_result:
+        logging.info("Unable to prepare this protein:%s"%(out_split))
+        return False
+    #convert into pdb format
+    prepared_candidate_filename = candidate_prefix + "_prepared.pdb"
+    commands.getoutput("$SCHRODINGER/utilities/pdbconvert -imae %s -opdb %s"%(prepared_protein_maegz, prepared_candidate_filename))
+    logging.info("Successfully prepared this protein:%s"%(prepared_candidate_filename))
+    return True
+
+def main_proteinprep ( challenge_data_path, pdb_protein_path, working_folder, ligand_workers = 1, protein_workers = 1, retry_failed = False ):
+    #the ligand of each target and each of its candidate proteins are prepared by independent jobs, if either worker
+    #count is larger than 1 ligand jobs and protein jobs run on separate pools of that many processes. Targets whose
+    #jobs all ran in an earlier run, as recorded by their completion marker, are skipped unless retry_failed is set,
+    #in which case only the jobs the marker lists as failed are run again
+    challenge_data_path = os.path.abspath(challenge_data_path)
     os.chdir(working_folder)
     current_dir_layer_1 = os.getcwd()
 #     all_stage_2_out = glob.glob("%s/*.txt"%s2_result_path)
@@ -208,6 +258,7 @@ def main_proteinprep ( challenge_data_path, pdb_protein_path, working_folder ):
          
     ## Get all potential target directories and candidates within
     valid_candidates = {}
+    retry_jobs = {}
     #target_ligands = {}
     pot_target_dirs = list(os.walk(challenge_data_path))[0][1]
     #target_ids = []
@@ -218,6 +269,13 @@ def main_proteinprep ( challenge_data_path, pdb_protein_path, working_folder ):
         if len(pot_target_id) != 4:
             logging.info('Filtering potential target directories: %s is not 4 characters long. Skipping' %(pot_target_id))
             continue
+        if prepjobs.is_target_complete(pot_target_id):
+            failed_jobs = prepjobs.get_failed_jobs(pot_target_id)
+            if not retry_failed or not failed_jobs:
+                logging.info('Target %s was prepared by an earlier run. Skipping' %(pot_target_id))
+                continue
+            logging.info('Retrying failed preparation jobs of target %s: %s' %(pot_target_id, ', '.join(sorted([job[1] for job in failed_jobs]))))
+            retry_jobs[pot_target_id] = failed_jobs
         commands.getoutput('mkdir %s' %(pot_target_id))
         #target_ids.append(pot_target_dir)
         valid_candidates[pot_target_id] = []
@@ -239,7 +297,7 @@ def main_proteinprep ( challenge_data_path, pdb_protein_path, working_folder ):
 
         
         # Copy in each valid candidate
-        for candidate_file in glob.glob('%s/*-%s_*.pdb' %(target_dir_path, pot_target_id)):
+        for candidate_file in sorted(glob.glob('%s/*-%s_*.pdb' %(target_dir_path, pot_target_id))):
             # The LMCSS ligand will be in a pdb file called something like celpp_week19_2016/1fcz/LMCSS-1fcz_1fcz-156-lig.pdb
             # We want to make sure we don't treat this like a receptor
             if 'lig.pdb' in candidate_file:
@@ -248,59 +306,28 @@ def main_proteinprep ( challenge_data_path, pdb_protein_path, working_folder ):
             candidate_local_file = os.path.basename(candidate_file)
             valid_candidates[pot_target_id].append((local_smiles_file, candidate_local_file))
                 
-    for target_id in valid_candidates.keys():
-        os.chdir(target_id)
-        ######################
-        #step 6, prepare all proteins
-        ######################
+    ######################
+    #step 6, prepare the ligand and all proteins
+    ######################
+    jobs = []
+    for target_id in sorted(valid_candidates.keys()):
+        if len(valid_candidates[target_id]) == 0:
+            continue
+        target_dir = os.path.join(current_dir_layer_1, target_id)
+        smiles_filename = valid_candidates[target_id][0][0]
+        target_jobs = []
+        target_jobs.append((prepjobs.LIGAND_JOB, target_dir, smiles_filename, ligand_prepare, (smiles_filename, smiles_filename.replace('.smi','_prepared.mae'))))
         for smiles_filename, candidate_filename in valid_candidates[target_id]:
-
-            
-            
-            ## Parse the candidate name 
-            ## Get the method type, target, and candidate info from the filename
-            # for example, this will parse 'hiResApo-5hib_2eb2_docked.mol' into [('hiResApo', '5hib', '2eb2')]
-            
-            parsed_name = re.findall('([a-zA-Z0-9]+)-([a-zA-Z0-9]+)_([a-zA-Z0-9]+)-?([a-zA-Z0-9]*).pdb', candidate_filename)
-            if len(parsed_name) != 1:
-                logging.info('Failed to parse docked structure name "%s". Parsing yielded %r' %(candidate_filename, parsed_name))
-                continue
-            candidate_structure_type = parsed_name[0][0]
-            candidate_structure_target = parsed_name[0][1]
-            candidate_structure_candidate = parsed_name[0][2]
-            candidate_structure_ligand = parsed_name[0][2]
-            
-            # Prepare the ligand
-            if not ligand_prepare(smiles_filename, smiles_filename.replace('.smi','_prepared.mae')):
-                logging.info("Unable to prepare the ligand for this query protein:%s"%target_id)
-                #os.chdir(current_dir_layer_1)
-                continue 
-
-            # Split the complex 
-            #candidate_prefix = candidate_filename.replace('.pdb','')
-            candidate_prefix = '%s-%s_%s' %(candidate_structure_type,
-                                            candidate_structure_target,
-                                            candidate_structure_candidate)
-            
-            out_split = candidate_prefix+ "_split.pdb"
-            out_receptor = split_complex("pdb", candidate_filename, out_split)
-            
-            if not(out_receptor):
-                logging.info("Unable to split this protein:%s"%(candidate_filename))
-                continue
-            
-            logging.info("Successfully split this protein:%s, go to preparation step"%(candidate_filename))
-            prepared_protein_maegz = candidate_prefix + "_prepared.mae"
-            #pass the wizard sleep time here
-            preparation_result = prepare_protein(out_receptor,prepared_protein_maegz, 180 )
-            if not preparation_result:
-                logging.info("Unable to prepare this protein:%s"%(out_split))
-                continue                
-            #convert into pdb format
-            prepared_candidate_filename = candidate_prefix + "_prepared.pdb"
-            commands.getoutput("$SCHRODINGER/utilities/pdbconvert -imae %s -opdb %s"%(prepared_protein_maegz, prepared_candidate_filename))
-            logging.info("Successfully prepared this protein:%s"%(prepared_candidate_filename))
-        os.chdir(current_dir_layer_1)
+            target_jobs.append((prepjobs.PROTEIN_JOB, target_dir, candidate_filename, prepare_candidate, (candidate_filename,)))
+        if target_id in retry_jobs:
+            target_jobs = [job for job in target_jobs if (job[0], job[2]) in retry_jobs[target_id]]
+        jobs.extend(target_jobs)
+    results = prepjobs.run_prep_jobs(jobs, ligand_workers = ligand_workers, protein_workers = protein_workers)
+    for target_dir, kind, name, success, elapsed, error in results:
+        if kind == prepjobs.LIGAND_JOB and not success:
+            logging.info("Unable to prepare the ligand for this query protein:%s"%os.path.basename(target_dir))
+    os.chdir(current_dir_layer_1)
+    return results
                     
                 
 
@@ -310,6 +337,9 @@ if ("__main__") == (__name__):
     parser.add_argument("-p", "--pdbdb", metavar = "PATH", help = "PDB DATABANK which we will dock into")
     parser.add_argument("-c", "--candidatedir", metavar="PATH", help = "PATH where we could find the stage 2 output")
     parser.add_argument("-o", "--outdir", metavar = "PATH", help = "PATH where we run stage 3")
+    parser.add_argument("--ligandworkers", type = int, default = 1, help = "Number of worker processes preparing ligands, if this or --proteinworkers is larger than 1 ligands and proteins are prepared in parallel (default 1)")
+    parser.add_argument("--proteinworkers", type = int, default = 1, help = "Number of worker processes preparing candidate proteins (default 1)")
+    parser.add_argument("--retryfailed", default = False, action = "store_true", help = "Rerun the preparation jobs that failed for targets prepared by an earlier run, by default those targets are skipped")
     #parser.add_option("-s", "--sleep", metavar = "VALUE", help = "Sleep time for protein prep")
     #parser.add_option("-u", "--update", default = False, action = "store_true", help = "update the protein generation and docking step")
     logger = logging.getLogger()
@@ -321,7 +351,7 @@ if ("__main__") == (__name__):
     #sleep_time = opt.sleep
     #running under this dir
     running_dir = os.getcwd()
-    main_proteinprep(challenge_data_path, pdb_location, result_path)
+    main_proteinprep(challenge_data_path, pdb_location, result_path, ligand_workers = opt.ligandworkers, protein_workers = opt.proteinworkers, retry_failed = opt.retryfailed)
     #move the final log file to the result dir
     log_file_path = os.path.join(running_dir, 'final.log')
     commands.getoutput("mv %s %s"%(log_file_path,result_path))
@@ -202,4 +202,15 @@ class OutputAnalysis(object):
         for l in out:
             logger.debug(l)
             handle.write("%s\n" %l)
-        handle.close()
\ No newline at end of file
+        handle.close()
+
+    def print_mcss_cache_summary(self, out_dir, mcss_cache):
+        handle = open(os.path.join(out_dir, 'summary.txt'), 'a')
+        out = ['MCSS CACHE SUMMARY']
+        out.append('  hits:{no:>35}'.format(no=mcss_cache.hits))
+        out.append('  misses:{no:>33}'.format(no=mcss_cache.misses))
+        out.append('  entries:{no:>32}'.format(no=len(mcss_cache)))
+        for l in out:
+            logger.debug(l)
+            handle.write("%s\n" %l)
+        handle.close()
@@ -0,0 +1,152 @@
+__author__ = 'churas'
+
+import numpy
+
+# Vectorized kernels for the coordinate math done on ligands and proteins
+# when generating challenge data and evaluating docked poses. Coordinates
+# are loaded from PDB files once into arrays of shape (number of atoms, 3)
+
+ATOM_RECORDS = ('ATOM  ', 'HETATM')
+
+# number of rows handled at once by min_distances to bound memory use
+DISTANCE_CHUNK_SIZE = 1024
+
+
+def _parse_coords(lines):
+    """Parses x, y, z columns of PDB atom records
+    :raises ValueError: if a coordinate is not a number
+    """
+    if not lines:
+        return numpy.zeros((0, 3))
+    return numpy.array([(line[30:38], line[38:46], line[46:54])
+                        for line in lines]).astype(float)
+
+
+def read_pdb_coords(pdb_file, record_types=ATOM_RECORDS):
+    """Reads coordinates of atom records of a PDB file
+
+    :param pdb_file: path to PDB file
+    :param record_types: record names, first 6 characters of a line, to read
+    :returns: tuple (list of atom names, numpy array of coordinates)
+    :raises ValueError: if coordinates of a record cannot be parsed
+    """
+    f = open(pdb_file, 'r')
+    try:
+        lines = [line for line in f if line[:6] in record_types]
+    finally:
+        f.close()
+    return [line[12:16] for line in lines], _parse_coords(lines)
+
+
+def read_ligand_coords(ligand_pdb):
+    """Reads coordinates of a ligand the way ligand centers have always
+       been calculated, from lines containing HETATM keeping only the first
+       line of each atom name
+
+    :param ligand_pdb: path to PDB file of ligand
+    :returns: tuple (numpy array of coordinates, True if an atom name
+              repeats, meaning the file holds more than one ligand)
+    :raises ValueError: if coordinates of a line cannot be parsed
+    """
+    f = open(ligand_pdb, 'r')
+    try:
+        lines = [line for line in f if 'HETATM' in line]
+    finally:
+        f.close()
+    seen = set()
+    unique_lines = []
+    for line in lines:
+        if line[12:16] not in seen:
+            seen.add(line[12:16])
+            unique_lines.append(line)
+    return _parse_coords(unique_lines), len(unique_lines) != len(lines)
+
+
+def centroid(coords):
+    """Gets the mean position of coordinates
+    :raises ValueError: if there are no coordinates
+    """
+    if len(coords) == 0:
+        raise ValueError('Cannot get center of zero atoms')
+    return coords.mean(axis=0)
+
+
+def format_center(center):
+    """Formats center as the 'x, y, z' string written to center.txt
+    """
+    return '%8.3f, %8.3f, %8.3f' % tuple(center)
+
+
+def parse_center(center):
+    """Parses a 'x, y, z' string as written by format_center
+    """
+    return numpy.array([float(value) for value in center.split(',')[:3]])
+
+
+def distance(pos1, pos2):
+    """Gets distance between two points
+    """
+    diff = numpy.asarray(pos1, dtype=float) - numpy.asarray(pos2, dtype=float)
+    return float(numpy.sqrt((diff * diff).sum()))
+
+
+def pairwise_distances(coords1, coords2):
+    """Gets distance from every point in coords1 to every point in coords2
+    :returns: numpy array of shape (len(coords1), len(coords2))
+    """
+    sq = ((coords1 * coords1).sum(axis=1)[:, numpy.newaxis] +
+          (coords2 * coords2).sum(axis=1)[numpy.newaxis, :] -
+          2.0 * numpy.dot(coords1, coords2.T))
+    return numpy.sqrt(numpy.maximum(sq, 0.0))
+
+
+def min_distances(coords1, coords2, chunk_size=DISTANCE_CHUNK_SIZE):
+    """Gets distance from every point in coords1 to its nearest point in
+       coords2 without holding the full distance matrix in memory
+    :returns: numpy array of shape (len(coords1),)
+    """
+    result = numpy.empty(len(coords1))
+    for start in range(0, len(coords1), chunk_size):
+        result[start:start + chunk_size] = pairwise_distances(
+            coords1[start:start + chunk_size], coords2).min(axis=1)
+    return result
+
+
+def rmsd(coords1, coords2):
+    """Gets RMSD between two sets of paired points, without superposition
+    """
+    diff = coords1 - coords2
+    return float(numpy.sqrt((diff * diff).sum() / len(coords1)))
+
+
+def kabsch(mobile, target):
+    """Gets the rotation and translation that best superimpose mobile onto
+       target, paired point by point, in the least squares sense
+
+    :returns: tuple (rotation, translation) to apply as
+              mobile.dot(rotation) + translation
+    """
+    mobile_center = mobile.mean(axis=0)
+    target_center = target.mean(axis=0)
+    h = numpy.dot((mobile - mobile_center).T, target - target_center)
+    u, s, vt = numpy.linalg.svd(h)
+    # flip the last axis if needed so the result is a proper rotation
+    d = numpy.sign(numpy.linalg.det(numpy.dot(u, vt)))
+    if d == 0:
+        d = 1.0
+    rotation = numpy.dot(u * numpy.array([1.0, 1.0, d]), vt)
+    translation = target_center - numpy.dot(mobile_center, rotation)
+    return rotation, translation
+
+
+def superpose(mobile, target):
+    """Gets mobile superimposed onto target using kabsch
+    """
+    rotation, translation = kabsch(mobile, target)
+    return numpy.dot(mobile, rotation) + translation
+
+
+def superposed_rmsd(mobile, target):
+    """Gets RMSD between mobile and target after superposition
+    """
+    return rmsd(superpose(mobile, target), target)
@@ -16,26 +16,44 @@ def create_queries(polymer, non_polymer, ph):
     :param non_polymer: (string) the absolute path to new_release_nonpolymer.tsv
     :return: (d3r.blast.Target() object)
     """
-    queries = read_sequences(polymer)
+    index = {}
+    queries = read_sequences(polymer, index)
     if queries is not None:
         logger.debug('Found ' + str(len(queries)) + ' queries from ' +
                      polymer + ' file')
 
-    read_ph(ph, queries)
-    read_ligands(non_polymer, queries)
+    read_ph(ph, queries, index)
+    read_ligands(non_polymer, queries, index)
     return queries
 
 
-def read_sequences(polymer):
+def index_queries(queries):
+    """
+    Returns a dictionary mapping the wwPDB ID of each query to the query. If more than one query has the same wwPDB
+    ID, the first one in the list is used.
+    :param queries: a list of query objects
+    :return: { 'pdb_id' : query }
+    """
+    index = {}
+    for query in queries:
+        if query and query.pdb_id not in index:
+            index[query.pdb_id] = query
+    return index
+
+
+def read_sequences(polymer, index=None):
     """
     Reads the information in a new_release_sequence.tsv file. A blast.Target() object is created for each unique wwPDB
     ID and appended to a list, which is returned.
     :param polymer: the absolute path to a new_release_sequence.tsv file
+    :param index: optional dictionary, which is filled with the wwPDB ID to query mapping of the returned list
     :return: queries a list of query objects.
     """
     queries = []
+    if index is None:
+        index = {}
     handle = open(polymer, 'r')
-    for line in handle.readlines():
+    for line in handle:
         if line.startswith('PDB_ID'):
             continue
 
@@ -44,7 +62,7 @@ def read_sequences(polymer):
             pdb_id = words[0].lower()
             chain_id = words[1]
             seq = words[2]
-            queries = add_sequence(queries, seq, pdb_id, chain_id)
+            queries = add_sequence(queries, seq, pdb_id, chain_id, index)
         except:
             logger.exception('Caught exception')
             continue
@@ -52,7 +70,7 @@ def read_sequences(polymer):
     return queries
 
 
-def add_sequence(queries, seq, pdb_id, chain_id):
+def add_sequence(queries, seq, pdb_id, chain_id, index=None):
     """
     Adds a FASTA sequence, with a specific chain and wwPDB ID, to the
     appropriate target object.
@@ -60,19 +78,25 @@ def add_sequence(queries, seq, pdb_id, chain_id):
     :param seq: a FASTA sequence. It will be converted to a Bio.SeqRecord
     :param pdb_id: The corresponding wwPDB id.
     :param chain_id: The corresponding chain id.
+    :param index: dictionary returned by index_queries for queries, which is updated if a target is added. If None,
+                  it is built from queries on each call.
     """
-    added = [query.pdb_id for query in queries if query]
-    if pdb_id in added:
-        queries[added.index(pdb_id)].set_sequence(chain_id, seq)
+    if index is None:
+        index = index_queries(queries)
+    query = index.get(pdb_id)
+    if query is not None:
+        query.set_sequence(chain_id, seq)
     else:
         query = Query()
         query.pdb_id = format(pdb_id.lower())
         query.set_sequence(chain_id, seq)
         queries.append(query)
+        if query.pdb_id not in index:
+            index[query.pdb_id] = query
     return queries
 
 
-def read_ligands(non_polymer, queries):
+def read_ligands(non_polymer, queries, index=None):
     """
     Reads the information in a new_release_structure_nonpolymer.tsv file. The
     ligands are mapped to the appropriate
@@ -82,9 +106,12 @@ def read_ligands(non_polymer, queries):
     filter.filtering_sets module.
     :param non_polymer: absolute path to the pre-release non_polymer.tsv file
     :param queries, a list of target objects.
+    :param index: dictionary returned by index_queries for queries, built if None
     """
+    if index is None:
+        index = index_queries(queries)
     handle = open(non_polymer, 'r')
-    for line in handle.readlines():
+    for line in handle:
         if line.startswith('PDB_ID'):
             continue
         words = line.split()
@@ -94,14 +121,14 @@ def read_ligands(non_polymer, queries):
                 resname = words[1]
                 inchi = words[2]
                 ligand_label = label(resname)
-                add_ligand(pdb_id, resname, inchi, ligand_label, queries)
+                add_ligand(pdb_id, resname, inchi, ligand_label, queries, index)
             except:
                 logger.exception('Caught exception')
                 continue
     handle.close()
 
 
-def add_ligand(pdb_id, resname, inchi, label, queries):
+def add_ligand(pdb_id, resname, inchi, label, queries, index=None):
     """
     Adds the ligand, represented by its resname, inchi string, and label ( which can be 'dock' or 'do_not_call'), to
     the target with the corresponding wwPDB id.
@@ -109,20 +136,26 @@ def add_ligand(pdb_id, resname, inchi, label, queries):
     :param resname: (string) the resname of the ligand.
     :param inchi: (string) the inchi string of the ligand
     :param queries: (list) a list of target objects
+    :param index: dictionary returned by index_queries for queries, built if None
     :return:
+    :raises KeyError: if no target has the wwPDB id
     """
-    added = [target.pdb_id for target in queries if target]
-    queries[added.index(pdb_id)].set_ligand(resname, inchi, label)
+    if index is None:
+        index = index_queries(queries)
+    index[pdb_id].set_ligand(resname, inchi, label)
 
-def read_ph(ph, queries):
+def read_ph(ph, queries, index=None):
     """
 
     :param ph:
     :param queries:
+    :param index: dictionary returned by index_queries for queries, built if None
     :return:
     """
+    if index is None:
+        index = index_queries(queries)
     handle = open(ph, 'r')
-    for line in handle.readlines():
+    for line in handle:
         if line.startswith('PDB_ID'):
             continue
         words = line.split()
@@ -130,22 +163,25 @@ def read_ph(ph, queries):
             try:
                 pdb_id = words[0].lower()
                 exp_ph = words[1]
-                add_ph(pdb_id, exp_ph, queries)
+                add_ph(pdb_id, exp_ph, queries, index)
             except:
                 logger.exception('Caught exception')
                 continue
     handle.close()
 
-def add_ph(pdb_id, exp_ph, queries):
+def add_ph(pdb_id, exp_ph, queries, index=None):
     """
 
     :param pdb_id:
     :param exp_ph:
     :param queries:
+    :param index: dictionary returned by index_queries for queries, built if None
     :return:
+    :raises KeyError: if no target has the wwPDB id
     """
-    added = [query.pdb_id for query in queries if query]
-    queries[added.index(pdb_id)].exp_ph = exp_ph
+    if index is None:
+        index = index_queries(queries)
+    index[pdb_id].exp_ph = exp_ph
 
 def label(resname):
     """
@@ -0,0 +1,113 @@
+__author__ = 'churas'
+
+import logging
+import numpy
+
+from d3r.utilities import geometry
+
+logger = logging.getLogger(__name__)
+
+try:
+    from rdkit import Chem
+    from rdkit.Chem import rdFMCS
+except ImportError:
+    logger.debug('Unable to import rdkit, rdkit_rmsd_mcss will not work')
+
+# timeout in seconds for rdkit to find maximum common substructure
+FINDMCS_TIMEOUT = 60
+
+# number of fit matches whose RMSD to one reference match is calculated at once, bounds the memory used for the
+# index and coordinate difference arrays no matter how many matches symmetric ligands have
+MATCH_CHUNK_SIZE = 1024
+
+
+def match_rmsd(ref_coords, fit_coords, atom_pairs):
+    """
+    Calculates the RMSD between the atoms of two poses paired up by an MCS match, straight from their coordinates.
+    The poses are not superimposed first.
+    :param ref_coords: numpy array of shape (number of atoms, 3) with the coordinates of the reference molecule
+    :param fit_coords: numpy array of shape (number of atoms, 3) with the coordinates of the fit molecule
+    :param atom_pairs: list of tuples (index of atom in reference, index of atom in fit)
+    :return: the RMSD or None if atom_pairs is empty
+    """
+    if not atom_pairs:
+        return None
+    ref_index, fit_index = zip(*atom_pairs)
+    return geometry.rmsd(ref_coords[list(ref_index)], fit_coords[list(fit_index)])
+
+
+def min_match_rmsd(ref_coords, fit_coords, ref_matches, fit_matches, max_matches=None):
+    """
+    Finds the lowest RMSD over every pairing of a match of the MCS on the reference molecule with a match of the MCS
+    on the fit molecule. The n-th atom of each match corresponds to the n-th atom of the MCS. For each reference match
+    the fit matches are evaluated together in chunks of MATCH_CHUNK_SIZE keeping a running minimum.
+    :param ref_coords: numpy array of shape (number of atoms, 3) with the coordinates of the reference molecule
+    :param fit_coords: numpy array of shape (number of atoms, 3) with the coordinates of the fit molecule
+    :param ref_matches: list of tuples of atom indices in the reference molecule
+    :param fit_matches: list of tuples of atom indices in the fit molecule
+    :param max_matches: (int) the most pairings to look at, None for all of them
+    :return: tuple (the lowest RMSD or None if there are no pairings, number of pairings looked at)
+    """
+    minimum = None
+    count = 0
+    for ref_match in ref_matches:
+        if not ref_match:
+            break
+        ref_sel = ref_coords[list(ref_match)]
+        for start in range(0, len(fit_matches), MATCH_CHUNK_SIZE):
+            chunk = fit_matches[start:start + MATCH_CHUNK_SIZE]
+            if max_matches is not None:
+                chunk = chunk[:max(max_matches - count, 0)]
+            if not chunk:
+                break
+            diff = fit_coords[numpy.array(chunk, dtype=int)] - ref_sel
+            rmsd = float(numpy.sqrt((diff * diff).sum(axis=2).mean(axis=1)).min())
+            count += len(chunk)
+            if minimum is None or rmsd < minimum:
+                minimum = rmsd
+    return minimum, count
+
+
+def get_coords(rd_mol):
+    """
+    :param rd_mol: rdkit molecule with a conformer
+    :return: numpy array of shape (number of atoms, 3) with the coordinates of the atoms
+    """
+    return numpy.array(rd_mol.GetConformer().GetPositions(), dtype=float)
+
+
+def rdkit_rmsd_mcss(ref_struc, fit_struc, max_matches=None, timeout=FINDMCS_TIMEOUT):
+    """
+    RDKit counterpart of the OpenEye based rmsd_mcss in evaluate.py. Finds the MCS of the two ligands matching atoms
+    on element and bonds of any order, keeping complete rings only, and returns the lowest RMSD over all pairs of MCS
+    matches on the two poses. Every RMSD is calculated in memory from the coordinates.
+    :param ref_struc: path to pdb file of the reference ligand
+    :param fit_struc: path to pdb file of the fit ligand
+    :param max_matches: (int) the most pairs of matches to look at, None for all of them
+    :param timeout: timeout in seconds for rdkit to find the MCS
+    :return: the lowest RMSD or False if it could not be calculated
+    """
+    ref_mol = Chem.MolFromPDBFile(ref_struc, removeHs=True)
+    fit_mol = Chem.MolFromPDBFile(fit_struc, removeHs=True)
+    if ref_mol is None or fit_mol is None:
+        logger.debug('Unable to read ' + ref_struc + ' or ' + fit_struc)
+        return False
+    res = rdFMCS.FindMCS([ref_mol, fit_mol], atomCompare=rdFMCS.AtomCompare.CompareElements,
+                         bondCompare=rdFMCS.BondCompare.CompareAny, completeRingsOnly=True, timeout=timeout)
+    if res.numAtoms == 0:
+        logger.debug('No MCS found between ' + ref_struc + ' and ' + fit_struc)
+        return False
+    pattern = Chem.MolFromSmarts(res.smartsString)
+    # rdkit caps matches per molecule, so the cap on pairs of matches is also the most matches needed on either
+    if max_matches is None:
+        max_per_mol = 1000000
+    else:
+        max_per_mol = max(max_matches, 1)
+    ref_matches = ref_mol.GetSubstructMatches(pattern, uniquify=False, maxMatches=max_per_mol)
+    fit_matches = fit_mol.GetSubstructMatches(pattern, uniquify=False, maxMatches=max_per_mol)
+    minimum, count = min_match_rmsd(get_coords(ref_mol), get_coords(fit_mol), ref_matches, fit_matches,
+                                    max_matches=max_matches)
+    logger.debug('Looked at ' + str(count) + ' pairs of MCS matches between ' + ref_struc + ' and ' + fit_struc)
+    if minimum is None:
+        return False
+    return minimum
@@ -45,4 +45,7 @@ class OutController(object):
         self.report.print_filter_criteria(out_dir)
 
     def print_to_file(self, out_dir):
-        self.report.print_to_file(out_dir)
\ No newline at end of file
+        self.report.print_to_file(out_dir)
+
+    def print_mcss_cache_summary(self, out_dir, mcss_cache):
+        self.report.print_mcss_cache_summary(out_dir, mcss_cache)
\ No newline at end of file
@@ -0,0 +1,208 @@
+__author__ = 'churas'
+
+import os
+import time
+import logging
+import threading
+from multiprocessing import Pool
+
+logger = logging.getLogger(__name__)
+
+# Runs the protein and ligand preparation jobs of the proteinligprep
+# scripts. Ligand jobs and protein jobs go to separate process pools so
+# a few slow protein preparations do not hold up the ligands. Once every
+# job of a target has run a marker file listing the outcome of each job
+# is written in the target directory which lets a rerun after a crash
+# skip that target, or rerun only the jobs the marker lists as failed
+
+LIGAND_JOB = 'ligand'
+PROTEIN_JOB = 'protein'
+
+TARGET_COMPLETE_MARKER = 'prep.complete'
+
+
+def get_target_complete_marker(target_dir):
+    """Gets path to completion marker file of `target_dir`
+    """
+    return os.path.join(target_dir, TARGET_COMPLETE_MARKER)
+
+
+def is_target_complete(target_dir):
+    """Returns True if every preparation job of `target_dir` ran in an
+       earlier run, whether or not it succeeded
+    """
+    return os.path.isfile(get_target_complete_marker(target_dir))
+
+
+def read_target_complete(target_dir):
+    """Reads completion marker of `target_dir`
+
+    :returns: list of tuples (kind, name, success, seconds) in the order
+              listed in the marker, empty if there is no marker
+    """
+    marker = get_target_complete_marker(target_dir)
+    if not os.path.isfile(marker):
+        return []
+    entries = []
+    f = open(marker, 'r')
+    try:
+        for line in f:
+            words = line.split()
+            if len(words) != 4:
+                continue
+            entries.append((words[0], words[1], words[2] == 'ok',
+                            float(words[3])))
+    finally:
+        f.close()
+    return entries
+
+
+def get_failed_jobs(target_dir):
+    """Gets jobs the completion marker of `target_dir` lists as failed
+
+    :returns: set of tuples (kind, name)
+    """
+    return set([(e[0], e[1]) for e in read_target_complete(target_dir)
+                if not e[2]])
+
+
+def write_target_complete(target_dir, results):
+    """Writes completion marker of `target_dir` listing `results`
+
+       Jobs listed in an existing marker that are not in `results`, such
+       as the jobs that succeeded before the failed ones were retried,
+       are kept. Marker is written under a temporary name and renamed so
+       a crash never leaves a partial marker behind
+    :param results: list of job results as returned by `run_prep_jobs`
+    """
+    rerun = set([(res[1], res[2]) for res in results])
+    entries = [e for e in read_target_complete(target_dir)
+               if (e[0], e[1]) not in rerun]
+    entries.extend([(res[1], res[2], res[3], res[4]) for res in results])
+    marker = get_target_complete_marker(target_dir)
+    tmp_marker = marker + '.tmp'
+    f = open(tmp_marker, 'w')
+    for kind, name, success, elapsed in entries:
+        if success:
+            status = 'ok'
+        else:
+            status = 'failed'
+        f.write('%s %s %s %.1f\n' % (kind, name, status, elapsed))
+    f.close()
+    os.rename(tmp_marker, marker)
+
+
+def _run_prep_job(job):
+    """Runs `job` tuple (kind, target_dir, name, func, args) calling
+       func(*args) from within target_dir, exceptions are caught so a
+       failure only affects its own job
+    :returns: tuple (target_dir, kind, name, success, seconds, error or None)
+    """
+    kind, target_dir, name, func, args = job
+    start_time = time.time()
+    curdir = os.getcwd()
+    error = None
+    try:
+        os.chdir(target_dir)
+        success = bool(func(*args))
+    except Exception as e:
+        success = False
+        error = str(e)
+    finally:
+        os.chdir(curdir)
+    return (target_dir, kind, name, success, time.time() - start_time,
+            error)
+
+
+class _TargetTracker(object):
+    """Writes completion marker of a target once results of all its
+       jobs are in, results may arrive from pool result threads
+    """
+    def __init__(self, jobs):
+        self._lock = threading.Lock()
+        self._remaining = {}
+        self._results = {}
+        for job in jobs:
+            self._remaining[job[1]] = self._remaining.get(job[1], 0) + 1
+            self._results[job[1]] = []
+
+    def add_result(self, res):
+        target_dir, kind, name, success, elapsed, error = res
+        if error is not None:
+            logger.info('%s job %s of %s failed after %.1f seconds: %s' %
+                        (kind, name, os.path.basename(target_dir),
+                         elapsed, error))
+        else:
+            logger.info('%s job %s of %s took %.1f seconds, success: %s' %
+                        (kind, name, os.path.basename(target_dir),
+                         elapsed, success))
+        self._lock.acquire()
+        try:
+            self._results[target_dir].append(res)
+            self._remaining[target_dir] -= 1
+            if self._remaining[target_dir] > 0:
+                return
+            results = self._results[target_dir]
+        finally:
+            self._lock.release()
+        failed = [r[2] for r in results if not r[3]]
+        if failed:
+            logger.info('Marking ' + target_dir + ' complete with failed '
+                        'jobs, a rerun asked to retry failed jobs will '
+                        'only run these: ' + ', '.join(failed))
+        try:
+            write_target_complete(target_dir, results)
+        except (IOError, OSError) as e:
+            logger.info('Unable to write completion marker for ' +
+                        target_dir + ': ' + str(e))
+
+
+def run_prep_jobs(jobs, ligand_workers=1, protein_workers=1):
+    """Runs preparation jobs, in parallel if either worker count is
+       larger than 1
+
+       If `ligand_workers` and `protein_workers` are both 1 or less the
+       jobs are run one at a time in list order in this process,
+       otherwise `LIGAND_JOB` jobs are run by a pool of `ligand_workers`
+       processes while `PROTEIN_JOB` jobs are run by a separate pool of
+       `protein_workers` processes. Each job runs from within its target
+       directory and the completion marker of a target is written as
+       soon as its last job finishes, listing whether each job succeeded.
+
+    :param jobs: list of tuples (kind, target_dir, name, func, args) where
+                 kind is `LIGAND_JOB` or `PROTEIN_JOB` and func(*args)
+                 returns True on success. func must be a module level
+                 function so it can be sent to a worker process
+    :returns: list of tuples (target_dir, kind, name, success, seconds,
+              error message or None) in the same order as `jobs`
+    """
+    start_time = time.time()
+    tracker = _TargetTracker(jobs)
+    if ligand_workers <= 1 and protein_workers <= 1:
+        results = []
+        for job in jobs:
+            res = _run_prep_job(job)
+            tracker.add_result(res)
+            results.append(res)
+    else:
+        pools = {LIGAND_JOB: Pool(processes=max(1, ligand_workers)),
+                 PROTEIN_JOB: Pool(processes=max(1, protein_workers))}
+        try:
+            pending = [pools[job[0]].apply_async(_run_prep_job, (job,),
+                                                 callback=tracker.add_result)
+                       for job in jobs]
+            results = [p.get() for p in pending]
+        finally:
+            for pool in pools.values():
+                pool.close()
+                pool.join()
+
+    job_time = sum([r[4] for r in results])
+    failed = len([r for r in results if not r[3]])
+    logger.info('Ran %d preparation jobs (%d failed) with %d ligand and '
+                '%d protein worker(s) in %.1f seconds, %.1f seconds of '
+                'per job time' % (len(results), failed,
+                                  max(1, ligand_workers),
+                                  max(1, protein_workers),
+                                  time.time() - start_time, job_time))
+    return results
@@ -3,9 +3,12 @@ __project__ = 'blastnfilter'
 
 import os
 import logging
+import multiprocessing
 import in_put
 from d3r.blast.hit import Hit
 from d3r.blast.ligand import Ligand
+from d3r.blast.query import Query
+from d3r.blast.mcss import MCSSCache
 from d3r.filter.filter import QueryFilter
 from d3r.filter.filter import HitFilter
 from d3r.filter.filter import CandidateFilter
@@ -34,16 +37,14 @@ def split_input(options):
     return non_polymer, polymer, ph, out_dir, blast_dir, pdb_db, pdb_path, fasta, compinchi
 
 
-def blast_the_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi):
+def load_shared_data(pdb_path, fasta, compinchi):
     """
-    Runs a blast search using the target sequence as a query
-    :param query: an instance of blast.query.Query
-    :param pdb_db: The absolute path to a BLASTP database
+    Loads the class-wide PDB directory, pdb_seqres.txt sequences and Components-inchi.ich data used by every query.
+    This is done once in the parent process before a worker pool is started so the forked workers inherit the
+    data instead of each rereading it. Components-inchi.ich is not read if Ligand.component_store is set.
     :param pdb_path: The absolute path to a decompressed copy of the PDB
     :param fasta: A file with fasta sequences of each chain in the PDB
-    :param out_dir: The path to the directory where results will be written
     :param compinchi: The absolute path to a file with InChI strings for each ligand in the PDB
-    :return: query
     """
     if not Hit.pdb_dir:
         logger.debug('Hit.set_pdb_dir')
@@ -51,9 +52,23 @@ def blast_the_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi):
     if not Hit.pdb_dict:
         logger.debug('Hit.set_pdb_dict')
         Hit.set_pdb_dict(fasta)
-    if not Ligand.inchi_component:
+    if Ligand.component_store is None and not Ligand.inchi_component:
         logger.debug('Ligand.set_inchi_component')
         Ligand.set_inchi_component(compinchi)
+
+
+def blast_the_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi):
+    """
+    Runs a blast search using the target sequence as a query
+    :param query: an instance of blast.query.Query
+    :param pdb_db: The absolute path to a BLASTP database
+    :param pdb_path: The absolute path to a decompressed copy of the PDB
+    :param fasta: A file with fasta sequences of each chain in the PDB
+    :param out_dir: The path to the directory where results will be written
+    :param compinchi: The absolute path to a file with InChI strings for each ligand in the PDB
+    :return: query
+    """
+    load_shared_data(pdb_path, fasta, compinchi)
     logger.debug('query.run_blast')
     records = query.run_blast(pdb_db, out_dir)
     if records:
@@ -76,8 +91,7 @@ def calculate_mcss(query):
         for hit in [hit for hit in query.hits if hit.dock_count > 0]:
             for hit_ligand in hit.dock:
                 for query_ligand in query.dock:
-                    mcss_mol = hit_ligand.mcss(query_ligand)
-                    tanimoto_score = hit_ligand.calc_tanimoto(query_ligand)
+                    mcss_mol, tanimoto_score = hit_ligand.mcss_and_tanimoto(query_ligand)
                     if mcss_mol and tanimoto_score:
                         hit_ligand.set_mcss(query_ligand, mcss_mol, tanimoto_score)
             hit.set_maxmin_mcss()
@@ -126,37 +140,140 @@ def candidate_filter(queries):
     c_filter.filter_for_highest_tanimoto()
 
 
+def search_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi):
+    """
+    Runs the BLAST, MCSS and hit filtering steps on a query that passed query filtering
+    :param query: an instance of blast.query.Query
+    :param pdb_db: The absolute path to a BLASTP database
+    :param pdb_path: The absolute path to a decompressed copy of the PDB
+    :param fasta: A file with fasta sequences of each chain in the PDB
+    :param out_dir: The path to the directory where results will be written
+    :param compinchi: The absolute path to a file with InChI strings for each ligand in the PDB
+    :return: query
+    """
+    logger.debug('Blasting query:  ' + query.pdb_id)
+    print "Blasting query:  %s "%query.pdb_id
+    logging.info("Blasting query:  %s "%query.pdb_id)
+    query = blast_the_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi)
+    logger.debug('calculate mcss')
+    calculate_mcss(query)
+    logger.debug('hit_filter')
+    hit_filter(query)
+    logger.debug('hit_filter')
+    candidate_filter(query)
+    logger.debug('set_query')
+    return query
+
+
+def _search_query_in_worker(args):
+    """
+    Worker pool entry point for search_query. The structures of the hits are dropped before the query is
+    sent back to the parent process since the writers only need the values already extracted from them. The
+    MCSS cache entries added by this worker are sent back along with the query.
+    :param args: (tuple) the arguments to search_query
+    :return: tuple (query, value of MCSSCache.pop_changes or None)
+    """
+    query = search_query(*args)
+    for hit in query.hits:
+        hit.pdb = None
+    mcss_changes = None
+    if Ligand.mcss_cache is not None:
+        mcss_changes = Ligand.mcss_cache.pop_changes()
+    return query, mcss_changes
+
+
+def run_worker_pool(queries, numworkers, pdb_db, pdb_path, fasta, out_dir, compinchi):
+    """
+    Generator that yields the queries in the order the serial loop in run() processes them, i.e. from the end of
+    the list. Only the queries that survived query filtering are sent to a pool of numworkers processes for
+    searching. The input list is emptied.
+    :param queries: a list of filtered Query objects
+    :param numworkers: (int) number of worker processes
+    :return: generator of Query objects
+    """
+    ordered = list(reversed(queries))
+    del queries[:]
+    jobs = [(query, pdb_db, pdb_path, fasta, out_dir, compinchi) for query in ordered if not query.triage]
+    if not jobs:
+        for query in ordered:
+            yield query
+        return
+    load_shared_data(pdb_path, fasta, compinchi)
+    logger.debug('Searching ' + str(len(jobs)) + ' queries with ' + str(numworkers) + ' workers')
+    pool = multiprocessing.Pool(processes=numworkers)
+    try:
+        results = pool.imap(_search_query_in_worker, jobs)
+        for query in ordered:
+            if not query.triage:
+                query, mcss_changes = next(results)
+                if mcss_changes is not None:
+                    Ligand.mcss_cache.merge_changes(mcss_changes)
+            yield query
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
 #from memory_profiler import profile
 #@profile(precision=4)
 def run(options):
     """
-    Run the BlastNFilter components
+    Run the BlastNFilter components. If options.numworkers is greater than 1, the queries are processed by a pool of
+    that many worker processes. Results are collected in the same order the serial loop processes them, so the
+    per-query txt files, blastnfilter.log and summary.txt are identical in either mode. If options.batchblast is
+    set, the sequences of all queries that pass query filtering are searched with a single blastp invocation
+    before the queries are processed, and if options.blastcachedir is set blastp results are reused across runs.
+    Likewise, if options.structurecachedir is set, parsed PDB structures are reused across runs, and if
+    options.mcsscache is set, MCSS and tanimoto results are stored in and reused from that file. If
+    options.componentstore is set, ligands are loaded from that d3r.blast.component_store.ComponentStore instead of
+    from the Components-inchi.ich file.
     :param options:
     """
     non_polymer, polymer, ph, out_dir, blast_dir, pdb_db, pdb_path, fasta, compinchi = split_input(options)
+    numworkers = getattr(options, 'numworkers', 1) or 1
     logger.debug('Creating queries')
     queries = in_put.create_queries(polymer, non_polymer, ph)
     out_put.input_analysis(out_dir, queries)
     out_analysis = out_put.OutController()
     out_analysis.print_filter_criteria(out_dir)
     logger.debug("# queries " + str(len(queries)))
-    while queries:
-        #here the pop method extract the last item in the list and remove this item from the original list
-        query = queries.pop()
+    for query in queries:
         query_filter(query)
-        if not query.triage:
-            logger.debug('Blasting query:  ' + query.pdb_id)
-            print "Blasting query:  %s "%query.pdb_id
-            logging.info("Blasting query:  %s "%query.pdb_id)
-            query = blast_the_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi)
-            logger.debug('calculate mcss')
-            calculate_mcss(query)
-            logger.debug('hit_filter')
-            hit_filter(query)
-            logger.debug('hit_filter')
-            candidate_filter(query)
-            logger.debug('set_query')
-        out_analysis.set_query(query)
-        out_put.writer(out_dir, query, True)
+    component_store = getattr(options, 'componentstore', None)
+    Ligand.component_store = None
+    if component_store:
+        Ligand.set_component_store(os.path.abspath(component_store))
+    structure_cache_dir = getattr(options, 'structurecachedir', None)
+    if structure_cache_dir:
+        Hit.set_structure_cache(os.path.abspath(structure_cache_dir))
+    mcss_cache = getattr(options, 'mcsscache', None)
+    Ligand.mcss_cache = None
+    if mcss_cache:
+        Ligand.mcss_cache = MCSSCache(os.path.abspath(mcss_cache),
+                                      getattr(options, 'mcsscachesize', MCSSCache.DEFAULT_MAX_ENTRIES))
+    blast_cache_dir = getattr(options, 'blastcachedir', None)
+    if blast_cache_dir:
+        Query.set_blast_cache_dir(os.path.abspath(blast_cache_dir))
+    if getattr(options, 'batchblast', False):
+        searched = Query.blastp_batch([query for query in queries if not query.triage], pdb_db, out_dir,
+                                      num_threads=getattr(options, 'blastthreads', 1))
+        logger.debug('Batch blastp searched ' + str(searched) + ' sequences')
+    if numworkers > 1:
+        for query in run_worker_pool(queries, numworkers, pdb_db, pdb_path, fasta, out_dir, compinchi):
+            out_analysis.set_query(query)
+            out_put.writer(out_dir, query, True)
+    else:
+        while queries:
+            #here the pop method extract the last item in the list and remove this item from the original list
+            query = queries.pop()
+            if not query.triage:
+                query = search_query(query, pdb_db, pdb_path, fasta, out_dir, compinchi)
+            out_analysis.set_query(query)
+            out_put.writer(out_dir, query, True)
     out_analysis.print_to_file(out_dir)
-
+    if Ligand.mcss_cache is not None:
+        out_analysis.print_mcss_cache_summary(out_dir, Ligand.mcss_cache)
+        Ligand.mcss_cache.save()
@@ -5,6 +5,12 @@ import os
 import glob
 import logging
 import time
+import shutil
+import signal
+import threading
+import subprocess
+import multiprocessing
+import hashlib
 
 logger = logging.getLogger()
 logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.INFO )
@@ -20,129 +26,356 @@ print struct
 struct.write(outFile)
 '''
 
-def dock(ligand_pdbqt,  protein_pdbqt, grid_center,):
+#commands used to prepare, dock and convert files, the mgltools commands are run after sourcing its environment
+MGLTOOLS_ENV = '. /usr/local/mgltools/bin/mglenv.sh; '
+PREPARE_RECEPTOR_CMD = MGLTOOLS_ENV + 'pythonsh $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/prepare_receptor4.py'
+PREPARE_LIGAND_CMD = MGLTOOLS_ENV + 'pythonsh $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/prepare_ligand4.py'
+PDBQT_TO_PDB_CMD = MGLTOOLS_ENV + 'python $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/pdbqt_to_pdb.py'
+VINA_CMD = 'vina'
+BABEL_CMD = 'babel'
+
+#default size limit of the preparation cache and name of the cache statistics file written to the output dir
+DEFAULT_PREP_CACHE_SIZE_MB = 1024
+PREP_CACHE_SUMMARY = 'prepcache_summary.txt'
+
+class JobTimeoutError(Exception):
+    pass
+
+class PrepCache(object):
+    #cache of .pdbqt files made by prepare_receptor4/prepare_ligand4 shared between weeks and worker processes
+    #entries are keyed by the SHA-256 of the preparation command, the input file name and its content
+    #and stored as <cache_dir>/<first 2 hex digits>/<key>.pdbqt. A hit refreshes the entry modification
+    #time which evict() uses to remove the least recently used entries once the cache is over max_bytes
+    def __init__(self, cache_dir, max_bytes = DEFAULT_PREP_CACHE_SIZE_MB * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.stats = {'receptor': [0, 0], 'ligand': [0, 0]}
+
+    def get_key(self, prep_cmd, mol2_path):
+        sha = hashlib.sha256()
+        sha.update(prep_cmd + '\0' + os.path.basename(mol2_path) + '\0')
+        with open(mol2_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), ''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pdbqt')
+
+    def prepare(self, kind, prep_cmd, mol2_file, working_dir, timeout = None):
+        #make the .pdbqt for mol2_file in working_dir, copying it from the cache if possible otherwise
+        #running '<prep_cmd> <mol2_file>' and storing the result. kind is 'receptor' or 'ligand'
+        pdbqt_file = os.path.join(working_dir, mol2_file.replace('.mol2', '.pdbqt'))
+        key = self.get_key(prep_cmd, os.path.join(working_dir, mol2_file))
+        entry = self.get_entry_path(key)
+        if os.path.isfile(entry):
+            try:
+                shutil.copyfile(entry, pdbqt_file)
+                os.utime(entry, None)
+                self.stats[kind][0] += 1
+                return
+            except (IOError, OSError):
+                #entry was evicted while copying
+                logging.info("Unable to use cached %s for %s, preparing it"%(entry, mol2_file))
+        self.stats[kind][1] += 1
+        run_cmd('%s %s' %(prep_cmd, mol2_file), working_dir, timeout)
+        if not os.path.isfile(pdbqt_file):
+            return
+        #write under a temporary name and rename so other workers never see a partial entry
+        try:
+            if not os.path.isdir(os.path.dirname(entry)):
+                os.makedirs(os.path.dirname(entry))
+        except OSError:
+            pass
+        tmp_entry = '%s.%d.tmp'%(entry, os.getpid())
+        try:
+            shutil.copyfile(pdbqt_file, tmp_entry)
+            os.rename(tmp_entry, entry)
+        except (IOError, OSError) as e:
+            logging.info("Unable to add %s to preparation cache: %s"%(pdbqt_file, e))
+
+    def evict(self):
+        #remove least recently used entries until the cache is at most max_bytes
+        #return (number of entries removed, bytes removed, bytes left in cache)
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.pdbqt'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+                total += st.st_size
+        removed = 0
+        removed_bytes = 0
+        for mtime, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            removed_bytes += size
+        return removed, removed_bytes, total
+
+def merge_prep_cache_stats(stats_list):
+    #add up the {kind: [hits, misses]} statistics of several PrepCache objects
+    merged = {'receptor': [0, 0], 'ligand': [0, 0]}
+    for stats in stats_list:
+        if stats is None:
+            continue
+        for kind, (hits, misses) in stats.items():
+            merged[kind][0] += hits
+            merged[kind][1] += misses
+    return merged
+
+def get_prep_cache_summary(cache_dir, stats, evicted):
+    #lines describing cache hit rate and eviction, written to PREP_CACHE_SUMMARY
+    def rate(hits, misses):
+        if hits + misses == 0:
+            return 0.0
+        return 100.0 * hits / (hits + misses)
+    hits = stats['receptor'][0] + stats['ligand'][0]
+    misses = stats['receptor'][1] + stats['ligand'][1]
+    lines = ['Preparation cache %s: %d hits, %d misses (%.1f%% hit rate)'%(cache_dir, hits, misses, rate(hits, misses))]
+    for kind in ['receptor', 'ligand']:
+        lines.append('  %s: %d hits, %d misses (%.1f%% hit rate)'%(kind, stats[kind][0], stats[kind][1], rate(*stats[kind])))
+    lines.append('  evicted %d entries (%d bytes), %d bytes in cache'%evicted)
+    return '\n'.join(lines) + '\n'
+
+def run_cmd(cmd, working_dir=None, timeout=None):
+    #run cmd through the shell in working_dir, the output is returned like commands.getoutput
+    #the command runs in its own process group which is killed if it runs longer than timeout seconds
+    p = subprocess.Popen(cmd, shell=True, cwd=working_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+    timed_out = []
+    timer = None
+    if timeout is not None:
+        def kill_group():
+            timed_out.append(True)
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        timer = threading.Timer(timeout, kill_group)
+        timer.start()
+    try:
+        out = p.communicate()[0]
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if timed_out:
+        raise JobTimeoutError("Command timed out after %s seconds: %s"%(timeout, cmd))
+    return out.rstrip("\n")
+
+def dock(ligand_pdbqt,  protein_pdbqt, grid_center, cpu = None, working_dir = None, timeout = None):
     center_list = grid_center.split(',')
-    vina_command = 'vina --receptor %s  --ligand %s --center_x %s --center_y %s --center_z %s --size_x 15 --size_y 15 --size_z 15 --seed 999 >& vina_output' %(protein_pdbqt, ligand_pdbqt, center_list[0], center_list[1], center_list[2])
+    vina_command = '%s --receptor %s  --ligand %s --center_x %s --center_y %s --center_z %s --size_x 15 --size_y 15 --size_z 15 --seed 999' %(VINA_CMD, protein_pdbqt, ligand_pdbqt, center_list[0], center_list[1], center_list[2])
+    if cpu is not None:
+        vina_command += ' --cpu %d'%cpu
+    vina_command += ' > vina_output 2>&1'
     out_dock_file = ligand_pdbqt.replace('.pdbqt','_out.pdbqt')
 
-    commands.getoutput(vina_command)
-    if not(os.path.isfile(out_dock_file)):
+    run_cmd(vina_command, working_dir, timeout)
+    if not(os.path.isfile(os.path.join(working_dir or '', out_dock_file))):
         logging.info("Docking failed for protein %s and ligand %s" %(protein_pdbqt, ligand_pdbqt))
         return False
     return out_dock_file
 
-def main_vina (stage_3_result, stage_4_working, update= True):
-    os.chdir(stage_4_working)
-    current_dir = os.getcwd()
+def split_cpu_budget(numworkers, total_cpus = None):
+    #split total_cpus between the workers, returns the --cpu value for each vina run
+    #or None to let vina use all cpus when jobs run one at a time
+    if numworkers <= 1:
+        return None
+    if total_cpus is None:
+        total_cpus = multiprocessing.cpu_count()
+    return max(1, total_cpus // numworkers)
+
+def get_dock_jobs(stage_3_result, stage_4_working):
+    #copy every target directory into stage_4_working and return the list of independent docking jobs,
+    #one per (target, candidate receptor) as tuples (target directory, candidate protein file, ligand files, grid center)
     dockable_paths = []
     for all_pdb_path in os.walk(stage_3_result):
         if all_pdb_path[0] != stage_3_result:
             dockable_paths.append(all_pdb_path[0])
 
+    jobs = []
     for dockable_path in dockable_paths:
         commands.getoutput("cp -r %s %s" %(dockable_path, stage_4_working))
         target_name = os.path.basename(dockable_path)
-        os.chdir(target_name)
-        current_dir_layer_2 = os.getcwd()
+        target_dir = os.path.join(stage_4_working, target_name)
         ##################
         #Do the docking here
         
         #1, get the center
         try:
-            grid_center = open("center.txt","r").readlines()[0]
+            grid_center = open(os.path.join(target_dir, "center.txt"),"r").readlines()[0].strip()
             logging.info("=============Start working on this case:%s=========="%target_name)
         except:
             logging.info("Fatal error: Unable to find the center file for this case %s"%target_name)
-            os.chdir(current_dir)
             continue
         
         # Get the candidate protein names in this directory
-        candidate_proteins = glob.glob('./*-????_????_prepared.mol2')
+        candidate_proteins = sorted([os.path.basename(i) for i in glob.glob(os.path.join(target_dir, '*-????_????_prepared.mol2'))])
         
         logging.info('Found candidates %r' %(candidate_proteins))
         # Get the ligand names in this directory
-        ligand_mol2s = glob.glob('lig_*_prepared.mol2')
+        ligand_mol2s = sorted([os.path.basename(i) for i in glob.glob(os.path.join(target_dir, 'lig_*_prepared.mol2'))])
         ligand_mol2s = [i for i in ligand_mol2s if not "unprep" in i]
         if len(ligand_mol2s) == 0:
             logging.info('No ligand files found for target %s. Skipping.' %(dockable_path))
-            os.chdir(current_dir)
             continue
         if len(ligand_mol2s) > 1:
             logging.info('Multiple ligand files found for target %s (found ligands %r). The workflow currently should only be sending one ligand. Skipping. ' %(dockable_path, ligand_mol2s))
-            os.chdir(current_dir)
             continue
 
-        
-        
         for candidate_protein in candidate_proteins:
-            candidate_prefix = candidate_protein.replace('_prepared.mol2','')
-            #if os.path.isfile(candidate_protein):
-            logging.info( "Working on this receptor: %s"%candidate_protein )
-            if not os.path.isdir(candidate_prefix):
-                os.mkdir(candidate_prefix)
-            os.chdir(candidate_prefix)
-            ##################
-            #do docking inside
-            commands.getoutput("cp ../%s ."%candidate_protein)
-            
-            ## Technical prep: Prepare the protein
-            #receptorMol2File = '.'.join(possible_protein.split('.')[:-1]) + '.mol2'
-            commands.getoutput('. /usr/local/mgltools/bin/mglenv.sh; pythonsh $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/prepare_receptor4.py -r %s' %(candidate_protein))
-            receptorPdbqtFile = candidate_protein.replace('.mol2','.pdbqt')
-
-
-            for ligand_mol2 in ligand_mol2s:
-                ## Technical prep: Prepare the ligand
-                ligand_name = ligand_mol2.replace('lig_','').replace('_prepped.mol2','')
-                ligandPdbqtFile = ligand_mol2.replace('.mol2','.pdbqt')
-                commands.getoutput("cp ../%s ." %(ligand_mol2))
-                commands.getoutput('. /usr/local/mgltools/bin/mglenv.sh; pythonsh $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/prepare_ligand4.py -l %s' %(ligand_mol2))
+            jobs.append((target_dir, candidate_protein, ligand_mol2s, grid_center))
+    return jobs
+
+def dock_candidate(target_dir, candidate_protein, ligand_mol2s, grid_center, cpu = None, timeout = None, prep_cache = None):
+    #prepare, dock and convert one candidate receptor of a target inside target_dir/<candidate prefix>
+    #every path is absolute or relative to that directory so jobs can run side by side in worker processes
+    #timeout applies to each external command, prepared .pdbqt files are reused from prep_cache if set
+    candidate_prefix = candidate_protein.replace('_prepared.mol2','')
+    logging.info( "Working on this receptor: %s"%candidate_protein )
+    candidate_dir = os.path.join(target_dir, candidate_prefix)
+    if not os.path.isdir(candidate_dir):
+        os.mkdir(candidate_dir)
+    ##################
+    #do docking inside
+    shutil.copy(os.path.join(target_dir, candidate_protein), candidate_dir)
     
-                ## Do the docking
-                logging.info("Trying to dock...")
-                out_dock_file = dock(ligandPdbqtFile, receptorPdbqtFile, grid_center)
-                if out_dock_file == False:
-                    logging.info("Docking failed - Skipping")
-                    continue
-                logging.info("Finished docking, beginning post-docking file conversion")
-                
-                ## Convert the receptor to pdb
-                intermediates_prefix = '%s_postdocking' %(candidate_prefix)
-                output_prefix = '%s_docked' %(candidate_prefix)
-                #receptorPdbqt = out_dock_file.replace('ligand_out',candidate_name)
-                #receptorPdbqt = candidate_prefix+'.pdbqt'
-                ## This receptor pdb will be one of our final outputs
-                outputReceptorPdb = "%s.pdb" %(output_prefix)
-                commands.getoutput('. /usr/local/mgltools/bin/mglenv.sh; python $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/pdbqt_to_pdb.py -f %s -o %s' %(receptorPdbqtFile, outputReceptorPdb))
-                
-                ## Then make the ligand mol
-                ## pdbqt_to_pdb.py can't split up the multiple poses in vina's output files, so we do that by hand
-                with open(out_dock_file) as fo:
-                    fileData = fo.read()
-                fileDataSp = fileData.split('ENDMDL')
-                
-                ## Write out each pose to its own pdb and mol file, then merge with the receptor to make the complex files.
-                for index, poseText in enumerate(fileDataSp[:-1]):
-                    this_pose_pdbqt = intermediates_prefix+'_ligand'+str(index+1)+'.pdbqt'
-                    this_pose_pdb = intermediates_prefix+'_ligand'+str(index+1)+'.pdb'
-                    this_pose_mol = intermediates_prefix+'_ligand'+str(index+1)+'.mol'
-                    with open(this_pose_pdbqt,'wb') as wf:
-                        wf.write(poseText+'ENDMDL')
-                    commands.getoutput('. /usr/local/mgltools/bin/mglenv.sh; python $MGL_ROOT/MGLToolsPckgs/AutoDockTools/Utilities24/pdbqt_to_pdb.py -f %s -o %s' %(this_pose_pdbqt, this_pose_pdb))
-                    commands.getoutput('babel -ipdb %s -omol %s' %(this_pose_pdb, this_pose_mol))
-                
-                ## Here convert our top-ranked pose to the final submission for this docking
-                ## Right now we're ignoring everything other than the top pose
-                top_intermediate_mol = intermediates_prefix+'_ligand1.mol'
-                final_ligand_mol = output_prefix+'.mol'
-                commands.getoutput('cp %s %s' %( top_intermediate_mol, final_ligand_mol))
-                commands.getoutput('cp %s ../' %(final_ligand_mol))
-                commands.getoutput('cp %s ../' %(outputReceptorPdb))
-                    
-                ##################
-            os.chdir(current_dir_layer_2)
-        os.chdir(current_dir)
+    ## Technical prep: Prepare the protein
+    if prep_cache is None:
+        run_cmd('%s -r %s' %(PREPARE_RECEPTOR_CMD, candidate_protein), candidate_dir, timeout)
+    else:
+        prep_cache.prepare('receptor', '%s -r' %(PREPARE_RECEPTOR_CMD), candidate_protein, candidate_dir, timeout)
+    receptorPdbqtFile = candidate_protein.replace('.mol2','.pdbqt')
+
+    docked = False
+    for ligand_mol2 in ligand_mol2s:
+        ## Technical prep: Prepare the ligand
+        ligandPdbqtFile = ligand_mol2.replace('.mol2','.pdbqt')
+        shutil.copy(os.path.join(target_dir, ligand_mol2), candidate_dir)
+        if prep_cache is None:
+            run_cmd('%s -l %s' %(PREPARE_LIGAND_CMD, ligand_mol2), candidate_dir, timeout)
+        else:
+            prep_cache.prepare('ligand', '%s -l' %(PREPARE_LIGAND_CMD), ligand_mol2, candidate_dir, timeout)
+
+        ## Do the docking
+        logging.info("Trying to dock...")
+        out_dock_file = dock(ligandPdbqtFile, receptorPdbqtFile, grid_center, cpu = cpu, working_dir = candidate_dir, timeout = timeout)
+        if out_dock_file == False:
+            logging.info("Docking failed - Skipping")
+            continue
+        logging.info("Finished docking, beginning post-docking file conversion")
+        
+        ## Convert the receptor to pdb
+        intermediates_prefix = '%s_postdocking' %(candidate_prefix)
+        output_prefix = '%s_docked' %(candidate_prefix)
+        ## This receptor pdb will be one of our final outputs
+        outputReceptorPdb = "%s.pdb" %(output_prefix)
+        run_cmd('%s -f %s -o %s' %(PDBQT_TO_PDB_CMD, receptorPdbqtFile, outputReceptorPdb), candidate_dir, timeout)
+        
+        ## Then make the ligand mol
+        ## pdbqt_to_pdb.py can't split up the multiple poses in vina's output files, so we do that by hand
+        with open(os.path.join(candidate_dir, out_dock_file)) as fo:
+            fileData = fo.read()
+        fileDataSp = fileData.split('ENDMDL')
+        
+        ## Write out each pose to its own pdb and mol file, then merge with the receptor to make the complex files.
+        for index, poseText in enumerate(fileDataSp[:-1]):
+            this_pose_pdbqt = intermediates_prefix+'_ligand'+str(index+1)+'.pdbqt'
+            this_pose_pdb = intermediates_prefix+'_ligand'+str(index+1)+'.pdb'
+            this_pose_mol = intermediates_prefix+'_ligand'+str(index+1)+'.mol'
+            with open(os.path.join(candidate_dir, this_pose_pdbqt),'wb') as wf:
+                wf.write(poseText+'ENDMDL')
+            run_cmd('%s -f %s -o %s' %(PDBQT_TO_PDB_CMD, this_pose_pdbqt, this_pose_pdb), candidate_dir, timeout)
+            run_cmd('%s -ipdb %s -omol %s' %(BABEL_CMD, this_pose_pdb, this_pose_mol), candidate_dir, timeout)
+        
+        ## Here convert our top-ranked pose to the final submission for this docking
+        ## Right now we're ignoring everything other than the top pose
+        top_intermediate_mol = intermediates_prefix+'_ligand1.mol'
+        final_ligand_mol = output_prefix+'.mol'
+        run_cmd('cp %s %s' %( top_intermediate_mol, final_ligand_mol), candidate_dir)
+        run_cmd('cp %s ../' %(final_ligand_mol), candidate_dir)
+        run_cmd('cp %s ../' %(outputReceptorPdb), candidate_dir)
+        docked = True
         ##################
+    return docked
+
+def _dock_candidate_in_worker(args):
+    #worker pool entry point for dock_candidate, failures are caught so they only affect their own job
+    #return (target directory, candidate protein, docked, seconds spent, error message or None,
+    #preparation cache statistics or None)
+    target_dir, candidate_protein, ligand_mol2s, grid_center, cpu, timeout, prep_cache_dir = args
+    start_time = time.time()
+    prep_cache = None
+    if prep_cache_dir is not None:
+        prep_cache = PrepCache(prep_cache_dir)
+    try:
+        docked = dock_candidate(target_dir, candidate_protein, ligand_mol2s, grid_center, cpu = cpu, timeout = timeout, prep_cache = prep_cache)
+        error = None
+    except Exception as e:
+        docked = False
+        error = str(e)
+    stats = None
+    if prep_cache is not None:
+        stats = prep_cache.stats
+    return target_dir, candidate_protein, docked, time.time() - start_time, error, stats
+
+def main_vina (stage_3_result, stage_4_working, update= True, numworkers = 1, total_cpus = None, job_timeout = None, prep_cache_dir = None, prep_cache_size_mb = DEFAULT_PREP_CACHE_SIZE_MB):
+    #every (target, candidate receptor) pair is an independent job, if numworkers is larger than 1 the jobs
+    #are run by a pool of numworkers processes and total_cpus (default all cpus) is split evenly between them
+    #through vina's --cpu flag. Each job only writes under its own candidate directory, and the results are
+    #logged in job order, so the output matches a serial run. job_timeout limits each external command of a job
+    #if prep_cache_dir is set prepared receptors and ligands are reused from that PrepCache directory which is
+    #trimmed to prep_cache_size_mb afterwards, hit rates are written to PREP_CACHE_SUMMARY in stage_4_working
+    stage_4_working = os.path.abspath(stage_4_working)
+    stage_3_result = os.path.abspath(stage_3_result)
+    os.chdir(stage_4_working)
+    start_time = time.time()
+    jobs = get_dock_jobs(stage_3_result, stage_4_working)
+    cpu = split_cpu_budget(numworkers, total_cpus)
+    if prep_cache_dir is not None:
+        prep_cache_dir = os.path.abspath(prep_cache_dir)
+    job_args = [job + (cpu, job_timeout, prep_cache_dir) for job in jobs]
+    if numworkers > 1 and len(jobs) > 1:
+        logging.info("Docking %d jobs with %d workers each running vina with --cpu %d"%(len(jobs), numworkers, cpu))
+        pool = multiprocessing.Pool(processes = numworkers)
+        try:
+            results = list(pool.imap(_dock_candidate_in_worker, job_args))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        numworkers = 1
+        results = [_dock_candidate_in_worker(args) for args in job_args]
+    failed = 0
+    job_time = 0
+    for target_dir, candidate_protein, docked, elapsed, error, stats in results:
+        job_time += elapsed
+        if error is not None:
+            failed += 1
+            logging.info("Job for target %s receptor %s failed after %.1f seconds: %s"%(os.path.basename(target_dir), candidate_protein, elapsed, error))
+        else:
+            logging.info("Job for target %s receptor %s took %.1f seconds, docked: %s"%(os.path.basename(target_dir), candidate_protein, elapsed, docked))
+    wall_time = time.time() - start_time
+    logging.info("Ran %d docking jobs (%d failed) with %d worker(s) in %.1f seconds, %.1f seconds of per job time"%(len(results), failed, numworkers, wall_time, job_time))
+    if prep_cache_dir is not None:
+        prep_cache = PrepCache(prep_cache_dir, max_bytes = prep_cache_size_mb * 1024 * 1024)
+        evicted = prep_cache.evict()
+        summary = get_prep_cache_summary(prep_cache_dir, merge_prep_cache_stats([r[5] for r in results]), evicted)
+        logging.info(summary)
+        with open(os.path.join(stage_4_working, PREP_CACHE_SUMMARY), 'w') as f:
+            f.write(summary)
+    return results
 
 if ("__main__") == (__name__):
     from argparse import ArgumentParser
@@ -150,6 +383,11 @@ if ("__main__") == (__name__):
     parser.add_argument("-s", "--structuredir", metavar="PATH", help = "PATH where we can find the proteinligprep output")
     parser.add_argument("-o", "--outdir", metavar = "PATH", help = "PATH where we will put the docking output")
     parser.add_argument("-u", "--update", action = "store_true",  help = "Update the docking result", default = False) 
+    parser.add_argument("-n", "--numworkers", type = int, default = 1, help = "Number of worker processes docking (target, candidate receptor) jobs in parallel (default 1)")
+    parser.add_argument("-c", "--cpu", type = int, default = None, help = "Total cpus split between the workers through vina's --cpu flag when --numworkers is larger than 1 (default all cpus)")
+    parser.add_argument("-t", "--jobtimeout", type = int, default = None, help = "Time in seconds each external command of a job may run before it is killed and the job fails (default no limit)")
+    parser.add_argument("--prepcache", metavar = "PATH", default = None, help = "PATH of directory, shared between weeks, where prepared receptor and ligand .pdbqt files are cached (default no cache)")
+    parser.add_argument("--prepcachesize", type = int, default = DEFAULT_PREP_CACHE_SIZE_MB, help = "Size in megabytes --prepcache is trimmed to, least recently used files are removed first (default %d)"%DEFAULT_PREP_CACHE_SIZE_MB)
     logger = logging.getLogger()
     logging.basicConfig( format  = '%(asctime)s: %(message)s', datefmt = '%m/%d/%y %I:%M:%S', filename = 'final.log', filemode = 'w', level   = logging.INFO )
     opt = parser.parse_args()
@@ -158,7 +396,7 @@ if ("__main__") == (__name__):
     update = opt.update
     #running under this dir
     running_dir = os.getcwd()
-    main_vina(proteinligprep_dir, dock_result_dir, update = update)
+    main_vina(proteinligprep_dir, dock_result_dir, update = update, numworkers = opt.numworkers, total_cpus = opt.cpu, job_timeout = opt.jobtimeout, prep_cache_dir = opt.prepcache, prep_cache_size_mb = opt.prepcachesize)
     #move the final log file to the result dir
     log_file_path = os.path.join(running_dir, 'final.log')
     commands.getoutput("mv %s %s"%(log_file_path, dock_result_dir))
@@ -0,0 +1,131 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import os
+import shutil
+from mock import patch
+
+"""
+test_component_store
+--------------------------------
+
+Tests for `component_store` module.
+"""
+
+from d3r.blast.component_store import ComponentStore
+from d3r.blast.ligand import Ligand
+
+
+def _fake_entry(inchi):
+    return {'inchi': inchi, 'rd_mol': 'mol:' + inchi, 'size': 3,
+            'heavy': 2, 'fingerprint': 'fp:' + inchi}
+
+
+class TestComponentStore(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def _write_compinchi(self, temp_dir, count):
+        compinchi = os.path.join(temp_dir, 'Components-inchi.ich')
+        f = open(compinchi, 'w')
+        for i in range(count):
+            f.write('InChI=1S/C' + str(i) + '\tR' + str(i) + '\n')
+        f.write('\n')
+        f.write('InChI=1S/missingresname\n')
+        f.close()
+        return compinchi
+
+    def test_build_and_get(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            compinchi = self._write_compinchi(temp_dir, 10)
+            store_path = os.path.join(temp_dir, 'Components-inchi.store')
+            self.assertEqual(ComponentStore.build(compinchi, store_path), 10)
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             ['Components-inchi.ich',
+                              'Components-inchi.store'])
+            store = ComponentStore(store_path)
+            self.assertEqual(len(store), 10)
+            self.assertTrue('R3' in store)
+            self.assertFalse('XYZ' in store)
+            self.assertEqual(store.get('XYZ'), None)
+            self.assertEqual(store._entries, {})
+            entry = store.get('R3')
+            self.assertEqual(entry['inchi'], 'InChI=1S/C3')
+            self.assertEqual(store.get('R9')['inchi'], 'InChI=1S/C9')
+            self.assertEqual(sorted(store._entries.keys()), ['R3', 'R9'])
+            self.assertTrue(store.get('R3') is entry)
+            store.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_build_stores_created_entries(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            compinchi = self._write_compinchi(temp_dir, 2)
+            store_path = os.path.join(temp_dir, 'store')
+            with patch.object(ComponentStore, 'create_entry',
+                              staticmethod(_fake_entry)):
+                ComponentStore.build(compinchi, store_path)
+            store = ComponentStore(store_path)
+            self.assertEqual(store.get('R1'), _fake_entry('InChI=1S/C1'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_open_invalid_store(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            store_path = os.path.join(temp_dir, 'store')
+            f = open(store_path, 'w')
+            f.write('InChI=1S/C1\tR1\n')
+            f.close()
+            try:
+                ComponentStore(store_path)
+                self.fail('Expected IOError')
+            except IOError as e:
+                self.assertEqual(str(e), store_path +
+                                 ' is not a component store')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ligand_set_component_store_too_few_entries(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            compinchi = self._write_compinchi(temp_dir, 10)
+            store_path = os.path.join(temp_dir, 'store')
+            ComponentStore.build(compinchi, store_path)
+            try:
+                Ligand.set_component_store(store_path)
+                self.fail('Expected IOError')
+            except IOError:
+                pass
+            self.assertEqual(Ligand.component_store, None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_ligand_set_rd_mol_from_resname_uses_store(self):
+        temp_dir = tempfile.mkdtemp()
+        orig_store = Ligand.component_store
+        try:
+            compinchi = self._write_compinchi(temp_dir, 2)
+            store_path = os.path.join(temp_dir, 'store')
+            with patch.object(ComponentStore, 'create_entry',
+                              staticmethod(_fake_entry)):
+                ComponentStore.build(compinchi, store_path)
+            Ligand.component_store = ComponentStore(store_path)
+            ligand = Ligand('R1', None)
+            self.assertTrue(ligand.set_rd_mol_from_resname('R1'))
+            self.assertEqual(ligand.rd_mol, 'mol:InChI=1S/C1')
+            self.assertEqual(ligand.inchi, 'InChI=1S/C1')
+            self.assertEqual(ligand.get_fingerprint(), 'fp:InChI=1S/C1')
+            self.assertFalse(ligand.set_rd_mol_from_resname('XYZ'))
+        finally:
+            Ligand.component_store = orig_store
+            shutil.rmtree(temp_dir)
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
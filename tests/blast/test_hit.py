@@ -0,0 +1,93 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import os
+import shutil
+
+"""
+test_hit
+--------------------------------
+
+Tests for `hit` module.
+"""
+
+from d3r.blast.hit import Hit
+from d3r.blast.hit import RegDict
+
+
+class TestHit(unittest.TestCase):
+    def setUp(self):
+        Hit.pdb_dict = RegDict()
+        Hit.pdb_index = {}
+
+    def _write_seqres(self, temp_dir):
+        seqres = os.path.join(temp_dir, 'pdb_seqres.txt')
+        f = open(seqres, 'w')
+        f.write('>101m_A mol:protein length:10  MYOGLOBIN\n'
+                'MVLSEGEWQL\n'
+                '>102d_A mol:na length:12  DNA\n'
+                'CGCAAATTTGCG\n'
+                '>102d_B mol:na length:12  DNA\n'
+                'CGCAAATTTGCG\n'
+                '>1abc_A mol:protein length:6  FOO\n'
+                'GSHMTT\n'
+                '>1abc_B mol:protein length:6  FOO\n'
+                'GSHMTT\n'
+                '>1abc_C mol:protein length:5  BAR\n'
+                'WWWYY\n'
+                '>1abd_A mol:protein length:5  BAR\n'
+                'WWWYY\n'
+                '>1xyz_A mol:unk length:5  BAR\n'
+                'XXXXX\n')
+        f.close()
+        return seqres
+
+    def test_set_pdb_dict_builds_index(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            Hit.set_pdb_dict(self._write_seqres(temp_dir))
+            self.assertEqual(len(Hit.pdb_dict), 7)
+            self.assertEqual(sorted(Hit.pdb_index.keys()),
+                             ['101m', '102d', '1abc', '1abd'])
+            for pdb_id in ['101m', '102d', '1abc', '1abd', '1xyz', '1ab']:
+                self.assertEqual(Hit.get_chain_records(pdb_id),
+                                 list(Hit.pdb_dict.get_matching(pdb_id + '_')))
+            self.assertEqual([id for id, rec in
+                              Hit.get_chain_records('1abc')],
+                             [id for id, rec in
+                              Hit.pdb_dict.get_matching('1abc')])
+            self.assertEqual(Hit.get_chain_records('1xyz'), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_chain_records_builds_missing_index(self):
+        Hit.pdb_dict['1abc_A'] = 'a'
+        Hit.pdb_dict['1abc_B'] = 'b'
+        self.assertEqual(sorted(Hit.get_chain_records('1abc')),
+                         [('1abc_A', 'a'), ('1abc_B', 'b')])
+        self.assertEqual(Hit.get_chain_records('2abc'), [])
+
+    def test_fill_sequence(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            Hit.set_pdb_dict(self._write_seqres(temp_dir))
+            hit = Hit()
+            hit.pdb_id = '1abc'
+            hit.fill_sequence()
+            self.assertEqual(hit.chain_count, 3)
+            self.assertEqual(hit.sequence_count, 2)
+            self.assertEqual(sorted([hs.hit_chain_id for hs in
+                                     hit.sequences]), ['A', 'B', 'C'])
+            for hs in hit.sequences:
+                self.assertEqual(hs.blast_hit, False)
+                self.assertEqual(hs.hit_pdb_id, '1abc')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def tearDown(self):
+        Hit.pdb_dict = RegDict()
+        Hit.pdb_index = {}
+
+if __name__ == '__main__':
+    unittest.main()
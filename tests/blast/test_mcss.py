@@ -0,0 +1,146 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import os
+import shutil
+
+"""
+test_mcss
+--------------------------------
+
+Tests for `mcss` module.
+"""
+
+from d3r.blast.mcss import MCSSCache
+from d3r.blast.ligand import Ligand
+
+
+class TestMCSS(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_get_put_and_counters(self):
+        cache = MCSSCache()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('InChI=1S/foo', 'ABC'), None)
+        cache.put('InChI=1S/foo', 'ABC', (5, '[#6]', 0.5, None))
+        self.assertEqual(cache.get('InChI=1S/foo', 'ABC'),
+                         (5, '[#6]', 0.5, None))
+        self.assertEqual(cache.get('InChI=1S/foo', 'XYZ'), None)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_get_timed_out_entries(self):
+        cache = MCSSCache()
+        cache.put('inchi', 'ABC', (5, '[#6]', 0.5, 60))
+        cache.put('inchi', 'XYZ', (None, None, 0.5, None))
+        # no MCS found is a result like any other
+        self.assertEqual(cache.get('inchi', 'XYZ', 120),
+                         (None, None, 0.5, None))
+        self.assertEqual(cache.get('inchi', 'ABC'), (5, '[#6]', 0.5, 60))
+        self.assertEqual(cache.get('inchi', 'ABC', 30), (5, '[#6]', 0.5, 60))
+        self.assertEqual(cache.get('inchi', 'ABC', 60), (5, '[#6]', 0.5, 60))
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 0)
+
+        # a larger timeout than the one that was hit is a miss
+        self.assertEqual(cache.get('inchi', 'ABC', 120), None)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(cache), 2)
+
+    def test_eviction_drops_least_recently_used(self):
+        cache = MCSSCache(max_entries=10)
+        for i in range(10):
+            cache.put('inchi', str(i), (i, '[#6]', 0.5, None))
+        # touch 0 so 1 becomes the least recently used
+        cache.get('inchi', '0')
+        cache.put('inchi', '10', (10, '[#6]', 0.5, None))
+        self.assertEqual(len(cache), 9)
+        self.assertNotEqual(cache.get('inchi', '0'), None)
+        self.assertEqual(cache.get('inchi', '1'), None)
+        self.assertEqual(cache.get('inchi', '2'), None)
+        self.assertNotEqual(cache.get('inchi', '10'), None)
+
+    def test_save_and_load(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'mcss.cache')
+            cache = MCSSCache(path)
+            self.assertEqual(len(cache), 0)
+            cache.put('inchi', 'ABC', (5, '[#6]', 0.5, None))
+            cache.save()
+            self.assertEqual(os.listdir(temp_dir), ['mcss.cache'])
+            cache = MCSSCache(path)
+            self.assertEqual(cache.get('inchi', 'ABC'),
+                             (5, '[#6]', 0.5, None))
+
+            f = open(path, 'w')
+            f.write('not a pickle')
+            f.close()
+            cache = MCSSCache(path)
+            self.assertEqual(len(cache), 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_pop_and_merge_changes(self):
+        worker = MCSSCache()
+        worker.put('inchi', 'ABC', (5, '[#6]', 0.5, None))
+        worker.get('inchi', 'ABC')
+        worker.get('inchi', 'XYZ')
+        changes = worker.pop_changes()
+        self.assertEqual(changes, ({('inchi', 'ABC'): (5, '[#6]', 0.5,
+                                                       None)}, 1, 1))
+        self.assertEqual(worker.pop_changes(), ({}, 0, 0))
+
+        parent = MCSSCache()
+        parent.merge_changes(changes)
+        self.assertEqual(parent.hits, 1)
+        self.assertEqual(parent.misses, 1)
+        self.assertEqual(parent.get('inchi', 'ABC'), (5, '[#6]', 0.5, None))
+
+    def test_ligand_mcss_and_tanimoto_uses_cache(self):
+        orig_cache = Ligand.mcss_cache
+        orig_timeout = Ligand.FINDMCS_TIMEOUT
+        try:
+            Ligand.mcss_cache = MCSSCache()
+            Ligand.mcss_cache.put('InChI=1S/foo', 'ABC',
+                                  (1, '[#6]', 0.25, None))
+            Ligand.mcss_cache.put('InChI=1S/foo', 'XYZ',
+                                  (None, None, 0.75, None))
+            Ligand.mcss_cache.put('InChI=1S/foo', 'TMO',
+                                  (1, '[#6]', 0.5, Ligand.FINDMCS_TIMEOUT))
+            Ligand.mcss_cache.pop_changes()
+            query_ligand = Ligand('FOO', 'InChI=1S/foo')
+            hit_ligand = Ligand('ABC', 'InChI=1S/bar')
+            self.assertEqual(hit_ligand.mcss_and_tanimoto(query_ligand)[1],
+                             0.25)
+            hit_ligand = Ligand('XYZ', 'InChI=1S/baz')
+            self.assertEqual(hit_ligand.mcss_and_tanimoto(query_ligand),
+                             (None, 0.75))
+            hit_ligand = Ligand('TMO', 'InChI=1S/qux')
+            self.assertEqual(hit_ligand.mcss_and_tanimoto(query_ligand)[1],
+                             0.5)
+            self.assertEqual(Ligand.mcss_cache.hits, 3)
+
+            # timed out entry is recomputed once the timeout is raised,
+            # which fails here since the ligands have no rd mol, and the
+            # result replaces the entry
+            Ligand.FINDMCS_TIMEOUT = orig_timeout * 2
+            self.assertEqual(hit_ligand.mcss_and_tanimoto(query_ligand),
+                             (None, None))
+            self.assertEqual(Ligand.mcss_cache.hits, 3)
+            self.assertEqual(Ligand.mcss_cache.misses, 1)
+            self.assertEqual(Ligand.mcss_cache.pop_changes(),
+                             ({('InChI=1S/foo', 'TMO'):
+                               (None, None, None, None)}, 3, 1))
+        finally:
+            Ligand.mcss_cache = orig_cache
+            Ligand.FINDMCS_TIMEOUT = orig_timeout
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import os
+import stat
+import shutil
+
+"""
+test_query
+--------------------------------
+
+Tests for `query` module.
+"""
+
+from d3r.blast.query import Query
+
+BLAST_XML_HEADER = """<?xml version="1.0"?>
+<!DOCTYPE BlastOutput PUBLIC "-//NCBI//NCBI BlastOutput/EN" "http://www.ncbi.nlm.nih.gov/dtd/NCBI_BlastOutput.dtd">
+<BlastOutput>
+  <BlastOutput_program>blastp</BlastOutput_program>
+  <BlastOutput_version>BLASTP 2.2.31+</BlastOutput_version>
+  <BlastOutput_reference>ref</BlastOutput_reference>
+  <BlastOutput_db>pdb_db</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>x</BlastOutput_query-def>
+  <BlastOutput_query-len>10</BlastOutput_query-len>
+  <BlastOutput_param>
+    <Parameters>
+      <Parameters_matrix>BLOSUM62</Parameters_matrix>
+      <Parameters_expect>0.001</Parameters_expect>
+      <Parameters_gap-open>11</Parameters_gap-open>
+      <Parameters_gap-extend>1</Parameters_gap-extend>
+      <Parameters_filter>F</Parameters_filter>
+    </Parameters>
+  </BlastOutput_param>
+  <BlastOutput_iterations>
+"""
+
+BLAST_XML_ITERATION = """    <Iteration>
+      <Iteration_iter-num>{num}</Iteration_iter-num>
+      <Iteration_query-ID>Query_{num}</Iteration_query-ID>
+      <Iteration_query-def>{query}</Iteration_query-def>
+      <Iteration_query-len>10</Iteration_query-len>
+      <Iteration_hits>
+      </Iteration_hits>
+      <Iteration_stat>
+        <Statistics>
+          <Statistics_db-num>1</Statistics_db-num>
+          <Statistics_db-len>10</Statistics_db-len>
+          <Statistics_hsp-len>0</Statistics_hsp-len>
+          <Statistics_eff-space>0</Statistics_eff-space>
+          <Statistics_kappa>0.041</Statistics_kappa>
+          <Statistics_lambda>0.267</Statistics_lambda>
+          <Statistics_entropy>0.14</Statistics_entropy>
+        </Statistics>
+      </Iteration_stat>
+    </Iteration>
+"""
+
+BLAST_XML_FOOTER = """  </BlastOutput_iterations>
+</BlastOutput>
+"""
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        Query.blast_cache_dir = None
+        Query.blast_records = {}
+
+    def _create_fake_blastp(self, temp_dir):
+        """Writes a blastp script to temp_dir/bin that logs its arguments
+           to temp_dir/blastp.calls and outputs one empty iteration per
+           fasta record in its -query file
+        """
+        bin_dir = os.path.join(temp_dir, 'bin')
+        os.makedirs(bin_dir)
+        fakeblastp = os.path.join(bin_dir, 'blastp')
+        f = open(fakeblastp, 'w')
+        f.write('#!/usr/bin/env python\n\n')
+        f.write('import sys\n')
+        f.write('log = open("' + os.path.join(temp_dir, 'blastp.calls') +
+                '", "a")\n')
+        f.write('log.write(" ".join(sys.argv[1:]) + "\\n")\n')
+        f.write('log.close()\n')
+        f.write('query = sys.argv[sys.argv.index("-query") + 1]\n')
+        f.write('ids = [l[1:].split()[0] for l in open(query) '
+                'if l.startswith(">")]\n')
+        f.write('sys.stdout.write(' + repr(BLAST_XML_HEADER) + ')\n')
+        f.write('for num, query_id in enumerate(ids):\n')
+        f.write('    sys.stdout.write(' + repr(BLAST_XML_ITERATION) +
+                '.format(num=num + 1, query=query_id))\n')
+        f.write('sys.stdout.write(' + repr(BLAST_XML_FOOTER) + ')\n')
+        f.close()
+        os.chmod(fakeblastp, stat.S_IRWXU)
+        return bin_dir
+
+    def _get_blastp_calls(self, temp_dir):
+        calls = os.path.join(temp_dir, 'blastp.calls')
+        if not os.path.isfile(calls):
+            return []
+        f = open(calls, 'r')
+        lines = f.readlines()
+        f.close()
+        return lines
+
+    def _create_query(self, pdb_id, seqs):
+        query = Query()
+        query.pdb_id = pdb_id
+        for chain_id, seq in enumerate(seqs):
+            query.set_sequence(chain_id + 1, seq)
+        return query
+
+    def test_get_database_fingerprint(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pdb_db = os.path.join(temp_dir, 'pdb_db')
+            empty = Query.get_database_fingerprint(pdb_db)
+            self.assertEqual(empty, Query.get_database_fingerprint(pdb_db))
+            f = open(pdb_db + '.psq', 'w')
+            f.write('hello')
+            f.close()
+            first = Query.get_database_fingerprint(pdb_db)
+            self.assertNotEqual(empty, first)
+            f = open(pdb_db + '.psq', 'a')
+            f.write('there')
+            f.close()
+            self.assertNotEqual(first,
+                                Query.get_database_fingerprint(pdb_db))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_blast_cache_key(self):
+        key = Query.get_blast_cache_key('ACDE', 'db')
+        self.assertEqual(key, Query.get_blast_cache_key('acde', 'db'))
+        self.assertEqual(key, Query.get_blast_cache_key('ACDE', 'db',
+                                                        evalue=0.001))
+        self.assertNotEqual(key, Query.get_blast_cache_key('ACDF', 'db'))
+        self.assertNotEqual(key, Query.get_blast_cache_key('ACDE', 'db2'))
+        self.assertNotEqual(key, Query.get_blast_cache_key('ACDE', 'db',
+                                                           evalue=1.0))
+
+    def test_cache_record_in_memory_and_on_disk(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(Query.get_cached_record('foo'), None)
+            Query.cache_record('foo', {'a': [1]})
+            rec = Query.get_cached_record('foo')
+            self.assertEqual(rec, {'a': [1]})
+            # each lookup returns a new copy
+            rec['a'].append(2)
+            self.assertEqual(Query.get_cached_record('foo'), {'a': [1]})
+            self.assertEqual(os.listdir(temp_dir), [])
+
+            cache_dir = os.path.join(temp_dir, 'cache')
+            Query.set_blast_cache_dir(cache_dir)
+            Query.cache_record('bar', [3])
+            self.assertEqual(os.listdir(cache_dir), ['bar.pickle'])
+            Query.blast_records = {}
+            self.assertEqual(Query.get_cached_record('bar'), [3])
+            self.assertEqual(Query.get_cached_record('foo'), None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_blast_uses_and_fills_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        orig_path = os.environ['PATH']
+        try:
+            bin_dir = self._create_fake_blastp(temp_dir)
+            os.environ['PATH'] = bin_dir + os.pathsep + orig_path
+            pdb_db = os.path.join(temp_dir, 'pdb_db')
+            Query.set_blast_cache_dir(os.path.join(temp_dir, 'cache'))
+
+            query = self._create_query('1abc', ['MKVLAAGIV'])
+            records = query.run_blast(pdb_db, temp_dir)
+            self.assertEqual(len(records), 1)
+            self.assertEqual(len(self._get_blastp_calls(temp_dir)), 1)
+
+            # same sequence under another pdb id comes from the cache
+            Query.blast_records = {}
+            query = self._create_query('2xyz', ['MKVLAAGIV'])
+            records = query.run_blast(pdb_db, temp_dir)
+            self.assertEqual(len(records), 1)
+            self.assertEqual(records[0].query, '2xyz_1')
+            self.assertEqual(len(self._get_blastp_calls(temp_dir)), 1)
+        finally:
+            os.environ['PATH'] = orig_path
+            shutil.rmtree(temp_dir)
+
+    def test_blastp_batch(self):
+        temp_dir = tempfile.mkdtemp()
+        orig_path = os.environ['PATH']
+        try:
+            bin_dir = self._create_fake_blastp(temp_dir)
+            os.environ['PATH'] = bin_dir + os.pathsep + orig_path
+            pdb_db = os.path.join(temp_dir, 'pdb_db')
+            queries = [self._create_query('1abc', ['MKVLAAGIV']),
+                       self._create_query('2xyz', ['MKVLAAGIV', 'GSHMTT']),
+                       self._create_query('3def', ['WWWYYY'])]
+            self.assertEqual(Query.blastp_batch(queries, pdb_db, temp_dir,
+                                                num_threads=4), 3)
+            calls = self._get_blastp_calls(temp_dir)
+            self.assertEqual(len(calls), 1)
+            self.assertTrue('-num_threads 4' in calls[0])
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             ['bin', 'blastp.calls'])
+
+            # nothing left to search
+            self.assertEqual(Query.blastp_batch(queries, pdb_db,
+                                                temp_dir), 0)
+
+            records = queries[1].run_blast(pdb_db, temp_dir)
+            self.assertEqual(len(records), 2)
+            self.assertEqual(records[0].query, '2xyz_1')
+            self.assertEqual(records[1].query, '2xyz_2')
+            self.assertEqual(len(self._get_blastp_calls(temp_dir)), 1)
+        finally:
+            os.environ['PATH'] = orig_path
+            shutil.rmtree(temp_dir)
+
+    def tearDown(self):
+        Query.blast_cache_dir = None
+        Query.blast_records = {}
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import os
+import shutil
+
+"""
+test_structure
+--------------------------------
+
+Tests for `structure` module.
+"""
+
+from d3r.blast.structure import CompactStructure
+from d3r.blast.structure import StructureCache
+from d3r.blast.hit import Hit
+
+TEST_PDB = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                        'celpp', 'eval_test_data', 'github_test_data',
+                        'mini_pdb', 't6', 'pdb5t6d.ent')
+
+
+class TestStructure(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_compact_structure_get_heteros(self):
+        cs = CompactStructure()
+        self.assertEqual(cs.header, {})
+        self.assertEqual(cs.get_chain_ids(), [])
+        self.assertEqual(cs.get_heteros('A'), [])
+        cs = CompactStructure({'resolution': 2.0},
+                              [('A', [('H_ZN', 1, ' ', ' ZN', [])]),
+                               ('B', [])])
+        self.assertEqual(cs.get_chain_ids(), ['A', 'B'])
+        self.assertEqual(cs.get_heteros('B'), [])
+        self.assertEqual(cs.get_heteros('A')[0][3], ' ZN')
+        # unknown chain falls back to first chain
+        self.assertEqual(cs.get_heteros('Z'), cs.get_heteros('A'))
+
+    def test_get_structure(self):
+        sc = StructureCache()
+        cs = sc.get_structure('5t6d', TEST_PDB)
+        self.assertEqual(sc.misses, 1)
+        self.assertEqual(sc.hits, 0)
+        self.assertEqual(cs.header['resolution'], 2.1)
+        self.assertEqual(cs.header['structure_method'], 'x-ray diffraction')
+        self.assertEqual(cs.get_chain_ids(), ['A', 'B'])
+        heteros = cs.get_heteros('A')
+        self.assertEqual([h[3] for h in heteros if h[0] != 'W'], ['N38'])
+        n38 = heteros[0]
+        self.assertEqual(n38[0], 'H_N38')
+        self.assertEqual(len(n38[4]), 37)
+        self.assertEqual(len(n38[4][0]), 4)
+        self.assertTrue(sc.get_structure('5t6d', TEST_PDB) is cs)
+        self.assertEqual(sc.hits, 1)
+
+    def test_get_structure_from_cache_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(temp_dir, 'cache')
+            sc = StructureCache(cache_dir)
+            cs = sc.get_structure('5t6d', TEST_PDB)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            # new cache object, same directory: no parsing needed
+            sc = StructureCache(cache_dir)
+            cached = sc.get_structure('5t6d', TEST_PDB)
+            self.assertEqual(sc.hits, 1)
+            self.assertEqual(sc.misses, 0)
+            self.assertEqual(cached.header, cs.header)
+            self.assertEqual(cached.chains, cs.chains)
+
+            # modifying the file changes the key
+            pdb_file = os.path.join(temp_dir, 'pdb5t6d.ent')
+            shutil.copy(TEST_PDB, pdb_file)
+            key = sc.get_key(pdb_file)
+            f = open(pdb_file, 'a')
+            f.write('\n')
+            f.close()
+            self.assertNotEqual(key, sc.get_key(pdb_file))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_lru_eviction(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            files = []
+            for name in ['a', 'b', 'c']:
+                pdb_file = os.path.join(temp_dir, name + '.ent')
+                shutil.copy(TEST_PDB, pdb_file)
+                files.append(pdb_file)
+            sc = StructureCache(max_entries=2)
+            sc.get_structure('a', files[0])
+            sc.get_structure('b', files[1])
+            sc.get_structure('a', files[0])
+            sc.get_structure('c', files[2])
+            self.assertEqual(sc.misses, 3)
+            self.assertEqual(sc.hits, 1)
+            # b was least recently used and got evicted
+            sc.get_structure('a', files[0])
+            self.assertEqual(sc.hits, 2)
+            sc.get_structure('b', files[1])
+            self.assertEqual(sc.misses, 4)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_hit_read_pdb_uses_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        orig_pdb_dir = Hit.pdb_dir
+        orig_cache = Hit.structure_cache
+        try:
+            pdb_dir = os.path.join(temp_dir, 't6')
+            os.makedirs(pdb_dir)
+            shutil.copy(TEST_PDB, pdb_dir)
+            Hit.set_pdb_dir(temp_dir)
+            Hit.set_structure_cache()
+            hit = Hit()
+            hit.pdb_id = '5t6d'
+            self.assertTrue(hit.read_pdb())
+            self.assertTrue(hit.set_resolution())
+            self.assertEqual(hit.resolution, 2.1)
+            hit.set_expt_method()
+            self.assertEqual(hit.exp_method, 'x-ray diffraction')
+            hit2 = Hit()
+            hit2.pdb_id = '5t6d'
+            self.assertTrue(hit2.read_pdb())
+            self.assertEqual(Hit.structure_cache.hits, 1)
+            self.assertEqual(Hit.structure_cache.misses, 1)
+            hit2.set_ligands('B')
+            self.assertEqual([l.resname for l in hit2.dock], ['N38'])
+            self.assertEqual(hit2.dock[0].chain, 'B')
+            hit.pdb_id = '1abc'
+            self.assertFalse(hit.read_pdb())
+        finally:
+            Hit.pdb_dir = orig_pdb_dir
+            Hit.structure_cache = orig_cache
+            shutil.rmtree(temp_dir)
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
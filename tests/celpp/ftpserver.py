@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import socket
+import threading
+import time
+import SocketServer
+
+"""
+ftpserver
+--------------------------------
+
+Minimal in-process ftp server used to test `filetransfer` module
+against a real ftp connection.  Supports the subset of commands
+used by ftplib and ftpretty for upload and download.
+"""
+
+
+class LocalFtpHandler(SocketServer.StreamRequestHandler):
+    """Handles one ftp control connection
+    """
+    def _reply(self, line):
+        self.wfile.write(line + '\r\n')
+        self.wfile.flush()
+
+    def _get_path(self, arg):
+        virtual = os.path.normpath(os.path.join(self._cwd, arg))
+        if not virtual.startswith('/'):
+            virtual = '/' + virtual
+        return virtual, os.path.join(self.server.root_dir,
+                                     virtual.lstrip('/'))
+
+    def _open_data_connection(self):
+        self._reply('150 Opening data connection')
+        con, addr = self._pasv_sock.accept()
+        self._pasv_sock.close()
+        self._pasv_sock = None
+        return con
+
+    def _stor(self, path):
+        rest = self._rest
+        self._rest = 0
+        if rest > 0 and os.path.isfile(path):
+            f = open(path, 'r+b')
+            f.seek(rest)
+            f.truncate()
+        else:
+            f = open(path, 'wb')
+        fail_after = self.server.get_fail_stor_after()
+        self.server.transfer_started()
+        con = self._open_data_connection()
+        received = 0
+        try:
+            time.sleep(self.server.stor_delay)
+            while True:
+                data = con.recv(8192)
+                if not data:
+                    break
+                if fail_after is not None and \
+                        received + len(data) >= fail_after:
+                    f.write(data[:fail_after - received])
+                    received = fail_after
+                    break
+                f.write(data)
+                received += len(data)
+        finally:
+            f.close()
+            con.close()
+            self.server.transfer_finished()
+        self.server.add_stor(path, rest, received)
+        if fail_after is not None:
+            self._reply('426 Connection closed; transfer aborted')
+        else:
+            self._reply('226 Transfer complete')
+
+    def _retr(self, path):
+        if not os.path.isfile(path):
+            self._reply('550 No such file')
+            return
+        con = self._open_data_connection()
+        f = open(path, 'rb')
+        try:
+            con.sendall(f.read())
+        finally:
+            f.close()
+            con.close()
+        self._reply('226 Transfer complete')
+
+    def handle(self):
+        self._cwd = '/'
+        self._rest = 0
+        self._pasv_sock = None
+        self._reply('220 LocalFtpServer ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.rstrip('\r\n')
+            if ' ' in line:
+                cmd, arg = line.split(' ', 1)
+            else:
+                cmd, arg = line, ''
+            cmd = cmd.upper()
+            self.server.add_command(cmd)
+            virtual, path = self._get_path(arg)
+            if cmd == 'USER':
+                self._reply('331 Password required')
+            elif cmd == 'PASS':
+                self._reply('230 Logged in')
+            elif cmd in ('TYPE', 'NOOP'):
+                self._reply('200 OK')
+            elif cmd == 'PWD':
+                self._reply('257 "' + self._cwd + '"')
+            elif cmd == 'CWD':
+                if os.path.isdir(path):
+                    self._cwd = virtual
+                    self._reply('250 OK')
+                else:
+                    self._reply('550 No such directory')
+            elif cmd == 'MKD':
+                try:
+                    os.mkdir(path)
+                    self._reply('257 "' + virtual + '" created')
+                except OSError:
+                    self._reply('550 File exists')
+            elif cmd == 'SIZE':
+                if os.path.isfile(path):
+                    self._reply('213 ' + str(os.path.getsize(path)))
+                else:
+                    self._reply('550 No such file')
+            elif cmd == 'DELE':
+                if os.path.isfile(path):
+                    os.unlink(path)
+                    self._reply('250 OK')
+                else:
+                    self._reply('550 No such file')
+            elif cmd == 'REST':
+                self._rest = int(arg)
+                self._reply('350 Restarting at ' + arg)
+            elif cmd == 'PASV':
+                self._pasv_sock = socket.socket(socket.AF_INET,
+                                                socket.SOCK_STREAM)
+                self._pasv_sock.bind(('127.0.0.1', 0))
+                self._pasv_sock.listen(1)
+                port = self._pasv_sock.getsockname()[1]
+                self._reply('227 Entering Passive Mode (127,0,0,1,%d,%d)' %
+                            (port >> 8, port & 0xFF))
+            elif cmd == 'STOR':
+                self._stor(path)
+            elif cmd == 'RETR':
+                self._retr(path)
+            elif cmd == 'QUIT':
+                self._reply('221 Bye')
+                break
+            else:
+                self._reply('502 Command not implemented')
+
+
+class LocalFtpServer(SocketServer.ThreadingTCPServer):
+    """Ftp server serving files under `root_dir` on localhost
+
+       Any user and password is accepted.  Records the commands
+       received, STOR requests, and the most transfers run at once.
+       Set `stor_delay` to slow down each STOR and
+       `set_fail_stor_after` to abort the next STOR after a
+       number of bytes
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root_dir):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 LocalFtpHandler)
+        self.root_dir = root_dir
+        self.stor_delay = 0
+        self.commands = []
+        self.stors = []
+        self.max_active_transfers = 0
+        self._active_transfers = 0
+        self._fail_stor_after = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get_port(self):
+        return self.server_address[1]
+
+    def set_fail_stor_after(self, num_bytes):
+        self._fail_stor_after = num_bytes
+
+    def get_fail_stor_after(self):
+        with self._lock:
+            fail_after = self._fail_stor_after
+            self._fail_stor_after = None
+            return fail_after
+
+    def add_command(self, cmd):
+        with self._lock:
+            self.commands.append(cmd)
+
+    def get_command_count(self, cmd):
+        with self._lock:
+            return self.commands.count(cmd)
+
+    def add_stor(self, path, rest, num_bytes):
+        with self._lock:
+            self.stors.append((os.path.relpath(path, self.root_dir),
+                               rest, num_bytes))
+
+    def transfer_started(self):
+        with self._lock:
+            self._active_transfers += 1
+            if self._active_transfers > self.max_active_transfers:
+                self.max_active_transfers = self._active_transfers
+
+    def transfer_finished(self):
+        with self._lock:
+            self._active_transfers -= 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import os
+import re
+import hashlib
+import threading
+import time
+import SocketServer
+import BaseHTTPServer
+
+"""
+httpserver
+--------------------------------
+
+Minimal in-process http server used to test downloads.  Serves
+files under a directory and supports single Range requests.
+"""
+
+RANGE_RE = re.compile(r'^bytes=(\d+)-$')
+
+
+def get_etag(path):
+    """Gets ETag the server sends for file at `path`
+    """
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    return '"' + hashlib.md5(data).hexdigest() + '"'
+
+
+class LocalHttpHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves GET and HEAD requests for files under server root_dir
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def _get_file(self):
+        return os.path.join(self.server.root_dir, self.path.lstrip('/'))
+
+    def do_GET(self):
+        path = self._get_file()
+        range_header = self.headers.getheader('Range')
+        if_range = self.headers.getheader('If-Range')
+        self.server.add_request(self.path, range_header, if_range)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+        size = len(data)
+        etag = get_etag(path)
+        last_modified = self.date_time_string(os.path.getmtime(path))
+        if not self.server.send_etag:
+            etag = None
+        offset = 0
+        match = None
+        if range_header is not None and self.server.ignore_range is False:
+            if if_range is None or if_range in [etag, last_modified]:
+                match = RANGE_RE.match(range_header)
+        if match is not None:
+            offset = int(match.group(1))
+            if offset >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */' + str(size))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes ' + str(offset) + '-' +
+                             str(size - 1) + '/' + str(size))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(size - offset))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        self.server.transfer_started()
+        try:
+            time.sleep(self.server.delay)
+            truncate_at = self.server.get_truncate_at(self.path)
+            if truncate_at is not None:
+                self.wfile.write(data[offset:truncate_at])
+                self.wfile.flush()
+                self.close_connection = 1
+                return
+            self.wfile.write(data[offset:])
+        finally:
+            self.server.transfer_finished()
+
+
+class LocalHttpServer(SocketServer.ThreadingMixIn,
+                      BaseHTTPServer.HTTPServer):
+    """Http server serving files under `root_dir` on localhost
+
+       Records path and Range header of each request, the If-Range
+       header of each request and the most transfers run at once.
+       Range requests whose If-Range matches neither the ETag nor the
+       Last-Modified value of the file get the whole file.  Set `delay`
+       to slow down each response, `ignore_range` to answer Range
+       requests with the whole file, `send_etag` to False to leave out
+       the ETag header, and `set_truncate_at` to end the next response
+       for a path after a number of bytes
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, root_dir):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           LocalHttpHandler)
+        self.root_dir = root_dir
+        self.delay = 0
+        self.ignore_range = False
+        self.send_etag = True
+        self.requests = []
+        self.if_ranges = []
+        self.max_active_transfers = 0
+        self._active_transfers = 0
+        self._truncate_at = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get_url(self):
+        return 'http://127.0.0.1:' + str(self.server_address[1])
+
+    def set_truncate_at(self, path, num_bytes):
+        with self._lock:
+            self._truncate_at[path] = num_bytes
+
+    def get_truncate_at(self, path):
+        with self._lock:
+            return self._truncate_at.pop(path, None)
+
+    def add_request(self, path, range_header, if_range=None):
+        with self._lock:
+            self.requests.append((path, range_header))
+            self.if_ranges.append(if_range)
+
+    def transfer_started(self):
+        with self._lock:
+            self._active_transfers += 1
+            if self._active_transfers > self.max_active_transfers:
+                self.max_active_transfers = self._active_transfers
+
+    def transfer_finished(self):
+        with self._lock:
+            self._active_transfers -= 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
@@ -403,6 +403,29 @@ class TestBlastNFilterTask(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_passes_component_store_if_found(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            params = D3RParameters()
+            params.blastnfilter = '/bin/echo'
+            params.postanalysis = 'true'
+            params.pdbdb = '/pdbdb'
+            dataimport = DataImportTask(temp_dir, params)
+            dataimport.create_dir()
+            open(dataimport.get_component_store_file(), 'a').close()
+            blasttask = BlastNFilterTask(temp_dir, params)
+            blasttask._can_run = True
+            blasttask.run()
+            self.assertEqual(blasttask.get_error(), None)
+            f = open(os.path.join(blasttask.get_dir(), 'echo.stdout'), 'r')
+            echo_out = f.read().replace('\n', '')
+            f.close()
+            echo_out.index(' --componentstore ' +
+                           dataimport.get_component_store_file())
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_run_with_blast_success_postanalysis_success_no_summary_file(self):
         temp_dir = tempfile.mkdtemp()
 
@@ -5,6 +5,7 @@ import tempfile
 import stat
 import re
 import tarfile
+import hashlib
 from mock import Mock
 
 from d3r.celpp.filetransfer import FtpFileTransfer
@@ -479,6 +480,25 @@ class TestChallengeDataTask(unittest.TestCase):
                 chk = os.path.join(cdir, fname)
                 self.assertEqual(os.path.isfile(chk), True, chk)
 
+            # check manifest has sha256 of files and tarball
+            manifest = task.get_celpp_challenge_data_manifest_file()
+            f = open(manifest, 'r')
+            lines = f.read().split('\n')
+            f.close()
+            f = open(readme, 'rb')
+            readme_sha = hashlib.sha256(f.read()).hexdigest()
+            f.close()
+            lines.index(readme_sha + '  ' + name + '/' +
+                        ChallengeDataTask.README_TXT_FILE)
+            f = open(tfile, 'rb')
+            tfile_sha = hashlib.sha256(f.read()).hexdigest()
+            f.close()
+            self.assertEqual(lines[-2], tfile_sha + '  ' +
+                             os.path.basename(tfile))
+            self.assertEqual(lines[-1], '')
+            self.assertEqual(len(lines), len(file_list) + 6)
+            self.assertTrue(manifest in task.get_uploadable_files())
+
         finally:
             shutil.rmtree(temp_dir)
 
@@ -827,6 +847,7 @@ parser = argparse.ArgumentParser(description=desc,
 parser.add_argument("--outdir", help='blah')
 parser.add_argument("--candidatedir", help='blah')
 parser.add_argument("--pdbdb", help='blah')
+parser.add_argument("--numworkers", default=1, type=int, help='blah')
 
 theargs = parser.parse_args(sys.argv[1:], namespace=parsed_arguments)
 
@@ -861,6 +882,9 @@ open(os.path.join(thedir,'lig_63N.inchi'),'a').close()
 open(os.path.join(thedir,'lig_63N.mol'),'a').close()
 open(os.path.join(thedir,'lig_63N.smi'),'a').close()
 
+sys.stdout.write('Generated challenge data for 2 targets with ' +
+                 str(theargs.numworkers) + ' worker(s) in 1.0 seconds, ' +
+                 '2.0 seconds of per target time, speedup 2.00\\n')
 """)
         f.flush()
         f.close()
@@ -988,6 +1012,47 @@ open(os.path.join(thedir,'lig_63N.smi'),'a').close()
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_succeeds_with_genchallengeworkers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            script = self.create_gen_challenge_script(temp_dir)
+            params = D3RParameters()
+            params.genchallenge = script
+            params.pdbdb = '/foo'
+            params.version = '1'
+            params.genchallengeworkers = 3
+
+            blastnfilter = BlastNFilterTask(temp_dir, params)
+            blastnfilter.create_dir()
+            open(os.path.join(blastnfilter.get_dir(), D3RTask.COMPLETE_FILE),
+                 'a').close()
+            chall = ChallengeDataTask(temp_dir, params)
+
+            dimport = DataImportTask(temp_dir, params)
+            dimport.create_dir()
+            for tsv in [dimport.get_crystalph_tsv(),
+                        dimport.get_nonpolymer_tsv(),
+                        dimport.get_sequence_tsv()]:
+                open(tsv, 'w').close()
+
+            chall.run()
+            self.assertEqual(chall.get_error(), None)
+            email_log = chall.get_email_log()
+            self.assertTrue(' --outdir ' + chall.get_dir() + '/' +
+                            chall.get_celpp_challenge_data_dir_name() +
+                            ' --numworkers 3\n' in email_log)
+            self.assertTrue('\nGenerated challenge data for 2 targets with '
+                            '3 worker(s) in 1.0 seconds, 2.0 seconds of '
+                            'per target time, speedup 2.00\n' in email_log)
+            self.assertEqual(chall._get_genchallenge_workers(), 3)
+
+            params.genchallengeworkers = None
+            self.assertEqual(chall._get_genchallenge_workers(), 1)
+            chall = ChallengeDataTask(temp_dir, D3RParameters())
+            self.assertEqual(chall._get_genchallenge_workers(), 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_run_succeeds_no_ftp(self):
         temp_dir = tempfile.mkdtemp()
         try:
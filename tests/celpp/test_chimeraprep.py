@@ -301,6 +301,36 @@ class TestChimeraProteinLigPrepTask(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_passes_prep_workers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            params.chimeraprep = 'echo'
+            params.pdbdb = '/foo'
+            chall = ChallengeDataTask(temp_dir, params)
+            chall.create_dir()
+            open(os.path.join(chall.get_dir(), D3RTask.COMPLETE_FILE),
+                 'a').close()
+            task = ChimeraProteinLigPrepTask(temp_dir, params)
+            self.assertEqual(task._get_workers_args(), '')
+            params.prepligandworkers = 1
+            params.prepproteinworkers = 1
+            self.assertEqual(task._get_workers_args(), '')
+            params.prepproteinworkers = 6
+            self.assertEqual(task._get_workers_args(),
+                             ' --ligandworkers 1 --proteinworkers 6')
+
+            task.run()
+            self.assertEqual(task.get_error(), None)
+            f = open(os.path.join(task.get_dir(), 'echo.stdout'), 'r')
+            out = f.read()
+            f.close()
+            self.assertTrue(out.endswith(' --outdir ' + task.get_dir() +
+                                         ' --ligandworkers 1 '
+                                         '--proteinworkers 6\n'))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 
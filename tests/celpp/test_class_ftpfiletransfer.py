@@ -6,9 +6,14 @@ import unittest
 import tempfile
 import shutil
 import os.path
+import re
+import ftplib
 from mock import Mock
+from mock import patch
 
 from d3r.celpp.filetransfer import FtpFileTransfer
+from d3r.celpp.filetransfer import FtpConnectionPool
+from tests.celpp.ftpserver import LocalFtpServer
 
 """
 test_uploader
@@ -318,9 +323,14 @@ class TestFtpFileTransfer(unittest.TestCase):
 
             self.assertEqual(foo.upload_files([valid_file]), True)
             self.assertEqual(foo.get_error_msg(), None)
-            self.assertEqual(foo.get_upload_summary(),
+            summary = foo.get_upload_summary().split('\n')
+            self.assertEqual(summary[0],
                              '1 (3 bytes) files uploaded in 0 '
                              'seconds to host hosty:/remote')
+            self.assertEqual(len(summary), 2)
+            self.assertTrue(re.match('  ' + valid_file + ' : 3 bytes in '
+                                     '[0-9.]+ seconds \\([0-9.]+ KB/s\\)$',
+                                     summary[1]))
             foo.disconnect()
             mockftp.put.assert_called_with(valid_file,
                                            os.path.normpath('/remote' +
@@ -351,9 +361,14 @@ class TestFtpFileTransfer(unittest.TestCase):
 
             self.assertEqual(foo.upload_files([valid_file, afile]), True)
             self.assertEqual(foo.get_error_msg(), None)
-            self.assertEqual(foo.get_upload_summary(),
+            summary = foo.get_upload_summary().split('\n')
+            self.assertEqual(summary[0],
                              '2 (6 bytes) files uploaded in 0 '
                              'seconds to host hosty:/remote')
+            self.assertEqual(len(summary), 3)
+            self.assertTrue(summary[1].startswith('  ' + afile + ' : 3 '))
+            self.assertTrue(summary[2].startswith('  ' + valid_file +
+                                                  ' : 3 '))
             foo.disconnect()
             self.assertEqual(mockftp.put.call_count, 2)
 
@@ -560,5 +575,198 @@ class TestFtpFileTransfer(unittest.TestCase):
     def tearDown(self):
         pass
 
+
+class TestFtpFileTransferLocalServer(unittest.TestCase):
+    """Tests upload_files against LocalFtpServer
+    """
+    def setUp(self):
+        self._root_dir = tempfile.mkdtemp()
+        self._temp_dir = tempfile.mkdtemp()
+        self._server = LocalFtpServer(self._root_dir)
+        self._server.start()
+        self._port_patcher = patch.object(ftplib.FTP, 'port',
+                                          self._server.get_port())
+        self._port_patcher.start()
+        FtpConnectionPool.close_all()
+
+    def tearDown(self):
+        FtpConnectionPool.close_all()
+        self._port_patcher.stop()
+        self._server.stop()
+        shutil.rmtree(self._root_dir)
+        shutil.rmtree(self._temp_dir)
+
+    def _get_transfer(self):
+        foo = FtpFileTransfer(None)
+        foo.set_host('127.0.0.1')
+        foo.set_user('bob')
+        foo.set_password('pass')
+        foo.set_remote_dir('/celpp')
+        foo.set_connect_timeout(10)
+        return foo
+
+    def _write_file(self, name, size):
+        path = os.path.join(self._temp_dir, name)
+        f = open(path, 'wb')
+        f.write(''.join([chr(i % 251) for i in range(size)]))
+        f.close()
+        return path
+
+    def _get_remote_path(self, file):
+        return os.path.join(self._root_dir, 'celpp', file.lstrip('/'))
+
+    def _read(self, path):
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def test_upload_files_in_parallel(self):
+        files = []
+        for i in range(6):
+            files.append(self._write_file('file' + str(i), 1000 * (i + 1)))
+        self._server.stor_delay = 0.2
+        foo = self._get_transfer()
+        foo.set_max_connections(3)
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files(files))
+        foo.disconnect()
+        self.assertEqual(foo.get_error_msg(), None)
+        for file in files:
+            self.assertEqual(self._read(self._get_remote_path(file)),
+                             self._read(file))
+        self.assertTrue(self._server.max_active_transfers > 1)
+        self.assertTrue(self._server.max_active_transfers <= 3)
+        self.assertEqual(self._server.get_command_count('USER'), 3)
+        summary = foo.get_upload_summary().split('\n')
+        self.assertEqual(summary[0], '6 (21000 bytes) files uploaded in ' +
+                         str(foo._duration) + ' seconds to host '
+                         '127.0.0.1:/celpp')
+        self.assertEqual(len(summary), 7)
+        for i in range(6):
+            self.assertTrue(summary[i + 1].startswith('  ' + files[i] +
+                                                      ' : ' +
+                                                      str(1000 * (i + 1)) +
+                                                      ' bytes in '))
+
+        # all connections were returned to the pool
+        pool = FtpConnectionPool.get_pool('127.0.0.1', 'bob', 'pass', 10)
+        self.assertEqual(pool.get_idle_count(), 3)
+
+    def test_connect_reuses_pooled_connection(self):
+        afile = self._write_file('afile', 10)
+        for i in range(3):
+            foo = self._get_transfer()
+            self.assertTrue(foo.connect())
+            self.assertTrue(foo.upload_files([afile]))
+            foo.disconnect()
+            self.assertEqual(foo._ftp, None)
+        self.assertEqual(self._server.get_command_count('USER'), 1)
+        self.assertEqual(self._server.get_command_count('NOOP'), 2)
+
+        # closed connection in pool is replaced on connect
+        FtpConnectionPool.get_pool('127.0.0.1', 'bob',
+                                   'pass', 10)._idle[0].conn.close()
+        foo = self._get_transfer()
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files([afile]))
+        foo.disconnect()
+        self.assertEqual(self._server.get_command_count('USER'), 2)
+
+    def test_upload_files_resumes_after_failed_transfer(self):
+        afile = self._write_file('afile', 100000)
+        self._server.set_fail_stor_after(30000)
+        foo = self._get_transfer()
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files([afile]))
+        foo.disconnect()
+        remote_file = self._get_remote_path(afile)
+        self.assertEqual(self._read(remote_file), self._read(afile))
+        self.assertEqual(self._server.stors,
+                         [(os.path.relpath(remote_file, self._root_dir),
+                           0, 30000),
+                          (os.path.relpath(remote_file, self._root_dir),
+                           30000, 70000)])
+        summary = foo.get_upload_summary().split('\n')
+        self.assertTrue(summary[0].startswith('1 (70000 bytes) files'))
+        self.assertTrue(summary[1].endswith(' resumed at byte 30000'))
+
+    def test_upload_files_resumes_partial_remote_file(self):
+        afile = self._write_file('afile', 5000)
+        remote_file = self._get_remote_path(afile)
+        os.makedirs(os.path.dirname(remote_file))
+        f = open(remote_file, 'wb')
+        f.write(self._read(afile)[:2000])
+        f.close()
+        foo = self._get_transfer()
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files([afile]))
+        foo.disconnect()
+        self.assertEqual(self._read(remote_file), self._read(afile))
+        self.assertEqual(self._server.stors[0][1:], (2000, 3000))
+
+        # with resume disabled entire file is sent
+        self._server.stors = []
+        f = open(remote_file, 'wb')
+        f.write(self._read(afile)[:2000])
+        f.close()
+        foo.set_resume(False)
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files([afile]))
+        foo.disconnect()
+        self.assertEqual(self._read(remote_file), self._read(afile))
+        self.assertEqual(self._server.stors[0][1:], (0, 5000))
+
+    def test_upload_files_verify_checksum(self):
+        afile = self._write_file('afile', 5000)
+        remote_file = self._get_remote_path(afile)
+        foo = self._get_transfer()
+        foo.set_verify_checksum(True)
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files([afile]))
+        self.assertEqual(len(self._server.stors), 1)
+        self.assertEqual(self._server.get_command_count('RETR'), 1)
+
+        # same file already on server is skipped
+        self.assertTrue(foo.upload_files([afile]))
+        self.assertEqual(len(self._server.stors), 1)
+        self.assertTrue(foo.get_upload_summary().endswith(
+            afile + ' : already uploaded'))
+
+        # remote file of same size with different content is replaced
+        f = open(remote_file, 'wb')
+        f.write('x' * 5000)
+        f.close()
+        self.assertTrue(foo.upload_files([afile]))
+        foo.disconnect()
+        self.assertEqual(self._server.stors[1][1:], (0, 5000))
+        self.assertEqual(self._read(remote_file), self._read(afile))
+
+    def test_upload_files_retries_exhausted(self):
+        afile = self._write_file('afile', 50000)
+        foo = self._get_transfer()
+        foo.set_retries(0)
+        self._server.set_fail_stor_after(10)
+        self.assertTrue(foo.connect())
+        self.assertFalse(foo.upload_files([afile]))
+        foo.disconnect()
+        self.assertEqual(foo.get_error_msg(), 'Error during upload')
+        self.assertEqual(foo.get_upload_summary(),
+                         'Error during upload\n0 (0 bytes) files uploaded '
+                         'in ' + str(foo._duration) + ' seconds to host '
+                         '127.0.0.1:/celpp')
+
+    def test_upload_files_skips_invalid_files(self):
+        afile = self._write_file('afile', 10)
+        foo = self._get_transfer()
+        foo.set_max_connections(2)
+        self.assertTrue(foo.connect())
+        self.assertTrue(foo.upload_files([None, afile,
+                                          os.path.join(self._temp_dir,
+                                                       'doesnotexist')]))
+        foo.disconnect()
+        self.assertEqual(foo._files_transferred, 1)
+        self.assertEqual(self._server.get_command_count('USER'), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -31,6 +31,7 @@ from d3r.celpp.makeblastdb import MakeBlastDBTask
 from d3r.celpp import util
 
 from tests.celpp import test_task
+from tests.celpp.httpserver import LocalHttpServer
 
 
 class TestDataImportTask(unittest.TestCase):
@@ -440,6 +441,95 @@ class TestDataImportTask(unittest.TestCase):
             mftp.get.assert_called_with('/foo2/' +
                                         DataImportTask.PARTICIPANT_LIST_CSV,
                                         local=task.get_participant_list_csv())
+            self.assertTrue('\n5 of 5 files (0 bytes) downloaded\n  ' +
+                            DataImportTask.NONPOLYMER_TSV + ' : 0 bytes in ' in
+                            task.get_email_log())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_download_files_from_http_server(self):
+        temp_dir = tempfile.mkdtemp()
+        web_dir = tempfile.mkdtemp()
+        server = LocalHttpServer(web_dir)
+        server.start()
+        try:
+            names = [DataImportTask.NONPOLYMER_TSV,
+                     DataImportTask.SEQUENCE_TSV,
+                     DataImportTask.OLDSEQUENCE_TSV,
+                     DataImportTask.CRYSTALPH_TSV,
+                     DataImportTask.COMPINCHI_ICH]
+            for name in names:
+                f = open(os.path.join(web_dir, name), 'w')
+                f.write(name + '\n' * 5000)
+                f.close()
+            server.set_truncate_at('/' + DataImportTask.SEQUENCE_TSV, 100)
+            server.delay = 0.2
+
+            params = D3RParameters()
+            params.skipimportwait = True
+            params.compinchi = server.get_url()
+            task = DataImportTask(temp_dir, params)
+            task._retrysleep = 0
+            task.create_dir()
+            self.assertTrue(task._download_files(server.get_url()))
+            self.assertEqual(task.get_error(), None)
+            for name in names:
+                f = open(os.path.join(task.get_dir(), name), 'r')
+                self.assertEqual(f.read(), name + '\n' * 5000)
+                f.close()
+            self.assertTrue(server.max_active_transfers > 1)
+            self.assertTrue(('/' + DataImportTask.SEQUENCE_TSV,
+                             'bytes=100-') in server.requests)
+            summary = task._download_summary.split('\n')
+            self.assertEqual(summary[0], '5 of 5 files (25168 bytes) '
+                                         'downloaded')
+            self.assertTrue(summary[2].startswith(
+                '  ' + DataImportTask.SEQUENCE_TSV + ' : 5044 bytes in '))
+            self.assertTrue(summary[2].endswith(' resumed at byte 100'))
+
+            # test missing file on server
+            os.unlink(os.path.join(web_dir, DataImportTask.CRYSTALPH_TSV))
+            self.assertFalse(task._download_files(server.get_url()))
+            self.assertEqual(task.get_error(), 'Unable to download file '
+                                               'from ' + server.get_url() +
+                                               ' to ' +
+                                               task.get_crystalph_tsv())
+        finally:
+            server.stop()
+            shutil.rmtree(temp_dir)
+            shutil.rmtree(web_dir)
+
+    def test_build_component_store(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # buildcomponentstore not set
+            params = D3RParameters()
+            task = DataImportTask(temp_dir, params)
+            task.create_dir()
+            task._build_component_store()
+            self.assertEqual(task.get_email_log(), None)
+
+            # buildcomponentstore set to None
+            params.buildcomponentstore = None
+            task._build_component_store()
+            self.assertEqual(task.get_email_log(), None)
+
+            params.buildcomponentstore = '/bin/echo'
+            task._build_component_store()
+            self.assertEqual(task.get_error(), None)
+            f = open(os.path.join(task.get_dir(), 'echo.stdout'), 'r')
+            echo_out = f.read()
+            f.close()
+            self.assertEqual(echo_out, '--compinchi ' +
+                             task.get_components_inchi_file() + ' --out ' +
+                             task.get_component_store_file() + '\n')
+
+            # failure is not fatal
+            params.buildcomponentstore = 'false'
+            task._build_component_store()
+            self.assertEqual(task.get_error(), None)
+            self.assertTrue('Although considered non fatal' in
+                            task.get_email_log())
         finally:
             shutil.rmtree(temp_dir)
 
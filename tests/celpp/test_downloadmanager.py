@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import shutil
+import os
+
+"""
+test_downloadmanager
+--------------------------------
+
+Tests for `downloadmanager` module.
+"""
+
+from d3r.celpp.downloadmanager import DownloadManager
+from d3r.celpp.util import DownloadError
+from tests.celpp.httpserver import LocalHttpServer
+from tests.celpp.httpserver import get_etag
+
+
+class TestDownloadManager(unittest.TestCase):
+    def setUp(self):
+        self._root_dir = tempfile.mkdtemp()
+        self._temp_dir = tempfile.mkdtemp()
+        self._server = LocalHttpServer(self._root_dir)
+        self._server.start()
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._root_dir)
+        shutil.rmtree(self._temp_dir)
+
+    def _write_file(self, name, size):
+        path = os.path.join(self._root_dir, name)
+        f = open(path, 'wb')
+        f.write(''.join([chr(i % 251) for i in range(size)]))
+        f.close()
+        return path
+
+    def _write_partial(self, dest, data, validator):
+        f = open(dest + DownloadManager.PARTIAL_SUFFIX, 'wb')
+        f.write(data)
+        f.close()
+        f = open(dest + DownloadManager.PARTIAL_SUFFIX +
+                 DownloadManager.VALIDATOR_SUFFIX, 'w')
+        f.write(validator + '\n')
+        f.close()
+
+    def _read(self, path):
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def test_constructor_and_add_invalid_values(self):
+        try:
+            DownloadManager(retry_sleep_time_secs=-1)
+            self.fail('Expected DownloadError')
+        except DownloadError as e:
+            self.assertEqual(str(e), 'retry sleep time cannot be negative')
+
+        manager = DownloadManager()
+        try:
+            manager.add(None, '/foo')
+            self.fail('Expected DownloadError')
+        except DownloadError as e:
+            self.assertEqual(str(e), 'url is not set')
+        try:
+            manager.add('http://foo', None)
+            self.fail('Expected DownloadError')
+        except DownloadError as e:
+            self.assertEqual(str(e), 'download_path is not set')
+        self.assertEqual(manager.get_downloads(), [])
+        self.assertTrue(manager.run())
+
+    def test_run_downloads_concurrently(self):
+        manager = DownloadManager(max_parallel_downloads=3, num_retries=0,
+                                  retry_sleep_time_secs=0)
+        for i in range(5):
+            self._write_file('file' + str(i), 1000 * (i + 1))
+            manager.add(self._server.get_url() + '/file' + str(i),
+                        os.path.join(self._temp_dir, 'file' + str(i)))
+        self._server.delay = 0.2
+        self.assertTrue(manager.run())
+        self.assertEqual(manager.get_failed_downloads(), [])
+        for i in range(5):
+            name = 'file' + str(i)
+            self.assertEqual(self._read(os.path.join(self._temp_dir, name)),
+                             self._read(os.path.join(self._root_dir, name)))
+        self.assertEqual(sorted(os.listdir(self._temp_dir)),
+                         ['file0', 'file1', 'file2', 'file3', 'file4'])
+        self.assertTrue(self._server.max_active_transfers > 1)
+        self.assertTrue(self._server.max_active_transfers <= 3)
+        summary = manager.get_summary().split('\n')
+        self.assertEqual(summary[0], '5 of 5 files (15000 bytes) downloaded')
+        self.assertEqual(len(summary), 6)
+        for i in range(5):
+            self.assertTrue(summary[i + 1].startswith(
+                '  file' + str(i) + ' : ' + str(1000 * (i + 1)) +
+                ' bytes in '))
+            self.assertTrue(summary[i + 1].endswith(' KB/s)'))
+
+    def test_run_resumes_truncated_download(self):
+        src = self._write_file('file', 100000)
+        self._server.set_truncate_at('/file', 40000)
+        manager = DownloadManager(num_retries=1, retry_sleep_time_secs=0)
+        dest = os.path.join(self._temp_dir, 'file')
+        download = manager.add(self._server.get_url() + '/file', dest)
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(self._server.requests,
+                         [('/file', None), ('/file', 'bytes=40000-')])
+        self.assertEqual(self._server.if_ranges, [None, get_etag(src)])
+        self.assertEqual(download.resumed_from, 40000)
+        self.assertEqual(download.bytes_transferred, 100000)
+        self.assertEqual(download.attempts, 1)
+        self.assertTrue(manager.get_summary().endswith(
+            ' resumed at byte 40000'))
+
+    def test_run_fails_when_retries_exhausted(self):
+        self._write_file('file', 100000)
+        self._server.set_truncate_at('/file', 40000)
+        manager = DownloadManager(num_retries=0, retry_sleep_time_secs=0)
+        dest = os.path.join(self._temp_dir, 'file')
+        download = manager.add(self._server.get_url() + '/file', dest)
+        self.assertFalse(manager.run())
+        self.assertEqual(manager.get_failed_downloads(), [download])
+        self.assertEqual(download.error, 'Received 40000 of 100000 bytes '
+                                         'from ' + self._server.get_url() +
+                                         '/file')
+        self.assertFalse(os.path.isfile(dest))
+        self.assertEqual(os.path.getsize(download.get_partial_path()),
+                         40000)
+
+        # next run resumes from partial file
+        self.assertTrue(manager.run())
+        self.assertEqual(self._server.requests[-1],
+                         ('/file', 'bytes=40000-'))
+        self.assertEqual(download.bytes_transferred, 60000)
+        self.assertFalse(os.path.isfile(download.get_partial_path()))
+        self.assertFalse(os.path.isfile(download.get_validator_path()))
+
+    def test_run_restarts_when_remote_file_changed(self):
+        self._write_file('file', 100000)
+        self._server.set_truncate_at('/file', 40000)
+        manager = DownloadManager(num_retries=0, retry_sleep_time_secs=0)
+        dest = os.path.join(self._temp_dir, 'file')
+        download = manager.add(self._server.get_url() + '/file', dest)
+        self.assertFalse(manager.run())
+        old_etag = get_etag(os.path.join(self._root_dir, 'file'))
+
+        # file is replaced on server with one of the same size
+        src = os.path.join(self._root_dir, 'file')
+        f = open(src, 'wb')
+        f.write('y' * 100000)
+        f.close()
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(self._server.requests[-1],
+                         ('/file', 'bytes=40000-'))
+        self.assertEqual(self._server.if_ranges[-1], old_etag)
+        self.assertEqual(download.resumed_from, 0)
+        self.assertEqual(download.bytes_transferred, 100000)
+        self.assertFalse(os.path.isfile(download.get_validator_path()))
+
+    def test_run_resumes_with_last_modified_without_etag(self):
+        src = self._write_file('file', 100000)
+        self._server.send_etag = False
+        self._server.set_truncate_at('/file', 40000)
+        manager = DownloadManager(num_retries=1, retry_sleep_time_secs=0)
+        dest = os.path.join(self._temp_dir, 'file')
+        download = manager.add(self._server.get_url() + '/file', dest)
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(download.resumed_from, 40000)
+        self.assertTrue(self._server.if_ranges[-1].endswith(' GMT'))
+
+    def test_run_removes_partial_file_without_validator(self):
+        src = self._write_file('file', 5000)
+        dest = os.path.join(self._temp_dir, 'file')
+        f = open(dest + DownloadManager.PARTIAL_SUFFIX, 'wb')
+        f.write('x' * 3000)
+        f.close()
+        manager = DownloadManager(num_retries=0)
+        download = manager.add(self._server.get_url() + '/file', dest)
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(download.resumed_from, 0)
+        self.assertEqual(self._server.requests, [('/file', None)])
+
+    def test_run_server_ignores_range(self):
+        src = self._write_file('file', 5000)
+        dest = os.path.join(self._temp_dir, 'file')
+        self._write_partial(dest, 'x' * 3000, get_etag(src))
+        self._server.ignore_range = True
+        manager = DownloadManager(num_retries=0)
+        download = manager.add(self._server.get_url() + '/file', dest)
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(download.resumed_from, 0)
+        self.assertEqual(self._server.requests, [('/file', 'bytes=3000-')])
+
+    def test_run_partial_file_larger_then_remote(self):
+        src = self._write_file('file', 5000)
+        dest = os.path.join(self._temp_dir, 'file')
+        self._write_partial(dest, 'x' * 6000, get_etag(src))
+        manager = DownloadManager(num_retries=0)
+        manager.add(self._server.get_url() + '/file', dest)
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(self._server.requests, [('/file', 'bytes=6000-'),
+                                                 ('/file', None)])
+
+    def test_run_missing_file(self):
+        manager = DownloadManager(num_retries=2, retry_sleep_time_secs=0)
+        good = self._write_file('good', 10)
+        manager.add(self._server.get_url() + '/good',
+                    os.path.join(self._temp_dir, 'good'))
+        download = manager.add(self._server.get_url() + '/missing',
+                               os.path.join(self._temp_dir, 'missing'))
+        self.assertFalse(manager.run())
+        self.assertEqual(manager.get_failed_downloads(), [download])
+        self.assertEqual(download.attempts, 3)
+        self.assertEqual(self._read(os.path.join(self._temp_dir, 'good')),
+                         self._read(good))
+        summary = manager.get_summary().split('\n')
+        self.assertEqual(summary[0], '1 of 2 files (10 bytes) downloaded')
+        self.assertEqual(summary[2], '  missing : failed after 3 '
+                                     'attempt(s) : HTTP Error 404: '
+                                     'Not Found')
+
+    def test_run_file_url(self):
+        src = self._write_file('file', 3000)
+        manager = DownloadManager()
+        dest = os.path.join(self._temp_dir, 'file')
+        download = manager.add('file://' + src, dest)
+        self.assertTrue(manager.run())
+        self.assertEqual(self._read(dest), self._read(src))
+        self.assertEqual(download.bytes_transferred, 3000)
+
+if __name__ == '__main__':
+    unittest.main()
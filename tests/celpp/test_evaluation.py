@@ -13,6 +13,7 @@ Tests for `evaluation` module.
 """
 import shutil
 import os
+import pickle
 
 from mock import Mock
 
@@ -670,6 +671,46 @@ class TestEvaluation(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_passes_evaluationworkers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            blasttask = BlastNFilterTask(temp_dir, params)
+            blasttask.create_dir()
+            open(os.path.join(blasttask.get_dir(),
+                              D3RTask.COMPLETE_FILE), 'a').close()
+            params.evaluation = 'echo'
+            params.pdbdb = '/data/pdb'
+            params.evaluationworkers = 4
+            docktask = D3RTask(temp_dir, params)
+            docktask.set_name('foo')
+            docktask.set_stage(EvaluationTaskFactory.DOCKSTAGE)
+            docktask.create_dir()
+            open(os.path.join(docktask.get_dir(), D3RTask.COMPLETE_FILE),
+                 'a').close()
+            evaluation = EvaluationTask(temp_dir, 'foo.evaluation',
+                                        docktask, params)
+            evaluation.run()
+            self.assertEqual(evaluation.get_error(), None)
+            f = open(os.path.join(evaluation.get_dir(), 'echo.stdout'), 'r')
+            out = f.read()
+            f.close()
+            self.assertTrue(out.endswith(' --outdir ' + evaluation.get_dir() +
+                                         ' --numworkers 4\n'))
+
+            # a single worker leaves the flag off
+            params.evaluationworkers = 1
+            evaluation = EvaluationTask(temp_dir, 'bar.evaluation',
+                                        docktask, params)
+            evaluation.run()
+            f = open(os.path.join(evaluation.get_dir(), 'echo.stdout'), 'r')
+            out = f.read()
+            f.close()
+            self.assertTrue(out.endswith(' --outdir ' + evaluation.get_dir() +
+                                         '\n'))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_run_succeeds_no_emailer(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -793,6 +834,63 @@ class TestEvaluation(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_timeout_compacts_journal(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            blasttask = BlastNFilterTask(temp_dir, params)
+            blasttask.create_dir()
+            open(os.path.join(blasttask.get_dir(),
+                              D3RTask.COMPLETE_FILE), 'a').close()
+            foo_script = os.path.join(temp_dir, 'foo.py')
+            params.evaluation = foo_script
+            params.evaluationtimeout = 1
+            params.evaluationtimeoutkilldelay = 1
+            params.pdbdb = '/data/pdb'
+
+            # fake evaluate.py that journals one finished target then
+            # hangs on the next one
+            f = open(foo_script, 'w')
+            f.write('#! /usr/bin/env python\n\n')
+            f.write('import os\n')
+            f.write('import sys\n')
+            f.write('import time\n')
+            f.write('outdir = sys.argv[sys.argv.index("--outdir") + 1]\n')
+            f.write('f = open(os.path.join(outdir, "RMSD.journal"), "w")\n')
+            f.write('f.write(\'{"target": "1abc", "type": "LMCSS", '
+                    '"value": 1.5}\\n\')\n')
+            f.write('f.write(\'{"target": "1abc", "finished": true}'
+                    '\\n\')\n')
+            f.write('f.write(\'{"target": "2abc", "type": "LMCSS", '
+                    '"value": 2.5}\\n\')\n')
+            f.write('f.close()\n')
+            f.write('time.sleep(360)\n')
+            f.flush()
+            f.close()
+            os.chmod(foo_script, stat.S_IRWXU)
+
+            docktask = D3RTask(temp_dir, params)
+            docktask.set_name('foo')
+            docktask.set_stage(EvaluationTaskFactory.DOCKSTAGE)
+            docktask.create_dir()
+            open(os.path.join(docktask.get_dir(), D3RTask.COMPLETE_FILE),
+                 'a').close()
+            evaluation = EvaluationTask(temp_dir, 'foo.evaluation',
+                                        docktask, params)
+            evaluation.run()
+            self.assertEqual(evaluation.get_error(), None)
+            self.assertFalse(os.path.isfile(evaluation.get_rmsd_journal()))
+            f = open(evaluation.get_rmsd_pickle(), 'r')
+            self.assertEqual(pickle.load(f), {'1abc': {'LMCSS': 1.5}})
+            f.close()
+            self.assertTrue(os.path.isfile(evaluation.get_rmsd_txt()))
+            self.assertTrue('wrote results of 1 evaluated targets' in
+                            evaluation.get_email_log())
+            self.assertTrue(evaluation.get_rmsd_pickle() in
+                            evaluation.get_uploadable_files())
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_run_succeeds_with_emailer(self):
         temp_dir = tempfile.mkdtemp()
         try:
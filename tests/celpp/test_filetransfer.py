@@ -122,6 +122,27 @@ class TestFileTransfer(unittest.TestCase):
             self.assertEqual(foo.get_remote_challenge_dir(), '/chall')
             self.assertEqual(foo.get_remote_submission_dir(), '/submit')
             self.assertEqual(foo.get_contestant_id(), '5678')
+            self.assertEqual(foo.get_max_connections(), 1)
+            self.assertEqual(foo.get_verify_checksum(), False)
+
+            # test passing valid config file with connections and
+            # verifychecksum
+            f = open(os.path.join(temp_dir, 'valid'), 'a')
+            f.write('connections 4\nverifychecksum True\n')
+            f.flush()
+            f.close()
+            foo = FileTransfer(os.path.join(temp_dir, 'valid'))
+            self.assertEqual(foo.get_contestant_id(), '5678')
+            self.assertEqual(foo.get_max_connections(), 4)
+            self.assertEqual(foo.get_verify_checksum(), True)
+
+            # test invalid connections value is ignored
+            f = open(os.path.join(temp_dir, 'valid'), 'a')
+            f.write('connections foo\n')
+            f.flush()
+            f.close()
+            foo = FileTransfer(os.path.join(temp_dir, 'valid'))
+            self.assertEqual(foo.get_max_connections(), 4)
 
         finally:
             shutil.rmtree(temp_dir)
@@ -286,6 +286,29 @@ class TestGlideTask(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_passes_glideworkers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            params.glide = 'echo'
+            params.glideworkers = 4
+            proteinligprep = ProteinLigPrepTask(temp_dir, params)
+            proteinligprep.create_dir()
+            open(os.path.join(proteinligprep.get_dir(),
+                              D3RTask.COMPLETE_FILE),
+                 'a').close()
+            glide = GlideTask(temp_dir, params)
+            glide.run()
+            self.assertEqual(glide.get_error(), None)
+            f = open(os.path.join(glide.get_dir(), 'echo.stdout'), 'r')
+            out = f.read()
+            f.close()
+            self.assertEqual(out, '--structuredir ' +
+                             proteinligprep.get_dir() + ' --outdir ' +
+                             glide.get_dir() + ' --numworkers 4\n')
+        finally:
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 
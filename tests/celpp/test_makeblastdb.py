@@ -451,11 +451,198 @@ class TestMakeBlastDBTask(unittest.TestCase):
             f.close()
 
             lines = task.get_email_log().split('\n')
-            self.assertEqual(lines[2], '# sequence(s): 0')
+            self.assertTrue(lines[1].startswith('Command echo took '))
+            self.assertEqual(lines[3], '# sequence(s): 0')
             f.close()
         finally:
             shutil.rmtree(temp_dir)
 
+    def _write_fake_makeblastdb(self, temp_dir):
+        """Writes script that mimics makeblastdb by creating <out>.pin
+           and reporting the number of sequences in <in>
+        """
+        script = os.path.join(temp_dir, 'makeblastdb')
+        f = open(script, 'w')
+        f.write('#!/bin/sh\n'
+                'touch "$4.pin"\n'
+                'echo "Adding sequences from FASTA; added `grep -c \'^>\' '
+                '$2` sequences in 0.01 seconds."\n')
+        f.close()
+        os.chmod(script, 0o755)
+        return script
+
+    def _run_week(self, celppdir, week, seqres, params):
+        week_dir = os.path.join(celppdir, '2017', 'dataset.week.' + week)
+        if not os.path.isdir(week_dir):
+            os.makedirs(week_dir)
+        fakegz = os.path.join(celppdir, 'pdb_seqres.txt.gz')
+        f = gzip.open(fakegz, 'wb')
+        f.write(seqres)
+        f.close()
+        params.pdbsequrl = 'file://' + fakegz
+        task = MakeBlastDBTask(week_dir, params)
+        task._retrysleep = 0
+        task._maxretries = 1
+        task.run()
+        self.assertEqual(task.get_error(), None)
+        return task
+
+    def test_read_fasta_entries(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            fasta = os.path.join(temp_dir, 'seqres')
+            f = open(fasta, 'w')
+            f.write('ignored\n>101m_A mol:protein length:4  MYOGLOBIN\n'
+                    'MVLS\n>102d_A mol:na length:4  DNA\nCG\nCA\n'
+                    '>103l_B\n')
+            f.close()
+            entries = list(MakeBlastDBTask.read_fasta_entries(fasta))
+            self.assertEqual(entries,
+                             [('101m_A', '>101m_A mol:protein length:4  '
+                                         'MYOGLOBIN', 'MVLS'),
+                              ('102d_A', '>102d_A mol:na length:4  DNA',
+                               'CGCA'),
+                              ('103l_B', '>103l_B', '')])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_oid_mask(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            mask = os.path.join(temp_dir, 'foo.msk')
+            MakeBlastDBTask.write_oid_mask(mask, [True, False, True, True,
+                                                  False, False, False, False,
+                                                  False, True])
+            f = open(mask, 'rb')
+            self.assertEqual(f.read(), '\x00\x00\x00\x0a\xb0\x40')
+            f.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_alias_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pal = os.path.join(temp_dir, 'foo.pal')
+            MakeBlastDBTask.write_alias_file(pal, 'foo', ['/a/db', 'b'],
+                                             5, 100, oidlist='foo.msk')
+            f = open(pal, 'r')
+            lines = f.read().split('\n')
+            f.close()
+            self.assertEqual(lines[3:], ['TITLE foo', 'DBLIST /a/db b',
+                                         'OIDLIST foo.msk', 'NSEQ 5',
+                                         'LENGTH 100', ''])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_incremental_mode(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            params.makeblastdb = self._write_fake_makeblastdb(temp_dir)
+            params.makeblastdbincremental = True
+            params.makeblastdbfullrebuild = 3
+            week1_seqres = ('>101m_A mol:protein length:4  MYOGLOBIN\nMVLS\n'
+                            '>102l_A mol:protein length:3  LYSOZYME\nMNI\n'
+                            '>103l_A mol:protein length:2  LYSOZYME\nFE\n'
+                            '>104l_A mol:protein length:2  LYSOZYME\nML\n')
+            # week 1 has no previous week so it is a full build
+            task = self._run_week(temp_dir, '1', week1_seqres, params)
+            summary = task.get_summary()
+            self.assertEqual(summary['mode'], MakeBlastDBTask.FULL_MODE)
+            self.assertEqual(summary['reason'], 'no previous week found')
+            self.assertEqual(summary['sequence_count'], 4)
+            self.assertEqual(summary['residue_count'], 11)
+            self.assertEqual(summary['makeblastdb_sequence_count'], 4)
+            self.assertEqual(summary['weeks_since_full'], 0)
+            self.assertTrue(os.path.isfile(task.get_pdb_db() + '.pin'))
+            self.assertTrue('Database build: full (no previous week found)'
+                            in task.get_email_log())
+            week1_db = task.get_pdb_db()
+            week1_seqres_txt = task.get_pdb_seqres_txt()
+
+            # week 2 removes 102l_A, changes 103l_A and adds 105m_A
+            week2_seqres = ('>101m_A mol:protein length:4  MYOGLOBIN\nMVLS\n'
+                            '>103l_A mol:protein length:3  LYSOZYME\nFEA\n'
+                            '>104l_A mol:protein length:2  LYSOZYME\nML\n'
+                            '>105m_A mol:protein length:3  MYOGLOBIN\nMVL\n')
+            task = self._run_week(temp_dir, '2', week2_seqres, params)
+            summary = task.get_summary()
+            self.assertEqual(summary['mode'],
+                             MakeBlastDBTask.INCREMENTAL_MODE)
+            self.assertEqual(summary['base_db'], week1_db)
+            self.assertEqual(summary['base_seqres'], week1_seqres_txt)
+            self.assertEqual(summary['weeks_since_full'], 1)
+            self.assertEqual(summary['delta_count'], 2)
+            self.assertEqual(summary['masked_count'], 2)
+            self.assertEqual(summary['sequence_count'], 4)
+            self.assertEqual(summary['residue_count'], 12)
+            self.assertTrue('# new or changed sequence(s): 2' in
+                            task.get_email_log())
+
+            f = open(task.get_pdb_seqres_delta_txt(), 'r')
+            self.assertEqual(f.read(),
+                             '>103l_A mol:protein length:3  LYSOZYME\nFEA\n'
+                             '>105m_A mol:protein length:3  MYOGLOBIN\n'
+                             'MVL\n')
+            f.close()
+            self.assertTrue(os.path.isfile(os.path.join(task.get_dir(),
+                                                        'pdb_db_delta.pin')))
+            f = open(os.path.join(task.get_dir(), 'pdb_db_base.msk'), 'rb')
+            self.assertEqual(f.read(), '\x00\x00\x00\x04\x90')
+            f.close()
+            f = open(os.path.join(task.get_dir(), 'pdb_db_base.pal'), 'r')
+            base_alias = f.read()
+            f.close()
+            self.assertTrue('DBLIST ' + week1_db + '\n' in base_alias)
+            self.assertTrue('OIDLIST pdb_db_base.msk\n' in base_alias)
+            self.assertTrue('NSEQ 2\nLENGTH 6\n' in base_alias)
+            f = open(task.get_pdb_db() + '.pal', 'r')
+            alias = f.read()
+            f.close()
+            self.assertTrue('DBLIST pdb_db_base pdb_db_delta\n' in alias)
+            self.assertTrue('NSEQ 4\nLENGTH 12\n' in alias)
+
+            # week 3 still uses week 1 as base
+            task = self._run_week(temp_dir, '3', week2_seqres, params)
+            summary = task.get_summary()
+            self.assertEqual(summary['mode'],
+                             MakeBlastDBTask.INCREMENTAL_MODE)
+            self.assertEqual(summary['base_db'], week1_db)
+            self.assertEqual(summary['weeks_since_full'], 2)
+
+            # week 4 is a periodic full rebuild
+            task = self._run_week(temp_dir, '4', week2_seqres, params)
+            summary = task.get_summary()
+            self.assertEqual(summary['mode'], MakeBlastDBTask.FULL_MODE)
+            self.assertEqual(summary['reason'],
+                             'periodic full rebuild after 3 weeks')
+            self.assertFalse(os.path.isfile(task.get_pdb_db() + '.pal'))
+
+            # incremental mode disabled
+            params.makeblastdbincremental = False
+            task = self._run_week(temp_dir, '5', week2_seqres, params)
+            summary = task.get_summary()
+            self.assertEqual(summary['mode'], MakeBlastDBTask.FULL_MODE)
+            self.assertEqual(summary['reason'], 'incremental mode not enabled')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_incremental_mode_unverified_base(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            params.makeblastdb = 'echo'
+            params.makeblastdbincremental = True
+            seqres = '>101m_A mol:protein length:4  MYOGLOBIN\nMVLS\n'
+            self._run_week(temp_dir, '1', seqres, params)
+            task = self._run_week(temp_dir, '2', seqres, params)
+            summary = task.get_summary()
+            self.assertEqual(summary['mode'], MakeBlastDBTask.FULL_MODE)
+            self.assertTrue(summary['reason'].startswith('number of '
+                                                         'sequences in '))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import shutil
+import os
+import gzip
+import random
+import hashlib
+import tarfile
+import subprocess
+
+"""
+test_parallelgzip
+--------------------------------
+
+Tests for `parallelgzip` module.
+"""
+
+from d3r.celpp.parallelgzip import ParallelGzipFile
+from d3r.celpp.parallelgzip import ParallelTarGzWriter
+
+
+class TestParallelGzip(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _read(self, path):
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def _make_data(self, size):
+        rand = random.Random(0)
+        words = ['ATOM', 'HETATM', 'CONECT', '1.000', '-23.455', 'LIG']
+        chunks = []
+        total = 0
+        while total < size:
+            word = rand.choice(words) + ' '
+            chunks.append(word)
+            total += len(word)
+        return ''.join(chunks)[:size]
+
+    def test_constructor_unable_to_write(self):
+        try:
+            ParallelGzipFile(os.path.join(self._temp_dir, 'nope', 'x.gz'))
+            self.fail('Expected IOError')
+        except IOError:
+            pass
+
+    def test_empty_file(self):
+        gzfile = os.path.join(self._temp_dir, 'empty.gz')
+        pgz = ParallelGzipFile(gzfile)
+        pgz.close()
+        pgz.close()
+        f = gzip.open(gzfile, 'rb')
+        self.assertEqual(f.read(), '')
+        f.close()
+        self.assertEqual(pgz.get_size(), 0)
+        self.assertEqual(pgz.get_sha256_hexdigest(),
+                         hashlib.sha256(self._read(gzfile)).hexdigest())
+        try:
+            pgz.write('hi')
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_write_many_blocks(self):
+        data = self._make_data(100000)
+        gzfile = os.path.join(self._temp_dir, 'foo.gz')
+        pgz = ParallelGzipFile(gzfile, block_size=4096, threads=3)
+        # odd sized writes that straddle block boundaries
+        offset = 0
+        step = 1
+        while offset < len(data):
+            pgz.write(data[offset:offset + step])
+            offset += step
+            step = step * 3 % 7919 + 1
+        self.assertEqual(pgz.tell(), len(data))
+        pgz.close()
+        f = gzip.open(gzfile, 'rb')
+        self.assertEqual(f.read(), data)
+        f.close()
+        self.assertEqual(pgz.get_compressed_size(),
+                         os.path.getsize(gzfile))
+        self.assertTrue(pgz.get_compressed_size() < len(data))
+        self.assertEqual(pgz.get_sha256_hexdigest(),
+                         hashlib.sha256(self._read(gzfile)).hexdigest())
+
+        # standard gunzip can read it and checks crc and length
+        p = subprocess.Popen(['gzip', '-dc', gzfile],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out, err = p.communicate()
+        self.assertEqual(p.returncode, 0, err)
+        self.assertEqual(out, data)
+
+    def test_tar_gz_writer(self):
+        srcdir = os.path.join(self._temp_dir, 'src')
+        os.makedirs(os.path.join(srcdir, 'sub', 'subsub'))
+        os.mkdir(os.path.join(srcdir, 'emptydir'))
+        files = {'a.txt': 'hello\n',
+                 'sub/b.pdb': self._make_data(50000),
+                 'sub/subsub/c.txt': ''}
+        for name, content in files.items():
+            f = open(os.path.join(srcdir, name), 'wb')
+            f.write(content)
+            f.close()
+
+        tfile = os.path.join(self._temp_dir, 'foo.tar.gz')
+        tar = ParallelTarGzWriter(tfile, block_size=1024, threads=2)
+        tar.add(srcdir, 'foo')
+        tar.close()
+        self.assertEqual(tar.get_manifest(),
+                         [hashlib.sha256(files[name]).hexdigest() +
+                          '  foo/' + name for name in
+                          ['a.txt', 'sub/b.pdb', 'sub/subsub/c.txt']])
+        self.assertEqual(tar.get_sha256_hexdigest(),
+                         hashlib.sha256(self._read(tfile)).hexdigest())
+        self.assertEqual(tar.get_compressed_size(), os.path.getsize(tfile))
+        self.assertTrue(tar.get_size() > 50000)
+
+        t = tarfile.open(tfile, 'r:gz')
+        self.assertEqual(sorted(t.getnames()),
+                         ['foo', 'foo/a.txt', 'foo/emptydir', 'foo/sub',
+                          'foo/sub/b.pdb', 'foo/sub/subsub',
+                          'foo/sub/subsub/c.txt'])
+        outdir = os.path.join(self._temp_dir, 'out')
+        t.extractall(path=outdir)
+        t.close()
+        for name, content in files.items():
+            self.assertEqual(self._read(os.path.join(outdir, 'foo', name)),
+                             content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+import unittest
+import threading
+
+"""
+test_scheduler
+--------------------------------
+
+Tests for `scheduler` module.
+"""
+
+from d3r.celpp.scheduler import TaskScheduler
+from d3r.celpp.scheduler import TaskNode
+
+
+class FakeLock(object):
+    def __init__(self, name, events):
+        self._name = name
+        self._events = events
+        events.append('lock ' + name)
+
+    def release(self):
+        self._events.append('release ' + self._name)
+
+
+class FakeTask(object):
+    """Task that records start and end in shared event list
+    """
+    def __init__(self, name, events, dependencies=None, error=None,
+                 wait_for=None, exception=None):
+        self._name = name
+        self._events = events
+        if dependencies is None:
+            dependencies = []
+        self._dependencies = dependencies
+        self._run_error = error
+        self._error = None
+        self._wait_for = wait_for
+        self._exception = exception
+        self.started = threading.Event()
+        self.run_count = 0
+
+    def get_name(self):
+        return self._name
+
+    def get_dir(self):
+        return '/foo/' + self._name
+
+    def get_dir_name(self):
+        return self._name
+
+    def get_status(self):
+        return 'unknown'
+
+    def get_error(self):
+        return self._error
+
+    def set_error(self, error):
+        self._error = error
+
+    def get_dependencies(self):
+        return [FakeTask(d, []) for d in self._dependencies]
+
+    def run(self):
+        self.run_count += 1
+        self._events.append('start ' + self._name)
+        self.started.set()
+        if self._wait_for is not None:
+            if not self._wait_for.started.wait(10):
+                self._error = 'timed out waiting for ' + \
+                              self._wait_for.get_name()
+        if self._exception is not None:
+            raise self._exception
+        self._error = self._run_error
+        self._events.append('end ' + self._name)
+
+
+class TestTaskScheduler(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def _get_scheduler(self, max_tasks, stages, events,
+                       barrier_stages=None):
+        def get_task_list(stage_name):
+            events.append('tasks ' + stage_name)
+            return stages[stage_name]
+
+        def get_lock(stage_name):
+            return FakeLock(stage_name, events)
+
+        return TaskScheduler(max_tasks, get_task_list, get_lock,
+                             barrier_stages=barrier_stages)
+
+    def test_independent_tasks_run_concurrently(self):
+        events = []
+        vina = FakeTask('vina', events)
+        # glide only finishes once vina has started so this would
+        # time out if tasks were run one at a time
+        glide = FakeTask('glide', events, wait_for=vina)
+        vina._wait_for = glide
+        sched = self._get_scheduler(2, {'glide': [glide],
+                                        'vina': [vina]}, events)
+        self.assertEqual(sched.run(['glide', 'vina']), 0)
+        self.assertEqual(glide.get_error(), None)
+        self.assertEqual(vina.get_error(), None)
+        self.assertEqual([n.state for n in sched.get_nodes()],
+                         [TaskNode.DONE, TaskNode.DONE])
+        self.assertEqual(events[:4], ['lock glide', 'tasks glide',
+                                      'lock vina', 'tasks vina'])
+        self.assertTrue('release glide' in events)
+        self.assertTrue('release vina' in events)
+
+    def test_dependencies_are_respected(self):
+        events = []
+        prep = FakeTask('prep', events)
+        glide = FakeTask('glide', events, dependencies=['prep'])
+        chimera = FakeTask('chimera', events)
+        vina = FakeTask('vina', events, dependencies=['chimera'])
+        sched = self._get_scheduler(4, {'prep': [prep],
+                                        'chimera': [chimera],
+                                        'glide': [glide],
+                                        'vina': [vina]}, events)
+        self.assertEqual(sched.run(['prep', 'chimera', 'glide', 'vina']), 0)
+        self.assertTrue(events.index('end prep') <
+                        events.index('start glide'))
+        self.assertTrue(events.index('end chimera') <
+                        events.index('start vina'))
+        # lock of stage is released after its task finishes
+        self.assertTrue(events.index('end prep') <
+                        events.index('release prep'))
+        nodes = sched.get_nodes()
+        self.assertEqual(nodes[2].dependencies, [nodes[0]])
+        self.assertEqual(nodes[3].dependencies, [nodes[1]])
+
+    def test_dependency_not_in_graph_is_ignored(self):
+        events = []
+        glide = FakeTask('glide', events, dependencies=['prep'])
+        sched = self._get_scheduler(2, {'glide': [glide]}, events)
+        self.assertEqual(sched.run(['glide']), 0)
+        self.assertEqual(glide.run_count, 1)
+
+    def test_failed_task_skips_dependents(self):
+        events = []
+        prep = FakeTask('prep', events, error='prep failed')
+        glide = FakeTask('glide', events, dependencies=['prep'])
+        chimera = FakeTask('chimera', events)
+        evaluation = FakeTask('evaluation', events)
+        sched = self._get_scheduler(1, {'prep': [prep],
+                                        'chimera': [chimera],
+                                        'glide': [glide],
+                                        'evaluation': [evaluation]},
+                                    events,
+                                    barrier_stages=['evaluation'])
+        self.assertEqual(sched.run(['prep', 'chimera', 'glide',
+                                    'evaluation']), 1)
+        self.assertEqual(prep.run_count, 1)
+        self.assertEqual(glide.run_count, 0)
+        self.assertEqual(chimera.run_count, 1)
+        self.assertEqual(evaluation.run_count, 0)
+        self.assertFalse('tasks evaluation' in events)
+        self.assertEqual([n.state for n in sched.get_nodes()],
+                         [TaskNode.FAILED, TaskNode.DONE,
+                          TaskNode.SKIPPED])
+        self.assertTrue('release glide' in events)
+
+    def test_task_exception_is_error(self):
+        events = []
+        prep = FakeTask('prep', events, exception=Exception('doh'))
+        sched = self._get_scheduler(2, {'prep': [prep]}, events)
+        self.assertEqual(sched.run(['prep']), 1)
+        self.assertEqual(prep.get_error(),
+                         'Caught Exception running task: doh')
+
+    def test_barrier_stage_added_after_earlier_tasks_finish(self):
+        events = []
+        glide = FakeTask('glide', events)
+        eval_one = FakeTask('evalone', events)
+        eval_two = FakeTask('evaltwo', events)
+        sched = self._get_scheduler(3, {'glide': [glide],
+                                        'evaluation': [eval_one,
+                                                       eval_two]},
+                                    events,
+                                    barrier_stages=['evaluation'])
+        self.assertEqual(sched.run(['glide', 'evaluation']), 0)
+        self.assertTrue(events.index('end glide') <
+                        events.index('tasks evaluation'))
+        self.assertEqual(eval_one.run_count, 1)
+        self.assertEqual(eval_two.run_count, 1)
+
+    def test_empty_and_none_task_lists(self):
+        events = []
+        prep = FakeTask('prep', events)
+        sched = self._get_scheduler(2, {'empty': [], 'prep': [prep]},
+                                    events)
+        self.assertEqual(sched.run(['empty', 'prep']), 2)
+        self.assertEqual(prep.run_count, 0)
+        self.assertTrue('release empty' in events)
+
+        events = []
+        sched = self._get_scheduler(2, {'none': None}, events)
+        self.assertEqual(sched.run(['none']), 3)
+        self.assertEqual(events, ['lock none', 'tasks none',
+                                  'release none'])
+
+    def test_get_lock_raises_exception(self):
+        events = []
+        prep = FakeTask('prep', events)
+
+        def get_task_list(stage_name):
+            return [prep]
+
+        def get_lock(stage_name):
+            if stage_name == 'glide':
+                raise Exception('celpprunner with pid 1 is running')
+            return FakeLock(stage_name, events)
+
+        sched = TaskScheduler(2, get_task_list, get_lock)
+        try:
+            sched.run(['prep', 'glide'])
+            self.fail('Expected exception')
+        except Exception as e:
+            self.assertEqual(str(e), 'celpprunner with pid 1 is running')
+        self.assertEqual(prep.run_count, 1)
+        self.assertEqual(events[-1], 'release prep')
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,6 +14,7 @@ import platform
 import os
 import pwd
 import gzip
+import signal
 from email.mime.multipart import MIMEMultipart
 
 from mock import Mock
@@ -683,6 +684,61 @@ class TestD3rTask(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_external_command_streams_and_truncates_output(self):
+        temp_dir = tempfile.mkdtemp()
+        orig_max_chars = D3RTask.MAX_CHARS_FOR_EMAIL_STR
+        try:
+            D3RTask.MAX_CHARS_FOR_EMAIL_STR = 8
+            params = D3RParameters()
+            task = D3RTask(None, params)
+            task.set_name('foo')
+            task.set_stage(1)
+            task.set_path(temp_dir)
+            task.create_dir()
+            task.set_path(temp_dir)
+            self.assertEquals(0, task.run_external_command('hi',
+                                                           'echo 123456789 '
+                                                           'abcdefgh',
+                                                           True))
+            lines = task.get_email_log().split('\n')
+            self.assertTrue(lines[1].startswith('Command hi took '))
+            self.assertTrue(' sys), peak RSS ' in lines[1])
+            self.assertTrue(lines[1].endswith(' MB, 19 bytes stdout, '
+                                              '0 bytes stderr'))
+            f = open(os.path.join(task.get_dir(), 'hi.stdout'), 'r')
+            self.assertEqual(f.read(), '123456789 abcdefgh\n')
+            f.close()
+
+            self.assertEquals(2, task.run_external_command('bye',
+                                                           'ls 123456789'
+                                                           'abcdefgh',
+                                                           False))
+            self.assertTrue(D3RTask.TEXT_TRUNCATED_STR in
+                            task.get_email_log())
+            self.assertEquals(task.get_error(), None)
+        finally:
+            D3RTask.MAX_CHARS_FOR_EMAIL_STR = orig_max_chars
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_timeout_in_summary(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            task = D3RTask(None, params)
+            task.set_name('foo')
+            task.set_stage(1)
+            task.set_path(temp_dir)
+            task.create_dir()
+            task.set_path(temp_dir)
+            self.assertEquals(-signal.SIGTERM,
+                              task.run_external_command('hi', 'sleep 60',
+                                                        True, timeout=0.5))
+            lines = task.get_email_log().split('\n')
+            self.assertTrue(lines[1].endswith(', timeout, terminated'))
+            self.assertEquals(task.get_status(), D3RTask.ERROR_STATUS)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_smtp_emailer_generate_from_address_using_login_and_host(self):
         emailer = SmtpEmailer()
         val = emailer.generate_from_address_using_login_and_host()
@@ -25,6 +25,9 @@ Tests for `task` module.
 
 import shutil
 import signal
+import subprocess
+import sys
+import time
 from datetime import date
 from d3r.celpp import util
 from d3r.celpp.util import DownloadError
@@ -72,6 +75,32 @@ class TestUtil(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_find_previous_weekly_dataset(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            self.assertEqual(util.find_previous_weekly_dataset(None), None)
+            week = os.path.join(temp_dir, '2016', 'dataset.week.2')
+            os.makedirs(week)
+            self.assertEqual(util.find_previous_weekly_dataset(week), None)
+            self.assertEqual(util.find_previous_weekly_dataset(temp_dir),
+                             None)
+
+            os.makedirs(os.path.join(temp_dir, '2015', 'dataset.week.52'))
+            os.makedirs(os.path.join(temp_dir, '2015', 'dataset.week.9'))
+            self.assertEqual(util.find_previous_weekly_dataset(week),
+                             os.path.join(temp_dir, '2015',
+                                          'dataset.week.52'))
+
+            os.makedirs(os.path.join(temp_dir, '2016', 'dataset.week.1'))
+            os.makedirs(os.path.join(temp_dir, '2016', 'dataset.week.3'))
+            os.makedirs(os.path.join(temp_dir, '2017', 'dataset.week.1'))
+            self.assertEqual(util.find_previous_weekly_dataset(week),
+                             os.path.join(temp_dir, '2016',
+                                          'dataset.week.1'))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_find_latest_weekly_dataset(self):
         temp_dir = tempfile.mkdtemp()
 
@@ -891,6 +920,311 @@ class TestUtil(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_head_tail_buffer(self):
+        buf = util.HeadTailBuffer(None)
+        buf.write('hello ')
+        buf.write('there')
+        self.assertEqual(buf.get_value(), 'hello there')
+        self.assertEqual(buf.get_total_length(), 11)
+        self.assertFalse(buf.is_truncated())
+
+        buf = util.HeadTailBuffer(8)
+        buf.write('abcdefgh')
+        self.assertEqual(buf.get_value(), 'abcdefgh')
+        self.assertFalse(buf.is_truncated())
+
+        buf = util.HeadTailBuffer(8)
+        for val in ['abc', 'defgh', 'ijklm', 'nopqrstuvw', 'xyz']:
+            buf.write(val)
+        self.assertTrue(buf.is_truncated())
+        self.assertEqual(buf.get_total_length(), 26)
+        self.assertEqual(buf.get_value('|'), 'ab|uvwxyz')
+
+        buf = util.HeadTailBuffer(0)
+        buf.write('abc')
+        self.assertEqual(buf.get_value('|'), '|')
+
+    def test_run_external_command_to_files_success(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import sys\n')
+            f.write('for i in range(10000):\n')
+            f.write('    sys.stdout.write("line %05d\\n" % i)\n')
+            f.write('sys.stderr.write("somestderr")\n')
+            f.write('sys.exit(3)\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            out_file = os.path.join(temp_dir, 'out')
+            err_file = os.path.join(temp_dir, 'err')
+            ecode, out, err, stats = util.\
+                run_external_command_to_files(fakecmd + ' hi', out_file,
+                                              err_file, max_chars=44,
+                                              truncated_marker='|')
+            self.assertEqual(ecode, 3)
+            self.assertEqual(out, 'line 00000\n|line 09997\nline 09998\n'
+                                  'line 09999\n')
+            self.assertEqual(err, 'somestderr')
+            f = open(out_file, 'r')
+            lines = f.readlines()
+            f.close()
+            self.assertEqual(len(lines), 10000)
+            self.assertEqual(lines[5000], 'line 05000\n')
+            f = open(err_file, 'r')
+            self.assertEqual(f.read(), 'somestderr')
+            f.close()
+            self.assertEqual(stats['stdout_chars'], 110000)
+            self.assertEqual(stats['stderr_chars'], 10)
+            self.assertTrue(stats['max_rss_kb'] > 0)
+            self.assertTrue(stats['wall_time'] >= 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_to_files_no_such_command(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(temp_dir, 'out')
+            err_file = os.path.join(temp_dir, 'err')
+            try:
+                util.run_external_command_to_files(
+                    os.path.join(temp_dir, 'nope'), out_file, err_file)
+                self.fail('Expected OSError')
+            except OSError:
+                pass
+            self.assertFalse(os.path.exists(out_file))
+            self.assertFalse(os.path.exists(err_file))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_to_files_timeout_exceeded(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import sys\n')
+            f.write('import time\n')
+            f.write('sys.stdout.write("somestdout")\n')
+            f.write('sys.stdout.flush()\n')
+            f.write('time.sleep(120)\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            out_file = os.path.join(temp_dir, 'out')
+            err_file = os.path.join(temp_dir, 'err')
+            ecode, out, err, stats = util.\
+                run_external_command_to_files(fakecmd, out_file, err_file,
+                                              timeout=1, kill_delay=1)
+            self.assertEqual(ecode, -signal.SIGTERM)
+            self.assertEqual(out, 'somestdout')
+            self.assertEqual(err, '')
+            self.assertTrue(stats['wall_time'] < 10)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_with_timeout_kills_process_group(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import sys\n')
+            f.write('import subprocess\n')
+            f.write('sys.stdout.write("somestdout")\n')
+            f.write('sys.stdout.flush()\n')
+            # grandchild holds the output pipes open
+            f.write('subprocess.call(["sleep", "120"])\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+
+            start = time.time()
+            ecode, out, err = util.\
+                run_external_command_with_timeout(fakecmd, temp_dir,
+                                                  timeout=1,
+                                                  kill_delay=1)
+            self.assertTrue(time.time() - start < 10)
+            self.assertEqual(ecode, -signal.SIGTERM)
+            self.assertEqual(out, 'somestdout')
+            self.assertEqual(err, '')
+            # nothing is written to tmp_dir
+            self.assertEqual(os.listdir(temp_dir), ['fake.py'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_timeout_after_pipes_closed(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # command closes its stdout and stderr then keeps running
+            start = time.time()
+            ecode, out, err = util.\
+                run_external_command_with_timeout('/bin/sh -c "exec '
+                                                  '>/dev/null 2>&1; '
+                                                  'sleep 12"', temp_dir,
+                                                  timeout=1,
+                                                  kill_delay=1)
+            self.assertTrue(time.time() - start < 5)
+            self.assertEqual(ecode, -signal.SIGTERM)
+            self.assertEqual(out, '')
+            self.assertEqual(err, '')
+
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import os\n')
+            f.write('import time\n')
+            f.write('import signal\n')
+            f.write('signal.signal(signal.SIGTERM, signal.SIG_IGN)\n')
+            f.write('os.close(1)\n')
+            f.write('os.close(2)\n')
+            f.write('time.sleep(120)\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            out_file = os.path.join(temp_dir, 'out')
+            err_file = os.path.join(temp_dir, 'err')
+            ecode, out, err, stats = util.\
+                run_external_command_to_files(fakecmd, out_file, err_file,
+                                              timeout=0.5, kill_delay=0.5)
+            self.assertTrue(stats['wall_time'] < 10)
+            self.assertEqual(ecode, -signal.SIGKILL)
+            self.assertEqual(stats['exit_reason'],
+                             util.EXIT_REASON_TIMEOUT_KILL)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_to_files_exit_reasons(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(temp_dir, 'out')
+            err_file = os.path.join(temp_dir, 'err')
+            ecode, out, err, stats = util.\
+                run_external_command_to_files('false', out_file, err_file)
+            self.assertEqual(ecode, 1)
+            self.assertEqual(stats['exit_reason'], util.EXIT_REASON_EXITED)
+            self.assertTrue(stats['user_time'] >= 0)
+            self.assertTrue(stats['sys_time'] >= 0)
+
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import os\n')
+            f.write('import signal\n')
+            f.write('os.kill(os.getpid(), signal.SIGUSR1)\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            ecode, out, err, stats = util.\
+                run_external_command_to_files(fakecmd, out_file, err_file)
+            self.assertEqual(ecode, -signal.SIGUSR1)
+            self.assertEqual(stats['exit_reason'],
+                             util.EXIT_REASON_SIGNALED)
+
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import time\n')
+            f.write('import signal\n')
+            f.write('signal.signal(signal.SIGTERM, signal.SIG_IGN)\n')
+            f.write('time.sleep(120)\n')
+            f.flush()
+            f.close()
+            start = time.time()
+            ecode, out, err, stats = util.\
+                run_external_command_to_files(fakecmd, out_file, err_file,
+                                              timeout=0.5, kill_delay=0.5)
+            self.assertTrue(time.time() - start < 10)
+            self.assertEqual(ecode, -signal.SIGKILL)
+            self.assertEqual(stats['exit_reason'],
+                             util.EXIT_REASON_TIMEOUT_KILL)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_external_command_to_files_stays_in_session(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(temp_dir, 'out')
+            err_file = os.path.join(temp_dir, 'err')
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import os\n')
+            f.write('print os.getsid(0), os.getpgrp(), os.getpid()\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            ecode, out, err, stats = util.\
+                run_external_command_to_files(fakecmd, out_file, err_file)
+            self.assertEqual(ecode, 0)
+            sid, pgid, pid = [int(x) for x in out.split()]
+            self.assertEqual(sid, os.getsid(0))
+            self.assertEqual(pgid, pid)
+            self.assertNotEqual(pgid, os.getpgrp())
+            self.assertFalse(pid in util._running_process_groups)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _is_running(self, pid):
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        # orphan may not be reaped right away, zombie is not running
+        stat_file = '/proc/' + str(pid) + '/stat'
+        if os.path.isfile(stat_file):
+            f = open(stat_file, 'r')
+            state = f.read().split(')')[-1].split()[0]
+            f.close()
+            return state != 'Z'
+        return True
+
+    def test_stop_running_commands_on_exit(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            pid_file = os.path.join(temp_dir, 'pid')
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import os\n')
+            f.write('import time\n')
+            f.write('open("' + pid_file + '.tmp", "w").write('
+                    'str(os.getpid()))\n')
+            f.write('os.rename("' + pid_file + '.tmp", "' + pid_file +
+                    '")\n')
+            f.write('time.sleep(120)\n')
+            f.flush()
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            runner = os.path.join(temp_dir, 'runner.py')
+            f = open(runner, 'w')
+            f.write('from d3r.celpp import util\n')
+            f.write('util.stop_running_commands_on_exit()\n')
+            f.write('util.run_external_command_to_files("' + fakecmd +
+                    '", "' + os.path.join(temp_dir, 'out') + '", "' +
+                    os.path.join(temp_dir, 'err') + '")\n')
+            f.flush()
+            f.close()
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+                os.path.dirname(os.path.abspath(util.__file__))))
+            p = subprocess.Popen([sys.executable, runner], env=env)
+            start = time.time()
+            while not os.path.isfile(pid_file) and time.time() - start < 30:
+                time.sleep(0.1)
+            f = open(pid_file, 'r')
+            cmd_pid = int(f.read())
+            f.close()
+            os.kill(p.pid, signal.SIGTERM)
+            self.assertEqual(p.wait(), -signal.SIGTERM)
+            start = time.time()
+            while self._is_running(cmd_pid) and time.time() - start < 10:
+                time.sleep(0.1)
+            self.assertFalse(self._is_running(cmd_pid))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 
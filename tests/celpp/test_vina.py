@@ -45,6 +45,12 @@ class TestAutoDockVinaTask(unittest.TestCase):
             flist.index(errfile)
             flist.index(outfile)
 
+            # try with preparation cache summary
+            open(task.get_prep_cache_summary_file(), 'a').close()
+            flist = task.get_uploadable_files()
+            self.assertEqual(len(flist), 3)
+            flist.index(task.get_prep_cache_summary_file())
+
         finally:
             shutil.rmtree(temp_dir)
 
@@ -222,6 +228,67 @@ class TestAutoDockVinaTask(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_passes_vinaworkers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            params = D3RParameters()
+            params.vina = 'echo'
+            params.vinaworkers = 3
+            proteinligprep = ChimeraProteinLigPrepTask(temp_dir, params)
+            proteinligprep.create_dir()
+            open(os.path.join(proteinligprep.get_dir(),
+                              D3RTask.COMPLETE_FILE),
+                 'a').close()
+            vina = AutoDockVinaTask(temp_dir, params)
+            vina.run()
+            self.assertEqual(vina.get_error(), None)
+            f = open(os.path.join(vina.get_dir(), 'echo.stdout'), 'r')
+            out = f.read()
+            f.close()
+            self.assertEqual(out, '--structuredir ' +
+                             proteinligprep.get_dir() + ' --outdir ' +
+                             vina.get_dir() + ' --numworkers 3\n')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_passes_vinaprepcache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # fake vina script that writes a cache summary to --outdir
+            fakevina = os.path.join(temp_dir, 'fakevina.sh')
+            f = open(fakevina, 'w')
+            f.write('#!/bin/sh\n')
+            f.write('echo $*\n')
+            f.write('echo "Preparation cache: 3 hits, 1 misses" > $4/' +
+                    AutoDockVinaTask.PREP_CACHE_SUMMARY + '\n')
+            f.close()
+            os.chmod(fakevina, 0o755)
+            params = D3RParameters()
+            params.vina = fakevina
+            params.vinaprepcache = '/cache/vina'
+            params.vinaprepcachesize = 10
+            proteinligprep = ChimeraProteinLigPrepTask(temp_dir, params)
+            proteinligprep.create_dir()
+            open(os.path.join(proteinligprep.get_dir(),
+                              D3RTask.COMPLETE_FILE),
+                 'a').close()
+            vina = AutoDockVinaTask(temp_dir, params)
+            vina.run()
+            self.assertEqual(vina.get_error(), None)
+            f = open(os.path.join(vina.get_dir(), 'fakevina.sh.stdout'), 'r')
+            out = f.read()
+            f.close()
+            self.assertEqual(out, '--structuredir ' +
+                             proteinligprep.get_dir() + ' --outdir ' +
+                             vina.get_dir() + ' --prepcache /cache/vina '
+                             '--prepcachesize 10\n')
+            self.assertTrue('\nPreparation cache: 3 hits, 1 misses\n' in
+                            vina.get_email_log())
+            flist = vina.get_uploadable_files()
+            flist.index(vina.get_prep_cache_summary_file())
+        finally:
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 
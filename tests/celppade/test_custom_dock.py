@@ -13,8 +13,45 @@ import tempfile
 import shutil
 import os
 import time
+import subprocess
 
 from d3r.celppade.custom_dock import Dock
+from tests import fakeprograms
+
+
+class _TimedDock(Dock):
+    """Dock that copies inputs to outputs recording start and end
+       time in the output. Ligand prep of target 8bad raises and
+       docking to target 9slw hangs
+    """
+    def ligand_technical_prep(self, sci_prepped_lig, targ_info_dict={}):
+        if os.path.basename(os.path.dirname(os.getcwd())) == '8bad':
+            raise ValueError('bad ligand')
+        return [sci_prepped_lig]
+
+    def dock(self, tech_prepped_lig_list, tech_prepped_receptor_list,
+             output_receptor_pdb, output_lig_mol, targ_info_dict={}):
+        start = time.time()
+        if '9slw' in output_lig_mol:
+            time.sleep(60)
+        time.sleep(0.3)
+        shutil.copyfile(tech_prepped_receptor_list[0], output_receptor_pdb)
+        f = open(output_lig_mol, 'w')
+        f.write('%f %f' % (start, time.time()))
+        f.close()
+        return True
+
+
+class _SubprocessDock(Dock):
+    """Dock that starts a program which keeps writing to a file in the
+       docking directory and waits for it
+    """
+    def dock(self, tech_prepped_lig_list, tech_prepped_receptor_list,
+             output_receptor_pdb, output_lig_mol, targ_info_dict={}):
+        p = subprocess.Popen('while true; do echo tick >> ticks; '
+                             'sleep 0.1; done', shell=True)
+        p.wait()
+        return False
 
 
 class TestDock(unittest.TestCase):
@@ -247,8 +284,132 @@ class TestDock(unittest.TestCase):
             os.chdir(orig_dir)
             shutil.rmtree(temp_dir_abs)
 
-   
-           
+    def _make_sci_prep_dirs(self, temp_dir, targets):
+        """Creates protein and ligand sci prep dirs with `targets`
+           dict of target name to list of candidate ids
+        """
+        prot_dir = os.path.join(temp_dir, 'prot_sci_prep_dir')
+        lig_dir = os.path.join(temp_dir, 'lig_sci_prep_dir')
+        for targ, cands in targets.items():
+            os.makedirs(os.path.join(prot_dir, targ))
+            os.makedirs(os.path.join(lig_dir, targ))
+            open(os.path.join(prot_dir, targ, 'center.txt'),
+                 'w').write('1,2,3')
+            for cand in cands:
+                open(os.path.join(prot_dir, targ, 'LMCSS-' + targ + '_' +
+                                  cand + '_prepared.pdb'),
+                     'w').write(targ + ' ' + cand)
+            open(os.path.join(lig_dir, targ, 'lig_156_prepared.sdf'),
+                 'w').write('lig')
+            open(os.path.join(lig_dir, targ, targ + '.txt'),
+                 'w').write('query, ' + targ)
+        return prot_dir, lig_dir
+
+    def _get_dock_times(self, dock_dir, results):
+        times = []
+        for targ, docked_cands, secs, error in results:
+            for category, targ_id, cand_id in docked_cands or []:
+                f = open(os.path.join(dock_dir, targ, '%s-%s_%s_docked.mol' %
+                                      (category, targ_id, cand_id)))
+                start, end = f.read().split()
+                f.close()
+                times.append((float(start), float(end)))
+        return times
+
+    def test_run_dock_parallel_matches_serial(self):
+        orig_dir = os.getcwd()
+        temp_dir = tempfile.mkdtemp()
+        try:
+            prot_dir, lig_dir = self._make_sci_prep_dirs(
+                temp_dir, {'1fcz': ['1fcy', '1abc'], '2fcz': ['2abc'],
+                           '3fcz': ['3abc'], '8bad': ['8abc']})
+            serial_dir = os.path.join(temp_dir, 'serial')
+            os.mkdir(serial_dir)
+            d = _TimedDock()
+            results = d.run_dock(prot_dir, lig_dir, serial_dir)
+            self.assertEqual(os.getcwd(), serial_dir)
+            self.assertEqual([(r[0], sorted(r[1] or []), r[3])
+                              for r in results],
+                             [('1fcz', [('LMCSS', '1fcz', '1abc'),
+                                        ('LMCSS', '1fcz', '1fcy')], None),
+                              ('2fcz', [('LMCSS', '2fcz', '2abc')], None),
+                              ('3fcz', [('LMCSS', '3fcz', '3abc')], None),
+                              ('8bad', [],
+                               'technical ligand preparation failed')])
+            self.assertEqual(fakeprograms.get_max_overlap(
+                self._get_dock_times(serial_dir, results)), 1)
+
+            parallel_dir = os.path.join(temp_dir, 'parallel')
+            os.mkdir(parallel_dir)
+            presults = d.run_dock(prot_dir, lig_dir, parallel_dir,
+                                  numworkers=3)
+            self.assertEqual([(r[0], sorted(r[1] or []), r[3])
+                              for r in presults],
+                             [(r[0], sorted(r[1] or []), r[3])
+                              for r in results])
+            overlap = fakeprograms.get_max_overlap(
+                self._get_dock_times(parallel_dir, presults))
+            self.assertTrue(overlap > 1)
+            self.assertTrue(overlap <= 3)
+            for targ, cand in [('1fcz', '1abc'), ('3fcz', '3abc')]:
+                name = 'LMCSS-%s_%s_docked.pdb' % (targ, cand)
+                for out_dir in [serial_dir, parallel_dir]:
+                    f = open(os.path.join(out_dir, targ, name))
+                    self.assertEqual(f.read(), targ + ' ' + cand)
+                    f.close()
+            self.assertTrue(os.path.isdir(os.path.join(parallel_dir,
+                                                       '8bad')))
+        finally:
+            os.chdir(orig_dir)
+            shutil.rmtree(temp_dir)
+
+    def test_run_dock_target_timeout(self):
+        orig_dir = os.getcwd()
+        temp_dir = tempfile.mkdtemp()
+        try:
+            prot_dir, lig_dir = self._make_sci_prep_dirs(
+                temp_dir, {'1fcz': ['1fcy'], '9slw': ['9abc']})
+            dock_dir = os.path.join(temp_dir, 'dock_dir')
+            os.mkdir(dock_dir)
+            d = _TimedDock()
+            start = time.time()
+            results = d.run_dock(prot_dir, lig_dir, dock_dir,
+                                 target_timeout=2)
+            self.assertTrue(time.time() - start < 30)
+            self.assertEqual([(r[0], r[1], r[3]) for r in results],
+                             [('1fcz', [('LMCSS', '1fcz', '1fcy')], None),
+                              ('9slw', False, 'timed out after 2 seconds')])
+            self.assertTrue(os.path.isfile(os.path.join(
+                dock_dir, '1fcz', 'LMCSS-1fcz_1fcy_docked.mol')))
+            self.assertFalse(os.path.isfile(os.path.join(
+                dock_dir, '9slw', 'LMCSS-9slw_9abc_docked.mol')))
+        finally:
+            os.chdir(orig_dir)
+            shutil.rmtree(temp_dir)
+
+    def test_run_dock_target_timeout_kills_dock_programs(self):
+        orig_dir = os.getcwd()
+        temp_dir = tempfile.mkdtemp()
+        try:
+            prot_dir, lig_dir = self._make_sci_prep_dirs(
+                temp_dir, {'1fcz': ['1fcy']})
+            dock_dir = os.path.join(temp_dir, 'dock_dir')
+            os.mkdir(dock_dir)
+            d = _SubprocessDock()
+            results = d.run_dock(prot_dir, lig_dir, dock_dir,
+                                 target_timeout=1)
+            self.assertEqual([(r[0], r[3]) for r in results],
+                             [('1fcz', 'timed out after 1 seconds')])
+            ticks = os.path.join(dock_dir, '1fcz', 'LMCSS_1fcy_docking',
+                                 'ticks')
+            self.assertTrue(os.path.isfile(ticks))
+            size = os.path.getsize(ticks)
+            time.sleep(0.5)
+            self.assertEqual(os.path.getsize(ticks), size)
+        finally:
+            os.chdir(orig_dir)
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'churas'
+
+"""
+fakeprograms
+--------------------------------
+
+Helpers shared by the tests that replace external programs such as
+vina, glide or prepwizard with fake scripts.  The fake scripts append
+a line starting with the start and end time of each run to a log file
+which is read with `read_fake_log` to check how many runs overlapped.
+"""
+
+import os
+import stat
+
+
+def write_script(path, content):
+    """Writes `content` to executable script at `path`
+    :returns: `path`
+    """
+    f = open(path, 'w')
+    f.write(content)
+    f.close()
+    os.chmod(path, stat.S_IRWXU)
+    return path
+
+
+def make_stage_3(stage_3, targets, ext):
+    """Creates proteinligprep output in `stage_3` directory with
+       `targets` dict of target name to list of candidate receptor
+       prefixes.  Ligand and receptors are written as files ending in
+       _prepared.`ext` and targets starting with nocenter get an empty
+       directory
+    :returns: `stage_3`
+    """
+    os.mkdir(stage_3)
+    for target, candidates in targets.items():
+        target_dir = os.path.join(stage_3, target)
+        os.mkdir(target_dir)
+        if target.startswith('nocenter'):
+            continue
+        open(os.path.join(target_dir, 'center.txt'),
+             'w').write('1.0, 2.0, 3.0\n')
+        open(os.path.join(target_dir, 'lig_' + target + '_prepared.' +
+                          ext), 'w').write('ligand ' + target)
+        for candidate in candidates:
+            open(os.path.join(target_dir, candidate + '_prepared.' + ext),
+                 'w').write('receptor ' + candidate + '\n')
+    return stage_3
+
+
+def get_tree(path, skip_names=('final.log',)):
+    """Gets contents of files under `path` skipping files named in
+       `skip_names`
+    :returns: dict of path relative to `path` to file contents
+    """
+    tree = {}
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            if name in skip_names:
+                continue
+            full = os.path.join(root, name)
+            tree[os.path.relpath(full, path)] = open(full).read()
+    return tree
+
+
+def read_fake_log(fake_log):
+    """Reads and removes log written by fake programs, each line holds
+       start time, end time and other values of one run
+    :returns: list of tuples (start, end, other values...), empty if
+              there is no log
+    """
+    if not os.path.isfile(fake_log):
+        return []
+    runs = []
+    for line in open(fake_log):
+        words = line.split()
+        runs.append((float(words[0]), float(words[1])) + tuple(words[2:]))
+    os.remove(fake_log)
+    return runs
+
+
+def get_max_overlap(runs):
+    """Gets most runs active at once
+    :param runs: list of tuples starting with start and end time
+    """
+    events = []
+    for run in runs:
+        events.append((run[0], 1))
+        events.append((run[1], -1))
+    active = 0
+    max_active = 0
+    for t, change in sorted(events):
+        active += change
+        max_active = max(max_active, active)
+    return max_active
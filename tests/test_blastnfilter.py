@@ -42,6 +42,11 @@ class TestBlastnfilter(unittest.TestCase):
         self.assertEqual(result.blast_db, 'mypdbblastdb')
         self.assertEqual(result.pdb_path, 'mypdbdb')
         self.assertEqual(result.compinchi, 'mycompinchi')
+        self.assertEqual(result.numworkers, 1)
+        theargs.append('--numworkers')
+        theargs.append('4')
+        result = blastnfilter._parse_arguments('hi', theargs)
+        self.assertEqual(result.numworkers, 4)
         theargs.append('--log')
         theargs.append('DEBUG')
         result = blastnfilter._parse_arguments('hi', theargs)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_buildcomponentstore
+----------------------------------
+
+Tests for `buildcomponentstore` module.
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+
+from d3r import buildcomponentstore
+from d3r.blast.component_store import ComponentStore
+
+
+class TestBuildComponentStore(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_parse_arguments(self):
+        theargs = []
+        try:
+            buildcomponentstore._parse_arguments('hi', theargs)
+            self.fail('expected exception')
+        except:
+            pass
+
+        theargs = ['--compinchi', 'mycompinchi', '--out', 'myout']
+        result = buildcomponentstore._parse_arguments('hi', theargs)
+        self.assertEqual(result.compinchi, 'mycompinchi')
+        self.assertEqual(result.out, 'myout')
+        self.assertEqual(result.loglevel, 'WARNING')
+
+    def test_main_compinchi_not_found(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            theargs = ['buildcomponentstore.py', '--compinchi',
+                       os.path.join(temp_dir, 'doesnotexist'),
+                       '--out', os.path.join(temp_dir, 'store')]
+            self.assertEqual(buildcomponentstore.main(theargs), 2)
+            self.assertEqual(os.listdir(temp_dir), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_main_success(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            compinchi = os.path.join(temp_dir, 'Components-inchi.ich')
+            f = open(compinchi, 'w')
+            f.write('InChI=1S/CH4/h1H4\tCH4\n')
+            f.close()
+            store_path = os.path.join(temp_dir, 'store')
+            theargs = ['buildcomponentstore.py', '--compinchi', compinchi,
+                       '--out', store_path]
+            self.assertEqual(buildcomponentstore.main(theargs), 0)
+            store = ComponentStore(store_path)
+            self.assertEqual(store.get('CH4')['inchi'], 'InChI=1S/CH4/h1H4')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def tearDown(self):
+        pass
+
+if __name__ == '__main__':
+    unittest.main()
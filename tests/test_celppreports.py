@@ -14,6 +14,7 @@ import logging
 import os
 import os.path
 import shutil
+import json
 
 from d3r import celppreports
 from d3r.celpp.task import D3RParameters
@@ -72,6 +73,7 @@ class TestCelppReports(unittest.TestCase):
     def test_parse_arguments(self):
         theargs = ['--outdir', '/outdir', '--log', 'INFO', 'celppdir']
         result = celppreports._parse_arguments('hi', theargs)
+        self.assertEqual(result.rebuildindex, False)
         self.assertEqual(result.outdir, '/outdir')
         self.assertEqual(result.loglevel, 'INFO')
         self.assertEqual(result.celppdir, 'celppdir')
@@ -199,6 +201,98 @@ class TestCelppReports(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def _write_summary(self, blastdir, complexes, targets):
+        f = open(os.path.join(blastdir,
+                              BlastNFilterTask.SUMMARY_TXT), 'w')
+        f.write('INPUT SUMMARY\n')
+        f.write('  complexes:                           ' + complexes + '\n')
+        f.write('  dockable complexes:                   95\n')
+        f.write('  dockable monomers:                    71\n')
+        f.write('OUTPUT SUMMARY\n')
+        f.write('  Targets found:                        ' + targets + '\n')
+        f.close()
+
+    def _read_csv_rows(self, outdir):
+        f = open(os.path.join(outdir, 'blastnfilter.summary.csv'), 'r')
+        rows = f.readlines()[1:]
+        f.close()
+        return rows
+
+    def test_generate_reports_uses_index(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            theargs = D3RParameters()
+            theargs.celppdir = os.path.join(temp_dir, 'celpp')
+            outdir = os.path.join(temp_dir, 'outdir')
+            theargs.outdir = outdir
+            blast = BlastNFilterTask(temp_dir, theargs)
+            blastdirs = []
+            for week in ['10', '11']:
+                blastdir = os.path.join(theargs.celppdir, '2016',
+                                        'dataset.week.' + week,
+                                        blast.get_dir_name())
+                os.makedirs(blastdir)
+                blastdirs.append(blastdir)
+            self._write_summary(blastdirs[0], '178', '67')
+
+            celppreports.generate_reports(theargs)
+            self.assertEqual(self._read_csv_rows(outdir),
+                             ['10,2016,178,95,71,67\n',
+                              '11,2016,0,0,0,0\n'])
+            index_file = os.path.join(outdir, 'celppreports.index.json')
+            index = json.load(open(index_file, 'r'))
+            self.assertEqual(index['version'], 1)
+            self.assertEqual(sorted(index['weeks'].keys()),
+                             [os.path.join('2016', 'dataset.week.10'),
+                              os.path.join('2016', 'dataset.week.11')])
+            self.assertEqual(index['weeks'][os.path.join(
+                '2016', 'dataset.week.11')]['key'], None)
+
+            # rows of unchanged weeks come from the index
+            week10 = os.path.join('2016', 'dataset.week.10')
+            index['weeks'][week10]['csv'] = 'cached'
+            f = open(index_file, 'w')
+            json.dump(index, f)
+            f.close()
+            celppreports.generate_reports(theargs)
+            self.assertEqual(self._read_csv_rows(outdir),
+                             ['cached\n', '11,2016,0,0,0,0\n'])
+
+            # new and changed summaries are parsed
+            self._write_summary(blastdirs[1], '5', '3')
+            celppreports.generate_reports(theargs)
+            self.assertEqual(self._read_csv_rows(outdir),
+                             ['cached\n', '11,2016,5,95,71,3\n'])
+            self._write_summary(blastdirs[0], '1781', '67')
+            celppreports.generate_reports(theargs)
+            self.assertEqual(self._read_csv_rows(outdir),
+                             ['10,2016,1781,95,71,67\n',
+                              '11,2016,5,95,71,3\n'])
+
+            # rebuild ignores index
+            index = json.load(open(index_file, 'r'))
+            index['weeks'][week10]['csv'] = 'cached'
+            f = open(index_file, 'w')
+            json.dump(index, f)
+            f.close()
+            theargs.rebuildindex = True
+            celppreports.generate_reports(theargs)
+            self.assertEqual(self._read_csv_rows(outdir)[0],
+                             '10,2016,1781,95,71,67\n')
+
+            # corrupt index is ignored
+            f = open(index_file, 'w')
+            f.write('{not json')
+            f.close()
+            theargs.rebuildindex = False
+            celppreports.generate_reports(theargs)
+            self.assertEqual(self._read_csv_rows(outdir),
+                             ['10,2016,1781,95,71,67\n',
+                              '11,2016,5,95,71,3\n'])
+            self.assertEqual(json.load(open(index_file, 'r'))['version'], 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_main_where_generate_reports_raises_error(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -156,6 +156,15 @@ class TestCelppRunner(unittest.TestCase):
         self.assertEqual(result.rdkitpython, '')
         self.assertEqual(result.summaryemail, None)
         self.assertEqual(result.postevaluation, 'post_evaluation.py')
+        self.assertEqual(result.maxparalleltasks, 1)
+        self.assertEqual(result.genchallengeworkers, 1)
+        self.assertEqual(result.evaluationworkers, 1)
+        self.assertEqual(result.vinaworkers, 1)
+        self.assertEqual(result.glideworkers, 1)
+        self.assertEqual(result.prepligandworkers, 1)
+        self.assertEqual(result.prepproteinworkers, 1)
+        self.assertEqual(result.vinaprepcache, None)
+        self.assertEqual(result.vinaprepcachesize, 1024)
         theargs = ['foo', '--stage', 'dock,glide', '--email', 'b@b.com,h@h',
                    '--log', 'ERROR',
                    '--blastnfilter', '/bin/blastnfilter.py',
@@ -167,6 +176,14 @@ class TestCelppRunner(unittest.TestCase):
                    '--evaluation', '/bin/evaluation.py',
                    '--makeblastdb', '/bin/makeblastdb',
                    '--genchallenge', '/bin/gen.py',
+                   '--genchallengeworkers', '4',
+                   '--evaluationworkers', '2',
+                   '--vinaworkers', '3',
+                   '--glideworkers', '5',
+                   '--prepligandworkers', '2',
+                   '--prepproteinworkers', '8',
+                   '--vinaprepcache', '/cache/vina',
+                   '--vinaprepcachesize', '50',
                    '--chimeraprep', '/bin/chimeraprep.py',
                    '--skipimportwait',
                    '--importretry', '10',
@@ -189,6 +206,14 @@ class TestCelppRunner(unittest.TestCase):
         self.assertEqual(result.makeblastdb, '/bin/makeblastdb')
         self.assertEqual(result.vina, '/bin/vina.py')
         self.assertEqual(result.genchallenge, '/bin/gen.py')
+        self.assertEqual(result.genchallengeworkers, 4)
+        self.assertEqual(result.evaluationworkers, 2)
+        self.assertEqual(result.vinaworkers, 3)
+        self.assertEqual(result.glideworkers, 5)
+        self.assertEqual(result.prepligandworkers, 2)
+        self.assertEqual(result.prepproteinworkers, 8)
+        self.assertEqual(result.vinaprepcache, '/cache/vina')
+        self.assertEqual(result.vinaprepcachesize, 50)
         self.assertEqual(result.chimeraprep, '/bin/chimeraprep.py')
         self.assertEqual(result.skipimportwait, True)
         self.assertEqual(result.importretry, 10)
@@ -660,6 +685,54 @@ class TestCelppRunner(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_run_stages_makedb_through_vina_in_parallel(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            theargs = D3RParameters()
+            theargs.pdbdb = '/pdbdb'
+            theargs.celppdir = os.path.join(temp_dir)
+            theargs.maxparalleltasks = 3
+            theargs.stage = 'makedb,import,blast,challengedata,proteinligprep,' \
+                            'chimeraprep,glide,vina'
+
+            d_import_dir = os.path.join(temp_dir, '2015', 'dataset.week.1',
+                                        TestCelppRunner.IMPORT_DIR_NAME)
+            os.makedirs(d_import_dir)
+            open(os.path.join(d_import_dir,
+                              D3RTask.COMPLETE_FILE), 'a').close()
+
+            fakegz = os.path.join(temp_dir, 'fake.gz')
+
+            f = gzip.open(fakegz, 'wb')
+            f.write('hello\n')
+            f.flush()
+            f.close()
+
+            theargs.pdbsequrl = 'file://' + fakegz
+            theargs.pdbfileurl = 'file://' + fakegz
+
+            theargs.compinchi = 'file://' + fakegz
+            theargs.version = '1.0.0'
+            theargs.makeblastdb = 'echo'
+            theargs.blastnfilter = 'echo'
+            theargs.postanalysis = 'true'
+            theargs.proteinligprep = 'echo'
+            theargs.glide = 'echo'
+            theargs.vina = 'echo'
+            theargs.genchallenge = 'echo'
+            theargs.chimeraprep = 'echo'
+            self.assertEqual(celpprunner.run_stages(theargs), 0)
+            week_dir = os.path.join(temp_dir, '2015', 'dataset.week.1')
+            for name in ['stage.6.glide', 'stage.6.autodockvina']:
+                self.assertTrue(os.path.isfile(os.path.join(
+                    week_dir, name, D3RTask.COMPLETE_FILE)))
+            self.assertEqual([x for x in os.listdir(week_dir)
+                              if x.endswith('.lockpid')], [])
+
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_get_task_list_for_stage_extsubmission(self):
         temp_dir = tempfile.mkdtemp()
         try:
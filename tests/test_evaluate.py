@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_evaluate
+----------------------------------
+
+Tests for `evaluate` module.
+"""
+
+import unittest
+import tempfile
+import shutil
+import subprocess
+import sys
+import os
+import json
+import pickle
+
+from d3r import evaluate
+
+
+def _write_journal(path, entries, tail=''):
+    f = open(path, 'w')
+    for entry in entries:
+        f.write(json.dumps(entry) + '\n')
+    f.write(tail)
+    f.close()
+
+
+class TestEvaluate(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _fake_score_target(self, target_dir, dock_dir, pdb_protein_path,
+                           current_dir, blastnfilter_dir,
+                           challenge_data_path, result_container):
+        self._scored.append(target_dir)
+        if target_dir in self._fail_targets:
+            raise RuntimeError('killed while evaluating ' + target_dir)
+        os.mkdir(os.path.join(current_dir, target_dir))
+        result_container.register(target_dir, 'LMCSS',
+                                  float(target_dir[0]))
+
+    def _run_main_score(self, targets):
+        dock_dir = os.path.join(self._temp_dir, 'dock')
+        eval_dir = os.path.join(self._temp_dir, 'eval')
+        for d in [dock_dir, eval_dir]:
+            if not os.path.isdir(d):
+                os.mkdir(d)
+        for target in targets:
+            if not os.path.isdir(os.path.join(dock_dir, target)):
+                os.mkdir(os.path.join(dock_dir, target))
+        self._scored = []
+        curdir = os.getcwd()
+        try:
+            evaluate.main_score(dock_dir, None, eval_dir, None, None)
+        finally:
+            os.chdir(curdir)
+        return eval_dir
+
+    def _read_pickle(self, path):
+        f = open(path, 'r')
+        data = pickle.load(f)
+        f.close()
+        return data
+
+    def test_open_journal(self):
+        journal = os.path.join(self._temp_dir, evaluate.RESULT_JOURNAL)
+        container = evaluate.data_container()
+        # no journal yet
+        self.assertEqual(container.open_journal(journal), [])
+        container.close_journal()
+        self.assertEqual(container._data, {})
+
+        # 1abc finished, 2abc unfinished and last line cut off
+        _write_journal(journal,
+                       [{'target': '1abc', 'type': 'LMCSS', 'value': 1.5},
+                        {'target': '2abc', 'type': 'LMCSS', 'value': 2.5},
+                        {'target': '1abc', 'type': 'SMCSS', 'value': 3.5},
+                        {'target': '1abc', 'finished': True}],
+                       tail='{"target": "2abc", "ty')
+        container = evaluate.data_container()
+        self.assertEqual(container.open_journal(journal), ['1abc'])
+        self.assertEqual(container._data,
+                         {'1abc': {'LMCSS': 1.5, 'SMCSS': 3.5}})
+        # values registered from now on are appended to the journal
+        container.register('3abc', 'LMCSS', 4.5)
+        container.finish_target('3abc')
+        container.close_journal()
+
+        container = evaluate.data_container()
+        self.assertEqual(container.open_journal(journal), ['1abc', '3abc'])
+        container.close_journal()
+        self.assertEqual(container._data,
+                         {'1abc': {'LMCSS': 1.5, 'SMCSS': 3.5},
+                          '3abc': {'LMCSS': 4.5}})
+        f = open(journal, 'r')
+        self.assertFalse('2abc' in f.read())
+        f.close()
+        self.assertFalse(os.path.isfile(journal + '.tmp'))
+
+    def test_main_score_skips_finished_targets(self):
+        orig_score_target = evaluate.score_target
+        evaluate.score_target = self._fake_score_target
+        self._fail_targets = []
+        try:
+            eval_dir = os.path.join(self._temp_dir, 'eval')
+            os.mkdir(eval_dir)
+            # earlier run finished 1abc and was stopped during 2abc
+            os.mkdir(os.path.join(eval_dir, '2abc'))
+            open(os.path.join(eval_dir, '2abc', 'partial'), 'w').close()
+            _write_journal(os.path.join(eval_dir, evaluate.RESULT_JOURNAL),
+                           [{'target': '1abc', 'type': 'LMCSS',
+                             'value': 1.0},
+                            {'target': '1abc', 'finished': True},
+                            {'target': '2abc', 'type': 'LMCSS',
+                             'value': 9.0}])
+            self._run_main_score(['1abc', '2abc', '3abc'])
+            self.assertEqual(sorted(self._scored), ['2abc', '3abc'])
+            self.assertEqual(os.listdir(os.path.join(eval_dir, '2abc')), [])
+            self.assertEqual(self._read_pickle(os.path.join(
+                eval_dir, evaluate.RESULT_PICKLE)),
+                {'1abc': {'LMCSS': 1.0}, '2abc': {'LMCSS': 2.0},
+                 '3abc': {'LMCSS': 3.0}})
+            self.assertTrue(os.path.isfile(os.path.join(eval_dir,
+                                                        'RMSD.txt')))
+            self.assertFalse(os.path.isfile(os.path.join(
+                eval_dir, evaluate.RESULT_JOURNAL)))
+        finally:
+            evaluate.score_target = orig_score_target
+
+    def test_main_score_writes_results_while_running(self):
+        orig_score_target = evaluate.score_target
+        orig_interval = evaluate.RESULT_WRITE_INTERVAL
+        evaluate.score_target = self._fake_score_target
+        evaluate.RESULT_WRITE_INTERVAL = 2
+        targets = ['1abc', '2abc', '3abc', '4abc', '5abc']
+        try:
+            dock_dir = os.path.join(self._temp_dir, 'dock')
+            os.mkdir(dock_dir)
+            for target in targets:
+                os.mkdir(os.path.join(dock_dir, target))
+            # run is stopped while evaluating the 4th target
+            order = list(os.walk(dock_dir))[0][1]
+            self._fail_targets = [order[3]]
+            try:
+                self._run_main_score(targets)
+                self.fail('expected RuntimeError')
+            except RuntimeError:
+                pass
+            eval_dir = os.path.join(self._temp_dir, 'eval')
+            pickle_file = os.path.join(eval_dir, evaluate.RESULT_PICKLE)
+            self.assertEqual(sorted(self._read_pickle(pickle_file).keys()),
+                             sorted(order[:2]))
+            self.assertTrue(os.path.isfile(os.path.join(eval_dir,
+                                                        'RMSD.csv')))
+
+            # compacting the journal adds the 3rd target
+            self.assertEqual(evaluate.compact_journal(eval_dir), order[:3])
+            self.assertEqual(sorted(self._read_pickle(pickle_file).keys()),
+                             sorted(order[:3]))
+            self.assertFalse(os.path.isfile(os.path.join(
+                eval_dir, evaluate.RESULT_JOURNAL)))
+            self.assertEqual(evaluate.compact_journal(eval_dir), None)
+        finally:
+            evaluate.score_target = orig_score_target
+            evaluate.RESULT_WRITE_INTERVAL = orig_interval
+
+    @unittest.skipIf(evaluate.HAS_OPENEYE, 'OpenEye is installed')
+    def test_openeye_backend_without_openeye_fails_at_parsing(self):
+        script = os.path.splitext(evaluate.__file__)[0] + '.py'
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(script))
+        p = subprocess.Popen([sys.executable, script,
+                              '--mcsbackend', 'openeye'],
+                             cwd=self._temp_dir, env=env,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out, err = p.communicate()
+        self.assertEqual(p.returncode, 2)
+        self.assertTrue('--mcsbackend openeye requires the OpenEye '
+                        'toolkit' in err)
+        self.assertFalse('NameError' in err)
+
+
+if __name__ == '__main__':
+    unittest.main()
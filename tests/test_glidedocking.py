@@ -0,0 +1,300 @@
+__author__ = 'churas'
+
+"""
+test_glidedocking
+--------------------------------
+
+Tests for `glidedocking` module.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+
+from d3r import glidedocking
+from tests import fakeprograms
+
+# fake $SCHRODINGER/glide, mimics job control: without -WAIT it prints
+# a JobId, returns right away and runs the job in a detached process
+# which records its status under FAKE_JOBS. Each job logs start and end
+# time to FAKE_LOG. Grid jobs of receptors starting with fail die
+FAKE_GLIDE = """#!/usr/bin/env python
+import os
+import sys
+import time
+args = sys.argv[1:]
+wait = '-WAIT' in args
+infile = [a for a in args if a != '-WAIT'][0]
+opts = {}
+for line in open(infile):
+    if not line.strip():
+        continue
+    key, value = line.split(None, 1)
+    opts[key] = value.strip()
+job_id = 'fakehost-0-%d' % os.getpid()
+status_file = os.path.join(os.environ['FAKE_JOBS'], job_id)
+
+
+def set_status(status):
+    open(status_file + '.tmp', 'w').write(infile + ' ' + status + '\\n')
+    os.rename(status_file + '.tmp', status_file)
+
+
+def work():
+    start = time.time()
+    status = 'completed'
+    if 'RECEP_FILE' in opts:
+        kind = 'grid'
+        time.sleep(0.3)
+        if opts['RECEP_FILE'].startswith('fail'):
+            status = 'died'
+        else:
+            open(opts['GRIDFILE'], 'w').write('grid ' + opts['RECEP_FILE'])
+    else:
+        kind = 'dock'
+        grid = open(opts['GRIDFILE']).read()
+        ligand = open(opts['LIGANDFILE']).read()
+        time.sleep(0.3)
+        open(infile.replace('_dock.in', '_dock_pv.maegz'),
+             'w').write(grid + ' ' + ligand)
+    f = open(os.environ['FAKE_LOG'], 'a')
+    f.write('%f %f %s %s\\n' % (start, time.time(), kind, infile))
+    f.close()
+    set_status(status)
+
+if wait:
+    work()
+    sys.exit(0)
+set_status('launched')
+sys.stdout.write('Launching JOB\\nJobId: ' + job_id + '\\n')
+sys.stdout.flush()
+if os.fork() == 0:
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in [0, 1, 2]:
+        os.dup2(devnull, fd)
+    try:
+        work()
+    finally:
+        os._exit(0)
+"""
+
+# fake $SCHRODINGER/jobcontrol, lists status of a job
+FAKE_JOBCONTROL = """#!/usr/bin/env python
+import os
+import sys
+job_id = sys.argv[2]
+print('JobId                JobName      Status')
+print('-------------------- ------------ ---------')
+status_file = os.path.join(os.environ['FAKE_JOBS'], job_id)
+if os.path.isfile(status_file):
+    name, status = open(status_file).read().split()
+    print(job_id + ' ' + name + ' ' + status)
+"""
+
+# fake $SCHRODINGER/jobcontrol whose listing comes back empty on every
+# other call for a job, like job control under load
+FAKE_FLAKY_JOBCONTROL = """#!/usr/bin/env python
+import os
+import sys
+job_id = sys.argv[2]
+status_file = os.path.join(os.environ['FAKE_JOBS'], job_id)
+calls_file = status_file + '.calls'
+calls = 0
+if os.path.isfile(calls_file):
+    calls = int(open(calls_file).read())
+open(calls_file, 'w').write(str(calls + 1))
+if calls % 2 == 1 or not os.path.isfile(status_file):
+    sys.exit(1)
+name, status = open(status_file).read().split()
+print(job_id + ' ' + name + ' ' + status)
+"""
+
+# fake $SCHRODINGER/run split_structure.py, writes receptor and 2 poses
+FAKE_RUN = """#!/usr/bin/env python
+import sys
+pv = open(sys.argv[5]).read()
+prefix = sys.argv[6][:-4]
+open(prefix + '_receptor1.mae', 'w').write('receptor ' + pv)
+for i in [1, 2]:
+    open(prefix + '_ligand%d.mae' % i, 'w').write('pose %d %s' % (i, pv))
+"""
+
+# fake $SCHRODINGER/utilities/structconvert, copies input to output
+FAKE_STRUCTCONVERT = """#!/usr/bin/env python
+import sys
+import shutil
+shutil.copy(sys.argv[1], sys.argv[2])
+"""
+
+
+class TestGlideDocking(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.mkdtemp()
+        self._orig_env = dict(os.environ)
+        schrodinger = os.path.join(self._temp_dir, 'schrodinger')
+        os.makedirs(os.path.join(schrodinger, 'utilities'))
+        for name, content in [('glide', FAKE_GLIDE),
+                              ('jobcontrol', FAKE_JOBCONTROL),
+                              ('run', FAKE_RUN),
+                              ('utilities/structconvert',
+                               FAKE_STRUCTCONVERT)]:
+            fakeprograms.write_script(os.path.join(schrodinger, name),
+                                      content)
+        jobs = os.path.join(self._temp_dir, 'jobs')
+        os.mkdir(jobs)
+        self._fake_log = os.path.join(self._temp_dir, 'fake.log')
+        os.environ['SCHRODINGER'] = schrodinger
+        os.environ['FAKE_JOBS'] = jobs
+        os.environ['FAKE_LOG'] = self._fake_log
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self._orig_env)
+        os.chdir(self._cwd)
+        shutil.rmtree(self._temp_dir)
+
+    def _make_stage_3(self, targets):
+        """Creates proteinligprep output with `targets` dict of target
+           name to list of candidate receptor prefixes
+        """
+        return fakeprograms.make_stage_3(os.path.join(self._temp_dir,
+                                                      'stage3'),
+                                         targets, 'mae')
+
+    def test_submit_and_get_job_status(self):
+        workdir = os.path.join(self._temp_dir, 'work')
+        os.mkdir(workdir)
+        grid_in, out_grid = glidedocking.write_grid_input('1, 2, 3',
+                                                          'r.mae', 'r',
+                                                          working_dir=workdir)
+        self.assertEqual((grid_in, out_grid), ('r_grid.in', 'r.zip'))
+        job_id = glidedocking.submit_glide_job(grid_in, workdir)
+        self.assertTrue(job_id.startswith('fakehost-0-'))
+        self.assertTrue(glidedocking.get_job_status(job_id) in
+                        ['launched', 'completed'])
+        self.assertEqual(glidedocking.get_job_status('nosuchjob'),
+                         'unknown')
+
+        # submission output without a JobId
+        os.environ['SCHRODINGER'] = '/bin/true;echo'
+        self.assertEqual(glidedocking.submit_glide_job(grid_in, workdir),
+                         None)
+
+    def test_main_glide_concurrent_matches_serial(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'SMCSS-1abd_1abd'],
+                   '2abc': ['LMCSS-2abc_2abc', 'hiResApo-2abe_2abe']}
+        stage_3 = self._make_stage_3(targets)
+        serial_dir = os.path.join(self._temp_dir, 'serial')
+        os.mkdir(serial_dir)
+        jobs = glidedocking.main_glide(stage_3, serial_dir,
+                                       poll_interval=0.05)
+        self.assertEqual(len(jobs), 8)
+        self.assertEqual(set([j.status for j in jobs]), set(['completed']))
+        serial_runs = fakeprograms.read_fake_log(self._fake_log)
+        self.assertEqual(fakeprograms.get_max_overlap(serial_runs), 1)
+        # each dock job runs right after the grid of its candidate
+        self.assertEqual([r[2] for r in sorted(serial_runs)],
+                         ['grid', 'dock'] * 4)
+
+        parallel_dir = os.path.join(self._temp_dir, 'parallel')
+        os.mkdir(parallel_dir)
+        jobs = glidedocking.main_glide(stage_3, parallel_dir,
+                                       numworkers=3, poll_interval=0.05)
+        self.assertEqual(len(jobs), 8)
+        self.assertEqual(set([j.status for j in jobs]), set(['completed']))
+        for job in jobs:
+            self.assertTrue(job.end_time >= job.start_time)
+            self.assertTrue(job.start_time >= job.queue_time)
+        parallel_runs = fakeprograms.read_fake_log(self._fake_log)
+        self.assertTrue(fakeprograms.get_max_overlap(parallel_runs) > 1)
+        self.assertTrue(fakeprograms.get_max_overlap(parallel_runs) <= 3)
+        # docking of the first candidates starts before the last grid
+        started = [j.name for j in sorted(jobs, key=lambda j: j.start_time)]
+        self.assertEqual(started[:3], ['LMCSS-1abc_1abc grid',
+                                       'SMCSS-1abd_1abd grid',
+                                       'LMCSS-2abc_2abc grid'])
+        self.assertTrue(started.index('LMCSS-1abc_1abc dock') <
+                        started.index('hiResApo-2abe_2abe grid'))
+
+        serial_tree = fakeprograms.get_tree(serial_dir)
+        self.assertEqual(serial_tree, fakeprograms.get_tree(parallel_dir))
+        self.assertEqual(serial_tree[os.path.join(
+            '1abc', 'SMCSS-1abd_1abd_docked.mol')],
+            'pose 1 grid SMCSS-1abd_1abd_prepared.mae ligand 1abc')
+        self.assertEqual(serial_tree[os.path.join(
+            '2abc', 'hiResApo-2abe_2abe_docked.pdb')],
+            'receptor grid hiResApo-2abe_2abe_prepared.mae ligand 2abc')
+
+    def test_main_glide_failed_grid_skips_dock(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'fail-1abd_1abd']}
+        stage_3 = self._make_stage_3(targets)
+        out_dir = os.path.join(self._temp_dir, 'out')
+        os.mkdir(out_dir)
+        jobs = glidedocking.main_glide(stage_3, out_dir, numworkers=2,
+                                       poll_interval=0.05)
+        self.assertEqual(sorted([(j.name, j.status) for j in jobs]),
+                         [('LMCSS-1abc_1abc dock', 'completed'),
+                          ('LMCSS-1abc_1abc grid', 'completed'),
+                          ('fail-1abd_1abd grid', 'died')])
+        self.assertTrue(os.path.isfile(os.path.join(
+            out_dir, '1abc', 'LMCSS-1abc_1abc_docked.mol')))
+        self.assertFalse(os.path.isfile(os.path.join(
+            out_dir, '1abc', 'fail-1abd_1abd_docked.mol')))
+
+    def test_main_glide_unknown_status_does_not_end_job(self):
+        fakeprograms.write_script(os.path.join(os.environ['SCHRODINGER'],
+                                               'jobcontrol'),
+                                  FAKE_FLAKY_JOBCONTROL)
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'SMCSS-1abd_1abd']}
+        stage_3 = self._make_stage_3(targets)
+        out_dir = os.path.join(self._temp_dir, 'out')
+        os.mkdir(out_dir)
+        jobs = glidedocking.main_glide(stage_3, out_dir, numworkers=2,
+                                       poll_interval=0.05)
+        self.assertEqual(sorted([(j.name, j.status) for j in jobs]),
+                         [('LMCSS-1abc_1abc dock', 'completed'),
+                          ('LMCSS-1abc_1abc grid', 'completed'),
+                          ('SMCSS-1abd_1abd dock', 'completed'),
+                          ('SMCSS-1abd_1abd grid', 'completed')])
+        for candidate in targets['1abc']:
+            self.assertTrue(os.path.isfile(os.path.join(
+                out_dir, '1abc', candidate + '_docked.mol')))
+
+    def test_scheduler_gives_up_on_job_after_unknown_polls(self):
+        # job control never lists the job
+        fakeprograms.write_script(os.path.join(os.environ['SCHRODINGER'],
+                                               'jobcontrol'), '#!/bin/sh\n')
+        workdir = os.path.join(self._temp_dir, 'work')
+        os.mkdir(workdir)
+        grid_in, out_grid = glidedocking.write_grid_input('1, 2, 3',
+                                                          'r.mae', 'r',
+                                                          working_dir=workdir)
+        done = []
+        scheduler = glidedocking.GlideJobScheduler(poll_interval=0.05,
+                                                   max_unknown_polls=3)
+        scheduler.add(glidedocking.GlideJob('r grid', grid_in, workdir,
+                                            on_done=done.append))
+        jobs = scheduler.run()
+        self.assertEqual([(j.status, j.unknown_polls) for j in jobs],
+                         [('unknown', 3)])
+        self.assertEqual(done, jobs)
+
+    def test_main_glide_no_update_reuses_grid_and_dock(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc']}
+        stage_3 = self._make_stage_3(targets)
+        out_dir = os.path.join(self._temp_dir, 'out')
+        os.mkdir(out_dir)
+        glidedocking.main_glide(stage_3, out_dir, poll_interval=0.05)
+        self.assertEqual(len(fakeprograms.read_fake_log(self._fake_log)), 2)
+        jobs = glidedocking.main_glide(stage_3, out_dir, update=False,
+                                       poll_interval=0.05)
+        self.assertEqual(jobs, [])
+        self.assertTrue(os.path.isfile(os.path.join(
+            out_dir, '1abc', 'LMCSS-1abc_1abc_docked.mol')))
+
+if __name__ == '__main__':
+    unittest.main()
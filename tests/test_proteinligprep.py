@@ -0,0 +1,240 @@
+__author__ = 'churas'
+
+"""
+test_proteinligprep
+--------------------------------
+
+Tests for `proteinligprep` module.
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+
+from d3r import proteinligprep
+from d3r.utilities import prepjobs
+from tests import fakeprograms
+
+# fake $SCHRODINGER/ligprep, fails for smiles containing bad
+FAKE_LIGPREP = """#!/usr/bin/env python
+import sys
+smiles = open(sys.argv[7]).read()
+if 'bad' not in smiles:
+    open(sys.argv[9], 'w').write('ligprep ' + smiles)
+"""
+
+# fake $SCHRODINGER/run split_structure.py, writes receptor
+FAKE_RUN = """#!/usr/bin/env python
+import os
+import sys
+out = os.path.splitext(sys.argv[6])
+open(out[0] + '_receptor1' + out[1],
+     'w').write('receptor ' + open(sys.argv[5]).read())
+"""
+
+# fake $SCHRODINGER/utilities/prepwizard, logs start and end time to
+# file in FAKE_LOG env variable and fails for proteins starting with fail
+FAKE_PREPWIZARD = """#!/usr/bin/env python
+import os
+import sys
+import time
+start = time.time()
+time.sleep(0.3)
+if not sys.argv[2].startswith('fail'):
+    open(sys.argv[2], 'w').write('prepared ' + open(sys.argv[1]).read())
+f = open(os.environ['FAKE_LOG'], 'a')
+f.write('%f %f %s\\n' % (start, time.time(), sys.argv[2]))
+f.close()
+"""
+
+# fake $SCHRODINGER/utilities/pdbconvert, copies input to output
+FAKE_PDBCONVERT = """#!/usr/bin/env python
+import sys
+import shutil
+if len(sys.argv) == 5:
+    shutil.copy(sys.argv[2], sys.argv[4])
+"""
+
+
+class TestProteinLigPrep(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.mkdtemp()
+        self._orig_env = dict(os.environ)
+        self._orig_sleep_time = proteinligprep.PREPWIZARD_SLEEP_TIME
+        proteinligprep.PREPWIZARD_SLEEP_TIME = 0
+        schrodinger = os.path.join(self._temp_dir, 'schrodinger')
+        os.makedirs(os.path.join(schrodinger, 'utilities'))
+        for name, content in [('ligprep', FAKE_LIGPREP),
+                              ('run', FAKE_RUN),
+                              ('utilities/prepwizard', FAKE_PREPWIZARD),
+                              ('utilities/pdbconvert', FAKE_PDBCONVERT)]:
+            fakeprograms.write_script(os.path.join(schrodinger, name),
+                                      content)
+        self._fake_log = os.path.join(self._temp_dir, 'fake.log')
+        os.environ['SCHRODINGER'] = schrodinger
+        os.environ['FAKE_LOG'] = self._fake_log
+
+    def tearDown(self):
+        proteinligprep.PREPWIZARD_SLEEP_TIME = self._orig_sleep_time
+        os.environ.clear()
+        os.environ.update(self._orig_env)
+        os.chdir(self._cwd)
+        shutil.rmtree(self._temp_dir)
+
+    def _make_challenge_dir(self, targets):
+        """Creates challenge data dir with `targets` dict of target name
+           to list of candidate file prefixes
+        """
+        challenge = os.path.join(self._temp_dir, 'challenge')
+        os.mkdir(challenge)
+        for target, candidates in targets.items():
+            target_dir = os.path.join(challenge, target)
+            os.mkdir(target_dir)
+            open(os.path.join(target_dir, 'center.txt'),
+                 'w').write('1.0, 2.0, 3.0\n')
+            open(os.path.join(target_dir, 'lig_' + target + '.smi'),
+                 'w').write('CCO ' + target + '\n')
+            open(os.path.join(target_dir, 'LMCSS-' + target + '_' + target +
+                              '-156-lig.pdb'), 'w').write('ligand\n')
+            for candidate in candidates:
+                open(os.path.join(target_dir, candidate + '.pdb'),
+                     'w').write(candidate + '\n')
+        return challenge
+
+    def test_main_proteinprep_parallel_matches_serial(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'SMCSS-1abc_2xyz',
+                            'hiResApo-1abc_3xyz'],
+                   '2abc': ['LMCSS-2abc_2abc', 'hiResHolo-2abc_4xyz'],
+                   'toolong': ['LMCSS-toolong_1abc']}
+        challenge = self._make_challenge_dir(targets)
+        serial_dir = os.path.join(self._temp_dir, 'serial')
+        os.mkdir(serial_dir)
+        results = proteinligprep.main_proteinprep(challenge, None,
+                                                  serial_dir)
+        self.assertEqual([(os.path.basename(r[0]), r[1], r[2], r[3])
+                          for r in results],
+                         [('1abc', 'ligand', 'lig_1abc.smi', True),
+                          ('1abc', 'protein', 'LMCSS-1abc_1abc.pdb', True),
+                          ('1abc', 'protein', 'SMCSS-1abc_2xyz.pdb', True),
+                          ('1abc', 'protein', 'hiResApo-1abc_3xyz.pdb',
+                           True),
+                          ('2abc', 'ligand', 'lig_2abc.smi', True),
+                          ('2abc', 'protein', 'LMCSS-2abc_2abc.pdb', True),
+                          ('2abc', 'protein', 'hiResHolo-2abc_4xyz.pdb',
+                           True)])
+        runs = fakeprograms.read_fake_log(self._fake_log)
+        self.assertEqual(fakeprograms.get_max_overlap(runs), 1)
+
+        parallel_dir = os.path.join(self._temp_dir, 'parallel')
+        os.mkdir(parallel_dir)
+        presults = proteinligprep.main_proteinprep(challenge, None,
+                                                   parallel_dir,
+                                                   ligand_workers=2,
+                                                   protein_workers=3)
+        self.assertEqual([r[:4] for r in presults],
+                         [(r[0].replace(serial_dir, parallel_dir),) +
+                          r[1:4] for r in results])
+        runs = fakeprograms.read_fake_log(self._fake_log)
+        self.assertEqual(len(runs), 5)
+        self.assertTrue(fakeprograms.get_max_overlap(runs) > 1)
+        self.assertTrue(fakeprograms.get_max_overlap(runs) <= 3)
+
+        skip_names = [prepjobs.TARGET_COMPLETE_MARKER]
+        serial_tree = fakeprograms.get_tree(serial_dir, skip_names)
+        self.assertEqual(serial_tree,
+                         fakeprograms.get_tree(parallel_dir, skip_names))
+        self.assertEqual(serial_tree[os.path.join(
+            '1abc', 'SMCSS-1abc_2xyz_prepared.pdb')],
+            'prepared receptor SMCSS-1abc_2xyz\n')
+        self.assertEqual(serial_tree[os.path.join(
+            '2abc', 'lig_2abc_prepared.mae')], 'ligprep CCO 2abc\n')
+        for target in ['1abc', '2abc']:
+            self.assertTrue(prepjobs.is_target_complete(
+                os.path.join(parallel_dir, target)))
+        self.assertFalse(os.path.isdir(os.path.join(serial_dir, 'toolong')))
+
+    def test_main_proteinprep_skips_completed_targets(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'SMCSS-1abc_2xyz'],
+                   '2abc': ['LMCSS-2abc_2abc', 'SMCSS-2abc_2xyz']}
+        challenge = self._make_challenge_dir(targets)
+        out_dir = os.path.join(self._temp_dir, 'out')
+        os.mkdir(out_dir)
+        # 1abc finished before a crash
+        os.mkdir(os.path.join(out_dir, '1abc'))
+        prepjobs.write_target_complete(os.path.join(out_dir, '1abc'), [])
+        results = proteinligprep.main_proteinprep(challenge, None, out_dir,
+                                                  ligand_workers=2,
+                                                  protein_workers=2)
+        self.assertEqual(set([os.path.basename(r[0]) for r in results]),
+                         set(['2abc']))
+        self.assertEqual(os.listdir(os.path.join(out_dir, '1abc')),
+                         [prepjobs.TARGET_COMPLETE_MARKER])
+        self.assertEqual(len(fakeprograms.read_fake_log(self._fake_log)), 2)
+
+        # nothing left to do on rerun
+        results = proteinligprep.main_proteinprep(challenge, None, out_dir,
+                                                  ligand_workers=2,
+                                                  protein_workers=2)
+        self.assertEqual(results, [])
+        self.assertEqual(fakeprograms.read_fake_log(self._fake_log), [])
+
+    def test_main_proteinprep_failures_are_isolated(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'fail-1abc_2xyz'],
+                   '2abc': ['LMCSS-2abc_2abc']}
+        challenge = self._make_challenge_dir(targets)
+        open(os.path.join(challenge, '2abc', 'lig_2abc.smi'),
+             'w').write('bad\n')
+        out_dir = os.path.join(self._temp_dir, 'out')
+        os.mkdir(out_dir)
+        results = proteinligprep.main_proteinprep(challenge, None, out_dir,
+                                                  ligand_workers=2,
+                                                  protein_workers=2)
+        self.assertEqual([(os.path.basename(r[0]), r[2], r[3])
+                          for r in results],
+                         [('1abc', 'lig_1abc.smi', True),
+                          ('1abc', 'LMCSS-1abc_1abc.pdb', True),
+                          ('1abc', 'fail-1abc_2xyz.pdb', False),
+                          ('2abc', 'lig_2abc.smi', False),
+                          ('2abc', 'LMCSS-2abc_2abc.pdb', True)])
+        self.assertTrue(os.path.isfile(os.path.join(
+            out_dir, '1abc', 'LMCSS-1abc_1abc_prepared.pdb')))
+        for target in ['1abc', '2abc']:
+            self.assertTrue(prepjobs.is_target_complete(
+                os.path.join(out_dir, target)))
+        self.assertEqual(prepjobs.get_failed_jobs(
+            os.path.join(out_dir, '1abc')),
+            set([(prepjobs.PROTEIN_JOB, 'fail-1abc_2xyz.pdb')]))
+        self.assertEqual(len(fakeprograms.read_fake_log(self._fake_log)), 3)
+
+        # rerun skips targets that finished, even with failed jobs
+        open(os.path.join(challenge, '2abc', 'lig_2abc.smi'),
+             'w').write('CCO 2abc\n')
+        results = proteinligprep.main_proteinprep(challenge, None, out_dir,
+                                                  ligand_workers=2,
+                                                  protein_workers=2)
+        self.assertEqual(results, [])
+        self.assertEqual(fakeprograms.read_fake_log(self._fake_log), [])
+
+        # only the failed jobs run when asked to retry them
+        results = proteinligprep.main_proteinprep(challenge, None, out_dir,
+                                                  ligand_workers=2,
+                                                  protein_workers=2,
+                                                  retry_failed=True)
+        self.assertEqual([(os.path.basename(r[0]), r[2], r[3])
+                          for r in results],
+                         [('1abc', 'fail-1abc_2xyz.pdb', False),
+                          ('2abc', 'lig_2abc.smi', True)])
+        self.assertEqual(len(fakeprograms.read_fake_log(self._fake_log)), 1)
+        self.assertEqual(prepjobs.get_failed_jobs(
+            os.path.join(out_dir, '1abc')),
+            set([(prepjobs.PROTEIN_JOB, 'fail-1abc_2xyz.pdb')]))
+        self.assertEqual(prepjobs.get_failed_jobs(
+            os.path.join(out_dir, '2abc')), set())
+        self.assertEqual(len(prepjobs.read_target_complete(
+            os.path.join(out_dir, '2abc'))), 2)
+
+if __name__ == '__main__':
+    unittest.main()
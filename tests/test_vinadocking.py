@@ -8,17 +8,115 @@ Tests for `vinadocking` module.
 """
 
 import unittest
+import tempfile
+import shutil
+import os
 
 from d3r import vinadocking
+from tests import fakeprograms
+
+# fake vina, logs start and end time and --cpu value of each run to file
+# in FAKE_LOG env variable, fails for receptors starting with fail and
+# hangs for receptors starting with hang
+FAKE_VINA = """#!/usr/bin/env python
+import os
+import sys
+import time
+args = sys.argv[1:]
+opts = dict(zip(args[0::2], args[1::2]))
+receptor = os.path.basename(opts['--receptor'])
+start = time.time()
+if receptor.startswith('fail'):
+    sys.exit(1)
+if receptor.startswith('hang'):
+    time.sleep(60)
+time.sleep(0.3)
+f = open(opts['--ligand'].replace('.pdbqt', '_out.pdbqt'), 'w')
+for i in range(2):
+    f.write('MODEL ' + str(i + 1) + '\\n' + receptor + ' ' +
+            opts['--center_x'] + '\\nENDMDL\\n')
+f.close()
+f = open(os.environ['FAKE_LOG'], 'a')
+f.write('%f %f %s %s\\n' % (start, time.time(), receptor,
+                           opts.get('--cpu')))
+f.close()
+"""
+
+# fake prepare_receptor4.py and prepare_ligand4.py, writes .pdbqt and
+# logs input file to file in FAKE_PREP_LOG env variable
+FAKE_PREPARE = """#!/usr/bin/env python
+import os
+import sys
+src = sys.argv[2]
+open(src.replace('.mol2', '.pdbqt'), 'w').write('prepared ' + src + '\\n')
+open(os.environ['FAKE_PREP_LOG'], 'a').write(src + '\\n')
+"""
+
+# fake pdbqt_to_pdb.py and babel, copies input to output
+FAKE_CONVERT = """#!/usr/bin/env python
+import sys
+import shutil
+src = sys.argv[2]
+if len(sys.argv) == 5:
+    dest = sys.argv[4]
+else:
+    src = sys.argv[1][5:]
+    dest = sys.argv[2][5:]
+shutil.copy(src, dest)
+"""
 
 
 class TestVinaDocking(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self._cwd = os.getcwd()
+        self._temp_dir = tempfile.mkdtemp()
+        self._orig_cmds = (vinadocking.PREPARE_RECEPTOR_CMD,
+                           vinadocking.PREPARE_LIGAND_CMD,
+                           vinadocking.PDBQT_TO_PDB_CMD,
+                           vinadocking.VINA_CMD,
+                           vinadocking.BABEL_CMD)
+        bindir = os.path.join(self._temp_dir, 'bin')
+        os.mkdir(bindir)
+        vinadocking.VINA_CMD = fakeprograms.write_script(
+            os.path.join(bindir, 'vina'), FAKE_VINA)
+        prepare = fakeprograms.write_script(os.path.join(bindir, 'prepare'),
+                                            FAKE_PREPARE)
+        vinadocking.PREPARE_RECEPTOR_CMD = prepare
+        vinadocking.PREPARE_LIGAND_CMD = prepare
+        convert = fakeprograms.write_script(os.path.join(bindir, 'convert'),
+                                            FAKE_CONVERT)
+        vinadocking.PDBQT_TO_PDB_CMD = convert
+        vinadocking.BABEL_CMD = convert
+        self._fake_log = os.path.join(self._temp_dir, 'fake.log')
+        os.environ['FAKE_LOG'] = self._fake_log
+        self._fake_prep_log = os.path.join(self._temp_dir, 'fakeprep.log')
+        os.environ['FAKE_PREP_LOG'] = self._fake_prep_log
 
     def tearDown(self):
-        pass
+        (vinadocking.PREPARE_RECEPTOR_CMD,
+         vinadocking.PREPARE_LIGAND_CMD,
+         vinadocking.PDBQT_TO_PDB_CMD,
+         vinadocking.VINA_CMD,
+         vinadocking.BABEL_CMD) = self._orig_cmds
+        del os.environ['FAKE_LOG']
+        del os.environ['FAKE_PREP_LOG']
+        os.chdir(self._cwd)
+        shutil.rmtree(self._temp_dir)
+
+    def _make_stage_3(self, targets, name='stage3'):
+        """Creates proteinligprep output with `targets` dict of target
+           name to list of candidate receptor prefixes
+        """
+        return fakeprograms.make_stage_3(os.path.join(self._temp_dir, name),
+                                         targets, 'mol2')
+
+    def _read_fake_prep_log(self):
+        if not os.path.isfile(self._fake_prep_log):
+            return []
+        prepared = [line.strip() for line in open(self._fake_prep_log)]
+        os.remove(self._fake_prep_log)
+        return prepared
 
     def test_dock_center_missing_comma(self):
         center = '1,2'
@@ -27,5 +125,160 @@ class TestVinaDocking(unittest.TestCase):
         except IndexError as ie:
             self.assertEqual(str(ie), 'list index out of range', str(ie))
 
+    def test_split_cpu_budget(self):
+        self.assertEqual(vinadocking.split_cpu_budget(1, 8), None)
+        self.assertEqual(vinadocking.split_cpu_budget(2, 8), 4)
+        self.assertEqual(vinadocking.split_cpu_budget(3, 8), 2)
+        self.assertEqual(vinadocking.split_cpu_budget(16, 8), 1)
+        self.assertTrue(vinadocking.split_cpu_budget(2) >= 1)
+
+    def test_run_cmd_timeout(self):
+        self.assertEqual(vinadocking.run_cmd('echo hi', self._temp_dir),
+                         'hi')
+        try:
+            vinadocking.run_cmd('sleep 60', self._temp_dir, timeout=0.5)
+            self.fail('Expected JobTimeoutError')
+        except vinadocking.JobTimeoutError as e:
+            self.assertEqual(str(e), 'Command timed out after 0.5 '
+                                     'seconds: sleep 60')
+
+    def test_main_vina_parallel_matches_serial(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'SMCSS-1abd_1abd'],
+                   '2abc': ['LMCSS-2abc_2abc', 'SMCSS-2abd_2abd',
+                            'hiResApo-2abe_2abe'],
+                   'nocenter': []}
+        stage_3 = self._make_stage_3(targets)
+        serial_dir = os.path.join(self._temp_dir, 'serial')
+        os.mkdir(serial_dir)
+        results = vinadocking.main_vina(stage_3, serial_dir)
+        self.assertEqual([(os.path.basename(r[0]), r[1], r[2], r[4])
+                          for r in results],
+                         [('1abc', 'LMCSS-1abc_1abc_prepared.mol2', True,
+                           None),
+                          ('1abc', 'SMCSS-1abd_1abd_prepared.mol2', True,
+                           None),
+                          ('2abc', 'LMCSS-2abc_2abc_prepared.mol2', True,
+                           None),
+                          ('2abc', 'SMCSS-2abd_2abd_prepared.mol2', True,
+                           None),
+                          ('2abc', 'hiResApo-2abe_2abe_prepared.mol2', True,
+                           None)])
+        serial_runs = fakeprograms.read_fake_log(self._fake_log)
+        self.assertEqual(len(serial_runs), 5)
+        self.assertEqual(fakeprograms.get_max_overlap(serial_runs), 1)
+        self.assertEqual(set([r[3] for r in serial_runs]), set(['None']))
+
+        parallel_dir = os.path.join(self._temp_dir, 'parallel')
+        os.mkdir(parallel_dir)
+        presults = vinadocking.main_vina(stage_3, parallel_dir,
+                                         numworkers=3, total_cpus=7)
+        self.assertEqual([(os.path.basename(r[0]), r[1], r[2], r[4])
+                          for r in presults],
+                         [(os.path.basename(r[0]), r[1], r[2], r[4])
+                          for r in results])
+        parallel_runs = fakeprograms.read_fake_log(self._fake_log)
+        self.assertEqual(len(parallel_runs), 5)
+        self.assertTrue(fakeprograms.get_max_overlap(parallel_runs) > 1)
+        self.assertTrue(fakeprograms.get_max_overlap(parallel_runs) <= 3)
+        self.assertEqual(set([r[3] for r in parallel_runs]), set(['2']))
+
+        serial_tree = fakeprograms.get_tree(serial_dir)
+        self.assertEqual(serial_tree, fakeprograms.get_tree(parallel_dir))
+        self.assertEqual(serial_tree[os.path.join(
+            '1abc', 'LMCSS-1abc_1abc_docked.mol')],
+            'MODEL 1\nLMCSS-1abc_1abc_prepared.pdbqt 1.0\nENDMDL')
+        self.assertTrue(os.path.join('2abc', 'hiResApo-2abe_2abe_docked.pdb')
+                        in serial_tree)
+
+    def test_main_vina_failures_are_isolated(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'fail-1abd_1abd',
+                            'hang-1abe_1abe'],
+                   '2abc': ['LMCSS-2abc_2abc']}
+        stage_3 = self._make_stage_3(targets)
+        for numworkers in [1, 2]:
+            out_dir = os.path.join(self._temp_dir, 'out' + str(numworkers))
+            os.mkdir(out_dir)
+            results = vinadocking.main_vina(stage_3, out_dir,
+                                            numworkers=numworkers,
+                                            job_timeout=1)
+            summary = [(os.path.basename(r[0]), r[1], r[2]) for r in results]
+            self.assertEqual(summary,
+                             [('1abc', 'LMCSS-1abc_1abc_prepared.mol2', True),
+                              ('1abc', 'fail-1abd_1abd_prepared.mol2', False),
+                              ('1abc', 'hang-1abe_1abe_prepared.mol2', False),
+                              ('2abc', 'LMCSS-2abc_2abc_prepared.mol2', True)])
+            self.assertEqual(results[1][4], None)
+            self.assertTrue('timed out after 1 seconds' in results[2][4])
+            self.assertTrue(results[2][3] < 30)
+            self.assertTrue(os.path.isfile(os.path.join(
+                out_dir, '2abc', 'LMCSS-2abc_2abc_docked.mol')))
+            self.assertFalse(os.path.isfile(os.path.join(
+                out_dir, '1abc', 'fail-1abd_1abd_docked.mol')))
+
+    def test_prep_cache_reused_across_weeks(self):
+        targets = {'1abc': ['LMCSS-1abc_1abc', 'SMCSS-1abd_1abd'],
+                   '2abc': ['LMCSS-2abc_2abc']}
+        cache_dir = os.path.join(self._temp_dir, 'cache')
+        week_one = os.path.join(self._temp_dir, 'week1')
+        os.mkdir(week_one)
+        stage_3 = self._make_stage_3(targets, name='week1stage3')
+        vinadocking.main_vina(stage_3, week_one, prep_cache_dir=cache_dir)
+        # ligand of 1abc is prepared once for both candidates
+        self.assertEqual(len(self._read_fake_prep_log()), 5)
+        f = open(os.path.join(week_one, vinadocking.PREP_CACHE_SUMMARY))
+        summary = f.read()
+        f.close()
+        self.assertEqual(summary.split('\n')[1:3],
+                         ['  receptor: 0 hits, 3 misses (0.0% hit rate)',
+                          '  ligand: 1 hits, 2 misses (33.3% hit rate)'])
+
+        # next week same files, one receptor with new content
+        week_two = os.path.join(self._temp_dir, 'week2')
+        os.mkdir(week_two)
+        stage_3 = self._make_stage_3(targets, name='week2stage3')
+        open(os.path.join(stage_3, '2abc', 'LMCSS-2abc_2abc_prepared.mol2'),
+             'w').write('changed receptor\n')
+        vinadocking.main_vina(stage_3, week_two, numworkers=2,
+                              prep_cache_dir=cache_dir)
+        self.assertEqual(self._read_fake_prep_log(),
+                         ['LMCSS-2abc_2abc_prepared.mol2'])
+        f = open(os.path.join(week_two, vinadocking.PREP_CACHE_SUMMARY))
+        summary = f.read()
+        f.close()
+        self.assertTrue(summary.startswith('Preparation cache ' + cache_dir +
+                                           ': 5 hits, 1 misses (83.3% hit '
+                                           'rate)\n'))
+        self.assertTrue('  evicted 0 entries (0 bytes), ' in summary)
+        week_one_tree = fakeprograms.get_tree(week_one)
+        week_two_tree = fakeprograms.get_tree(week_two)
+        for name in ['1abc/LMCSS-1abc_1abc/LMCSS-1abc_1abc_prepared.pdbqt',
+                     '1abc/LMCSS-1abc_1abc/lig_1abc_prepared.pdbqt',
+                     '1abc/SMCSS-1abd_1abd_docked.mol']:
+            self.assertEqual(week_one_tree[name], week_two_tree[name])
+
+    def test_prep_cache_evict(self):
+        cache = vinadocking.PrepCache(os.path.join(self._temp_dir, 'cache'),
+                                      max_bytes=40)
+        self.assertEqual(cache.evict(), (0, 0, 0))
+        workdir = os.path.join(self._temp_dir, 'work')
+        os.mkdir(workdir)
+        prep_cmd = vinadocking.PREPARE_RECEPTOR_CMD + ' -r'
+        entries = []
+        for i in range(4):
+            mol2 = 'r%d.mol2' % i
+            open(os.path.join(workdir, mol2), 'w').write('receptor %d' % i)
+            cache.prepare('receptor', prep_cmd, mol2, workdir)
+            key = cache.get_key(prep_cmd, os.path.join(workdir, mol2))
+            entries.append(cache.get_entry_path(key))
+            os.utime(entries[-1], (1000 + i, 1000 + i))
+        self.assertEqual(cache.stats['receptor'], [0, 4])
+        # a hit makes the oldest entry the most recently used
+        cache.prepare('receptor', prep_cmd, 'r0.mol2', workdir)
+        self.assertEqual(cache.stats['receptor'], [1, 4])
+        size = os.path.getsize(entries[0])
+        self.assertEqual(cache.evict(), (2, 2 * size, 2 * size))
+        self.assertEqual([os.path.isfile(e) for e in entries],
+                         [True, False, False, True])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,135 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+
+"""
+test_geometry
+--------------------------------
+
+Tests for `geometry` module.
+"""
+
+from d3r.utilities import geometry
+
+
+def _atom_line(record, serial, name, x, y, z):
+    return '%-6s%5d  %-3s LIG A 900    %8.3f%8.3f%8.3f  1.00  0.00\n' % (
+        record, serial, name, x, y, z)
+
+
+class TestGeometry(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _write_pdb(self, lines):
+        path = os.path.join(self._temp_dir, 'foo.pdb')
+        f = open(path, 'w')
+        f.writelines(lines)
+        f.close()
+        return path
+
+    def test_read_pdb_coords(self):
+        pdb = self._write_pdb(['HEADER    foo\n',
+                               _atom_line('ATOM', 1, 'CA', 1.0, 2.0, 3.0),
+                               _atom_line('HETATM', 2, 'C1', 4.0, 5.0, 6.0),
+                               'END\n'])
+        names, coords = geometry.read_pdb_coords(pdb)
+        self.assertEqual(names, [' CA ', ' C1 '])
+        self.assertTrue(numpy.allclose(coords, [[1.0, 2.0, 3.0],
+                                                [4.0, 5.0, 6.0]]))
+        names, coords = geometry.read_pdb_coords(pdb,
+                                                 record_types=('HETATM',))
+        self.assertEqual(names, [' C1 '])
+        self.assertEqual(coords.shape, (1, 3))
+
+        pdb = self._write_pdb(['END\n'])
+        names, coords = geometry.read_pdb_coords(pdb)
+        self.assertEqual(names, [])
+        self.assertEqual(coords.shape, (0, 3))
+
+    def test_read_ligand_coords_and_center(self):
+        pdb = self._write_pdb([_atom_line('ATOM', 1, 'CA', 9.0, 9.0, 9.0),
+                               _atom_line('HETATM', 2, 'C1', 0.0, 0.0, 0.0),
+                               _atom_line('HETATM', 3, 'C2', 2.0, 4.0, 6.0)])
+        coords, multi_ligand = geometry.read_ligand_coords(pdb)
+        self.assertFalse(multi_ligand)
+        center = geometry.centroid(coords)
+        self.assertTrue(numpy.allclose(center, [1.0, 2.0, 3.0]))
+        self.assertEqual(geometry.format_center(center),
+                         '   1.000,    2.000,    3.000')
+        self.assertTrue(numpy.allclose(
+            geometry.parse_center(geometry.format_center(center)), center))
+
+        # repeated atom name means a second ligand, it is left out
+        pdb = self._write_pdb([_atom_line('HETATM', 1, 'C1', 0.0, 0.0, 0.0),
+                               _atom_line('HETATM', 2, 'C2', 2.0, 0.0, 0.0),
+                               _atom_line('HETATM', 3, 'C1', 8.0, 8.0, 8.0)])
+        coords, multi_ligand = geometry.read_ligand_coords(pdb)
+        self.assertTrue(multi_ligand)
+        self.assertTrue(numpy.allclose(geometry.centroid(coords),
+                                       [1.0, 0.0, 0.0]))
+
+        pdb = self._write_pdb(['HETATM    1  C1  LIG A 900       foo\n'])
+        self.assertRaises(ValueError, geometry.read_ligand_coords, pdb)
+
+        self.assertRaises(ValueError, geometry.centroid,
+                          numpy.zeros((0, 3)))
+
+    def test_distances(self):
+        self.assertEqual(geometry.distance((0, 0, 0), (3, 4, 0)), 5.0)
+        self.assertEqual(geometry.distance(
+            geometry.parse_center('1, 1, 1'),
+            geometry.parse_center('1, 1, 3')), 2.0)
+        coords1 = numpy.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0],
+                               [0.0, 0.0, 5.0]])
+        coords2 = numpy.array([[3.0, 4.0, 0.0], [10.0, 1.0, 0.0]])
+        dist = geometry.pairwise_distances(coords1, coords2)
+        self.assertEqual(dist.shape, (3, 2))
+        self.assertAlmostEqual(dist[0][0], 5.0)
+        self.assertAlmostEqual(dist[1][1], 1.0)
+        self.assertAlmostEqual(dist[2][0], numpy.sqrt(50.0))
+        expected = dist.min(axis=1)
+        self.assertTrue(numpy.allclose(
+            geometry.min_distances(coords1, coords2), expected))
+        self.assertTrue(numpy.allclose(
+            geometry.min_distances(coords1, coords2, chunk_size=2),
+            expected))
+
+    def test_rmsd(self):
+        ref = numpy.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+        fit = numpy.array([[1.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        self.assertEqual(geometry.rmsd(ref, ref), 0.0)
+        self.assertEqual(geometry.rmsd(ref, fit), 1.0)
+
+    def test_kabsch(self):
+        rand = numpy.random.RandomState(0)
+        mobile = rand.uniform(-10.0, 10.0, (50, 3))
+        angle = 0.7
+        rotation = numpy.array([[numpy.cos(angle), numpy.sin(angle), 0.0],
+                                [-numpy.sin(angle), numpy.cos(angle), 0.0],
+                                [0.0, 0.0, 1.0]])
+        translation = numpy.array([1.0, -2.0, 3.0])
+        target = numpy.dot(mobile, rotation) + translation
+        found_rotation, found_translation = geometry.kabsch(mobile, target)
+        self.assertTrue(numpy.allclose(found_rotation, rotation))
+        self.assertTrue(numpy.allclose(found_translation, translation))
+        self.assertTrue(numpy.allclose(geometry.superpose(mobile, target),
+                                       target))
+        self.assertAlmostEqual(geometry.superposed_rmsd(mobile, target), 0.0)
+        self.assertTrue(geometry.rmsd(mobile, target) > 1.0)
+
+        # mirror image cannot be reached by a proper rotation
+        mirror = mobile * numpy.array([1.0, 1.0, -1.0])
+        found_rotation, found_translation = geometry.kabsch(mobile, mirror)
+        self.assertAlmostEqual(numpy.linalg.det(found_rotation), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
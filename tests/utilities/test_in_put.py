@@ -91,6 +91,13 @@ class TestInPut(unittest.TestCase):
             q.pdb_id = '2n7b'
             queries.append(q)
             in_put.read_ligands(nonpoly, queries)
+            self.assertEqual([query.ligand_count for query in queries],
+                             [1, 1, 1])
+            self.assertEqual(queries[0].do_not_call[0].resname, 'CA')
+            self.assertEqual(queries[1].dock[0].resname, '4DY')
+            self.assertEqual(queries[2].dock[0].resname, '0D8')
+            self.assertEqual(queries[2].dock[0].inchi,
+                             'InChI=1S/C3H9NO/c4-2-1-3-5/h5H,1-4H2')
 
         finally:
             shutil.rmtree(temp_dir)
@@ -167,6 +174,50 @@ class TestInPut(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_index_queries(self):
+        self.assertEqual(in_put.index_queries([]), {})
+        first = Query()
+        first.pdb_id = '2n1i'
+        second = Query()
+        second.pdb_id = '2n27'
+        dup = Query()
+        dup.pdb_id = '2n1i'
+        index = in_put.index_queries([first, second, dup])
+        self.assertEqual(len(index), 2)
+        self.assertTrue(index['2n1i'] is first)
+        self.assertTrue(index['2n27'] is second)
+
+    def test_add_sequence_updates_index(self):
+        index = {}
+        queries = in_put.add_sequence([], 'ACDE', '2n1i', '1', index)
+        queries = in_put.add_sequence(queries, 'FGHI', '2n1i', '2', index)
+        queries = in_put.add_sequence(queries, 'KLMN', '2n27', '1', index)
+        self.assertEqual([q.pdb_id for q in queries], ['2n1i', '2n27'])
+        self.assertTrue(index['2n1i'] is queries[0])
+        self.assertTrue(index['2n27'] is queries[1])
+        self.assertEqual(queries[0].sequence_count, 2)
+
+        # without an index the queries are searched
+        queries = in_put.add_sequence(queries, 'PQRS', '2n27', '2')
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[1].sequence_count, 2)
+
+    def test_add_ligand_and_ph_unknown_pdb_id(self):
+        q = Query()
+        q.pdb_id = '2n1i'
+        try:
+            in_put.add_ligand('xxxx', 'CA', 'InChI=1S/Ca/q+2', 'dock', [q])
+            self.fail('Expected KeyError')
+        except KeyError:
+            pass
+        try:
+            in_put.add_ph('xxxx', '7', [q])
+            self.fail('Expected KeyError')
+        except KeyError:
+            pass
+        in_put.add_ph('2n1i', '7', [q])
+        self.assertEqual(q.exp_ph, '7')
+
     def test_label(self):
         self.assertEqual(in_put.label('VA3'), 'do_not_call')
         self.assertEqual(in_put.label('hahaha'), 'dock')
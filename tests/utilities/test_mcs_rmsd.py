@@ -0,0 +1,134 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import shutil
+import os
+import imp
+import numpy
+
+"""
+test_mcs_rmsd
+--------------------------------
+
+Tests for `mcs_rmsd` module.
+"""
+
+from d3r.utilities import mcs_rmsd
+
+try:
+    imp.find_module('rdkit')
+    HAS_RDKIT = True
+except ImportError:
+    HAS_RDKIT = False
+
+# ethanol heavy atoms, C1-C2-O3
+ETHANOL = ['HETATM    1  C1  EOH A 900       0.000   0.000   0.000  1.00  '
+           '0.00           C  \n',
+           'HETATM    2  C2  EOH A 900       1.540   0.000   0.000  1.00  '
+           '0.00           C  \n',
+           'HETATM    3  O3  EOH A 900       2.050   1.350   0.000  1.00  '
+           '0.00           O  \n',
+           'CONECT    1    2\n',
+           'CONECT    2    1    3\n',
+           'CONECT    3    2\n',
+           'END\n']
+
+
+class TestMcsRmsd(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_match_rmsd(self):
+        ref = numpy.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+        fit = numpy.array([[1.0, 0.0, 0.0], [0.0, 0.0, 2.0]])
+        self.assertEqual(mcs_rmsd.match_rmsd(ref, fit, []), None)
+        self.assertEqual(mcs_rmsd.match_rmsd(ref, fit, [(0, 1)]), 2.0)
+        # atoms swapped, each one off by 1 and sqrt(5)
+        self.assertAlmostEqual(mcs_rmsd.match_rmsd(ref, fit,
+                                                   [(0, 0), (1, 1)]),
+                               numpy.sqrt(3.0))
+        self.assertEqual(mcs_rmsd.match_rmsd(ref, ref, [(0, 0), (1, 1)]),
+                         0.0)
+
+    def test_min_match_rmsd(self):
+        # symmetric pair of atoms, the swapped match lines up exactly
+        ref = numpy.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+        fit = numpy.array([[1.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        ref_matches = [(0, 1)]
+        fit_matches = [(0, 1), (1, 0)]
+        self.assertEqual(mcs_rmsd.min_match_rmsd(ref, fit, ref_matches,
+                                                 fit_matches),
+                         (0.0, 2))
+        self.assertEqual(mcs_rmsd.min_match_rmsd(ref, fit, ref_matches,
+                                                 fit_matches,
+                                                 max_matches=1),
+                         (1.0, 1))
+        self.assertEqual(mcs_rmsd.min_match_rmsd(ref, fit, ref_matches,
+                                                 fit_matches,
+                                                 max_matches=0),
+                         (None, 0))
+        self.assertEqual(mcs_rmsd.min_match_rmsd(ref, fit, [], fit_matches),
+                         (None, 0))
+
+    def test_min_match_rmsd_in_chunks(self):
+        ref = numpy.random.RandomState(1).uniform(-5, 5, (6, 3))
+        fit = numpy.random.RandomState(2).uniform(-5, 5, (6, 3))
+        ref_matches = [(0, 1, 2), (2, 1, 0), (3, 4, 5)]
+        fit_matches = [(a, b, c) for a in range(6) for b in range(6)
+                       for c in range(6) if len(set([a, b, c])) == 3]
+        expected = []
+        for ref_match in ref_matches:
+            for fit_match in fit_matches:
+                expected.append(mcs_rmsd.match_rmsd(
+                    ref, fit, list(zip(ref_match, fit_match))))
+        orig_chunk_size = mcs_rmsd.MATCH_CHUNK_SIZE
+        try:
+            for chunk_size in [1, 7, 1024]:
+                mcs_rmsd.MATCH_CHUNK_SIZE = chunk_size
+                minimum, count = mcs_rmsd.min_match_rmsd(ref, fit,
+                                                         ref_matches,
+                                                         fit_matches)
+                self.assertEqual(count, len(expected))
+                self.assertAlmostEqual(minimum, min(expected))
+                minimum, count = mcs_rmsd.min_match_rmsd(ref, fit,
+                                                         ref_matches,
+                                                         fit_matches,
+                                                         max_matches=150)
+                self.assertEqual(count, 150)
+                self.assertAlmostEqual(minimum, min(expected[:150]))
+        finally:
+            mcs_rmsd.MATCH_CHUNK_SIZE = orig_chunk_size
+
+    @unittest.skipIf(not HAS_RDKIT, 'rdkit is not installed')
+    def test_rdkit_rmsd_mcss(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            ref = os.path.join(temp_dir, 'ref.pdb')
+            f = open(ref, 'w')
+            f.writelines(ETHANOL)
+            f.close()
+            # same pose shifted 1 angstrom along z
+            fit = os.path.join(temp_dir, 'fit.pdb')
+            f = open(fit, 'w')
+            f.writelines([line[:46] + '%8.3f' % 1.0 + line[54:]
+                          if line.startswith('HETATM') else line
+                          for line in ETHANOL])
+            f.close()
+            self.assertAlmostEqual(mcs_rmsd.rdkit_rmsd_mcss(ref, ref), 0.0)
+            self.assertAlmostEqual(mcs_rmsd.rdkit_rmsd_mcss(ref, fit), 1.0)
+            self.assertAlmostEqual(mcs_rmsd.rdkit_rmsd_mcss(ref, fit,
+                                                            max_matches=1),
+                                   1.0)
+            # no match files are written
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             ['fit.pdb', 'ref.pdb'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
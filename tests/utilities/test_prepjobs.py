@@ -0,0 +1,165 @@
+__author__ = 'churas'
+
+import unittest
+import tempfile
+import shutil
+import time
+import os
+
+"""
+test_prepjobs
+--------------------------------
+
+Tests for `prepjobs` module.
+"""
+
+from d3r.utilities import prepjobs
+
+
+def _write_job(name, sleep_time):
+    """Job writes `name` in current directory along with its start
+       and end time
+    """
+    start = time.time()
+    time.sleep(sleep_time)
+    f = open(name, 'w')
+    f.write('%f %f' % (start, time.time()))
+    f.close()
+    return True
+
+
+def _failing_job(name):
+    return False
+
+
+def _raising_job(name):
+    raise ValueError('bad ' + name)
+
+
+class TestPrepJobs(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._targets = []
+        for target in ['1abc', '2abc']:
+            target_dir = os.path.join(self._temp_dir, target)
+            os.mkdir(target_dir)
+            self._targets.append(target_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _get_jobs(self, sleep_time):
+        jobs = []
+        for target_dir in self._targets:
+            jobs.append((prepjobs.LIGAND_JOB, target_dir, 'lig',
+                         _write_job, ('lig', sleep_time)))
+            for candidate in ['LMCSS', 'SMCSS', 'hiResApo']:
+                jobs.append((prepjobs.PROTEIN_JOB, target_dir, candidate,
+                             _write_job, (candidate, sleep_time)))
+        return jobs
+
+    def _read_marker(self, target_dir):
+        f = open(prepjobs.get_target_complete_marker(target_dir), 'r')
+        lines = [line.split()[:3] for line in f]
+        f.close()
+        return sorted(lines)
+
+    def test_is_target_complete(self):
+        self.assertFalse(prepjobs.is_target_complete(self._targets[0]))
+        prepjobs.write_target_complete(self._targets[0], [])
+        self.assertTrue(prepjobs.is_target_complete(self._targets[0]))
+        self.assertFalse(os.path.isfile(prepjobs.get_target_complete_marker(
+            self._targets[0]) + '.tmp'))
+
+    def test_run_prep_jobs_serial(self):
+        curdir = os.getcwd()
+        jobs = self._get_jobs(0)
+        results = prepjobs.run_prep_jobs(jobs)
+        self.assertEqual(os.getcwd(), curdir)
+        self.assertEqual([(r[0], r[1], r[2], r[3], r[5]) for r in results],
+                         [(j[1], j[0], j[2], True, None) for j in jobs])
+        for target_dir in self._targets:
+            self.assertEqual(sorted(os.listdir(target_dir)),
+                             ['LMCSS', 'SMCSS', 'hiResApo', 'lig',
+                              prepjobs.TARGET_COMPLETE_MARKER])
+            self.assertEqual(self._read_marker(target_dir),
+                             [['ligand', 'lig', 'ok'],
+                              ['protein', 'LMCSS', 'ok'],
+                              ['protein', 'SMCSS', 'ok'],
+                              ['protein', 'hiResApo', 'ok']])
+
+    def test_run_prep_jobs_parallel(self):
+        jobs = self._get_jobs(0.3)
+        results = prepjobs.run_prep_jobs(jobs, ligand_workers=2,
+                                         protein_workers=3)
+        self.assertEqual([(r[0], r[1], r[2], r[3], r[5]) for r in results],
+                         [(j[1], j[0], j[2], True, None) for j in jobs])
+        times = []
+        for target_dir in self._targets:
+            self.assertTrue(prepjobs.is_target_complete(target_dir))
+            for name in ['lig', 'LMCSS', 'SMCSS', 'hiResApo']:
+                f = open(os.path.join(target_dir, name), 'r')
+                start, end = f.read().split()
+                f.close()
+                times.append((float(start), 1))
+                times.append((float(end), -1))
+        active = 0
+        max_active = 0
+        for t, change in sorted(times):
+            active += change
+            max_active = max(max_active, active)
+        # up to 2 ligand and 3 protein jobs at once
+        self.assertTrue(max_active > 1)
+        self.assertTrue(max_active <= 5)
+
+    def test_run_prep_jobs_failures_are_isolated(self):
+        for workers in [1, 2]:
+            jobs = [(prepjobs.LIGAND_JOB, self._targets[0], 'lig',
+                     _raising_job, ('lig',)),
+                    (prepjobs.PROTEIN_JOB, self._targets[0], 'LMCSS',
+                     _failing_job, ('LMCSS',)),
+                    (prepjobs.PROTEIN_JOB, self._targets[1], 'LMCSS',
+                     _write_job, ('LMCSS', 0))]
+            results = prepjobs.run_prep_jobs(jobs, ligand_workers=workers,
+                                             protein_workers=workers)
+            self.assertEqual([(r[3], r[5]) for r in results],
+                             [(False, 'bad lig'), (False, None),
+                              (True, None)])
+            # target with failed jobs is marked complete listing them
+            self.assertEqual(self._read_marker(self._targets[0]),
+                             [['ligand', 'lig', 'failed'],
+                              ['protein', 'LMCSS', 'failed']])
+            self.assertEqual(self._read_marker(self._targets[1]),
+                             [['protein', 'LMCSS', 'ok']])
+            for target_dir in self._targets:
+                os.remove(prepjobs.get_target_complete_marker(target_dir))
+
+    def test_retry_failed_jobs_updates_marker(self):
+        target_dir = self._targets[0]
+        self.assertEqual(prepjobs.read_target_complete(target_dir), [])
+        self.assertEqual(prepjobs.get_failed_jobs(target_dir), set())
+        jobs = [(prepjobs.LIGAND_JOB, target_dir, 'lig',
+                 _write_job, ('lig', 0)),
+                (prepjobs.PROTEIN_JOB, target_dir, 'LMCSS',
+                 _failing_job, ('LMCSS',)),
+                (prepjobs.PROTEIN_JOB, target_dir, 'SMCSS',
+                 _failing_job, ('SMCSS',))]
+        prepjobs.run_prep_jobs(jobs)
+        self.assertEqual(prepjobs.get_failed_jobs(target_dir),
+                         set([(prepjobs.PROTEIN_JOB, 'LMCSS'),
+                              (prepjobs.PROTEIN_JOB, 'SMCSS')]))
+
+        # rerun of one failed job keeps the other entries
+        prepjobs.run_prep_jobs([(prepjobs.PROTEIN_JOB, target_dir, 'LMCSS',
+                                 _write_job, ('LMCSS', 0))])
+        self.assertEqual([e[:3] for e in
+                          prepjobs.read_target_complete(target_dir)],
+                         [(prepjobs.LIGAND_JOB, 'lig', True),
+                          (prepjobs.PROTEIN_JOB, 'SMCSS', False),
+                          (prepjobs.PROTEIN_JOB, 'LMCSS', True)])
+        self.assertEqual(prepjobs.get_failed_jobs(target_dir),
+                         set([(prepjobs.PROTEIN_JOB, 'SMCSS')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
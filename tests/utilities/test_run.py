@@ -1,6 +1,9 @@
 __author__ = 'churas'
 
 import unittest
+import tempfile
+import shutil
+import os
 
 
 """
@@ -12,6 +15,45 @@ Tests for `run` module.
 
 from d3r.utilities import run
 from d3r import blastnfilter
+from d3r.blast.hit import Hit
+from d3r.blast.ligand import Ligand
+from d3r.blast.mcss import MCSSCache
+from d3r.filter.filter import QueryFilter
+
+
+def _load_no_shared_data(pdb_path, fasta, compinchi):
+    pass
+
+
+def _query_filter_without_inchi_check(query):
+    # rdkit may not be installed, in which case every InChI is an error
+    q_filter = QueryFilter(query)
+    q_filter.filter_apo()
+    q_filter.filter_by_sequence_count()
+    q_filter.filter_by_dockable_ligand_count()
+    q_filter.filter_by_sequence_type()
+
+
+def _search_query_with_apo_hit(query, pdb_db, pdb_path, fasta, out_dir,
+                               compinchi):
+    hit = Hit()
+    hit.pdb_id = '1' + query.pdb_id[1:]
+    hit.resolution = '2.0'
+    hit.set_retain_reason(4)
+    query.hits.append(hit)
+    return query
+
+
+def _search_query_with_holo_hit(query, pdb_db, pdb_path, fasta, out_dir,
+                                compinchi):
+    hit = Hit()
+    hit.pdb_id = '1' + query.pdb_id[1:]
+    for resname in ['LIG', 'NEW']:
+        hit.dock.append(Ligand(resname))
+        hit.dock_count += 1
+    query.hits.append(hit)
+    run.calculate_mcss(query)
+    return query
 
 
 class TestBlastNFilterTask(unittest.TestCase):
@@ -39,6 +81,126 @@ class TestBlastNFilterTask(unittest.TestCase):
         self.assertEqual(fasta, '/f/mypdbblastdb/pdb_seqres.txt')
         self.assertEqual(compinchi, '/f/mycompinchi')
 
+    def _write_run_inputs(self, temp_dir):
+        seq = os.path.join(temp_dir, 'seq.tsv')
+        f = open(seq, 'w')
+        f.write('PDB_ID  Sequence_Count  Sequence\n'
+                '2N1I    1       GSGFPTSEDFTPKEGSPYEAPVYIPEDIPIPADFELRE\n'
+                '2N27    1       ADQLTEEQIAEFKEAFSLFDKDGDGTITTKELGTVMRS\n'
+                '2N4M    1       (DG)(DT)(DG)(DC)(4E9)(DT)(DG)(DT)(DT)\n'
+                '2N4M    2       (DA)(DC)(DA)(DA)(DA)(DC)(DA)(DC)(DG)\n'
+                '2N9T    1       YCQKWMWTCDSERKCCEGMVCRLWCKKKLW\n')
+        f.close()
+        nonpoly = os.path.join(temp_dir, 'nonpoly.tsv')
+        f = open(nonpoly, 'w')
+        f.write('PDB_ID  Component_ID    InChI\n'
+                '2N1I    CA      InChI=1S/Ca/q+2\n'
+                '2N27    MOH     InChI=1S/CH4O/c1-2/h2H,1H3\n'
+                '2N9T    ACN     InChI=1S/C3H6O/c1-3(2)4/h1-2H3\n')
+        f.close()
+        ph = os.path.join(temp_dir, 'ph.tsv')
+        f = open(ph, 'w')
+        f.write('PDB_ID  _exptl_crystal_grow.pH\n'
+                '2N27    7.5\n')
+        f.close()
+        return ['--nonpolymertsv', nonpoly,
+                '--sequencetsv', seq,
+                '--crystalpH', ph,
+                '--pdbblastdb', temp_dir,
+                '--pdbdb', temp_dir,
+                '--compinchi', os.path.join(temp_dir, 'foo')]
+
+    def _read_outputs(self, out_dir):
+        contents = {}
+        for entry in os.listdir(out_dir):
+            f = open(os.path.join(out_dir, entry), 'r')
+            contents[entry] = f.read()
+            f.close()
+        return contents
+
+    def test_run_serial_and_worker_pool_output_match(self):
+        orig_load_shared_data = run.load_shared_data
+        orig_query_filter = run.query_filter
+        orig_search_query = run.search_query
+        run.load_shared_data = _load_no_shared_data
+        run.query_filter = _query_filter_without_inchi_check
+        run.search_query = _search_query_with_apo_hit
+        temp_dir = tempfile.mkdtemp()
+        try:
+            theargs = self._write_run_inputs(temp_dir)
+            serial_dir = os.path.join(temp_dir, 'serial')
+            os.mkdir(serial_dir)
+            pool_dir = os.path.join(temp_dir, 'pool')
+            os.mkdir(pool_dir)
+
+            opts = blastnfilter._parse_arguments('hi', theargs +
+                                                 ['--outdir', serial_dir])
+            run.run(opts)
+            opts = blastnfilter._parse_arguments('hi', theargs +
+                                                 ['--outdir', pool_dir,
+                                                  '--numworkers', '3'])
+            run.run(opts)
+
+            serial = self._read_outputs(serial_dir)
+            pool = self._read_outputs(pool_dir)
+            self.assertEqual(sorted(serial.keys()),
+                             ['2n27.txt', '2n9t.txt', 'blastnfilter.log',
+                              'summary.txt'])
+            self.assertTrue('hiResApo, 1n27\n' in serial['2n27.txt'])
+            self.assertTrue('hiResApo, 1n9t\n' in serial['2n9t.txt'])
+            self.assertEqual(serial, pool)
+            self.assertTrue(serial['blastnfilter.log'].index('2n9t') <
+                            serial['blastnfilter.log'].index('2n1i'))
+        finally:
+            run.load_shared_data = orig_load_shared_data
+            run.query_filter = orig_query_filter
+            run.search_query = orig_search_query
+            shutil.rmtree(temp_dir)
+
+    def test_run_with_mcss_cache(self):
+        orig_load_shared_data = run.load_shared_data
+        orig_query_filter = run.query_filter
+        orig_search_query = run.search_query
+        run.load_shared_data = _load_no_shared_data
+        run.query_filter = _query_filter_without_inchi_check
+        run.search_query = _search_query_with_holo_hit
+        temp_dir = tempfile.mkdtemp()
+        try:
+            theargs = self._write_run_inputs(temp_dir)
+            mcss_cache = os.path.join(temp_dir, 'mcss.cache')
+            cache = MCSSCache(mcss_cache)
+            cache.put('InChI=1S/CH4O/c1-2/h2H,1H3', 'LIG',
+                      (2, '[#6]-[#8]', 0.5, None))
+            cache.save()
+
+            # only LIG in 2n27 is a hit on the first run, the results of
+            # the other ligands are stored and are hits on the second run
+            for numworkers, hits, misses in [('1', 1, 3), ('2', 4, 0)]:
+                out_dir = os.path.join(temp_dir, 'out' + numworkers)
+                os.mkdir(out_dir)
+                opts = blastnfilter._parse_arguments('hi', theargs +
+                                                     ['--outdir', out_dir,
+                                                      '--mcsscache',
+                                                      mcss_cache,
+                                                      '--numworkers',
+                                                      numworkers])
+                run.run(opts)
+                f = open(os.path.join(out_dir, 'summary.txt'), 'r')
+                summary = f.read()
+                f.close()
+                self.assertTrue('MCSS CACHE SUMMARY\n'
+                                '  hits:{no:>35}\n'
+                                '  misses:{mi:>33}\n'.format(no=hits,
+                                                              mi=misses)
+                                in summary)
+            self.assertEqual(len(MCSSCache(mcss_cache)), 4)
+        finally:
+            run.load_shared_data = orig_load_shared_data
+            run.query_filter = orig_query_filter
+            run.search_query = orig_search_query
+            run.Ligand.mcss_cache = None
+            shutil.rmtree(temp_dir)
+
     def tearDown(self):
         pass
 